@@ -1,4 +1,5 @@
 from server import ServiceId
+from server import ServerHandle
 from server import ServerRequestId
 from services.source_code_model_service import SourceCodeModelSubServiceId
 from services.source_code_model.indexer.clang_indexer import SourceCodeModelIndexerRequestId
@@ -6,12 +7,12 @@ from services.source_code_model.indexer.clang_indexer import SourceCodeModelInde
 #
 # Server API
 #
-def server_start(get_server_instance, get_server_instance_args, log_file):
+def server_start(get_server_instance, get_server_instance_args, log_file, socket_path=None):
     import logging
     import multiprocessing
     import sys
 
-    def __run_impl(handle, get_server_instance, args, log_file):
+    def __run_impl(handle, get_server_instance, args, log_file, socket_path):
         def __handle_exception(exc_type, exc_value, exc_traceback):
             logging.critical("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
 
@@ -42,24 +43,40 @@ def server_start(get_server_instance, get_server_instance_args, log_file):
         # Instantiate and run the server
         try:
             from server import server_listener
-            server_listener(get_server_instance(handle, args))
+            server = get_server_instance(handle, args)
+            socket_server = None
+            if socket_path:
+                from socket_server import SocketServer
+                socket_server = SocketServer(socket_path, handle, server)
+                socket_server.start()
+            server_listener(server)
+            if socket_server:
+                socket_server.stop()
         except:
             sys.excepthook(*sys.exc_info())
 
-    server_queue = multiprocessing.Queue()
+    server_handle = ServerHandle()
     server_process = multiprocessing.Process(
         target=__run_impl,
         args=(
-            server_queue,
+            server_handle,
             get_server_instance,
             get_server_instance_args,
-            log_file
+            log_file,
+            socket_path
         ),
         name="cxxd_server"
     )
     server_process.daemon = False
     server_process.start()
-    return server_queue
+    return server_handle
+
+def server_connect(socket_path, source_code_model_plugin, project_builder_plugin, clang_format_plugin, clang_tidy_plugin):
+    from socket_server import SocketClient
+    return SocketClient(socket_path, source_code_model_plugin, project_builder_plugin, clang_format_plugin, clang_tidy_plugin)
+
+def server_disconnect(handle):
+    handle.close()
 
 def server_stop(handle, *payload):
     handle.put([ServerRequestId.SHUTDOWN_AND_EXIT, 0x0, list(payload)])
@@ -115,8 +132,26 @@ def source_code_model_indexer_drop_all_and_run_on_directory_request(handle):
     source_code_model_indexer_drop_all_request(handle, True)
     source_code_model_indexer_run_on_directory_request(handle)
 
-def source_code_model_indexer_find_all_references_request(handle, filename, line, col):
-    _indexer_request(handle, SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, filename, line, col)
+def source_code_model_indexer_find_all_references_request(handle, filename, line, col, limit=None, continuation_token=None):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, filename, line, col, limit, continuation_token)
+
+def source_code_model_indexer_workspace_symbol_request(handle, query, limit=100):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL, query, limit)
+
+def source_code_model_indexer_incoming_calls_request(handle, filename, line, col, usr=None):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.INCOMING_CALLS, filename, line, col, usr)
+
+def source_code_model_indexer_outgoing_calls_request(handle, filename, line, col, usr=None):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.OUTGOING_CALLS, filename, line, col, usr)
+
+def source_code_model_indexer_base_classes_request(handle, filename, line, col, usr=None, transitive=True):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.BASE_CLASSES, filename, line, col, usr, transitive)
+
+def source_code_model_indexer_derived_classes_request(handle, filename, line, col, usr=None, transitive=True):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.DERIVED_CLASSES, filename, line, col, usr, transitive)
+
+def source_code_model_indexer_includers_request(handle, filename, transitive=True):
+    _indexer_request(handle, SourceCodeModelIndexerRequestId.INCLUDERS, filename, transitive)
 
 #
 # Project builder service API
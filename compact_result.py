@@ -0,0 +1,129 @@
+import array
+import struct
+import sys
+
+class CompactResult():
+    """
+    Plain, compact representation of the sub-service results which otherwise hold live libclang objects.
+
+    Result is made of one or more tables. Each table is a flat array of ints with a fixed number of fields per row.
+    Strings are interned into a single string table shared by all the tables and referred to by their index. This
+    makes the result cheap to keep around (i.e. to cache or diff), cheap to pickle (see serialize()) and possible to
+    read directly from the mmap-ed buffer (see deserialize()).
+
+    Serialized format (little-endian):
+        <number of tables (u32)>
+        <row size (u32)> <number of values (u32)> <values (i32 * number of values)>    ... for each table
+        <number of strings (u32)> <string end offsets (u32 * number of strings)> <utf-8 encoded strings>
+    """
+    value_typecode = 'i'
+    offset_typecode = 'I'
+
+    def __init__(self, *row_sizes):
+        self.row_sizes = list(row_sizes)
+        self.tables = [array.array(CompactResult.value_typecode) for row_size in row_sizes]
+        self.strings = []
+        self.string_index = {}
+
+    def intern(self, string):
+        index = self.string_index.get(string, None)
+        if index is None:
+            index = self.string_index[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def string(self, index):
+        return self.strings[index]
+
+    def append(self, table, *fields):
+        assert len(fields) == self.row_sizes[table]
+        self.tables[table].extend(fields)
+
+    def row_count(self, table):
+        return len(self.tables[table]) / self.row_sizes[table]
+
+    def row(self, table, index):
+        row_size = self.row_sizes[table]
+        return tuple(self.tables[table][index*row_size:(index+1)*row_size])
+
+    def rows(self, table):
+        for index in range(self.row_count(table)):
+            yield self.row(table, index)
+
+    def as_dict(self):
+        # JSON-friendly representation used by the front-ends which do not speak the serialized format.
+        return {'rowSizes': self.row_sizes, 'tables': [table.tolist() for table in self.tables], 'strings': self.strings}
+
+    @staticmethod
+    def from_dict(d):
+        result = CompactResult(*d['rowSizes'])
+        for table, values in zip(result.tables, d['tables']):
+            table.extend(values)
+        for string in d['strings']:
+            result.intern(string)
+        return result
+
+    def __eq__(self, other):
+        return isinstance(other, CompactResult) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        return (deserialize, (self.serialize(),))
+
+    def serialize(self):
+        chunks = [struct.pack('<I', len(self.tables))]
+        for row_size, table in zip(self.row_sizes, self.tables):
+            chunks.append(struct.pack('<II', row_size, len(table)))
+            chunks.append(_to_little_endian(table).tostring())
+        encoded_strings = [s.encode('utf8') if isinstance(s, unicode) else s for s in self.strings]
+        offsets, end = array.array(CompactResult.offset_typecode), 0
+        for s in encoded_strings:
+            end += len(s)
+            offsets.append(end)
+        chunks.append(struct.pack('<I', len(encoded_strings)))
+        chunks.append(_to_little_endian(offsets).tostring())
+        chunks.extend(encoded_strings)
+        return ''.join(chunks)
+
+def deserialize(data):
+    result, offset = CompactResult(), 0
+    number_of_tables, = struct.unpack_from('<I', data, offset)
+    offset += 4
+    for _ in range(number_of_tables):
+        row_size, number_of_values = struct.unpack_from('<II', data, offset)
+        offset += 8
+        table, offset = _from_little_endian(CompactResult.value_typecode, data, offset, number_of_values)
+        result.row_sizes.append(row_size)
+        result.tables.append(table)
+    number_of_strings, = struct.unpack_from('<I', data, offset)
+    offset += 4
+    offsets, offset = _from_little_endian(CompactResult.offset_typecode, data, offset, number_of_strings)
+    start = 0
+    for end in offsets:
+        result.intern(data[offset+start:offset+end])
+        start = end
+    return result
+
+def json_default(obj):
+    # To be used as json.dumps(..., default=json_default)
+    if hasattr(obj, 'as_dict'):
+        return obj.as_dict()
+    raise TypeError('{0} is not JSON serializable'.format(repr(obj)))
+
+def is_compact_result_dict(obj):
+    return isinstance(obj, dict) and sorted(obj.keys()) == ['rowSizes', 'strings', 'tables']
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+def _from_little_endian(typecode, data, offset, count):
+    values = array.array(typecode)
+    values.fromstring(data[offset:offset+count*values.itemsize])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values, offset + count*values.itemsize
@@ -0,0 +1,284 @@
+import argparse
+import errno
+import functools
+import json
+import logging
+import os
+import select
+import socket
+import tempfile
+import api
+from compact_result import json_default
+from server import Server
+from server import ServerRequestId
+from service import CancelledRequests
+from service import ServiceRequestId
+from service import TaggedPayload
+from service_plugin import ServicePlugin
+from socket_server import json_loads
+from transport import Transport
+
+#
+# JSON-RPC 2.0 front-end to the services.
+#
+# Messages are framed the same way as in Language Server Protocol: 'Content-Length: <n>\r\n\r\n<json>'. Methods
+# listed below are mapped onto the api.py functions. Parameters can be given either by name or by position.
+#
+# Requests to start and stop the services are answered right away. Service requests are answered once the service
+# completes them with '{"success": <bool>, "result": <args>}' where args is the result converted to plain
+# data (see Service.serialize_result()). Compact results are sent as '{"rowSizes": [...], "tables": [[...]],
+# "strings": [...]}' (see CompactResult). Many requests can be in flight at once and each of them can be cancelled
+# with '$/cancelRequest' notification.
+#
+# Results streamed in pages (i.e. find-all-references) come as '{"items": [...], "continuationToken": ...}'. All
+# but the last page are sent ahead of the response in '$/partialResult' notifications: '{"id": <request id>,
+# "success": <bool>, "result": <page>}'. Parameters given as (name, default) pairs below are optional.
+#
+class JsonRpcErrorCode():
+    PARSE_ERROR       = -32700
+    INVALID_REQUEST   = -32600
+    METHOD_NOT_FOUND  = -32601
+    INVALID_PARAMS    = -32602
+    REQUEST_CANCELLED = -32800
+
+methods = {
+    'sourceCodeModel/start'                     : (api.source_code_model_start,                               ['projectRootDirectory', 'compilerArgs']),
+    'sourceCodeModel/stop'                      : (api.source_code_model_stop,                                ['subscribeForCallback']),
+    'sourceCodeModel/semanticSyntaxHighlight'   : (api.source_code_model_semantic_syntax_highlight_request,   ['filename', 'contents']),
+    'sourceCodeModel/diagnostics'               : (api.source_code_model_diagnostics_request,                 ['filename', 'contents']),
+    'sourceCodeModel/typeDeduction'             : (api.source_code_model_type_deduction_request,              ['filename', 'contents', 'line', 'column']),
+    'sourceCodeModel/goToDefinition'            : (api.source_code_model_go_to_definition_request,            ['filename', 'contents', 'line', 'column']),
+    'sourceCodeModel/goToInclude'               : (api.source_code_model_go_to_include_request,               ['filename', 'contents', 'line']),
+    'sourceCodeModel/indexer/runOnSingleFile'   : (api.source_code_model_indexer_run_on_single_file_request,  ['filename', 'contents']),
+    'sourceCodeModel/indexer/runOnDirectory'    : (api.source_code_model_indexer_run_on_directory_request,    []),
+    'sourceCodeModel/indexer/dropSingleFile'    : (api.source_code_model_indexer_drop_single_file_request,    ['filename']),
+    'sourceCodeModel/indexer/dropAll'           : (api.source_code_model_indexer_drop_all_request,            ['removeDbFromDisk']),
+    'sourceCodeModel/indexer/findAllReferences' : (api.source_code_model_indexer_find_all_references_request, ['filename', 'line', 'column', ('limit', None), ('continuationToken', None)]),
+    'sourceCodeModel/indexer/workspaceSymbol'   : (api.source_code_model_indexer_workspace_symbol_request,    ['query', ('limit', 100)]),
+    'sourceCodeModel/indexer/incomingCalls'     : (api.source_code_model_indexer_incoming_calls_request,      ['filename', 'line', 'column', ('usr', None)]),
+    'sourceCodeModel/indexer/outgoingCalls'     : (api.source_code_model_indexer_outgoing_calls_request,      ['filename', 'line', 'column', ('usr', None)]),
+    'sourceCodeModel/indexer/baseClasses'       : (api.source_code_model_indexer_base_classes_request,        ['filename', 'line', 'column', ('usr', None), ('transitive', True)]),
+    'sourceCodeModel/indexer/derivedClasses'    : (api.source_code_model_indexer_derived_classes_request,     ['filename', 'line', 'column', ('usr', None), ('transitive', True)]),
+    'sourceCodeModel/indexer/includers'         : (api.source_code_model_indexer_includers_request,           ['filename', ('transitive', True)]),
+    'projectBuilder/start'                      : (api.project_builder_start,                                 ['projectRootDirectory']),
+    'projectBuilder/stop'                       : (api.project_builder_stop,                                  ['subscribeForCallback']),
+    'projectBuilder/build'                      : (api.project_builder_request,                               ['buildCommand']),
+    'clangFormat/start'                         : (api.clang_format_start,                                    ['configFile']),
+    'clangFormat/stop'                          : (api.clang_format_stop,                                     ['subscribeForCallback']),
+    'clangFormat/format'                        : (api.clang_format_request,                                  ['filename']),
+    'clangTidy/start'                           : (api.clang_tidy_start,                                      ['compilationDatabase']),
+    'clangTidy/stop'                            : (api.clang_tidy_stop,                                       ['subscribeForCallback']),
+    'clangTidy/run'                             : (api.clang_tidy_request,                                    ['filename', 'applyFixes']),
+}
+
+def encode_message(message):
+    body = json.dumps(message, default=json_default)
+    return 'Content-Length: {0}\r\n\r\n{1}'.format(len(body), body)
+
+class MessageReader():
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        messages = []
+        self.buffer.extend(data)
+        while True:
+            header_end = self.buffer.find('\r\n\r\n')
+            if header_end == -1:
+                break
+            content_length = None
+            for header in str(self.buffer[0:header_end]).split('\r\n'):
+                name, _, value = header.partition(':')
+                if name.strip().lower() == 'content-length':
+                    content_length = int(value)
+            if content_length is None:
+                raise ValueError('Content-Length header is missing.')
+            body_start = header_end + 4
+            if len(self.buffer) < body_start + content_length:
+                break
+            messages.append(str(self.buffer[body_start:body_start+content_length]))
+            del self.buffer[0:body_start+content_length]
+        return messages
+
+class TaggingHandle():
+    """
+    Handle which tags the service requests (see TaggedPayload) before handing them over to the server handle so
+    that their results are routed back to us. Requests to start and stop the services are passed through as they are.
+    """
+    def __init__(self, handle, tag):
+        self.handle = handle
+        self.tag = tag
+        self.tagged = False
+
+    def put(self, request):
+        request_id, service_id, payload = request
+        if request_id == ServerRequestId.SEND_SERVICE:
+            payload, self.tagged = TaggedPayload(payload, self.tag), True
+        self.handle.put([request_id, service_id, payload])
+
+class JsonRpcServer():
+    """
+    Single-threaded JSON-RPC dispatcher. Reads the messages from the input file descriptor, forwards them to the
+    services and, as the results come back over the responses transport (see Server.route_tagged_results()), writes
+    them to the output file descriptor. Results may therefore arrive in a different order than requests were issued.
+    """
+    def __init__(self, input_fd, output_fd, handle, responses, cancelled_requests):
+        self.input_fd = input_fd
+        self.output_fd = output_fd
+        self.handle = handle
+        self.responses = responses
+        self.cancelled_requests = cancelled_requests
+        self.reader = MessageReader()
+        self.in_flight = {}     # tag -> request id
+        self.next_tag = 0
+        self.server_running = True
+        self.running = True
+
+    def run(self):
+        while self.process_events():
+            pass
+        self.shutdown()
+
+    def process_events(self, timeout=None):
+        try:
+            readable, _, _ = select.select([self.input_fd, self.responses], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return self.running
+            raise
+        if self.responses in readable:
+            while self.responses.poll():
+                self.__route_response(*self.responses.get())
+        if self.input_fd in readable:
+            data = os.read(self.input_fd, 65536)
+            if not data:
+                logging.info('Client has gone away.')
+                self.running = False
+                return self.running
+            try:
+                messages = self.reader.feed(data)
+            except ValueError as e:
+                logging.error('Malformed message received: {0}.'.format(e))
+                self.running = False
+                return self.running
+            for message in messages:
+                self.__dispatch(message)
+        return self.running
+
+    def shutdown(self):
+        if self.server_running:
+            api.server_stop(self.handle)
+            self.server_running = False
+
+    def __dispatch(self, message):
+        try:
+            message = json_loads(message)
+        except ValueError:
+            self.__send_error(None, JsonRpcErrorCode.PARSE_ERROR, 'Parse error')
+            return
+        if not isinstance(message, dict) or not isinstance(message.get('method', None), str):
+            self.__send_error(message.get('id', None) if isinstance(message, dict) else None, JsonRpcErrorCode.INVALID_REQUEST, 'Invalid request')
+            return
+        method, params, request_id = message['method'], message.get('params', []), message.get('id', None)
+        if method == '$/cancelRequest':
+            self.__cancel(params.get('id', None) if isinstance(params, dict) else None)
+        elif method == 'shutdown':
+            self.shutdown()
+            self.__send_result(request_id, None)
+        elif method == 'exit':
+            self.running = False
+        elif method not in methods:
+            self.__send_error(request_id, JsonRpcErrorCode.METHOD_NOT_FOUND, "Method '{0}' not found".format(method))
+        else:
+            function, param_names = methods[method]
+            required = [name for name in param_names if not isinstance(name, tuple)]
+            optional = [name for name in param_names if isinstance(name, tuple)]
+            try:
+                if isinstance(params, dict):
+                    args = [params[name] for name in required] + [params.get(name, default) for name, default in optional]
+                else:
+                    args = list(params) + [default for name, default in optional[max(0, len(params) - len(required)):]]
+            except (KeyError, TypeError) as e:
+                self.__send_error(request_id, JsonRpcErrorCode.INVALID_PARAMS, 'Missing parameter {0}'.format(e))
+                return
+            if len(args) != len(param_names):
+                self.__send_error(request_id, JsonRpcErrorCode.INVALID_PARAMS, 'Expected parameters: {0}'.format(param_names))
+                return
+            tag, self.next_tag = self.next_tag, (self.next_tag + 1) & 0xFFFFFFFF
+            handle = TaggingHandle(self.handle, tag)
+            function(handle, *args)
+            if handle.tagged and request_id is not None:
+                self.in_flight[tag] = request_id
+            elif request_id is not None:
+                self.__send_result(request_id, None)
+
+    def __cancel(self, request_id):
+        for tag, in_flight_request_id in self.in_flight.items():
+            if in_flight_request_id == request_id:
+                del self.in_flight[tag]
+                self.cancelled_requests.add(tag)
+                self.__send_error(request_id, JsonRpcErrorCode.REQUEST_CANCELLED, 'Request cancelled')
+                return
+
+    def __route_response(self, service_request_id, tag, service_id, success, payload, args):
+        if service_request_id not in (ServiceRequestId.REQUEST, ServiceRequestId.PARTIAL_RESULT) or tag not in self.in_flight:
+            return # Cancelled or not issued by us
+        if service_request_id == ServiceRequestId.PARTIAL_RESULT:
+            send = lambda result: self.__send({'jsonrpc': '2.0', 'method': '$/partialResult', 'params': dict(result, id=self.in_flight[tag])})
+        else:
+            send = functools.partial(self.__send_result, self.in_flight.pop(tag))
+        try:
+            send({'success': success, 'result': args})
+        except (TypeError, ValueError) as e:
+            logging.error("Result of '{0}' cannot be encoded: '{1}'. Sending an empty result instead.".format(payload, e))
+            send({'success': success, 'result': None})
+
+    def __send_result(self, request_id, result):
+        self.__send({'jsonrpc': '2.0', 'id': request_id, 'result': result})
+
+    def __send_error(self, request_id, code, message):
+        self.__send({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}})
+
+    def __send(self, message):
+        data = encode_message(message)
+        while data:
+            data = data[os.write(self.output_fd, data):]
+
+def get_server_instance(handle, args):
+    responses, cancelled_requests = args
+    server = Server(handle, ServicePlugin(), ServicePlugin(), ServicePlugin(), ServicePlugin())
+    server.route_tagged_results(responses, cancelled_requests)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON-RPC front-end to cxxd services.')
+    channel = parser.add_mutually_exclusive_group(required=True)
+    channel.add_argument('--stdio', action='store_true', help='Speak JSON-RPC over stdin/stdout.')
+    channel.add_argument('--socket', help='Speak JSON-RPC over the Unix domain socket created at given path.')
+    parser.add_argument('--log-file', default=os.path.join(tempfile.gettempdir(), 'cxxd_jsonrpc.log'), help='Server log file.')
+    args = parser.parse_args()
+
+    responses, cancelled_requests = Transport(), CancelledRequests()
+    if args.stdio:
+        # Anything written to stdout by us or by the services (which inherit it) would corrupt the message stream.
+        input_fd, output_fd = 0, os.dup(1)
+        os.dup2(2, 1)
+    handle = api.server_start(get_server_instance, [responses, cancelled_requests], args.log_file)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(args.socket)
+        os.chmod(args.socket, 0600)
+        listener.listen(1)
+        connection, _ = listener.accept()
+        input_fd = output_fd = connection.fileno()
+    try:
+        JsonRpcServer(input_fd, output_fd, handle, responses, cancelled_requests).run()
+    finally:
+        if args.socket:
+            listener.close()
+            os.remove(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -67,13 +67,13 @@ class ClangParser():
     def get_compiler_args_db(self):
         return self.compiler_args
 
-    def parse(self, contents_filename, original_filename):
-        def do_parse(contents_filename, original_filename):
+    def parse(self, contents_filename, original_filename, skip_function_bodies=False):
+        def do_parse(contents_filename, original_filename, options=clang.cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD): # TODO CXTranslationUnit_KeepGoing?
             try:
                 return self.index.parse(
                     path = contents_filename,
                     args = self.compiler_args.get(original_filename, contents_filename != original_filename),
-                    options = clang.cindex.TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD # TODO CXTranslationUnit_KeepGoing?
+                    options = options
                 )
             except:
                 logging.error(sys.exc_info())
@@ -81,6 +81,11 @@ class ClangParser():
         logging.info('Filename = {0}'.format(original_filename))
         logging.info('Contents Filename = {0}'.format(contents_filename))
 
+        # Declarations alone are much cheaper to get to: neither the function bodies nor the macros make it into the
+        # AST. Such a tunit is of no use to anybody else so it is not cached.
+        if skip_function_bodies:
+            return do_parse(contents_filename, original_filename, clang.cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES)
+
         # Check if we have this tunit already in the cache ...
         tunit, m_timestamp = self.tunit_cache.fetch(contents_filename)
 
@@ -8,6 +8,7 @@ class CompilerArgs():
         def __init__(self, default_compiler_args, filename):
             self.default_compiler_args = default_compiler_args
             self.cached_compiler_args = []
+            self.database = None
             try:
                 self.database = clang.cindex.CompilationDatabase.fromDirectory(os.path.dirname(filename))
             except:
@@ -60,6 +61,12 @@ class CompilerArgs():
                         compiler_args = list(self.default_compiler_args)
             return compiler_args
 
+        def get_source_files(self):
+            if self.database is None:
+                return None
+            compile_commands = self.database.getAllCompileCommands() or []
+            return [os.path.normpath(os.path.join(compile_cmd.directory, compile_cmd.filename)) for compile_cmd in compile_commands]
+
     class CompileFlagsCompilationDatabase():
         def __init__(self, default_compiler_args, filename):
             self.root_project_directory = ['-working-directory=' + os.path.dirname(filename)] # TODO this assumes that compile_flags.txt is in the root project directory
@@ -68,6 +75,9 @@ class CompilerArgs():
         def get(self, filename):
             return self.compiler_args
 
+        def get_source_files(self):
+            return None
+
     class FallbackCompilationDatabase():
         def __init__(self, default_compiler_args):
             self.default_compiler_args = default_compiler_args
@@ -75,6 +85,9 @@ class CompilerArgs():
         def get(self, filename):
             return self.default_compiler_args
 
+        def get_source_files(self):
+            return None
+
     def __init__(self, compiler_args_filename):
         self.database = None
         self.database_filename = None
@@ -124,6 +137,11 @@ class CompilerArgs():
         logging.info('Compiler args = ' + str(compiler_args))
         return compiler_args
 
+    def get_source_files(self):
+        # Source files the compilation database has the entries for or None if it does not list the files at all
+        # (e.g. 'compile_flags.txt' applies the same args to each and every file)
+        return self.database.get_source_files()
+
     def is_json_database(self, compiler_args_filename):
         return os.path.basename(compiler_args_filename) == 'compile_commands.json'
 
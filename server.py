@@ -1,5 +1,10 @@
+import ctypes
 import logging
+import multiprocessing
 from multiprocessing import Process
+from service import ServiceRequestId
+from service_plugin import RoutingServicePlugin
+from transport import Transport
 from services.clang_format_service import ClangFormat
 from services.clang_tidy_service import ClangTidy
 from services.project_builder_service import ProjectBuilder
@@ -19,11 +24,73 @@ class ServerRequestId():
     SHUTDOWN_SERVICE      = 0xFE
     SHUTDOWN_AND_EXIT     = 0xFF
 
+class ServerHandle():
+    """
+    Handle to the server.
+
+    Server requests (starting and shutting down the services) are sent to the server process but service requests
+    are sent directly to the service process over its own transport, saving one process hop per each request.
+
+    Handle can be used from more than one process at once (i.e. client and the socket front-end running in the
+    server process) which is why the information about which services are started is kept in shared memory.
+    """
+    def __init__(self):
+        self.server_transport = Transport()
+        self.service_transport = {
+            ServiceId.SOURCE_CODE_MODEL : Transport(),
+            ServiceId.PROJECT_BUILDER   : Transport(),
+            ServiceId.CLANG_FORMAT      : Transport(),
+            ServiceId.CLANG_TIDY        : Transport(),
+        }
+        self.service_started = multiprocessing.Array(ctypes.c_bool, len(self.service_transport))
+
+    def put(self, request):
+        request_id, service_id, payload = request
+        with self.service_started.get_lock():
+            if request_id == ServerRequestId.SEND_SERVICE and self.is_service_started(service_id):
+                self.service_transport[service_id].put([ServiceRequestId.REQUEST, payload])
+                return
+            if request_id == ServerRequestId.START_ALL_SERVICES:
+                self.__startup(self.service_transport.keys(), payload)
+            elif request_id == ServerRequestId.START_SERVICE and service_id in self.service_transport:
+                self.__startup([service_id], payload)
+            elif request_id in [ServerRequestId.SHUTDOWN_ALL_SERVICES, ServerRequestId.SHUTDOWN_AND_EXIT]:
+                self.__shutdown(self.service_transport.keys(), payload)
+            elif request_id == ServerRequestId.SHUTDOWN_SERVICE and service_id in self.service_transport:
+                self.__shutdown([service_id], payload)
+            # Server will take care of starting and joining the service processes. Startup and shutdown requests
+            # are written by us, to the same transport as the service requests are, so that their ordering is preserved.
+            self.server_transport.put(request)
+
+    def is_service_started(self, service_id):
+        return service_id in self.service_transport and self.service_started[service_id]
+
+    def get(self):
+        return self.server_transport.get()
+
+    def __startup(self, service_id_list, payload):
+        for service_id in service_id_list:
+            if not self.service_started[service_id]:
+                self.service_transport[service_id].put([ServiceRequestId.STARTUP, payload])
+                self.service_started[service_id] = True
+
+    def __shutdown(self, service_id_list, payload):
+        for service_id in service_id_list:
+            if self.service_started[service_id]:
+                self.service_transport[service_id].put([ServiceRequestId.SHUTDOWN, payload])
+                self.service_started[service_id] = False
+
 class Server():
     class ServiceHandler():
         def __init__(self, service):
             self.service = service
             self.process = None
+            self.forward_requests = True
+
+        def attach_transport(self, transport):
+            # Requests are sent directly by the client over this transport so we must not forward them anymore.
+            self.service.queue = transport
+            self.forward_requests = False
 
         def start_listening(self):
             if self.is_started():
@@ -46,19 +113,22 @@ class Server():
 
         def startup_request(self, payload):
             if self.is_started():
-                self.service.send_startup_request(payload)
+                if self.forward_requests:
+                    self.service.send_startup_request(payload)
             else:
                 logging.warning("Service process must be started before issuing any kind of requests!")
 
         def shutdown_request(self, payload):
             if self.is_started():
-                self.service.send_shutdown_request(payload)
+                if self.forward_requests:
+                    self.service.send_shutdown_request(payload)
             else:
                 logging.warning("Service process must be started before issuing any kind of requests!")
 
         def request(self, payload):
             if self.is_started():
-                self.service.send_request(payload)
+                if self.forward_requests:
+                    self.service.send_request(payload)
             else:
                 logging.warning("Service process must be started before issuing any kind of requests!")
 
@@ -70,6 +140,9 @@ class Server():
             ServiceId.CLANG_FORMAT      : self.ServiceHandler(ClangFormat(clang_format_plugin)),
             ServiceId.CLANG_TIDY        : self.ServiceHandler(ClangTidy(clang_tidy_plugin)),
         }
+        if isinstance(handle, ServerHandle):
+            for service_id, svc_handler in self.service.iteritems():
+                svc_handler.attach_transport(handle.service_transport[service_id])
         self.action = {
             ServerRequestId.START_ALL_SERVICES    : self.__start_all_services,
             ServerRequestId.START_SERVICE         : self.__start_service,
@@ -149,6 +222,13 @@ class Server():
         logging.error("Unknown action triggered! Valid actions are: {0}".format(self.action))
         return self.started_up
 
+    def route_tagged_results(self, transport, cancelled_requests=None):
+        # Must be done before services are started so that service processes inherit the routing plugins.
+        for service_id, svc_handler in self.service.iteritems():
+            svc = svc_handler.service
+            svc.service_plugin = RoutingServicePlugin(svc.service_plugin, service_id, transport, svc.serialize_result)
+            svc.cancelled_requests = cancelled_requests
+
     def process_request(self):
         payload = self.handle.get()
         still_running = self.action.get(int(payload[0]), self.__unknown_action)(int(payload[1]), payload[2])
@@ -1,18 +1,155 @@
+import Queue
+import ctypes
 import logging
-from multiprocessing import Queue
+import multiprocessing
+import select
+import threading
+import time
+import types
+from transport import Transport
 
 # TODO Service impl. is where bits from ServiceHandler impl. should really go
 
+class ServiceRequestId():
+    STARTUP  = 0x0
+    SHUTDOWN = 0x1
+    REQUEST  = 0x2
+    PARTIAL_RESULT = 0x3    # Only ever seen in the routed results (see RoutingServicePlugin)
+
+class TaggedPayload(list):
+    """
+    Service request payload which carries a tag given to it by one of the front-ends so that the result of the
+    request can be routed back to the client who issued it. Otherwise behaves exactly as the original payload.
+    """
+    def __init__(self, payload, tag):
+        list.__init__(self, payload)
+        self.tag = tag
+
+def get_payload_tag(payload):
+    return getattr(payload, 'tag', None)
+
+class ResultPage(list):
+    """
+    One page of the result which service streams back in a series of plugin callbacks rather than all at once (see
+    Service.__stream()). Otherwise behaves exactly as the list of items it holds. Whether more pages are to follow is
+    told by 'last'. 'continuation_token', if any, can be given to the subsequent request in order to pick the result
+    up from where this page ends (i.e. once the request has been cancelled or has reached its limit).
+    """
+    def __init__(self, items, continuation_token=None, last=True):
+        list.__init__(self, items)
+        self.continuation_token = continuation_token
+        self.last = last
+
+class CancelledRequests():
+    """
+    Tags of the requests which have been cancelled by one of the front-ends while they were still waiting in the
+    service queue. Kept in shared memory so that service processes can see the tags which have been added after they
+    were started. Only the most recent 'capacity' tags are remembered which is more than enough given that the
+    cancelled request is usually only a few places behind in the queue.
+    """
+    capacity = 256
+
+    def __init__(self):
+        self.tags = multiprocessing.Array(ctypes.c_longlong, [-1] * CancelledRequests.capacity)
+        self.next = multiprocessing.Value(ctypes.c_uint, 0, lock=False) # Guarded by the tags lock
+
+    def add(self, tag):
+        with self.tags.get_lock():
+            self.tags[self.next.value] = tag
+            self.next.value = (self.next.value + 1) % CancelledRequests.capacity
+
+    def __contains__(self, tag):
+        with self.tags.get_lock():
+            return tag in self.tags[:]
+
+class PluginDispatcher():
+    """
+    Delivers the results to the service plugin from a separate thread so that a slow plugin does not hold back the
+    next request. Callbacks are delivered in the order they were dispatched. Queue is bounded so that results do not
+    pile up if plugin cannot keep up; in which case service is slowed down to the pace of the plugin.
+
+    Until the dispatcher is started (see service_listener()) callbacks are delivered synchronously. Callbacks which
+    must be run from the calling thread (see execute()) are delivered once all of the ones dispatched before them are.
+
+    Time spent in callbacks is accumulated per request type (see Service.get_request_type()) and logged once the
+    dispatcher is stopped.
+    """
+    queue_size = 32
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.stats = {}     # request type -> [number of callbacks, total time, max time]
+
+    def start(self):
+        self.queue = Queue.Queue(PluginDispatcher.queue_size)
+        self.thread = threading.Thread(target=self.__run, name='cxxd_plugin_dispatcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.queue = None
+            for request_type, (count, total, maximum) in sorted(self.stats.iteritems()):
+                logging.info("Plugin callbacks for '{0}': count={1}, avg={2:.3f}s, max={3:.3f}s, total={4:.3f}s".format(
+                    request_type, count, total / count, maximum, total)
+                )
+
+    def dispatch(self, request_type, callback, *args):
+        if self.thread is None:
+            self.__execute(request_type, callback, args)
+            return
+        try:
+            self.queue.put_nowait((request_type, callback, args,))
+        except Queue.Full:
+            logging.warning("Plugin cannot keep up with the service. Waiting for '{0}' callback to be queued ...".format(request_type))
+            self.queue.put((request_type, callback, args,))
+
+    def execute(self, request_type, callback, *args):
+        # Delivers the callback from the calling thread, in order with the callbacks which have been dispatched so far
+        if self.thread is not None:
+            self.queue.join()
+        self.__execute(request_type, callback, args)
+
+    def get_stats(self):
+        return self.stats
+
+    def __run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            self.__execute(*item)
+            self.queue.task_done()
+
+    def __execute(self, request_type, callback, args):
+        start = time.time()
+        try:
+            callback(*args)
+        except:
+            logging.exception("Plugin callback for '{0}' failed.".format(request_type))
+        elapsed = time.time() - start
+        stats = self.stats.setdefault(request_type, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
 class Service():
     def __init__(self, service_plugin):
-        self.queue = Queue()
+        self.queue = Transport()
         self.service_plugin = service_plugin
         self.action = {
-            0x0 : self.__startup_request,
-            0x1 : self.__shutdown_request,
-            0x2 : self.__request
+            ServiceRequestId.STARTUP  : self.__startup_request,
+            ServiceRequestId.SHUTDOWN : self.__shutdown_request,
+            ServiceRequestId.REQUEST  : self.__request
         }
         self.started_up = False
+        self.cancelled_requests = None
+        self.plugin_dispatcher = PluginDispatcher()
         logging.info("Actions: {0}".format(self.action))
 
     def __startup_request(self, payload):
@@ -21,7 +158,7 @@ class Service():
         else:
             logging.info("Service startup ... Payload = {0}".format(payload))
             self.startup_callback(payload)
-            self.service_plugin.startup_callback(True, payload)
+            self.plugin_dispatcher.dispatch('startup', self.service_plugin.startup_callback, True, payload)
             self.started_up = True
         return self.started_up
 
@@ -29,21 +166,65 @@ class Service():
         if self.started_up:
             logging.info("Service shutdown ... Payload = {0}".format(payload))
             self.shutdown_callback(payload)
-            self.service_plugin.shutdown_callback(True, payload)
+            self.plugin_dispatcher.dispatch('shutdown', self.service_plugin.shutdown_callback, True, payload)
             self.started_up = False
         else:
             logging.warning('Service must be started before issuing any other kind of requests!')
         return self.started_up
 
     def __request(self, payload):
-        if self.started_up:
+        if self.started_up and self.__is_cancelled(payload):
+            logging.info("Service request cancelled ... Payload = {0}".format(payload))
+        elif self.started_up:
             logging.info("Service request ... Payload = {0}".format(payload))
             success, args = self.__call__(payload)
-            self.service_plugin.__call__(success, payload, args)
+            if isinstance(args, types.GeneratorType):
+                self.__stream(success, payload, args)
+            else:
+                self.__dispatch_result(self.get_request_type(payload), success, payload, args)
         else:
             logging.warning('Service must be started before issuing any other kind of requests!')
         return self.started_up
 
+    def __stream(self, success, payload, pages):
+        # Service may produce its result in pages, (items, continuation token) at a time, so that the plugin gets to
+        # the first ones while the rest is still being produced. Next page is produced before the current one is
+        # dispatched so that the last one can be told apart. Streaming stops once the request gets cancelled.
+        request_type = self.get_request_type(payload)
+        page = next(pages, None)
+        if page is None:
+            page = ([], None,)
+        while page is not None:
+            if self.__is_cancelled(payload):
+                logging.info("Service request cancelled while streaming the result ... Payload = {0}".format(payload))
+                pages.close()
+                return
+            next_page = next(pages, None)
+            items, continuation_token = page
+            self.__dispatch_result(request_type, success, payload, ResultPage(items, continuation_token, next_page is None))
+            page = next_page
+
+    def __dispatch_result(self, request_type, success, payload, args):
+        # Result which holds live objects (i.e. libclang ones) must not be used from the plugin thread as the service
+        # is about to use the very same objects (e.g. re-parse the translation unit) for the next request. Hence such
+        # results are converted into plain data here, from the service thread, before being dispatched. Results which
+        # are routed to the front-ends are converted by the plugin (see RoutingServicePlugin.prepare()) and the rest
+        # by the service (see serialize_result()). Only the plugins which have opted in to get the live objects (see
+        # ServicePlugin.needs_live_objects) are handed over such results from the service thread instead.
+        prepare = getattr(self.service_plugin, 'prepare', None)
+        if prepare:
+            args = prepare(payload, args)
+        if get_payload_tag(payload) is None and self.holds_live_objects(payload):
+            if getattr(self.service_plugin, 'needs_live_objects', False):
+                self.plugin_dispatcher.execute(request_type, self.service_plugin.__call__, success, payload, args)
+                return
+            args = self.serialize_result(payload, args)
+        self.plugin_dispatcher.dispatch(request_type, self.service_plugin.__call__, success, payload, args)
+
+    def __is_cancelled(self, payload):
+        tag = get_payload_tag(payload)
+        return tag is not None and self.cancelled_requests is not None and tag in self.cancelled_requests
+
     def __unknown_action(self, payload):
         logging.error("Unknown action triggered! Valid actions are: {0}".format(self.action))
         return self.started_up
@@ -57,25 +238,64 @@ class Service():
     def __call__(self, payload):
         return False, None
 
+    def get_request_type(self, payload):
+        return self.__class__.__name__
+
+    def get_background_fds(self):
+        # Services which keep some work running in the background (e.g. in the subprocesses) return the file
+        # descriptors (or objects with fileno()) which become readable once that work has progressed.
+        return []
+
+    def background_callback(self):
+        pass
+
+    def serialize_result(self, payload, args):
+        # Services whose results hold live objects (i.e. libclang ones) override this to convert them into plain data
+        # which can be sent to the front-ends running in other processes.
+        return args
+
+    def holds_live_objects(self, payload):
+        # Services whose results hold live objects override this so that these are converted into plain data (see
+        # serialize_result()) before being used from the plugin thread
+        return False
+
     def process_request(self):
+        # Background work is handled in between the requests, whenever it has progressed and there is no request
+        # waiting, so that it is done from the same thread (and with the same state) as the requests are.
+        while not self.__wait_for_request():
+            self.background_callback()
         payload = self.queue.get()
         still_running = self.action.get(payload[0], self.__unknown_action)(payload[1])
         return still_running
 
+    def __wait_for_request(self):
+        background_fds = self.get_background_fds()
+        if not background_fds:
+            return True
+        readable, _, _ = select.select([self.queue] + background_fds, [], [])
+        return self.queue in readable
+
+    def requests_pending(self):
+        # Long-running requests (e.g. indexing the whole project) can check this to leave the rest of the work for
+        # later and let the requests waiting behind them to be served first
+        return self.queue.poll()
+
     def send_startup_request(self, payload):
-        self.queue.put([0x0, payload])
+        self.queue.put([ServiceRequestId.STARTUP, payload])
 
     def send_shutdown_request(self, payload):
-        self.queue.put([0x1, payload])
+        self.queue.put([ServiceRequestId.SHUTDOWN, payload])
 
     def send_request(self, payload):
-        self.queue.put([0x2, payload])
+        self.queue.put([ServiceRequestId.REQUEST, payload])
 
     def is_started_up(self):
         return self.started_up
 
 def service_listener(service):
+    service.plugin_dispatcher.start()
     keep_listening = True
     while keep_listening:
         keep_listening = service.process_request()
+    service.plugin_dispatcher.stop()
     logging.info('Service listener shut down ...')
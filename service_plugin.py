@@ -1,12 +1,88 @@
+import cPickle
+import logging
+from service import ResultPage
+from service import ServiceRequestId
+from service import get_payload_tag
+
 class ServicePlugin():
+    # Results which hold live objects (i.e. libclang ones) are converted into plain data before being handed over to
+    # the plugin (see Service.serialize_result()). Plugin which needs the live objects instead sets this to True, in
+    # which case it gets such results synchronously, from the service thread.
+    needs_live_objects = False
+
     def __init__(self):
         pass
 
-    def __startup_callback(self, success, payload):
+    def startup_callback(self, success, payload):
         pass
 
-    def __shutdown_callback(self, success, payload):
+    def shutdown_callback(self, success, payload):
         pass
 
     def __call__(self, success, payload, args):
         pass
+
+class RoutedResult():
+    """
+    Result of the tagged request converted into what is routed back to the front-end (see RoutingServicePlugin).
+    """
+    def __init__(self, service_request_id, args):
+        self.service_request_id = service_request_id
+        self.args = args
+
+class RoutingServicePlugin():
+    """
+    Results of requests tagged by one of the front-ends (see TaggedPayload) are routed back to the front-end over
+    the given transport. Results of all the other requests are handed over to the original plugin.
+
+    Result streamed in pages (see ResultPage) is routed as '{'items': [...], 'continuationToken': ...}', one page
+    at a time. All but the last page are routed as PARTIAL_RESULT.
+
+    Results are converted into plain data by prepare() which service runs from its own thread, before the result
+    is dispatched to the plugin thread (see Service.__dispatch_result()).
+    """
+    def __init__(self, service_plugin, service_id, transport, serialize_result=None):
+        self.service_plugin = service_plugin
+        self.service_id = service_id
+        self.transport = transport
+        self.serialize_result = serialize_result if serialize_result else lambda payload, args: args
+
+    @property
+    def needs_live_objects(self):
+        return getattr(self.service_plugin, 'needs_live_objects', False)
+
+    def startup_callback(self, success, payload):
+        if get_payload_tag(payload) is not None:
+            self.__route(ServiceRequestId.STARTUP, success, payload, None)
+        else:
+            self.service_plugin.startup_callback(success, payload)
+
+    def shutdown_callback(self, success, payload):
+        if get_payload_tag(payload) is not None:
+            self.__route(ServiceRequestId.SHUTDOWN, success, payload, None)
+        else:
+            self.service_plugin.shutdown_callback(success, payload)
+
+    def prepare(self, payload, args):
+        if get_payload_tag(payload) is None or isinstance(args, RoutedResult):
+            return args
+        if isinstance(args, ResultPage):
+            return RoutedResult(
+                ServiceRequestId.REQUEST if args.last else ServiceRequestId.PARTIAL_RESULT,
+                {'items': self.serialize_result(payload, args), 'continuationToken': args.continuation_token}
+            )
+        return RoutedResult(ServiceRequestId.REQUEST, self.serialize_result(payload, args))
+
+    def __call__(self, success, payload, args):
+        if get_payload_tag(payload) is not None:
+            routed_result = self.prepare(payload, args)
+            self.__route(routed_result.service_request_id, success, payload, routed_result.args)
+        else:
+            self.service_plugin.__call__(success, payload, args)
+
+    def __route(self, service_request_id, success, payload, args):
+        try:
+            self.transport.put([service_request_id, get_payload_tag(payload), self.service_id, success, list(payload), args])
+        except (cPickle.PicklingError, TypeError, ValueError) as e:
+            logging.error("Result of '{0}' cannot be serialized: '{1}'. Sending an empty result instead.".format(payload, e))
+            self.transport.put([service_request_id, get_payload_tag(payload), self.service_id, success, list(payload), None])
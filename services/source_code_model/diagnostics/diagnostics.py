@@ -1,3 +1,9 @@
+from cxxd.compact_result import CompactResult
+
+class DiagnosticsTable():
+    DIAGNOSTICS = 0x0   # line, column, spelling, severity, category number, category name, first fixit, number of fixits
+    FIXITS      = 0x1   # start line, start column, end line, end column, value
+
 class Diagnostics():
     def __init__(self, parser):
         self.parser = parser
@@ -30,3 +36,24 @@ class Diagnostics():
             self.parser.parse(contents_filename, original_filename)
         )
         return diag_iter is not None, [diag_iter, self.__diagnostics_visitor__, self.__fixit_visitor__]
+
+    def serialize_result(self, payload, args):
+        def fixit_callback(fixit_range, fixit_value, result):
+            result.append(DiagnosticsTable.FIXITS,
+                fixit_range.start.line, fixit_range.start.column, fixit_range.end.line, fixit_range.end.column, result.intern(fixit_value)
+            )
+
+        def diagnostics_callback(line, column, spelling, severity, category_number, category_name, fixits_iterator, result):
+            first_fixit = result.row_count(DiagnosticsTable.FIXITS)
+            self.__fixit_visitor__(fixits_iterator, fixit_callback, result)
+            result.append(DiagnosticsTable.DIAGNOSTICS,
+                line, column, result.intern(spelling), severity, category_number, result.intern(category_name),
+                first_fixit, result.row_count(DiagnosticsTable.FIXITS) - first_fixit
+            )
+
+        diag_iter, diagnostics_visitor, fixit_visitor = args
+        if diag_iter is None:
+            return None
+        result = CompactResult(8, 5)
+        diagnostics_visitor(diag_iter, diagnostics_callback, result)
+        return result
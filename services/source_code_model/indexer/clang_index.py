@@ -20,12 +20,13 @@ sys.path.append(
 )
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Index given list of files.')
+    parser = argparse.ArgumentParser(description='Index the files given over stdin (one JSON-encoded filename per line) and report the progress to stdout.')
     parser.add_argument('--project_root_directory', required=True, help='a root directory of project to be indexed')
     parser.add_argument('--compiler_args_filename', required=True, help='a file containing a list of compiler args to be used while indexing')
-    parser.add_argument('--input_list',             required=True, help='input file containing all source filenames to be indexed (one filename per each line)')
     parser.add_argument('--output_db_filename',     required=True, help='indexing result will be recorded in this file (SQLite db)')
     parser.add_argument('--log_file',               required=True, help='log file to log indexing actions')
+    parser.add_argument('--engine',                 required=False, default='visitor', choices=['visitor', 'callbacks'], help='visit each of the AST nodes (visitor) or let libclang call back for the declarations and references only (callbacks)')
+    parser.add_argument('--headers_db_filename',    required=False, help='symbol database (SQLite db) in which the headers are claimed so that each of them gets indexed only once, in the context of the first source file including it. If not given, only the symbols from the source files themselves are recorded.')
 
     args = parser.parse_args()
 
@@ -33,9 +34,15 @@ if __name__ == "__main__":
     logging.basicConfig(filename=args.log_file, filemode='w', format=FORMAT, datefmt='%H:%M:%S', level=logging.INFO)
  
     import clang_indexer
-    clang_indexer.index_file_list(
+    # stdout is where we report the progress so make sure nobody else writes into it
+    output_stream = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    clang_indexer.index_file_stream(
         args.project_root_directory,
-        args.input_list,
         args.compiler_args_filename,
-        args.output_db_filename
+        args.output_db_filename,
+        sys.stdin,
+        output_stream,
+        args.headers_db_filename,
+        args.engine
     )
@@ -1,30 +1,81 @@
-import linecache
+import clang.cindex
+import collections
+import distutils.spawn
+import hashlib
+import json
 import logging
 import multiprocessing
 import os
+import resource
 import shlex
 import subprocess
+import sys
 import time
 import tempfile
 from cxxd.parser.clang_parser import ClangParser
 from cxxd.parser.tunit_cache import TranslationUnitCache, NoCache
 from cxxd.parser.ast_node_identifier import ASTNodeId
 from cxxd.parser.clang_parser import ChildVisitResult
+from cxxd.compact_result import CompactResult
+import indexer_callbacks
+from indexing_worker import IndexingWorker
+from indexing_worker import IndexingWorkerPool
+from indexing_worker import Throttle
+from line_cache import LineCache
+from project_files import DirectoryScanner
+from project_files import IgnoreRules
 from symbol_database import SymbolDatabase
 
-# TODO move this to utils
-import itertools
-def slice_it(iterable, n, padvalue=None):
-    return itertools.izip_longest(*[iter(iterable)]*n, fillvalue=padvalue)
-
 class SourceCodeModelIndexerRequestId():
     RUN_ON_SINGLE_FILE        = 0x0
     RUN_ON_DIRECTORY          = 0x1
     DROP_SINGLE_FILE          = 0x2
     DROP_ALL                  = 0x3
     FIND_ALL_REFERENCES       = 0x10
+    WORKSPACE_SYMBOL          = 0x11
+    INCOMING_CALLS            = 0x12
+    OUTGOING_CALLS            = 0x13
+    BASE_CLASSES              = 0x14
+    DERIVED_CLASSES           = 0x15
+    INCLUDERS                 = 0x16
 
 class ClangIndexer(object):
+    # Number of references returned in a single page of find-all-references result
+    references_page_size = 500
+
+    # Number of files re-indexed in the background (e.g. includers of the header which has changed) before their
+    # results are merged into the symbol database
+    reindexing_batch_size = 64
+
+    # Indexing engine run by the indexing workers (see index_single_file())
+    indexing_engine = 'visitor'
+
+    # Minimum number of files to be indexed by run-on-directory for the declaration pass to be run first (see
+    # index_single_file()). Their references are then recorded in the background.
+    declaration_pass_min_files = 100
+
+    # Files (not) to be indexed by run-on-directory, in '.gitignore' syntax (see IgnoreRules). Patterns found in
+    # '.cxxdignore' file of the root directory are applied on top of these.
+    ignore_patterns = []
+
+    # Resources the indexing workers get to use so that the editor, and the requests it makes, stay responsive while
+    # the project is being indexed: number of workers (None for one per CPU), niceness, I/O scheduling class and
+    # priority (see ionice(1), None to leave it as it is) and CPUs the workers are pinned to (None for any).
+    max_workers = None
+    worker_nice = 10
+    worker_ionice = (2, 7)
+    worker_cpu_affinity = None
+
+    # Indexing workers are restarted once they have indexed this many files or once their RSS has grown beyond this
+    # many MB, whichever comes first (None for no limit). Memory held by libclang across the translation units is
+    # given back only this way. File which was in flight when the worker has died (e.g. out of memory) is retried once.
+    worker_max_files = 1000
+    worker_max_rss_mb = 2048
+
+    # Whether run-on-directory stops handing out the files to the workers when there are requests waiting to be
+    # served. Files which have been held back are indexed in the background instead.
+    throttle_on_requests = True
+
     supported_ast_node_ids = [
         ASTNodeId.getClassId(),           ASTNodeId.getStructId(),            ASTNodeId.getEnumId(),             ASTNodeId.getEnumValueId(), # handle user-defined types
         ASTNodeId.getUnionId(),           ASTNodeId.getTypedefId(),           ASTNodeId.getUsingDeclarationId(),
@@ -33,18 +84,36 @@ class ClangIndexer(object):
         ASTNodeId.getMacroDefinitionId(), ASTNodeId.getMacroInstantiationId()                                                                # handle macros
     ]
 
-    def __init__(self, parser, root_directory):
+    def __init__(self, parser, root_directory, requests_pending=None):
         self.root_directory         = root_directory
         self.symbol_db              = SymbolDatabase()
         self.symbol_db_name         = '.cxxd_index.db'
         self.symbol_db_path         = os.path.join(self.root_directory, self.symbol_db_name)
         self.parser                 = parser
+        self.requests_pending       = requests_pending
+        self.indexing_worker_pool   = IndexingWorkerPool(
+                                        ClangIndexer.max_workers or multiprocessing.cpu_count(),
+                                        self.__start_indexing_worker,
+                                        ClangIndexer.worker_max_files,
+                                        ClangIndexer.worker_max_rss_mb * 1024 * 1024 if ClangIndexer.worker_max_rss_mb else None,
+                                        self.__release_headers
+                                      )
+        self.line_cache             = LineCache()
+        self.directory_scanner      = DirectoryScanner(cpp_file_extensions)
+        self.background_reports     = []
+        self.outdated_headers       = set()
         self.op = {
             SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE  : self.__run_on_single_file,
             SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY    : self.__run_on_directory,
             SourceCodeModelIndexerRequestId.DROP_SINGLE_FILE    : self.__drop_single_file,
             SourceCodeModelIndexerRequestId.DROP_ALL            : self.__drop_all,
-            SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES : self.__find_all_references
+            SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES : self.__find_all_references,
+            SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL    : self.__workspace_symbol,
+            SourceCodeModelIndexerRequestId.INCOMING_CALLS      : self.__incoming_calls,
+            SourceCodeModelIndexerRequestId.OUTGOING_CALLS      : self.__outgoing_calls,
+            SourceCodeModelIndexerRequestId.BASE_CLASSES        : self.__base_classes,
+            SourceCodeModelIndexerRequestId.DERIVED_CLASSES     : self.__derived_classes,
+            SourceCodeModelIndexerRequestId.INCLUDERS           : self.__includers
         }
 
     def symbol_db_exists(self):
@@ -53,6 +122,21 @@ class ClangIndexer(object):
     def get_symbol_db(self):
         return self.symbol_db
 
+    def close(self):
+        self.indexing_worker_pool.close()
+        self.line_cache.clear()
+        self.directory_scanner.close()
+
+    def get_background_fds(self):
+        return self.indexing_worker_pool.busy_workers()
+
+    def background_callback(self):
+        # Results are merged once the whole batch is done, which is when the next one is started
+        self.background_reports.extend(self.indexing_worker_pool.receive())
+        if not self.indexing_worker_pool.busy_workers():
+            self.__index([])
+            self.indexing_worker_pool.start_batch(ClangIndexer.reindexing_batch_size)
+
     def __call__(self, args):
         return self.op.get(int(args[0]), self.__unknown_op)(int(args[0]), args[1:len(args)])
 
@@ -67,15 +151,23 @@ class ClangIndexer(object):
             contents_filename = str(args[1])
             if contents_filename == original_filename: # Files modified but not saved will _NOT_ get indexed
                 self.symbol_db.open(self.symbol_db_path)
-                self.symbol_db.delete(remove_root_dir_from_filename(self.root_directory, original_filename))
-                success = index_single_file(
-                    self.parser,
-                    self.root_directory,
-                    contents_filename,
-                    original_filename,
-                    self.symbol_db
-                )
-                # TODO what if index_single_file() fails? we should revert the symbol_db.delete() back
+                relative_filename = remove_root_dir_from_filename(self.root_directory, original_filename)
+                includer_headers, includer_files = self.__get_includers(relative_filename)
+                if is_header(original_filename):
+                    # Headers are not indexed on their own but in the context of the files including them
+                    self.__outdate_headers([relative_filename] + includer_headers)
+                    success = True
+                else:
+                    self.symbol_db.delete(relative_filename)
+                    self.symbol_db.flush() # Workers claim the headers in this very database (see get_recorded_files())
+                    reports = self.__index([original_filename])
+                    success = len(reports) == 1 and reports[0][1]
+                    # TODO what if index_single_file() fails? we should revert the symbol_db.delete() back
+                    if success:
+                        self.__record_file_state(original_filename)
+                        self.__outdate_headers(includer_headers)
+                if success:
+                    self.__schedule_includers(original_filename, includer_files)
             else:
                 logging.warning('Indexing will not take place on existing files whose contents were modified but not saved.')
         else:
@@ -83,86 +175,214 @@ class ClangIndexer(object):
         return success, None
 
     def __run_on_directory(self, id, args):
-        if not self.symbol_db_exists():
-            logging.info("Starting to index whole directory '{0}' ... ".format(self.root_directory))
-
-            # Establish the connection first and create an empty symbol database
-            self.symbol_db.open(self.symbol_db_path)
-
-            # When creating the symbol db for the first time we need to create a data model for it
-            self.symbol_db.create_data_model()
-
-            # Build-up a list of source code files from given project directory
-            cpp_file_list = get_cpp_file_list(self.root_directory)
-
-            indexing_subprocess_list = []
-            symbol_db_list = []
-            indexer_input_list = []
-
-            # We will slice the input file list into a number of chunks which corresponds to the amount of available CPU cores
-            how_many_chunks = len(cpp_file_list) / multiprocessing.cpu_count()
-
-            # Now we are able to parallelize the indexing operation across different CPU cores
-            for cpp_file_list_chunk in slice_it(cpp_file_list, how_many_chunks):
-
-                # Each subprocess will get a file containing source files to be indexed
-                indexer_input_handle, indexer_input = create_indexer_input_list_file(self.root_directory, '.cxxd_idx_input', cpp_file_list_chunk)
-
-                # Each subprocess will get an empty DB file to record indexing results into it
-                symbol_db_handle, symbol_db = create_empty_symbol_db(self.root_directory, self.symbol_db_name)
-
-                # Start indexing a given chunk in a new subprocess
-                #   Note: Running and handling subprocesses as following, and not via multiprocessing.Process module,
-                #         is done intentionally and more or less it served as a (very ugly) workaround because of several reasons:
-                #           (1) 'libclang' is not made thread safe which is why we want to utilize it from different
-                #               processes (e.g. each process will get its own instance of 'libclang')
-                #           (2) Python bindings for 'libclang' implement some sort of module caching mechanism which basically
-                #               contradicts with the intent from (1)
-                #           (3) Point (2) seems to be a Pythonic way of implementing modules which basically obscures
-                #               the way how different instances of libraries (modules?) across different processes
-                #               should behave
-                #           (4) Python does have a way to handle such situations (module reloading) but seems that it
-                #               works only for the simplest cases which is unfortunally not the case here
-                #           (5) Creating a new process via subprocess.Popen interface and running the indexing operation
-                #               from another Python script ('clang_index.py') is the only way how I managed to get it
-                #               working correctly (each process will get their own instance of library)
-                indexing_subprocess = start_indexing_subprocess(
-                    self.root_directory,
-                    self.parser.get_compiler_args_db().filename(),
-                    indexer_input,
-                    symbol_db,
-                    logging.getLoggerClass().root.handlers[0].baseFilename + '_' + str(len(indexing_subprocess_list)+1)
-                )
-
-                # Store handles to subprocesses and corresponding tmp files so we can handle them later on
-                indexing_subprocess_list.append(indexing_subprocess)
-                symbol_db_list.append(symbol_db)
-                indexer_input_list.append(indexer_input)
-
-            # Wait indexing subprocesses to finish with their work
-            for indexing_subprocess in indexing_subprocess_list:
-                indexing_subprocess.wait()
-
-            # Merge the results of indexing operations into the single symbol database
-            self.symbol_db.insert_from(symbol_db_list)
-
-            # Get rid of temporary symbol db's & indexer input list filenames
-            for symbol_db, indexer_input in zip(symbol_db_list, indexer_input_list):
-                os.remove(symbol_db)
-                os.remove(indexer_input)
-
-            # TODO how to count total CPU time, for all sub-processes?
-            logging.info("Indexing {0} is completed.".format(self.root_directory))
+        logging.info("Starting to index whole directory '{0}' ... ".format(self.root_directory))
+
+        # Establish the connection first and create the data model (which is a no-op if symbol database already exists)
+        self.symbol_db.open(self.symbol_db_path)
+        self.symbol_db.create_data_model()
+
+        # Build-up a list of source code files from the compilation database if it lists them, together with the
+        # headers reachable from them. Otherwise, whatever is found in the project directory is taken.
+        ignore_rules = IgnoreRules.from_directory(self.root_directory, ClangIndexer.ignore_patterns)
+        compilation_database_files = self.parser.get_compiler_args_db().get_source_files()
+        if compilation_database_files is None:
+            cpp_file_list = get_cpp_file_list(self.root_directory, ignore_rules, self.directory_scanner)
+        else:
+            cpp_file_list = get_compilation_database_file_list(self.root_directory, compilation_database_files, self.symbol_db.get_included_files(), ignore_rules)
+
+        # Only new and changed files are going to be indexed. Whatever has been left in 'indexed_files' after
+        # that, has been removed from the project directory in the meantime.
+        indexed_files = self.symbol_db.get_all_files()
+        declarations_only_files = set(self.symbol_db.get_declarations_only_files())
+        changed_file_list, changed_header_list, source_files, file_states = [], [], 0, {}
+        reference_pass_list = [] # Files which are up-to-date but whose references are yet to be recorded
+        for filename in cpp_file_list:
+            relative_filename = remove_root_dir_from_filename(self.root_directory, filename)
+            indexed_file_state = indexed_files.pop(relative_filename, None)
+            file_state, up_to_date = get_file_state(filename, self.__get_compiler_args_hash(filename), indexed_file_state)
+            if is_header(filename):
+                if not up_to_date:
+                    changed_header_list.append(relative_filename)
+            else:
+                source_files += 1
+                if not up_to_date:
+                    changed_file_list.append((file_state[1], filename,))
+                elif relative_filename in declarations_only_files:
+                    reference_pass_list.append((file_state[1], filename,))
+            if file_state != indexed_file_state:
+                file_states[relative_filename] = file_state
+        changed_files = len(changed_file_list) + len(changed_header_list)
+
+        # Headers are indexed in the context of the files including them (see get_recorded_files()) so the ones which
+        # have changed (or have been removed) are taken care of by re-indexing their includers. These have to be found
+        # before any of the symbols, together with the includes recorded along with them, are deleted.
+        includer_headers, includer_files = collections.OrderedDict(), collections.OrderedDict()
+        for relative_filename in changed_header_list + [filename for filename in indexed_files.iterkeys() if is_header(filename)]:
+            headers, files = self.__get_includers(relative_filename)
+            includer_headers.update((header, None) for header in headers if header not in file_states)
+            includer_files.update((filename, None) for filename in files)
+        changed_file_set = set(filename for size, filename in changed_file_list)
+        changed_file_list.extend(
+            (os.path.getsize(filename), filename,) for filename in includer_files.iterkeys() if filename not in changed_file_set and os.path.exists(filename)
+        )
+
+        if self.indexing_worker_pool.busy_workers():
+            self.__index([]) # Files in flight might have claimed some of the headers which are about to be deleted
+        self.__outdate_headers(includer_headers.keys())
+        for size, filename in changed_file_list:
+            self.symbol_db.delete(remove_root_dir_from_filename(self.root_directory, filename))
+        for relative_filename in changed_header_list:
+            self.symbol_db.delete(relative_filename)
+        for relative_filename in indexed_files.iterkeys():
+            self.symbol_db.delete(relative_filename)
+            self.symbol_db.delete_file(relative_filename)
+        self.symbol_db.flush()
+        logging.info("{0} file(s) changed, {1} file(s) up-to-date, {2} file(s) removed. {3} file(s) to be indexed.".format(
+            changed_files, len(cpp_file_list) - changed_files, len(indexed_files), len(changed_file_list))
+        )
+
+        # Files are handed out to the workers one at a time, biggest ones first, as size is the best cheap estimate
+        # we have of how long it will take to index the file. This way we do not end up waiting for a single worker
+        # which got stuck with a few heavy files at the end.
+        changed_file_list = [filename for size, filename in sorted(changed_file_list, reverse=True)]
+
+        # When (re-)indexing the whole project, it is much cheaper to build the indexes once all of the symbols are
+        # in than to maintain them on each insert. Incremental runs are small enough to keep them as they are.
+        full_run = len(changed_file_list) > 0 and len(changed_file_list) == source_files
+        if full_run:
+            self.symbol_db.begin_bulk_load()
+
+        # Big runs (e.g. a fresh checkout) record the declarations first, which is what the navigation (e.g.
+        # go-to-definition) needs, and leave the references to be recorded by re-indexing the files in the background.
+        # Until then, the files (and the headers they have claimed) are marked as indexed by the declaration pass only.
+        declaration_pass = len(changed_file_list) >= ClangIndexer.declaration_pass_min_files
+
+        # Requests which arrive in the meantime (e.g. the ones the user makes while the project is being opened) are
+        # not kept waiting until the whole project is indexed: workers get no more files once there are any and the
+        # rest of the files is indexed in the background instead, from in between the requests.
+        throttle = Throttle(self.requests_pending) if self.requests_pending and ClangIndexer.throttle_on_requests else None
+        reports = self.__index(changed_file_list, declaration_pass, throttle)
+        for filename, success, elapsed in reports:
+            if not success:
+                file_states.pop(remove_root_dir_from_filename(self.root_directory, filename), None) # To be retried on the next run
+        held_back_file_list = throttle.held_back if throttle else []
+        if held_back_file_list:
+            held_back_file_set = set(held_back_file_list)
+            changed_file_list = [filename for filename in changed_file_list if filename not in held_back_file_set]
+            for filename in held_back_file_list:
+                file_states.pop(remove_root_dir_from_filename(self.root_directory, filename), None) # Not indexed yet
+
+        # Indexing is completed so we can record the state of files we have just indexed
+        indexed_at = time.time()
+        indexed_file_set = set(remove_root_dir_from_filename(self.root_directory, filename) for filename in changed_file_list)
+        declarations_only_files = (declarations_only_files - indexed_file_set) | (indexed_file_set if declaration_pass else set())
+        if compilation_database_files is not None:
+            # Headers which have just been reached for the first time are recorded too, otherwise they would be taken
+            # as changed on the next run
+            listed_file_set = set(cpp_file_list)
+            for filename in get_compilation_database_file_list(self.root_directory, [], self.symbol_db.get_included_files(), ignore_rules):
+                if filename not in listed_file_set:
+                    file_states[remove_root_dir_from_filename(self.root_directory, filename)] = get_file_state(filename, self.__get_compiler_args_hash(filename))[0]
+        # Headers which are included by the indexed files but which none of them has claimed (e.g. the ones including
+        # it have failed to index) are left as not indexed until some of them does
+        claimed_headers, included_files = set(self.symbol_db.get_claimed_headers()), set(self.symbol_db.get_included_files())
+        for relative_filename in [filename for filename in file_states.iterkeys() if is_header(filename)]:
+            if relative_filename in included_files and relative_filename not in claimed_headers:
+                del file_states[relative_filename]
+                self.outdated_headers.add(os.path.join(self.root_directory, relative_filename))
+        for relative_filename, (mtime, size, content_hash, compiler_args_hash) in file_states.iteritems():
+            declarations_only = relative_filename in declarations_only_files and not is_header(relative_filename)
+            self.symbol_db.insert_file(relative_filename, mtime, size, content_hash, compiler_args_hash, indexed_at, declarations_only)
+        if full_run:
+            self.symbol_db.end_bulk_load()
         else:
-            logging.info("Directory '{0}' already indexed ... ".format(self.root_directory))
-        return True, None
+            self.symbol_db.flush()
+
+        if declaration_pass:
+            reference_pass_list = [(os.path.getsize(filename), filename,) for filename in changed_file_list] + reference_pass_list
+        if reference_pass_list:
+            reference_pass_list = [filename for size, filename in sorted(reference_pass_list, reverse=True)]
+            logging.info("{0} file(s) scheduled for recording the references.".format(len(reference_pass_list)))
+            self.__schedule_in_background(reference_pass_list)
+        if held_back_file_list:
+            logging.info("{0} file(s) held back are scheduled for indexing in the background.".format(len(held_back_file_list)))
+            self.__schedule_in_background(held_back_file_list)
+
+        # TODO how to count total CPU time, for all sub-processes?
+        logging.info("Indexing {0} is completed.".format(self.root_directory))
+        return True, [changed_files, len(cpp_file_list) - changed_files, len(indexed_files)]
+
+    def __get_includers(self, relative_filename):
+        # Headers (relative filenames) and source files (absolute filenames) including the given one, directly or not
+        includer_headers, includer_files = collections.OrderedDict(), collections.OrderedDict()
+        for includer, line, included in self.symbol_db.get_includers(relative_filename):
+            includer = includer.encode('utf8', 'ignore')
+            if includer == relative_filename:
+                continue
+            if is_header(includer):
+                includer_headers[includer] = None
+            else:
+                includer_files[os.path.join(self.root_directory, includer)] = None
+        return includer_headers.keys(), includer_files.keys()
+
+    def __outdate_headers(self, relative_filenames):
+        # Symbols of the headers are deleted and they get to be claimed, and recorded again, by whichever of the files
+        # including them is indexed next (see get_recorded_files()). Until then, headers are treated as not indexed
+        # so that they are taken care of even if that never happens (e.g. cxxd is shut down in the meantime).
+        if not relative_filenames:
+            return
+        if self.indexing_worker_pool.busy_workers():
+            self.__index([]) # Files in flight might have claimed some of the headers already
+        for relative_filename in relative_filenames:
+            self.symbol_db.delete(relative_filename)
+            self.symbol_db.outdate_file(relative_filename)
+            self.outdated_headers.add(os.path.join(self.root_directory, relative_filename))
+        self.symbol_db.flush() # Workers claim the headers in this very database
+
+    def __record_outdated_headers(self):
+        # Headers are recorded again once all of the files scheduled for re-indexing have been merged, but only the
+        # ones which have been claimed by any of them. The rest is left as not indexed (see __outdate_headers()).
+        if self.outdated_headers and not self.indexing_worker_pool.scheduled and not self.indexing_worker_pool.busy_workers():
+            claimed_headers = set(self.symbol_db.get_claimed_headers())
+            for filename in self.outdated_headers:
+                if os.path.exists(filename) and remove_root_dir_from_filename(self.root_directory, filename) in claimed_headers:
+                    self.__record_file_state(filename)
+            self.outdated_headers = set()
+
+    def __release_headers(self, filename):
+        # Headers claimed for the file which has failed to index are outdated, together with whatever of them has been
+        # recorded, so that they get to be claimed again by the next one including them
+        released_headers = self.symbol_db.get_claimed_headers(remove_root_dir_from_filename(self.root_directory, filename))
+        for relative_filename in released_headers:
+            self.symbol_db.delete(relative_filename)
+            self.symbol_db.outdate_file(relative_filename)
+            self.outdated_headers.add(os.path.join(self.root_directory, relative_filename))
+        if released_headers:
+            logging.info("{0} header(s) claimed for '{1}' released.".format(len(released_headers), filename))
+            self.symbol_db.flush()
+
+    def __schedule_includers(self, filename, includer_files):
+        # Symbols recorded from the files including the one which has changed (e.g. references to the symbols
+        # declared in the header) might be stale now so all of them are re-indexed in the background
+        if includer_files:
+            logging.info("{0} file(s) including '{1}' scheduled for re-indexing.".format(len(includer_files), filename))
+            self.__schedule_in_background(includer_files)
+        self.__record_outdated_headers()
+
+    def __schedule_in_background(self, file_list):
+        self.indexing_worker_pool.schedule(file_list)
+        if not self.indexing_worker_pool.busy_workers():
+            self.indexing_worker_pool.start_batch(ClangIndexer.reindexing_batch_size)
 
     def __drop_single_file(self, id, args):
         symbol_db_exists = self.symbol_db_exists()
         if symbol_db_exists:
             filename = str(args[0])
             self.symbol_db.open(self.symbol_db_path)
-            self.symbol_db.delete(remove_root_dir_from_filename(self.root_directory, filename))
+            relative_filename = remove_root_dir_from_filename(self.root_directory, filename)
+            self.symbol_db.delete(relative_filename)
+            self.symbol_db.delete_file(relative_filename)
+            self.symbol_db.flush() # Workers claim the headers in this very database so it cannot be kept locked
         else:
             logging.error('Action cannot be run if symbol database does not exist yet!')
         return symbol_db_exists, None
@@ -170,8 +390,13 @@ class ClangIndexer(object):
     def __drop_all(self, id, args):
         symbol_db_exists = self.symbol_db_exists()
         if symbol_db_exists:
+            self.indexing_worker_pool.cancel()
+            self.indexing_worker_pool.clear()
+            self.background_reports = []
+            self.outdated_headers = set()
             self.symbol_db.open(self.symbol_db_path)
             self.symbol_db.delete_all()
+            self.symbol_db.flush()
             delete_file_from_disk = bool(args[0])
             if delete_file_from_disk:
                 self.symbol_db.close()
@@ -182,107 +407,604 @@ class ClangIndexer(object):
         return symbol_db_exists, None
 
     def __find_all_references(self, id, args):
-        tunit, cursor, references = None, None, []
-        if self.symbol_db_exists():
-            tunit = self.parser.parse(str(args[0]), str(args[0]))
-            cursor = self.parser.get_cursor(tunit, int(args[1]), int(args[2]))
-            if cursor:
-                # TODO In order to make find-all-references work on edited (and not yet saved) files,
-                #      we would need to manipulate directly with USR.
-                #      In case of edited files, USR contains a name of a temporary file we serialized
-                #      the contents in and therefore will not match the USR in the database (which in
-                #      contrast contains an original filename).
-                usr = cursor.referenced.get_usr() if cursor.referenced else cursor.get_usr()
-                self.symbol_db.open(self.symbol_db_path)
-                for ref in self.symbol_db.get_by_usr(usr).fetchall():
-                    references.append([
-                        os.path.join(self.root_directory, self.symbol_db.get_filename(ref)),
-                        self.symbol_db.get_line(ref),
-                        self.symbol_db.get_column(ref),
-                        self.symbol_db.get_context(ref)
-                    ])
-                logging.info("Find-all-references operation completed for '{0}', [{1}, {2}], '{3}'".format(
-                    cursor.displayname, cursor.location.line, cursor.location.column, tunit.spelling)
-                )
-            logging.info("\n{0}".format('\n'.join(str(ref) for ref in references)))
-        else:
+        # args: filename, line, column[, limit[, continuation token]]
+        # References are streamed in pages (see Service.__stream()). Each page comes with the continuation token
+        # ([USR, number of references returned so far]) which can be given to the next request to pick up where
+        # the last page ended. Symbol under the cursor does not need to be looked up again in that case.
+        limit = int(args[3]) if len(args) > 3 and args[3] is not None else None
+        continuation_token = args[4] if len(args) > 4 else None
+        usr, offset = continuation_token if continuation_token else (None, 0,)
+        if not self.symbol_db_exists():
+            logging.error('Action cannot be run if symbol database does not exist yet!')
+            return False, self.__reference_pages(None, 0, limit)
+        if usr is None:
+            usr = self.__get_usr(args[0], args[1], args[2], 'Find-all-references')
+            if usr is None:
+                return False, self.__reference_pages(None, 0, limit)
+        self.symbol_db.open(self.symbol_db_path)
+        return True, self.__reference_pages(usr, int(offset), limit)
+
+    def __get_usr(self, filename, line, column, operation):
+        # USR of the symbol under the cursor or None if there is no symbol
+        tunit = self.parser.parse(str(filename), str(filename))
+        cursor = self.parser.get_cursor(tunit, int(line), int(column)) if tunit else None
+        if not cursor:
+            return None
+        # TODO In order to make find-all-references work on edited (and not yet saved) files,
+        #      we would need to manipulate directly with USR.
+        #      In case of edited files, USR contains a name of a temporary file we serialized
+        #      the contents in and therefore will not match the USR in the database (which in
+        #      contrast contains an original filename).
+        logging.info("{0} operation started for '{1}', [{2}, {3}], '{4}'".format(
+            operation, cursor.displayname, cursor.location.line, cursor.location.column, tunit.spelling)
+        )
+        return cursor.referenced.get_usr() if cursor.referenced else cursor.get_usr()
+
+    def __reference_pages(self, usr, offset, limit):
+        if usr is None:
+            return
+        start, count = time.time(), 0
+        rows = self.symbol_db.get_by_usr(usr, offset)
+        while True:
+            page_size = ClangIndexer.references_page_size if limit is None else min(ClangIndexer.references_page_size, limit - count)
+            references = []
+            for ref in rows.fetchmany(page_size) if page_size > 0 else []:
+                filename = os.path.join(self.root_directory, self.symbol_db.get_filename(ref))
+                references.append([
+                    filename,
+                    self.symbol_db.get_line(ref),
+                    self.symbol_db.get_column(ref),
+                    self.line_cache.getline(filename, self.symbol_db.get_line(ref))
+                ])
+            count += len(references)
+            limit_reached = limit is not None and count >= limit
+            if len(references) < page_size:
+                more = False
+            elif limit_reached:
+                more = rows.fetchone() is not None
+            else:
+                more = True # Possibly followed by an empty page
+            yield references, [usr, offset + count] if more else None
+            if not more or limit_reached:
+                break
+        logging.info("Find-all-references returned {0} reference(s) of '{1}' in {2:.3f}s.".format(count, usr, time.time() - start))
+
+    def __workspace_symbol(self, id, args):
+        # args: query[, limit]
+        if not self.symbol_db_exists():
+            logging.error('Action cannot be run if symbol database does not exist yet!')
+            return False, None
+        query, limit = args[0], int(args[1]) if len(args) > 1 and args[1] is not None else 100
+        start = time.time()
+        self.symbol_db.open(self.symbol_db_path)
+        symbols = [
+            [name, qualified_name, kind, os.path.join(self.root_directory, filename), line, column]
+            for name, qualified_name, kind, filename, line, column in self.symbol_db.find_symbols(query, limit)
+        ]
+        logging.info("Workspace symbol search for '{0}' returned {1} symbol(s) in {2:.3f}s.".format(query, len(symbols), time.time() - start))
+        return True, symbols
+
+    def __incoming_calls(self, id, args):
+        return self.__calls(args, self.symbol_db.get_incoming_calls, 'Incoming-calls')
+
+    def __outgoing_calls(self, id, args):
+        return self.__calls(args, self.symbol_db.get_outgoing_calls, 'Outgoing-calls')
+
+    def __calls(self, args, get_calls, operation):
+        # args: filename, line, column[, USR]
+        # USR of the function, once known (e.g. from the result of previous request), can be given instead of
+        # looking it up again, which is what expanding the call hierarchy level by level comes down to.
+        if not self.symbol_db_exists():
+            logging.error('Action cannot be run if symbol database does not exist yet!')
+            return False, None
+        usr = args[3] if len(args) > 3 and args[3] else self.__get_usr(args[0], args[1], args[2], operation)
+        if usr is None:
+            return False, None
+        start = time.time()
+        self.symbol_db.open(self.symbol_db_path)
+        calls = [
+            [name.encode('utf8', 'ignore'), (qualified_name or u'').encode('utf8', 'ignore'), other_usr.encode('utf8', 'ignore'),
+             os.path.join(self.root_directory, filename.encode('utf8', 'ignore')), line, column]
+            for name, qualified_name, other_usr, filename, line, column in get_calls(usr)
+        ]
+        logging.info("{0} returned {1} call(s) of '{2}' in {3:.3f}s.".format(operation, len(calls), usr, time.time() - start))
+        return True, calls
+
+    def __base_classes(self, id, args):
+        return self.__type_hierarchy(args, self.symbol_db.get_base_classes, 'Base-classes')
+
+    def __derived_classes(self, id, args):
+        return self.__type_hierarchy(args, self.symbol_db.get_derived_classes, 'Derived-classes')
+
+    def __type_hierarchy(self, args, get_classes, operation):
+        # args: filename, line, column[, USR[, transitive]]
+        # Each of the derivations found comes with the USR of the class on this end of it so that the whole hierarchy
+        # (transitive, by default) can be rebuilt from a single response.
+        if not self.symbol_db_exists():
             logging.error('Action cannot be run if symbol database does not exist yet!')
-        return tunit is not None and cursor is not None, references
+            return False, None
+        usr = args[3] if len(args) > 3 and args[3] else self.__get_usr(args[0], args[1], args[2], operation)
+        if usr is None:
+            return False, None
+        transitive = bool(args[4]) if len(args) > 4 else True
+        start = time.time()
+        self.symbol_db.open(self.symbol_db_path)
+        classes = [
+            [name.encode('utf8', 'ignore'), (qualified_name or u'').encode('utf8', 'ignore'), other_usr.encode('utf8', 'ignore'),
+             this_usr.encode('utf8', 'ignore'), os.path.join(self.root_directory, filename.encode('utf8', 'ignore')), line, column, access, bool(is_virtual)]
+            for name, qualified_name, other_usr, this_usr, filename, line, column, access, is_virtual in get_classes(usr, transitive)
+        ]
+        logging.info("{0} returned {1} derivation(s) of '{2}' in {3:.3f}s.".format(operation, len(classes), usr, time.time() - start))
+        return True, classes
+
+    def __includers(self, id, args):
+        # args: filename[, transitive]
+        if not self.symbol_db_exists():
+            logging.error('Action cannot be run if symbol database does not exist yet!')
+            return False, None
+        transitive = bool(args[1]) if len(args) > 1 else True
+        start = time.time()
+        self.symbol_db.open(self.symbol_db_path)
+        includers = [
+            [os.path.join(self.root_directory, includer.encode('utf8', 'ignore')), line, os.path.join(self.root_directory, included.encode('utf8', 'ignore'))]
+            for includer, line, included in self.symbol_db.get_includers(remove_root_dir_from_filename(self.root_directory, str(args[0])), transitive)
+        ]
+        logging.info("Includers returned {0} include(s) of '{1}' in {2:.3f}s.".format(len(includers), args[0], time.time() - start))
+        return True, includers
+
+    def __index(self, file_list, declarations_only=False, throttle=None):
+        start, rows_written = time.time(), self.symbol_db.rows_written
+
+        # Workers are about to be merged and cleared so the files they are re-indexing in the background have to
+        # be finished first. Whatever is left of the batch is handed out again later on (see background_callback()).
+        background_reports, self.background_reports = self.background_reports + self.indexing_worker_pool.drain(), []
+        if background_reports and self.indexing_worker_pool.batch_started_at:
+            # Effective throughput, which includes the time spent on serving the requests in between
+            batch_time = time.time() - self.indexing_worker_pool.batch_started_at
+            logging.info("{0} file(s) indexed in the background in {1:.2f}s ({2:.1f} files/s).".format(
+                len(background_reports), batch_time, len(background_reports) / batch_time if batch_time else 0)
+            )
+        self.indexing_worker_pool.batch_started_at = None
 
-def index_file_list(root_directory, input_filename_list, compiler_args_filename, output_db_filename):
+        # Feed the workers until there is no more files left to be indexed (or until the throttle holds them back)
+        reports = self.indexing_worker_pool.index(file_list, declarations_only, throttle)
+
+        # Symbols of the files re-indexed in the background are replaced only if re-indexing has succeeded
+        reindexed_file_list = [filename for filename, success, elapsed in background_reports if success]
+        for filename in reindexed_file_list:
+            self.symbol_db.delete(remove_root_dir_from_filename(self.root_directory, filename))
+
+        # Merge the results of indexing operations into the single symbol database. Files whose results are in the
+        # databases which could not be merged are reported as failed and are indexed again on the next run.
+        skipped_db_list = self.symbol_db.insert_from(self.indexing_worker_pool.output_db_filenames())
+        lost_file_set = set(self.indexing_worker_pool.files_recorded_into(skipped_db_list))
+        if lost_file_set:
+            logging.error("Results of {0} indexed file(s) could not be merged.".format(len(lost_file_set)))
+            reports = [(filename, success and filename not in lost_file_set, elapsed,) for filename, success, elapsed in reports]
+            reindexed_file_list = [filename for filename in reindexed_file_list if filename not in lost_file_set]
+            for filename in lost_file_set:
+                self.symbol_db.outdate_file(remove_root_dir_from_filename(self.root_directory, filename))
+            self.symbol_db.flush()
+        self.indexing_worker_pool.clear()
+        for filename, success, elapsed in reports + background_reports:
+            if not success or filename in lost_file_set:
+                self.__release_headers(filename)
+        for filename in reindexed_file_list:
+            self.__record_file_state(filename)
+        self.__record_outdated_headers()
+
+        elapsed, rows_written = time.time() - start, self.symbol_db.rows_written - rows_written
+        if file_list or reindexed_file_list:
+            logging.info("{0} symbol(s) from {1} file(s) written in {2:.2f}s ({3:.0f} rows/s).".format(
+                rows_written, len(file_list) + len(reindexed_file_list), elapsed, rows_written / elapsed if elapsed else 0)
+            )
+        return reports
+
+    def __start_indexing_worker(self, worker_id, symbol_db=None):
+        # Each worker will get an empty DB file to record indexing results into it, unless it takes over the one of
+        # the worker it replaces (see IndexingWorkerPool.recycle())
+        if symbol_db is None:
+            symbol_db_handle, symbol_db = create_empty_symbol_db(self.root_directory, self.symbol_db_name)
+            os.close(symbol_db_handle)
+
+        # Start the indexing worker in a new subprocess
+        #   Note: Running and handling subprocesses as following, and not via multiprocessing.Process module,
+        #         is done intentionally and more or less it served as a (very ugly) workaround because of several reasons:
+        #           (1) 'libclang' is not made thread safe which is why we want to utilize it from different
+        #               processes (e.g. each process will get its own instance of 'libclang')
+        #           (2) Python bindings for 'libclang' implement some sort of module caching mechanism which basically
+        #               contradicts with the intent from (1)
+        #           (3) Point (2) seems to be a Pythonic way of implementing modules which basically obscures
+        #               the way how different instances of libraries (modules?) across different processes
+        #               should behave
+        #           (4) Python does have a way to handle such situations (module reloading) but seems that it
+        #               works only for the simplest cases which is unfortunally not the case here
+        #           (5) Creating a new process via subprocess.Popen interface and running the indexing operation
+        #               from another Python script ('clang_index.py') is the only way how I managed to get it
+        #               working correctly (each process will get their own instance of library)
+        indexing_subprocess = start_indexing_subprocess(
+            self.root_directory,
+            self.parser.get_compiler_args_db().filename(),
+            symbol_db,
+            logging.getLoggerClass().root.handlers[0].baseFilename + '_' + str(worker_id+1),
+            self.symbol_db_path,
+            ClangIndexer.indexing_engine,
+            ClangIndexer.worker_nice,
+            ClangIndexer.worker_ionice,
+            ClangIndexer.worker_cpu_affinity
+        )
+        return IndexingWorker(indexing_subprocess, symbol_db)
+
+    def __get_compiler_args_hash(self, filename):
+        # Headers are indexed with the compiler args of whichever file claims them so there is nothing of their own
+        # to be compared against (see get_file_state())
+        if is_header(filename):
+            return ''
+        return get_compiler_args_hash(self.parser.get_compiler_args_db().get(filename, False))
+
+    def __record_file_state(self, filename):
+        file_state, up_to_date = get_file_state(filename, self.__get_compiler_args_hash(filename))
+        self.symbol_db.insert_file(remove_root_dir_from_filename(self.root_directory, filename), *(file_state + (time.time(),)))
+        self.symbol_db.flush()
+
+    def serialize_result(self, payload, args):
+        if int(payload[0]) == SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES and args is not None:
+            result = CompactResult(4) # filename, line, column, context
+            for filename, line, column, context in args:
+                result.append(0, result.intern(filename), int(line), int(column), result.intern(context or ''))
+            return result
+        if int(payload[0]) in [SourceCodeModelIndexerRequestId.INCOMING_CALLS, SourceCodeModelIndexerRequestId.OUTGOING_CALLS] and args is not None:
+            result = CompactResult(6) # name, qualified name, USR (of the caller or callee), filename, line, column (of the call)
+            for name, qualified_name, usr, filename, line, column in args:
+                result.append(0, result.intern(name), result.intern(qualified_name), result.intern(usr), result.intern(filename), int(line), int(column))
+            return result
+        if int(payload[0]) in [SourceCodeModelIndexerRequestId.BASE_CLASSES, SourceCodeModelIndexerRequestId.DERIVED_CLASSES] and args is not None:
+            result = CompactResult(9) # name, qualified name, USR (of the base or derived class), USR (of the class on this end), filename, line, column (of the base specifier), access, is virtual
+            for name, qualified_name, usr, this_usr, filename, line, column, access, is_virtual in args:
+                result.append(0, result.intern(name), result.intern(qualified_name), result.intern(usr), result.intern(this_usr),
+                    result.intern(filename), int(line), int(column), int(access), int(is_virtual))
+            return result
+        if int(payload[0]) == SourceCodeModelIndexerRequestId.INCLUDERS and args is not None:
+            result = CompactResult(3) # filename (of the includer), line (of the include directive), filename (of the included file)
+            for includer, line, included in args:
+                result.append(0, result.intern(includer), int(line), result.intern(included))
+            return result
+        if int(payload[0]) == SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL and args is not None:
+            result = CompactResult(6) # name, qualified name, kind, filename, line, column
+            for name, qualified_name, kind, filename, line, column in args:
+                result.append(0, result.intern(name), result.intern(qualified_name), int(kind), result.intern(filename), int(line), int(column))
+            return result
+        return args
+
+def index_file_stream(root_directory, compiler_args_filename, output_db_filename, input_stream, output_stream, headers_db_filename=None, engine='visitor'):
+    # Indexes files as they arrive over the input stream (JSON-encoded filename, or [filename, declarations only],
+    # per line) and reports back over the output stream once each of them is indexed (see IndexingWorker), together
+    # with the memory the worker is using by then so that it can be restarted once it grows too big.
     symbol_db = SymbolDatabase(output_db_filename)
     symbol_db.create_data_model()
+    symbol_db.begin_bulk_load()
+    headers_db = SymbolDatabase(headers_db_filename) if headers_db_filename else None
     parser = ClangParser(compiler_args_filename, TranslationUnitCache(NoCache()))
-    with open(input_filename_list, 'r') as input_list:
-        for filename in input_list.readlines():
-            index_single_file(parser, root_directory, filename.strip(), filename.strip(), symbol_db)
+    for line in iter(input_stream.readline, ''):
+        request = json.loads(line)
+        filename, declarations_only = request if isinstance(request, list) else (request, False)
+        filename = filename.encode('utf8')
+        start = time.time()
+        try:
+            success = index_single_file(parser, root_directory, filename, filename, symbol_db, headers_db, engine, declarations_only)
+        except:
+            logging.exception("Indexing of '{0}' failed.".format(filename))
+            success = False
+        output_stream.write(json.dumps([filename, success, time.time() - start, get_rss()]) + '\n')
+        output_stream.flush()
     symbol_db.close()
+    if headers_db:
+        headers_db.close()
+
+def get_rss():
+    # Resident set size of this very process in bytes. Where '/proc' is not available, the peak one is the best we have.
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024 # Reported in bytes on macOS and in kilobytes elsewhere
 
 def indexer_visitor(ast_node, ast_parent_node, args):
-    def extract_cursor_context(filename, line):
-        return linecache.getline(filename, line)
-
-    parser, symbol_db, root_directory = args
+    parser, symbol_db, recorded_files, enclosing_functions = args
     ast_node_location = ast_node.location
-    ast_node_tunit_spelling = ast_node.translation_unit.spelling
-    if ast_node_location.file and ast_node_location.file.name == ast_node_tunit_spelling:  # we are not interested in symbols which got into this TU via includes
+    filename = recorded_files.get(ast_node_location.file.name) if ast_node_location.file else None
+    if filename:  # we are not interested in symbols which got into this TU via includes, except for the headers it has claimed
         id = parser.get_ast_node_id(ast_node)
         usr = ast_node.referenced.get_usr() if ast_node.referenced else ast_node.get_usr()
         line = int(parser.get_ast_node_line(ast_node))
         column = int(parser.get_ast_node_column(ast_node))
         if id in ClangIndexer.supported_ast_node_ids:
+            symbol = ast_node.referenced if ast_node.referenced else ast_node
             symbol_db.insert_single(
-                remove_root_dir_from_filename(root_directory, ast_node_tunit_spelling),
+                filename,
                 line,
                 column,
                 usr,
-                extract_cursor_context(ast_node_tunit_spelling, line),
-                ast_node.referenced._kind_id if ast_node.referenced else ast_node._kind_id,
-                ast_node.is_definition()
+                symbol._kind_id,
+                ast_node.is_definition(),
+                symbol.spelling,
+                get_qualified_name(symbol) if usr and not symbol_db.is_usr_known(usr) else None # Only the first occurrence gets recorded
+            )
+        # Visitor only ever sees the node and its parent so the function each of the nodes is found in is passed down
+        # from the parent (see track_enclosing_function()). This is the caller of any call expression we run into.
+        caller_usr = track_enclosing_function(ast_node, ast_parent_node, enclosing_functions)
+        if caller_usr and ast_node.kind == clang.cindex.CursorKind.CALL_EXPR and ast_node.referenced:
+            symbol_db.insert_call(
+                filename,
+                line,
+                column,
+                caller_usr,
+                usr
+            )
+        # Base specifiers are only ever found directly beneath the class (or struct) deriving from them
+        if ast_parent_node and ast_node.kind == clang.cindex.CursorKind.CXX_BASE_SPECIFIER and ast_node.referenced:
+            symbol_db.insert_base(
+                filename,
+                line,
+                column,
+                ast_parent_node.get_usr(),
+                usr,
+                ast_node.access_specifier.value,
+                is_virtual_base(ast_node)
             )
         return ChildVisitResult.RECURSE.value  # If we are positioned in TU of interest, then we'll traverse through all descendants
     return ChildVisitResult.CONTINUE.value  # Otherwise, we'll skip to the next sibling
 
-def index_single_file(parser, root_directory, contents_filename, original_filename, symbol_db):
+def declaration_visitor(ast_node, ast_parent_node, args):
+    # Only the declarations (and the base specifiers found beneath them) are recorded, none of the references
+    if ast_node.kind.is_declaration() or ast_node.kind == clang.cindex.CursorKind.CXX_BASE_SPECIFIER:
+        return indexer_visitor(ast_node, ast_parent_node, args)
+    return ChildVisitResult.RECURSE.value # Declarations found beneath (e.g. parameters of the function) are recorded too
+
+def track_enclosing_function(ast_node, ast_parent_node, enclosing_functions):
+    # Records and returns the USR of the function given node is found in (or is itself), if any: { node hash: USR }
+    if ClangParser.to_ast_node_id(ast_node.kind) in [ASTNodeId.getFunctionId(), ASTNodeId.getMethodId()]:
+        usr = ast_node.get_usr()
+    else:
+        usr = enclosing_functions.get(ast_parent_node.hash) if ast_parent_node else None
+    if usr:
+        enclosing_functions[ast_node.hash] = usr
+    return usr
+
+def index_with_callbacks(parser, tunit, symbol_db, recorded_files):
+    # Alternative to traversing the whole AST with indexer_visitor(): libclang walks the AST on its own and calls back
+    # only for the declarations and references it finds (see indexer_callbacks), which is what the symbols are made
+    # of. Macros are not reported that way so these are picked up from the top-level of the AST, where they reside.
+    #
+    # Callbacks are run on the thread libclang spawns for the indexing and SQLite objects are bound to the thread
+    # which created them so the rows are only collected while indexing and written into the database afterwards.
+    supported_kinds = get_cursor_kinds(ClangIndexer.supported_ast_node_ids)
+    function_kinds = get_cursor_kinds([ASTNodeId.getFunctionId(), ASTNodeId.getMethodId()])
+    get_file_location, files = indexer_callbacks.FileLocation(), {} # { file handle: relative filename or None if not recorded }
+    symbols, bases, calls, cursors = [], [], [], {} # cursors: { USR: cursor of the first occurrence }
+
+    def get_recorded_filename(file):
+        if file not in files:
+            files[file] = recorded_files.get(indexer_callbacks.get_filename(file)) if file else None
+        return files[file]
+
+    def add_symbol(filename, line, column, usr, symbol, is_definition, name):
+        if usr not in cursors:
+            cursors[usr] = clang.cindex.Cursor.from_buffer_copy(symbol) # Index infos are only valid during the callback
+        symbols.append((filename, line, column, usr, symbol._kind_id, is_definition, name))
+
+    def on_declaration(client_data, decl_info):
+        decl = decl_info.contents
+        if decl.isImplicit or decl.cursor._kind_id not in supported_kinds:
+            return
+        file, line, column = get_file_location(decl.loc)
+        filename = get_recorded_filename(file)
+        if filename:
+            entity = decl.entityInfo.contents
+            add_symbol(filename, line, column, entity.USR or '', entity.cursor, bool(decl.isDefinition), entity.name or '')
+            for base in indexer_callbacks.get_cxx_class_bases(decl_info) if decl.isDefinition else []:
+                if not base.base: # Dependent base (e.g. template parameter) does not resolve to any entity
+                    continue
+                file, line, column = get_file_location(base.loc)
+                bases.append((
+                    get_recorded_filename(file) or filename, line, column, entity.USR, base.base.contents.USR,
+                    base.cursor.access_specifier.value, is_virtual_base(base.cursor)
+                ))
+
+    def on_reference(client_data, ref_info):
+        ref = ref_info.contents
+        if not ref.referencedEntity or ref.referencedEntity.contents.cursor._kind_id not in supported_kinds:
+            return
+        entity = ref.referencedEntity.contents
+        file, line, column = get_file_location(ref.loc)
+        filename = get_recorded_filename(file)
+        if filename:
+            # Referenced entity is the template itself rather than its specialization actually being referenced so the
+            # symbol is looked up the same way indexer_visitor() does it (and queries resolve the cursor under the caret)
+            cursor = clang.cindex.Cursor.from_buffer_copy(ref.cursor)
+            cursor._tu = tunit
+            symbol = cursor.referenced or entity.cursor
+            usr = symbol.get_usr() if cursor.referenced else (entity.USR or '')
+            add_symbol(filename, line, column, usr, symbol, False, symbol.spelling if cursor.referenced else (entity.name or ''))
+            if ref.role & indexer_callbacks.SymbolRole.CALL and ref.parentEntity and ref.parentEntity.contents.cursor._kind_id in function_kinds:
+                calls.append((filename, line, column, ref.parentEntity.contents.USR, usr))
+
+    def macro_visitor(ast_node, ast_parent_node, args):
+        if ast_node._kind_id in [clang.cindex.CursorKind.MACRO_DEFINITION.value, clang.cindex.CursorKind.MACRO_INSTANTIATION.value]:
+            indexer_visitor(ast_node, ast_parent_node, args)
+        return ChildVisitResult.CONTINUE.value
+
+    parser.traverse(tunit.cursor, [parser, symbol_db, recorded_files, {}], macro_visitor)
+    success = indexer_callbacks.index_translation_unit(tunit, on_declaration, on_reference)
+    for filename, line, column, usr, kind, is_definition, name in symbols:
+        qualified_name = None
+        if usr and not symbol_db.is_usr_known(usr): # Only the first occurrence gets recorded
+            cursors[usr]._tu = tunit
+            qualified_name = get_qualified_name(cursors[usr])
+        symbol_db.insert_single(filename, line, column, usr, kind, is_definition, name, qualified_name)
+    for base in bases:
+        symbol_db.insert_base(*base)
+    for call in calls:
+        symbol_db.insert_call(*call)
+    return success
+
+def get_cursor_kinds(ast_node_ids):
+    # Cursor kinds (their ids) which map to any of the given AST node ids
+    return set(kind.value for kind in clang.cindex.CursorKind.get_all_kinds() if ClangParser.to_ast_node_id(kind) in ast_node_ids)
+
+def is_virtual_base(cursor):
+    # TODO Shall be removed once 'cindex.py' exposes it
+    return bool(clang.cindex.conf.lib.clang_isVirtualBase(cursor))
+
+def get_qualified_name(cursor):
+    # Symbols which are not visible outside of the function (or template) they are declared in do not get one
+    if ClangParser.to_ast_node_id(cursor.kind) in [
+        ASTNodeId.getFunctionParameterId(), ASTNodeId.getTemplateTypeParameterId(),
+        ASTNodeId.getTemplateNonTypeParameterId(), ASTNodeId.getTemplateTemplateParameterId()
+    ]:
+        return None
+    names, parent = [cursor.spelling], cursor.semantic_parent
+    while parent and not parent.kind.is_translation_unit():
+        if ClangParser.to_ast_node_id(parent.kind) in [ASTNodeId.getFunctionId(), ASTNodeId.getMethodId()]:
+            return None
+        names.insert(0, parent.spelling or '(anonymous)')
+        parent = parent.semantic_parent
+    return '::'.join(names)
+
+def index_single_file(parser, root_directory, contents_filename, original_filename, symbol_db, headers_db=None, engine='visitor', declarations_only=False):
+    # Engine is either 'visitor' (see indexer_visitor()) or 'callbacks' (see index_with_callbacks()). Declaration pass
+    # (declarations_only) is what gets the navigation going in a fraction of the time, before the references are in:
+    # function bodies are skipped altogether and macros are not recorded.
     logging.info("Indexing a file '{0}' ... ".format(original_filename))
-    tunit = parser.parse(contents_filename, original_filename)
+    tunit = parser.parse(contents_filename, original_filename, declarations_only)
     if tunit:
-        parser.traverse(tunit.cursor, [parser, symbol_db, root_directory], indexer_visitor)
+        recorded_files = get_recorded_files(tunit, root_directory, headers_db, declarations_only)
+        if declarations_only:
+            parser.traverse(tunit.cursor, [parser, symbol_db, recorded_files, {}], declaration_visitor)
+        elif engine == 'callbacks':
+            index_with_callbacks(parser, tunit, symbol_db, recorded_files)
+        else:
+            parser.traverse(tunit.cursor, [parser, symbol_db, recorded_files, {}], indexer_visitor)
+        record_includes(tunit, root_directory, symbol_db)
         symbol_db.flush()
     logging.info("Indexing of {0} completed.".format(original_filename))
     return tunit is not None
 
+def get_recorded_files(tunit, root_directory, headers_db, declarations_only=False):
+    # Files whose symbols are recorded while indexing the TU: { filename as seen by libclang: relative filename }.
+    # Besides the TU itself, these are the headers of the project it includes, but only the ones it gets to claim
+    # (see SymbolDatabase.claim_headers()). This way each of the headers is indexed only once, in the context of
+    # whichever TU claims it first, instead of once per each TU including it.
+    recorded_files = {tunit.spelling: remove_root_dir_from_filename(root_directory, tunit.spelling)}
+    if headers_db:
+        root_directory = os.path.join(os.path.normpath(root_directory), '')
+        headers = {}
+        for inclusion in tunit.get_includes():
+            included = os.path.normpath(inclusion.include.name)
+            if included.startswith(root_directory):
+                headers[inclusion.include.name] = remove_root_dir_from_filename(root_directory, included)
+        claimed = set(headers_db.claim_headers(sorted(set(headers.itervalues())), declarations_only, recorded_files[tunit.spelling]))
+        recorded_files.update((name, filename) for name, filename in headers.iteritems() if filename in claimed)
+    return recorded_files
+
+def record_includes(tunit, root_directory, symbol_db):
+    # Each of the inclusions found in the TU, headers including other headers too. Only the headers which are part
+    # of the project are of interest (e.g. system headers are left out).
+    root_directory = os.path.join(os.path.normpath(root_directory), '')
+    for inclusion in tunit.get_includes():
+        included = os.path.normpath(inclusion.include.name)
+        if included.startswith(root_directory):
+            symbol_db.insert_include(
+                remove_root_dir_from_filename(root_directory, os.path.normpath(inclusion.source.name)),
+                remove_root_dir_from_filename(root_directory, included),
+                inclusion.location.line
+            )
+
 def remove_root_dir_from_filename(root_dir, full_path):
     return full_path[len(root_dir):].lstrip(os.sep)
 
+def get_file_state(filename, compiler_args_hash, indexed_file_state=None):
+    # Content hash is only computed for files whose mtime or size has changed so that re-indexing the
+    # directory where most of the files are up-to-date does not end up reading all of them.
+    stat = os.stat(filename)
+    if indexed_file_state is not None:
+        mtime, size, content_hash, indexed_compiler_args_hash = indexed_file_state
+        if compiler_args_hash in ['', indexed_compiler_args_hash] and size == stat.st_size: # Headers come with no compiler args
+            if mtime == stat.st_mtime:
+                return indexed_file_state, True
+            if content_hash == get_content_hash(filename):
+                return (stat.st_mtime, stat.st_size, content_hash, compiler_args_hash,), True # Touched but not changed
+    return (stat.st_mtime, stat.st_size, get_content_hash(filename), compiler_args_hash,), False
+
+def get_content_hash(filename):
+    content_hash = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(65536), ''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+def get_compiler_args_hash(compiler_args):
+    return hashlib.sha1('\0'.join(compiler_args)).hexdigest()
+
 def get_clang_index_path():
     this_script_directory = os.path.dirname(os.path.realpath(__file__))
     return os.path.join(this_script_directory, 'clang_index.py')
 
-def get_cpp_file_list(root_directory):
-    cpp_file_list = []
-    for dirpath, dirs, files in os.walk(root_directory):
-        for file in files:
-            name, extension = os.path.splitext(file)
-            if extension in ['.cpp', '.cc', '.cxx', '.c', '.h', '.hh', '.hpp']:
-                cpp_file_list.append(os.path.join(dirpath, file))
-    return cpp_file_list
-
-def create_indexer_input_list_file(directory, with_prefix, cpp_file_list_chunk):
-    chunk_with_no_none_items = '\n'.join(item for item in cpp_file_list_chunk if item)
-    cpp_file_list_handle, cpp_file_list = tempfile.mkstemp(prefix=with_prefix, dir=directory)
-    os.write(cpp_file_list_handle, chunk_with_no_none_items)
-    return cpp_file_list_handle, cpp_file_list
+def is_header(filename):
+    return os.path.splitext(filename)[1] in ['.h', '.hh', '.hpp']
+
+cpp_file_extensions = ['.cpp', '.cc', '.cxx', '.c', '.h', '.hh', '.hpp']
+
+def get_cpp_file_list(root_directory, ignore_rules=None, directory_scanner=None):
+    # Directory scanner keeps the listings of the directories between the scans (see DirectoryScanner)
+    if directory_scanner is not None:
+        return directory_scanner.scan(root_directory, ignore_rules)
+    directory_scanner = DirectoryScanner(cpp_file_extensions)
+    try:
+        return directory_scanner.scan(root_directory, ignore_rules)
+    finally:
+        directory_scanner.close()
+
+def get_compilation_database_file_list(root_directory, source_files, included_files, ignore_rules=None):
+    # Source files are the entries of compilation database found in the project directory and the headers are the
+    # ones reachable from them, as recorded while indexing them (see record_includes()). Directory is not scanned.
+    root_directory = os.path.join(os.path.normpath(root_directory), '')
+    cpp_file_list = collections.OrderedDict()
+    for filename in source_files + [os.path.join(root_directory, filename) for filename in included_files if is_header(filename)]:
+        if filename.startswith(root_directory) and filename not in cpp_file_list and os.path.isfile(filename):
+            if not (ignore_rules and ignore_rules.is_ignored(filename[len(root_directory):])):
+                cpp_file_list[filename] = None
+    return cpp_file_list.keys()
 
 def create_empty_symbol_db(directory, with_prefix):
     symbol_db_handle, symbol_db = tempfile.mkstemp(prefix=with_prefix, dir=directory)
     return symbol_db_handle, symbol_db
 
-def start_indexing_subprocess(root_directory, compiler_args_filename, indexer_input_list_filename, output_db_filename, log_filename):
+def start_indexing_subprocess(root_directory, compiler_args_filename, output_db_filename, log_filename, headers_db_filename=None, engine='visitor', nice=0, ionice=None, cpu_affinity=None):
     cmd = "python2 " + get_clang_index_path() + \
             " --project_root_directory='" + root_directory + \
             "' --compiler_args_filename='" + compiler_args_filename + \
-            "' --input_list='" + indexer_input_list_filename + \
             "' --output_db_filename='" + output_db_filename + \
-            "' " + "--log_file='" + log_filename + "'"
-    return subprocess.Popen(shlex.split(cmd))
+            "' " + "--log_file='" + log_filename + \
+            "' --engine=" + engine
+    if headers_db_filename:
+        cmd += " --headers_db_filename='" + headers_db_filename + "'"
+    cmd = shlex.split(cmd)
+    resource_limits = get_resource_limits_cmd(nice, ionice, cpu_affinity)
+    if resource_limits:
+        cmd = resource_limits + cmd
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+def get_resource_limits_cmd(nice=0, ionice=None, cpu_affinity=None):
+    # Each of the tools exec()'s the command it is given so the worker is still the very process we have started.
+    # Limits which cannot be applied (e.g. the tool is not available on this platform) are skipped.
+    cmd = []
+    if nice and distutils.spawn.find_executable('nice'):
+        cmd += ['nice', '-n', str(nice)]
+    if ionice and distutils.spawn.find_executable('ionice'):
+        io_class, io_level = ionice
+        cmd += ['ionice', '-c', str(io_class)] + (['-n', str(io_level)] if io_level is not None else [])
+    if cpu_affinity and distutils.spawn.find_executable('taskset'):
+        cmd += ['taskset', '-c', ','.join(str(cpu) for cpu in cpu_affinity)]
+    return cmd
@@ -0,0 +1,134 @@
+import clang.cindex
+import ctypes
+
+#
+# Bindings for the libclang indexing API (see 'clang-c/Index.h'), which is not exposed by 'cindex.py'. Instead of
+# visiting each and every node of the AST, libclang walks the AST itself and calls back only for the declarations and
+# the references to the declared entities it finds.
+#
+# TODO Shall be removed once 'cindex.py' exposes it
+#
+class IndexOption():
+    SUPPRESS_REDUNDANT_REFS                 = 0x1
+    INDEX_FUNCTION_LOCAL_SYMBOLS            = 0x2
+    INDEX_IMPLICIT_TEMPLATE_INSTANTIATIONS  = 0x4
+    SUPPRESS_WARNINGS                       = 0x8
+    SKIP_PARSED_BODIES_IN_SESSION           = 0x10
+
+class SymbolRole():
+    DECLARATION = 1 << 0
+    DEFINITION  = 1 << 1
+    REFERENCE   = 1 << 2
+    READ        = 1 << 3
+    WRITE       = 1 << 4
+    CALL        = 1 << 5
+
+class IdxLoc(ctypes.Structure):
+    _fields_ = [('ptr_data', ctypes.c_void_p * 2), ('int_data', ctypes.c_uint)]
+
+class IdxEntityInfo(ctypes.Structure):
+    _fields_ = [
+        ('kind', ctypes.c_int), ('templateKind', ctypes.c_int), ('lang', ctypes.c_int),
+        ('name', ctypes.c_char_p), ('USR', ctypes.c_char_p), ('cursor', clang.cindex.Cursor),
+        ('attributes', ctypes.c_void_p), ('numAttributes', ctypes.c_uint)
+    ]
+
+class IdxContainerInfo(ctypes.Structure):
+    _fields_ = [('cursor', clang.cindex.Cursor)]
+
+class IdxDeclInfo(ctypes.Structure):
+    _fields_ = [
+        ('entityInfo', ctypes.POINTER(IdxEntityInfo)), ('cursor', clang.cindex.Cursor), ('loc', IdxLoc),
+        ('semanticContainer', ctypes.POINTER(IdxContainerInfo)), ('lexicalContainer', ctypes.POINTER(IdxContainerInfo)),
+        ('isRedeclaration', ctypes.c_int), ('isDefinition', ctypes.c_int), ('isContainer', ctypes.c_int),
+        ('declAsContainer', ctypes.POINTER(IdxContainerInfo)), ('isImplicit', ctypes.c_int),
+        ('attributes', ctypes.c_void_p), ('numAttributes', ctypes.c_uint), ('flags', ctypes.c_uint)
+    ]
+
+class IdxBaseClassInfo(ctypes.Structure):
+    _fields_ = [('base', ctypes.POINTER(IdxEntityInfo)), ('cursor', clang.cindex.Cursor), ('loc', IdxLoc)]
+
+class IdxCXXClassDeclInfo(ctypes.Structure):
+    _fields_ = [
+        ('declInfo', ctypes.POINTER(IdxDeclInfo)), ('bases', ctypes.POINTER(ctypes.POINTER(IdxBaseClassInfo))), ('numBases', ctypes.c_uint)
+    ]
+
+class IdxEntityRefInfo(ctypes.Structure):
+    _fields_ = [
+        ('kind', ctypes.c_int), ('cursor', clang.cindex.Cursor), ('loc', IdxLoc),
+        ('referencedEntity', ctypes.POINTER(IdxEntityInfo)), ('parentEntity', ctypes.POINTER(IdxEntityInfo)),
+        ('container', ctypes.POINTER(IdxContainerInfo)), ('role', ctypes.c_int)
+    ]
+
+declaration_callback = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(IdxDeclInfo))
+reference_callback   = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.POINTER(IdxEntityRefInfo))
+
+class IndexerCallbacks(ctypes.Structure):
+    # Only the callbacks we are interested in are given, the rest of them are left as NULL
+    _fields_ = [
+        ('abortQuery', ctypes.c_void_p), ('diagnostic', ctypes.c_void_p), ('enteredMainFile', ctypes.c_void_p),
+        ('ppIncludedFile', ctypes.c_void_p), ('importedASTFile', ctypes.c_void_p), ('startedTranslationUnit', ctypes.c_void_p),
+        ('indexDeclaration', declaration_callback), ('indexEntityReference', reference_callback)
+    ]
+
+functions_registered = False
+
+def get_lib():
+    global functions_registered
+    lib = clang.cindex.conf.lib
+    if not functions_registered:
+        lib.clang_IndexAction_create.argtypes = [ctypes.c_void_p]
+        lib.clang_IndexAction_create.restype = ctypes.c_void_p
+        lib.clang_IndexAction_dispose.argtypes = [ctypes.c_void_p]
+        lib.clang_indexTranslationUnit.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.POINTER(IndexerCallbacks), ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p
+        ]
+        lib.clang_indexTranslationUnit.restype = ctypes.c_int
+        lib.clang_indexLoc_getFileLocation.argtypes = [
+            IdxLoc, ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p), ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint), ctypes.c_void_p
+        ]
+        lib.clang_indexLoc_getFileLocation.restype = None
+        lib.clang_index_getCXXClassDeclInfo.argtypes = [ctypes.POINTER(IdxDeclInfo)]
+        lib.clang_index_getCXXClassDeclInfo.restype = ctypes.POINTER(IdxCXXClassDeclInfo)
+        functions_registered = True
+    return lib
+
+def index_translation_unit(tunit, on_declaration, on_reference, options=IndexOption.INDEX_FUNCTION_LOCAL_SYMBOLS):
+    """
+    Runs the indexing over already parsed translation unit. Callbacks are given the pointers to IdxDeclInfo and
+    IdxEntityRefInfo respectively, which are valid only for the duration of the callback.
+
+    Returns True if indexing has completed.
+    """
+    lib = get_lib()
+    callbacks = IndexerCallbacks(indexDeclaration=declaration_callback(on_declaration), indexEntityReference=reference_callback(on_reference))
+    action = lib.clang_IndexAction_create(tunit.index.obj)
+    try:
+        return lib.clang_indexTranslationUnit(action, None, ctypes.byref(callbacks), ctypes.sizeof(callbacks), options, tunit.obj) == 0
+    finally:
+        lib.clang_IndexAction_dispose(action)
+
+class FileLocation():
+    """
+    Resolves the index locations into the file, line and column. Files are identified by the handle libclang gives
+    them so their names only need to be looked up once per each of the files (see get_filename()).
+    """
+    def __init__(self):
+        self.lib = get_lib()
+        self.file, self.line, self.column = ctypes.c_void_p(), ctypes.c_uint(), ctypes.c_uint()
+
+    def __call__(self, loc):
+        # Returns the (file handle, line, column) of the given location. File handle is None for invalid locations.
+        self.lib.clang_indexLoc_getFileLocation(loc, None, ctypes.byref(self.file), ctypes.byref(self.line), ctypes.byref(self.column), None)
+        return self.file.value, self.line.value, self.column.value
+
+def get_filename(file):
+    return clang.cindex.File(ctypes.cast(ctypes.c_void_p(file), clang.cindex.c_object_p)).name
+
+def get_cxx_class_bases(decl_info):
+    # Base class infos of the class (or struct) being declared, if any
+    class_info = get_lib().clang_index_getCXXClassDeclInfo(decl_info)
+    if not class_info:
+        return []
+    class_info = class_info.contents
+    return [class_info.bases[i].contents for i in range(class_info.numBases)]
@@ -0,0 +1,310 @@
+import collections
+import json
+import logging
+import os
+import select
+import time
+from symbol_database import SymbolDatabase
+
+class IndexingWorker():
+    """
+    Handle to the indexing worker process (see clang_index.py) which records indexing results into its own symbol
+    database. Worker is fed with files one at a time over its stdin, either the filename alone or [filename, True] if
+    only the declarations are to be recorded, and, for each of them, reports back over its stdout once it is done with
+    it: [filename, success, elapsed time, resident set size (in bytes)].
+    """
+    def __init__(self, process, output_db_filename):
+        self.process = process
+        self.output_db_filename = output_db_filename
+        self.buffer = ''
+        self.in_flight = None
+        self.files_indexed = 0
+        self.busy_time = 0.0
+        self.rss, self.peak_rss = 0, 0
+        self.alive = True
+        self.recorded = [] # Files successfully indexed into the output DB since it has been emptied (see IndexingWorkerPool.clear())
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def send(self, filename, declarations_only=False):
+        self.process.stdin.write(json.dumps([filename, True] if declarations_only else filename) + '\n')
+        self.process.stdin.flush()
+        self.in_flight = filename
+
+    def receive(self):
+        # Returns the list of reports received so far or None if worker has gone away.
+        data = os.read(self.fileno(), 65536)
+        if not data:
+            self.alive = False
+            return None
+        self.buffer += data
+        lines = self.buffer.split('\n')
+        self.buffer = lines.pop()
+        reports = []
+        for line in lines:
+            filename, success, elapsed, self.rss = json.loads(line)
+            self.peak_rss = max(self.peak_rss, self.rss)
+            self.in_flight = None
+            self.files_indexed += 1
+            self.busy_time += elapsed
+            if success:
+                self.recorded.append(filename.encode('utf8'))
+            reports.append((filename.encode('utf8'), success, elapsed,))
+        return reports
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+class Throttle():
+    """
+    Holds back the files which are yet to be handed out to the workers (see index_files()) once the condition holds,
+    e.g. when there are interactive requests waiting to be served. Files which have been held back are left for the
+    caller to take care of them later on (e.g. by indexing them in the background).
+    """
+    def __init__(self, engaged):
+        self.engaged = engaged  # () -> True if no more files are to be handed out
+        self.held_back = []
+
+class IndexingWorkerPool():
+    """
+    Long-lived pool of indexing workers. Workers are started on first use and are kept around, together with the
+    libclang instance and compilation database they have loaded, until the pool is closed. Worker which has died in
+    the meantime is replaced with a new one the next time it is needed.
+
+    Results are recorded into the workers' own symbol databases which are to be merged by the caller (see
+    output_db_filenames()) and emptied (see clear()) before the workers are used again.
+
+    Files can also be scheduled to be indexed in the background (see schedule()). These are handed out in batches
+    (see start_batch()) and only while the caller keeps collecting the reports (see receive()). Workers are done
+    with the batch once none of them has a file in flight, which is when their results can be merged.
+
+    Worker is restarted once it has indexed max_files files or its RSS has grown beyond max_rss bytes (see recycle()),
+    which is the only way to get back the memory libclang keeps on holding. Worker which dies while indexing the file
+    is replaced too, whatever it has claimed for the file is released and the file is given to the fresh one once more.
+    """
+    def __init__(self, size, start_worker, max_files=None, max_rss=None, release=None):
+        self.start_worker = start_worker    # (worker_id[, output_db_filename]) -> IndexingWorker
+        self.release = release              # (filename) -> None, called for the file its worker has died on
+        self.workers = [None] * size
+        self.max_files = max_files
+        self.max_rss = max_rss
+        self.scheduled = collections.OrderedDict() # Files waiting to be indexed in the background, in the order they were scheduled
+        self.retried = set() # Files which were in flight when their worker has died, given only one more chance
+        self.batch_left = 0
+        self.batch_started_at = None
+
+    def get_workers(self, count):
+        for worker_id in range(min(count, len(self.workers))):
+            worker = self.workers[worker_id]
+            if worker and worker.in_flight is None and worker.process.poll() is not None:
+                # Its database might still hold the results which are yet to be merged, so the new one takes it over
+                logging.warning("Indexing worker {0} has exited with {1}. Starting a new one.".format(worker.process.pid, worker.process.returncode))
+                worker.alive = False
+                worker = self.recycle(worker)
+            if worker is None:
+                self.workers[worker_id] = self.start_worker(worker_id)
+        return self.workers[0:count]
+
+    def index(self, file_list, declarations_only=False, throttle=None):
+        if not declarations_only:
+            for filename in file_list:
+                self.scheduled.pop(filename, None) # No need to index it once again in the background
+        return index_files(self.get_workers(len(file_list)), file_list, declarations_only, throttle, self.recycle)
+
+    def recycle(self, worker):
+        # Returns the worker to carry on with: the given one or, if it has died or outgrown its limits, a fresh one
+        # recording into the very same symbol database so that none of the results which are yet to be merged is lost
+        over_limits = (self.max_files and worker.files_indexed >= self.max_files) or (self.max_rss and worker.rss >= self.max_rss)
+        if worker.alive and not over_limits:
+            return worker
+        worker_id = self.workers.index(worker)
+        if worker.alive:
+            logging.info("Indexing worker {0} is restarted after {1} file(s), RSS {2:.0f}MB (peak {3:.0f}MB).".format(
+                worker.process.pid, worker.files_indexed, worker.rss / MB, worker.peak_rss / MB)
+            )
+        elif worker.in_flight is not None and self.release:
+            self.release(worker.in_flight)
+        worker.close()
+        self.workers[worker_id] = self.start_worker(worker_id, worker.output_db_filename)
+        self.workers[worker_id].recorded = worker.recorded
+        return self.workers[worker_id]
+
+    def schedule(self, file_list):
+        # File which is already waiting to be indexed is not scheduled again, no matter how many times it is given
+        for filename in file_list:
+            self.scheduled[filename] = None
+
+    def start_batch(self, batch_size):
+        # Only as many workers are started as there are files in the batch
+        self.batch_left = min(batch_size, len(self.scheduled))
+        self.retried.clear()
+        if self.batch_left:
+            self.batch_started_at = time.time()
+        for worker in self.get_workers(self.batch_left):
+            if worker.in_flight is None:
+                self.__feed(worker)
+
+    def busy_workers(self):
+        return [worker for worker in self.workers if worker and worker.in_flight is not None]
+
+    def receive(self):
+        # Returns the reports of the background indexing which have arrived so far, without waiting for any of them.
+        # Workers which are done get the next file of the batch.
+        reports = []
+        busy_workers = self.busy_workers()
+        readable, _, _ = select.select(busy_workers, [], [], 0) if busy_workers else ([], [], [])
+        for worker in readable:
+            worker_reports = worker.receive()
+            if worker_reports is None:
+                filename = worker.in_flight
+                logging.error("Indexing worker {0} has died while indexing '{1}'.".format(worker.process.pid, filename))
+                worker = self.recycle(worker)
+                if filename not in self.retried:
+                    logging.info("Retrying '{0}' with indexing worker {1}.".format(filename, worker.process.pid))
+                    self.retried.add(filename)
+                    worker.send(filename)
+                else:
+                    reports.append((filename, False, 0.0,))
+                continue
+            reports.extend(worker_reports)
+            if worker.in_flight is None:
+                self.__feed(self.recycle(worker))
+        return reports
+
+    def drain(self):
+        # Waits for the files which are in flight and hands out no more of the batch. Rest of the scheduled files
+        # is left for the next batch.
+        self.batch_left = 0
+        reports = []
+        while self.busy_workers():
+            select.select(self.busy_workers(), [], [])
+            reports.extend(self.receive())
+        return reports
+
+    def cancel(self):
+        # Scheduled files are forgotten and the ones in flight are waited for. Their results are still to be thrown
+        # away by the caller (see clear()).
+        self.scheduled.clear()
+        return self.drain()
+
+    def __feed(self, worker):
+        if self.batch_left > 0 and self.scheduled and worker.process.poll() is None:
+            filename, _ = self.scheduled.popitem(last=False)
+            worker.send(filename)
+            self.batch_left -= 1
+
+    def output_db_filenames(self):
+        return [worker.output_db_filename for worker in self.workers if worker]
+
+    def files_recorded_into(self, db_filename_list):
+        # Files whose results are to be found in the given output DBs, e.g. the ones which could not be merged
+        return [filename for worker in self.workers if worker and worker.output_db_filename in db_filename_list for filename in worker.recorded]
+
+    def clear(self):
+        for worker in self.workers:
+            if worker:
+                symbol_db = SymbolDatabase(worker.output_db_filename)
+                if symbol_db.has_data_model():
+                    symbol_db.delete_all_symbols()
+                    symbol_db.flush()
+                symbol_db.close()
+                worker.recorded = []
+
+    def close(self):
+        self.scheduled.clear()
+        self.batch_left = 0
+        for worker_id, worker in enumerate(self.workers):
+            if worker:
+                worker.close()
+                remove_db(worker.output_db_filename)
+                self.workers[worker_id] = None
+
+def remove_db(db_filename):
+    try:
+        os.remove(db_filename)
+    except OSError:
+        pass
+
+MB = 1024.0 * 1024.0
+
+def index_files(workers, file_list, declarations_only=False, throttle=None, recycle=None):
+    """
+    Dynamically schedules the indexing of given files across given workers: whenever worker is done with one file
+    it gets the next one. Files are handed out in the order they are given so the caller should put the ones which
+    are expected to take the longest (i.e. the biggest ones) first, which keeps them from ending up in the tail.
+    Either all of the files are indexed in full or only their declarations are recorded (see index_single_file()).
+    Once the throttle is engaged, the rest of the files is held back and only the ones in flight are waited for.
+    Workers are handed to recycle() (see IndexingWorkerPool.recycle()), if given, once they are done with the file or
+    have died, and the file which was in flight when the worker has died is retried, once, by the fresh one. File
+    which is not retried (any more) is reported as failed.
+
+    Returns the list of [filename, success, elapsed time] for each of the files indexed.
+    """
+    pending, active, reports = collections.deque(file_list), [], []
+    used, retried = list(workers), set()
+    start = time.time()
+
+    def feed(worker):
+        if pending and throttle and throttle.engaged():
+            logging.info("{0} file(s) held back as there are requests waiting to be served.".format(len(pending)))
+            throttle.held_back.extend(pending)
+            pending.clear()
+        if pending:
+            worker.send(pending.popleft(), declarations_only)
+            active.append(worker)
+
+    for worker in workers:
+        feed(worker)
+    while active:
+        readable, _, _ = select.select(active, [], [])
+        for worker in readable:
+            worker_reports = worker.receive()
+            active.remove(worker)
+            if worker_reports is None:
+                filename = worker.in_flight
+                logging.error("Indexing worker {0} has died while indexing '{1}'.".format(worker.process.pid, filename))
+                if recycle is None:
+                    reports.append((filename, False, 0.0,))
+                    continue
+                worker = recycle(worker)
+                used.append(worker)
+                if filename not in retried:
+                    logging.info("Retrying '{0}' with indexing worker {1}.".format(filename, worker.process.pid))
+                    retried.add(filename)
+                    pending.appendleft(filename)
+                else:
+                    reports.append((filename, False, 0.0,))
+                feed(worker)
+                continue
+            reports.extend(worker_reports)
+            if worker.in_flight is None:
+                if recycle:
+                    fresh = recycle(worker)
+                    if fresh is not worker:
+                        used.append(fresh)
+                    worker = fresh
+                feed(worker)
+            else:
+                active.append(worker) # Only part of the report arrived
+    log_indexing_stats(used, reports, time.time() - start)
+    return reports
+
+def log_indexing_stats(workers, reports, wall_time):
+    if not reports:
+        return
+    logging.info("Indexed {0} file(s) in {1:.2f}s ({2:.1f} files/s) using {3} worker(s).".format(
+        len(reports), wall_time, len(reports) / wall_time if wall_time else 0, len(workers))
+    )
+    for worker in workers:
+        logging.info("Worker {0}: {1} file(s), busy {2:.2f}s, utilization {3:.0f}%, peak RSS {4:.0f}MB.".format(
+            worker.process.pid, worker.files_indexed, worker.busy_time, 100.0 * worker.busy_time / wall_time if wall_time else 100.0, worker.peak_rss / MB)
+        )
+    elapsed = sorted(report[2] for report in reports)
+    percentile = lambda p: elapsed[min(len(elapsed) - 1, int(p * len(elapsed)))]
+    logging.info("Per-file indexing time: p50={0:.3f}s, p90={1:.3f}s, p99={2:.3f}s, max={3:.3f}s.".format(
+        percentile(0.5), percentile(0.9), percentile(0.99), elapsed[-1])
+    )
+    for filename, success, file_elapsed in sorted(reports, key=lambda report: report[2], reverse=True)[0:5]:
+        logging.info("Slowest: '{0}' {1:.3f}s".format(filename, file_elapsed))
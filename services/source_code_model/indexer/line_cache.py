@@ -0,0 +1,64 @@
+import array
+import collections
+import mmap
+import os
+
+class LineCache():
+    """
+    Serves the lines of source files straight from their memory-mapped contents, without reading the files into
+    memory. Byte offset at which each of the lines starts is computed once per file and kept, together with the
+    mapping, for as long as the file remains unchanged (i.e. the same mtime and size). Only a limited number of the
+    most recently used files is kept mapped at once.
+    """
+    def __init__(self, max_files=64):
+        self.max_files = max_files
+        self.files = collections.OrderedDict()  # filename -> [mtime, size, mmap, line offsets]
+
+    def getline(self, filename, line):
+        # Same as linecache.getline(): line is 1-based and comes with the line ending. Empty string if there is none.
+        entry = self.__get(filename)
+        if entry is None:
+            return ''
+        mtime, size, contents, line_offsets = entry
+        if not 0 < line <= len(line_offsets):
+            return ''
+        return contents[line_offsets[line-1]:line_offsets[line] if line < len(line_offsets) else size]
+
+    def clear(self):
+        while self.files:
+            self.files.popitem()[1][2].close()
+
+    def __get(self, filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            stat = None
+        entry = self.files.pop(filename, None)
+        if entry and (stat is None or entry[0] != stat.st_mtime or entry[1] != stat.st_size):
+            entry[2].close()
+            entry = None
+        if entry is None and stat is not None:
+            entry = map_file(filename, stat)
+        if entry is None:
+            return None
+        self.files[filename] = entry
+        while len(self.files) > self.max_files:
+            self.files.popitem(last=False)[1][2].close()
+        return entry
+
+def map_file(filename, stat):
+    try:
+        with open(filename, 'rb') as f:
+            contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, ValueError, mmap.error): # Empty files cannot be mapped
+        return None
+    return [stat.st_mtime, stat.st_size, contents, get_line_offsets(contents)]
+
+def get_line_offsets(contents):
+    # Byte offset at which each of the lines starts
+    line_offsets = array.array('L', [0])
+    offset = contents.find('\n')
+    while offset != -1:
+        line_offsets.append(offset + 1)
+        offset = contents.find('\n', offset + 1)
+    return line_offsets
@@ -0,0 +1,143 @@
+import os
+import re
+from multiprocessing.pool import ThreadPool
+
+class IgnoreRules():
+    """
+    Patterns telling which files of the project are (not) to be indexed, in the same syntax as the one of '.gitignore':
+    pattern without a slash matches the name at any level, the one with it is relative to the root directory, trailing
+    slash matches directories only, '*', '?' and '**' are the wildcards and '!' includes back what has been excluded by
+    any of the preceding patterns. Last matching pattern wins. Files found beneath the excluded directory are excluded
+    too, no matter the patterns which follow.
+    """
+    filename = '.cxxdignore'
+
+    def __init__(self, patterns):
+        self.rules = [rule for rule in (parse_pattern(pattern) for pattern in patterns) if rule]
+
+    @staticmethod
+    def from_directory(root_directory, patterns=[]):
+        # Given patterns come first so the ones from the file found in root directory, if any, can override them
+        try:
+            with open(os.path.join(root_directory, IgnoreRules.filename)) as f:
+                return IgnoreRules(patterns + f.read().splitlines())
+        except IOError:
+            return IgnoreRules(patterns)
+
+    def __nonzero__(self):
+        return bool(self.rules)
+
+    def match(self, relative_path, is_directory=False):
+        # Tells if the path itself is excluded, regardless of the directories it is found in
+        ignored = False
+        for negate, directory_only, anchored, regex in self.rules:
+            if directory_only and not is_directory:
+                continue
+            if regex.match(relative_path if anchored else relative_path.rsplit('/', 1)[-1]):
+                ignored = not negate
+        return ignored
+
+    def is_ignored(self, relative_path):
+        components = relative_path.replace(os.sep, '/').split('/')
+        for depth in range(1, len(components)):
+            if self.match('/'.join(components[0:depth]), True):
+                return True
+        return self.match('/'.join(components))
+
+def parse_pattern(pattern):
+    # Returns (negate, directory only, anchored, compiled regex) or None for blank lines and comments
+    pattern = pattern.rstrip()
+    if not pattern or pattern.startswith('#'):
+        return None
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+    directory_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    if not pattern:
+        return None
+    return negate, directory_only, anchored, re.compile(translate(pattern) + '$')
+
+def translate(pattern):
+    # Unlike fnmatch.translate(), wildcards do not match across the directories except for '**'
+    regex, i = '', 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex, i = regex + '(?:.*/)?', i + 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex, i = regex + '/.*', i + 3
+        elif pattern.startswith('**', i):
+            regex, i = regex + '.*', i + 2
+        elif pattern[i] == '*':
+            regex, i = regex + '[^/]*', i + 1
+        elif pattern[i] == '?':
+            regex, i = regex + '[^/]', i + 1
+        elif pattern[i] == '[' and pattern.find(']', i + 2) != -1:
+            end = pattern.find(']', i + 2)
+            characters = pattern[i+1:end].replace('\\', '\\\\')
+            regex, i = regex + '[' + ('^' + characters[1:] if characters.startswith('!') else characters) + ']', end + 1
+        else:
+            regex, i = regex + re.escape(pattern[i]), i + 1
+    return regex
+
+class DirectoryScanner():
+    """
+    Lists the files with one of the given extensions found beneath the directory. Listing of each of the directories
+    is kept and served for as long as the mtime of the directory stays the same (adding, removing or renaming any of
+    its entries changes it) so re-scanning the tree which has not changed takes only a stat() per directory.
+    Directories found at the same depth are listed in parallel.
+    """
+    def __init__(self, extensions, threads=8):
+        self.extensions = extensions
+        self.threads = threads
+        self.pool = None
+        self.listings = {}  # directory -> (mtime, [subdirectories], [files])
+
+    def scan(self, root_directory, ignore_rules=None):
+        if self.pool is None:
+            self.pool = ThreadPool(self.threads) # Kept for the lifetime of the scanner, starting it up is not for free
+        cpp_file_list, listings = [], {}
+        level = [(root_directory, '')]
+        while level:
+            next_level = []
+            directories = [directory for directory, relative_directory in level]
+            for (directory, relative_directory), listing in zip(level, self.pool.map(self.list_directory, directories) if len(level) > 1 else map(self.list_directory, directories)):
+                if listing is None:
+                    continue
+                listings[directory] = listing
+                mtime, subdirectories, files = listing
+                for name in subdirectories:
+                    relative_path = relative_directory + name
+                    if not (ignore_rules and ignore_rules.match(relative_path, True)):
+                        next_level.append((os.path.join(directory, name), relative_path + '/'))
+                for name in files:
+                    if not (ignore_rules and ignore_rules.match(relative_directory + name)):
+                        cpp_file_list.append(os.path.join(directory, name))
+            level = next_level
+        self.listings = listings # Directories which are gone (or excluded) in the meantime are forgotten
+        return cpp_file_list
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close() # Threads are left to finish on their own, there is nothing for them to do anyway
+            self.pool = None
+
+    def list_directory(self, directory):
+        try:
+            mtime = os.stat(directory).st_mtime
+            listing = self.listings.get(directory)
+            if listing is not None and listing[0] == mtime:
+                return listing
+            subdirectories, files = [], []
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if os.path.isdir(path):
+                    if not os.path.islink(path): # Same as os.walk(), symbolic links to directories are not followed
+                        subdirectories.append(name)
+                elif os.path.splitext(name)[1] in self.extensions:
+                    files.append(name)
+            return mtime, sorted(subdirectories), sorted(files)
+        except OSError:
+            return None # Directory has been removed in the meantime
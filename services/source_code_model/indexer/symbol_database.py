@@ -1,14 +1,96 @@
 import logging
+import re
 import sqlite3
+import time
 
 class SymbolDatabase(object):
     VERSION_MAJOR = 0
-    VERSION_MINOR = 1
+    VERSION_MINOR = 10
+
+    # Secondary indexes are not maintained during the bulk load but rather (re-)built once it is done. Lookups by
+    # USR (find-all-references, go-to-definition) are served from the index alone: being a WITHOUT ROWID table, the
+    # primary key columns (file_id, usr_id, line) are part of each index entry anyway. Lookups by filename do not need
+    # one of their own since file_id leads the primary key.
+    # Workspace symbol search looks the names and their initials up by prefix, case-insensitively, hence the NOCASE
+    # collation. Qualified names come with the names so that these can be narrowed down by scope from the index alone.
+    indexes = [
+        ('symbol_usr_definition', 'symbol(usr_id, is_definition, column)'),
+        ('usrs_name',             'usrs(name COLLATE NOCASE, qualified_name)'),
+        ('usrs_initials',         'usrs(initials COLLATE NOCASE)'),
+        ('calls_caller',          'calls(caller_usr_id)'),
+        ('calls_file',            'calls(file_id)'),
+        ('bases_derived',         'bases(derived_usr_id)'),
+        ('bases_file',            'bases(file_id)'),
+        ('includes_includer',     'includes(includer_file_id)'),
+    ]
+
+    # Indexes which have been superseded by the ones above
+    obsolete_indexes = ['symbol_usr']
+
+    # Number of rows buffered in bulk-load mode before they are written to the database
+    bulk_load_batch_size = 10000
+
+    # Number of databases attached at once while merging them (SQLite allows up to 10 by default)
+    max_attached = 8
+
+    # Number of times the claims are attempted while somebody else keeps the database locked (see claim_headers())
+    claim_attempts = 3
+
+    # Maximum number of candidates each of the workspace symbol search strategies contributes before they get ranked
+    search_candidates = 1000
+
+    # Call sites come with the function on the other end of the call, i.e. the caller for incoming calls and the
+    # callee for outgoing ones
+    calls_select = \
+        'SELECT usrs.name, usrs.qualified_name, usrs.usr, files.path, calls.line, calls.column \
+         FROM calls JOIN files ON files.id=calls.file_id JOIN usrs ON usrs.id=calls.{0}_usr_id \
+         WHERE calls.{1}_usr_id=(SELECT id FROM usrs WHERE usr=?)'
+
+    # Derivations of the classes found in the hierarchy come with the class on the other end of each of them, i.e.
+    # the derived class when going down the hierarchy and the base class when going up, and with the class on this
+    # end. Hierarchy is either the given class alone or, recursively, all of the classes reachable from it. Each class
+    # is reached only once, even if there is more than one path to it (e.g. diamond).
+    bases_select = \
+        'SELECT usrs.name, usrs.qualified_name, usrs.usr, this_usrs.usr, files.path, bases.line, bases.column, bases.access, bases.is_virtual \
+         FROM hierarchy JOIN bases ON bases.{1}_usr_id=hierarchy.usr_id JOIN files ON files.id=bases.file_id \
+         JOIN usrs ON usrs.id=bases.{0}_usr_id JOIN usrs this_usrs ON this_usrs.id=bases.{1}_usr_id'
+    hierarchy_direct = 'WITH hierarchy(usr_id) AS (SELECT id FROM usrs WHERE usr=?) '
+    hierarchy_transitive = \
+        'WITH RECURSIVE hierarchy(usr_id) AS ( \
+            SELECT id FROM usrs WHERE usr=? \
+            UNION \
+            SELECT bases.{0}_usr_id FROM bases JOIN hierarchy ON bases.{1}_usr_id=hierarchy.usr_id \
+         ) '
+
+    # Inclusions of the files found in the inclusion graph come with the file including and the file being included.
+    # Graph is either the given file alone or, recursively, all of the files it gets included by.
+    includers_select = \
+        'SELECT includers.path, includes.line, included.path \
+         FROM inclusion JOIN includes ON includes.included_file_id=inclusion.file_id \
+         JOIN files includers ON includers.id=includes.includer_file_id JOIN files included ON included.id=includes.included_file_id'
+    inclusion_direct = 'WITH inclusion(file_id) AS (SELECT id FROM files WHERE path=?) '
+    inclusion_transitive = \
+        'WITH RECURSIVE inclusion(file_id) AS ( \
+            SELECT id FROM files WHERE path=? \
+            UNION \
+            SELECT includes.includer_file_id FROM includes JOIN inclusion ON includes.included_file_id=inclusion.file_id \
+         ) '
+
+    # Workspace symbol search candidates
+    usrs_select = 'SELECT id, name, qualified_name, kind, initials FROM usrs'
+
+    # Symbol rows come with the filename and USR resolved
+    symbol_select = \
+        'SELECT files.path, symbol.line, symbol.column, usrs.usr, usrs.kind, symbol.is_definition, usrs.name \
+         FROM symbol JOIN files ON files.id=symbol.file_id JOIN usrs ON usrs.id=symbol.usr_id'
 
     def __init__(self, db_filename = None):
         self.filename = db_filename
+        self.bulk_rows = None
+        self.rows_written = 0
+        self.file_ids, self.usr_ids = {}, {}
         if db_filename:
-            self.db_connection = sqlite3.connect(db_filename)
+            self.db_connection = self.__connect(db_filename)
         else:
             self.db_connection = None
 
@@ -18,9 +100,18 @@ class SymbolDatabase(object):
 
     def open(self, db_filename):
         if not self.db_connection:
-            self.db_connection = sqlite3.connect(db_filename)
+            self.db_connection = self.__connect(db_filename)
             self.filename = db_filename
 
+    def __connect(self, db_filename):
+        # WAL journal lets readers (e.g. go-to-definition) proceed while the indexer is writing and, with
+        # synchronous=NORMAL, commits no longer wait for the disk.
+        db_connection = sqlite3.connect(db_filename)
+        db_connection.execute('PRAGMA journal_mode=WAL')
+        db_connection.execute('PRAGMA synchronous=NORMAL')
+        self.file_ids, self.usr_ids = {}, {}
+        return db_connection
+
     def close(self):
         if self.db_connection:
             self.db_connection.close()
@@ -41,88 +132,558 @@ class SymbolDatabase(object):
     def get_usr(self, row):
         return row[3].encode('utf8', 'ignore')
 
-    def get_context(self, row):
-        return row[4].encode('utf8', 'ignore')
-
     def get_kind(self, row):
-        return row[5]
+        return row[4]
 
     def get_is_definition(self, row):
-        return row[6]
+        return row[5]
+
+    def get_name(self, row):
+        return row[6].encode('utf8', 'ignore')
 
     def get_all(self):
         # TODO Use generators
-        return self.db_connection.cursor().execute('SELECT * FROM symbol')
+        return self.db_connection.cursor().execute(SymbolDatabase.symbol_select)
 
-    def get_by_usr(self, usr):
-        return self.db_connection.cursor().execute('SELECT * FROM symbol WHERE usr=?', (usr,))
+    def get_by_usr(self, usr, offset=0):
+        # Offset lets the caller skip the rows it has already been given. NOTE Relies on rows coming in the same order
+        #      each time, i.e. in the order of the index they are looked up in.
+        if offset:
+            return self.db_connection.cursor().execute(SymbolDatabase.symbol_select + ' WHERE usrs.usr=? LIMIT -1 OFFSET ?', (usr, offset,))
+        return self.db_connection.cursor().execute(SymbolDatabase.symbol_select + ' WHERE usrs.usr=?', (usr,))
 
     def get_definition(self, usr):
-        return self.db_connection.cursor().execute('SELECT * FROM symbol WHERE usr=? AND is_definition=1', (usr,))
+        return self.db_connection.cursor().execute(SymbolDatabase.symbol_select + ' WHERE usrs.usr=? AND symbol.is_definition=1', (usr,))
+
+    def find_symbols(self, query, limit):
+        # Workspace symbol search: names starting with the query, names whose initials start with it (i.e. camel-case
+        # or snake_case abbreviations such as 'gfb' for 'getFooBar') and names containing it (served from the trigram
+        # index). Only the symbols which are visible outside of the function they are declared in (i.e. those with
+        # the qualified name) are searched. Each match comes with the location of its definition (or declaration if
+        # there is none): [(name, qualified_name, kind, filename, line, column)]
+        if not query:
+            return []
+        query = query.decode('utf8') if isinstance(query, str) else query
+        # Queries containing the scope (e.g. 'ns::Cl') are looked up by the name ('Cl'), by prefix or initials only,
+        # and then narrowed down by the qualified name. Searching the qualified names themselves would not get us far
+        # since most of them share the same few (namespace) trigrams.
+        name, scope_filter = query, ('',)
+        if '::' in query:
+            name = query.rpartition('::')[2]
+            scope_filter = (" AND usrs.qualified_name LIKE ? ESCAPE '\\'", '%' + escape_like(query) + '%',)
+        # NOTE Prefix lookups are spelled out as ranges rather than LIKE 'prefix%' because SQLite does not use the
+        #      index for LIKE whose pattern is given as a parameter (not unless the statement is re-prepared for it).
+        candidates = {}
+        self.__find_candidates(candidates,
+            SymbolDatabase.usrs_select + ' WHERE name >= ? COLLATE NOCASE AND name < ? COLLATE NOCASE AND qualified_name IS NOT NULL',
+            (name, name + u'\uffff',), scope_filter
+        )
+        if name:
+            self.__find_candidates(candidates,
+                SymbolDatabase.usrs_select + ' WHERE initials >= ? COLLATE NOCASE AND initials < ? COLLATE NOCASE',
+                (name, name + u'\uffff',), scope_filter
+            )
+        if len(query) >= 3 and not scope_filter[0]: # Trigram index cannot match anything shorter than that
+            try:
+                self.__find_candidates(candidates,
+                    'SELECT usrs.id, usrs.name, usrs.qualified_name, usrs.kind, usrs.initials \
+                     FROM usrs_search JOIN usrs ON usrs.id=usrs_search.rowid WHERE usrs_search MATCH ?',
+                    ('"' + query.replace('"', '""') + '"',)
+                )
+            except sqlite3.OperationalError: # No trigram index (i.e. SQLite built without FTS5) so we have to scan
+                self.__find_candidates(candidates,
+                    SymbolDatabase.usrs_select + " WHERE name LIKE ? ESCAPE '\\' AND qualified_name IS NOT NULL",
+                    ('%' + escape_like(query) + '%',)
+                )
+        symbols = []
+        for usr_id, name, qualified_name, kind, initials in sorted(candidates.itervalues(),
+            key=lambda candidate: (rank_symbol(query, candidate[1], candidate[2], candidate[4]), len(candidate[1]), candidate[1], candidate[2])):
+            location = self.db_connection.cursor().execute(
+                'SELECT files.path, symbol.line, symbol.column FROM symbol JOIN files ON files.id=symbol.file_id \
+                 WHERE symbol.usr_id=? ORDER BY symbol.is_definition DESC LIMIT 1', (usr_id,)
+            ).fetchone()
+            if location is None:
+                continue # Symbol is not referenced from any of the files anymore
+            symbols.append((
+                name.encode('utf8', 'ignore'), qualified_name.encode('utf8', 'ignore'), kind,
+                location[0].encode('utf8', 'ignore'), location[1], location[2],
+            ))
+            if len(symbols) == limit:
+                break
+        return symbols
+
+    def __find_candidates(self, candidates, sql, args, scope_filter=('',)):
+        for row in self.db_connection.cursor().execute(sql + scope_filter[0] + ' LIMIT ?', args + scope_filter[1:] + (SymbolDatabase.search_candidates,)):
+            candidates[row[0]] = row
+
+    def get_incoming_calls(self, usr):
+        # Call sites of the given function together with the function each of them is found in
+        return self.db_connection.cursor().execute(SymbolDatabase.calls_select.format('caller', 'callee'), (usr,))
+
+    def get_outgoing_calls(self, usr):
+        # Call sites found in the given function together with the function being called
+        return self.db_connection.cursor().execute(SymbolDatabase.calls_select.format('callee', 'caller'), (usr,))
+
+    def get_derived_classes(self, usr, transitive=True):
+        # Classes deriving from the given one, directly or (transitively) through any number of other classes
+        return self.__get_hierarchy(usr, transitive, 'derived', 'base')
+
+    def get_base_classes(self, usr, transitive=True):
+        # Classes the given one derives from, directly or (transitively) through any number of other classes
+        return self.__get_hierarchy(usr, transitive, 'base', 'derived')
+
+    def __get_hierarchy(self, usr, transitive, other_end, this_end):
+        hierarchy = SymbolDatabase.hierarchy_transitive if transitive else SymbolDatabase.hierarchy_direct
+        return self.db_connection.cursor().execute(
+            hierarchy.format(other_end, this_end) + SymbolDatabase.bases_select.format(other_end, this_end), (usr,)
+        )
+
+    def get_includers(self, filename, transitive=True):
+        # Files including the given one, directly or (transitively) through any number of other files
+        filename = filename.decode('utf8') if isinstance(filename, str) else filename
+        inclusion = SymbolDatabase.inclusion_transitive if transitive else SymbolDatabase.inclusion_direct
+        return self.db_connection.cursor().execute(inclusion + SymbolDatabase.includers_select, (filename,))
 
-    def insert_single(self, filename, line, column, unique_id, context, symbol_kind, is_definition):
+    def get_included_files(self):
+        # Files included by any of the indexed files, i.e. the headers reachable from the files which have been indexed
+        return [row[0].encode('utf8', 'ignore') for row in self.db_connection.cursor().execute(
+            'SELECT path FROM files WHERE id IN (SELECT included_file_id FROM includes)'
+        )]
+
+    def insert_include(self, includer, included, line):
+        # Inclusions belong to the file including the other one, i.e. these go away once the includer is deleted
         try:
-            if unique_id != '':
-                self.db_connection.cursor().execute('INSERT INTO symbol VALUES (?, ?, ?, ?, ?, ?, ?)',
-                    (
-                        filename.decode('utf8') if isinstance(filename, str) else filename,     # NOTE Decoding an already UTF-8 encoded
-                        line,                                                                   #      string (unicode) raises an exception.
-                        column,                                                                 #      Therefore 'isinstance' check.
-                        unique_id.decode('utf8') if isinstance(unique_id, str) else unique_id,
-                        context.decode('utf8') if isinstance(context, str) else context,
-                        symbol_kind,
-                        is_definition,
-                    )
+            row = (
+                self.__get_file_id(included),
+                self.__get_file_id(includer),
+                line,
+            )
+        except sqlite3.ProgrammingError as e:
+            logging.error(
+                'Failed to insert include \'[{0}, {1}, {2}]\' into the database. Exception details: \'{3}\''.format(
+                    includer, included, line, e
+                )
+            )
+            return
+        self.db_connection.cursor().execute('INSERT OR IGNORE INTO includes VALUES (?, ?, ?)', row)
+
+    def claim_headers(self, filenames, declarations_only=False, claimed_by=None):
+        # Each of the headers is indexed only once, by whichever of the indexing workers gets to claim it first (see
+        # get_recorded_files()). Claims of all given headers are made at once. Claim is released once the symbols
+        # of the header are deleted (see delete()), which is when it gets to be claimed again. Header claimed by the
+        # declaration pass (see index_single_file()) is still to be claimed, once, by a worker recording everything.
+        # Claim remembers the file it has been made for so that it can be released if indexing of that one fails.
+        # Headers are left unclaimed, and are recorded by somebody else, if the database stays locked all along.
+        claimed_by = claimed_by.decode('utf8') if isinstance(claimed_by, str) else claimed_by
+        for attempt in range(SymbolDatabase.claim_attempts):
+            claimed = []
+            try:
+                for filename in filenames:
+                    path = filename.decode('utf8') if isinstance(filename, str) else filename
+                    if self.db_connection.cursor().execute('INSERT OR IGNORE INTO indexed_headers VALUES (?, ?, ?)', (path, declarations_only, claimed_by,)).rowcount:
+                        claimed.append(filename)
+                    elif not declarations_only and self.db_connection.cursor().execute(
+                        'UPDATE indexed_headers SET declarations_only=0, claimed_by=? WHERE path=? AND declarations_only', (claimed_by, path,)).rowcount:
+                        claimed.append(filename)
+                self.db_connection.commit()
+                return claimed
+            except sqlite3.OperationalError as e:
+                self.db_connection.rollback()
+                logging.warning('Failed to claim {0} header(s) (attempt {1} of {2}). Exception details: \'{3}\''.format(
+                    len(filenames), attempt + 1, SymbolDatabase.claim_attempts, e)
                 )
+        return []
+
+    def get_claimed_headers(self, claimed_by=None):
+        # Headers which have been claimed, either by anyone or by the given file only
+        if claimed_by is None:
+            rows = self.db_connection.cursor().execute('SELECT path FROM indexed_headers')
+        else:
+            claimed_by = claimed_by.decode('utf8') if isinstance(claimed_by, str) else claimed_by
+            rows = self.db_connection.cursor().execute('SELECT path FROM indexed_headers WHERE claimed_by=?', (claimed_by,))
+        return [row[0].encode('utf8', 'ignore') for row in rows]
+
+    def insert_base(self, filename, line, column, derived_usr, base_usr, access, is_virtual):
+        # USRs are expected to have been recorded (see insert_single()) already, as derived is the class being
+        # visited and base is the class base specifier refers to.
+        if derived_usr == '' or base_usr == '':
+            return
+        try:
+            row = (
+                self.__get_usr_id(base_usr, '', None),
+                self.__get_usr_id(derived_usr, '', None),
+                self.__get_file_id(filename),
+                line,
+                column,
+                access,
+                is_virtual,
+            )
         except sqlite3.ProgrammingError as e:
             logging.error(
-                'Failed to insert \'[{0}, {1}, {2}, {3}, {4}, {5}, {6}]\' into the database. Exception details: \'{7}\''.format(
-                    filename, line, column, unique_id, context, symbol_kind, is_definition, e
+                'Failed to insert base \'[{0}, {1}, {2}, {3}, {4}]\' into the database. Exception details: \'{5}\''.format(
+                    filename, line, column, derived_usr, base_usr, e
                 )
             )
+            return
+        self.db_connection.cursor().execute('INSERT OR IGNORE INTO bases VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+
+    def insert_call(self, filename, line, column, caller_usr, callee_usr):
+        # USRs are expected to have been recorded (see insert_single()) already, as caller is the function being
+        # visited and callee is the symbol call expression refers to.
+        if caller_usr == '' or callee_usr == '':
+            return
+        try:
+            row = (
+                self.__get_usr_id(callee_usr, '', None),
+                self.__get_usr_id(caller_usr, '', None),
+                self.__get_file_id(filename),
+                line,
+                column,
+            )
+        except sqlite3.ProgrammingError as e:
+            logging.error(
+                'Failed to insert call \'[{0}, {1}, {2}, {3}, {4}]\' into the database. Exception details: \'{5}\''.format(
+                    filename, line, column, caller_usr, callee_usr, e
+                )
+            )
+            return
+        self.db_connection.cursor().execute('INSERT OR IGNORE INTO calls VALUES (?, ?, ?, ?, ?)', row)
+
+    def is_usr_known(self, usr):
+        # Whether the USR has already been recorded through this connection, i.e. whether whatever is going to be
+        # recorded together with it (see insert_single()) is going to be thrown away anyway.
+        return (usr.decode('utf8') if isinstance(usr, str) else usr) in self.usr_ids
+
+    def insert_single(self, filename, line, column, unique_id, symbol_kind, is_definition, name='', qualified_name=None):
+        if unique_id == '':
+            return
+        try:
+            row = (
+                self.__get_file_id(filename),
+                line,
+                column,
+                self.__get_usr_id(unique_id, name, symbol_kind, qualified_name),
+                is_definition,
+            )
+        except sqlite3.ProgrammingError as e:
+            logging.error(
+                'Failed to insert \'[{0}, {1}, {2}, {3}, {4}, {5}]\' into the database. Exception details: \'{6}\''.format(
+                    filename, line, column, unique_id, symbol_kind, is_definition, e
+                )
+            )
+            return
+        if self.bulk_rows is not None:
+            self.bulk_rows.append(row)
+            if len(self.bulk_rows) >= SymbolDatabase.bulk_load_batch_size:
+                self.__write_bulk_rows()
+            return
+        try:
+            self.db_connection.cursor().execute('INSERT INTO symbol VALUES (?, ?, ?, ?, ?)', row)
+            self.rows_written += 1
         except sqlite3.IntegrityError:
             pass # NOTE Very much expected to be triggered during indexer operation and not an error
 
+    def __get_file_id(self, filename):
+        filename = filename.decode('utf8') if isinstance(filename, str) else filename   # NOTE Decoding an already UTF-8 encoded
+        file_id = self.file_ids.get(filename, None)                                     #      string (unicode) raises an exception.
+        if file_id is None:                                                             #      Therefore 'isinstance' check.
+            self.db_connection.cursor().execute('INSERT OR IGNORE INTO files (path) VALUES (?)', (filename,))
+            file_id = self.file_ids[filename] = self.db_connection.cursor().execute('SELECT id FROM files WHERE path=?', (filename,)).fetchone()[0]
+        return file_id
+
+    def __get_usr_id(self, usr, name, kind, qualified_name=None):
+        usr = usr.decode('utf8') if isinstance(usr, str) else usr
+        usr_id = self.usr_ids.get(usr, None)
+        if usr_id is None:
+            name = name.decode('utf8') if isinstance(name, str) else name
+            qualified_name = qualified_name.decode('utf8') if isinstance(qualified_name, str) else qualified_name
+            self.db_connection.cursor().execute('INSERT OR IGNORE INTO usrs (usr, name, kind, qualified_name, initials) VALUES (?, ?, ?, ?, ?)',
+                (usr, name, kind, qualified_name, get_initials(name) if qualified_name else None,)
+            )
+            usr_id = self.usr_ids[usr] = self.db_connection.cursor().execute('SELECT id FROM usrs WHERE usr=?', (usr,)).fetchone()[0]
+        return usr_id
+
+    def begin_bulk_load(self):
+        # Rows are from now on buffered and written in large batches (see flush()), secondary indexes are dropped
+        # and commits do not even wait for the OS to write the data out. Meant for the (re-)indexing runs where
+        # it is cheaper to redo the run than to pay for all of this on every insert.
+        self.bulk_rows = []
+        self.db_connection.execute('PRAGMA synchronous=OFF')
+        for name, columns in SymbolDatabase.indexes:
+            self.db_connection.execute('DROP INDEX IF EXISTS {0}'.format(name))
+
+    def end_bulk_load(self):
+        self.flush()
+        self.bulk_rows = None
+        for name, columns in SymbolDatabase.indexes:
+            self.db_connection.execute('CREATE INDEX IF NOT EXISTS {0} ON {1}'.format(name, columns))
+        self.db_connection.execute('PRAGMA synchronous=NORMAL')
+
+    def __write_bulk_rows(self):
+        try:
+            self.db_connection.cursor().executemany('INSERT OR IGNORE INTO symbol VALUES (?, ?, ?, ?, ?)', self.bulk_rows)
+            self.rows_written += len(self.bulk_rows)
+        except sqlite3.ProgrammingError as e:
+            logging.error('Failed to insert a batch of {0} rows into the database. Exception details: \'{1}\''.format(len(self.bulk_rows), e))
+        self.bulk_rows = []
+
     def insert_from(self, symbol_db_filename_list):
-        for db in symbol_db_filename_list:
-            symbol_db = SymbolDatabase(db)
-            rows = symbol_db.get_all()
-            if rows:
-                for row in rows:
-                    self.insert_single(
-                        symbol_db.get_filename(row),
-                        symbol_db.get_line(row),
-                        symbol_db.get_column(row),
-                        symbol_db.get_usr(row),
-                        symbol_db.get_context(row),
-                        symbol_db.get_kind(row),
-                        symbol_db.get_is_definition(row)
+        # Rows are copied from one database to another by SQLite itself, without ever being brought into Python.
+        # Only a limited number of databases can be attached at once (SQLITE_MAX_ATTACHED) hence the batches.
+        # Each database has its own file and USR ids so these are translated through the path and USR they stand for.
+        # Databases without the data model (e.g. the worker has died before creating it) are skipped and returned.
+        start, rows_written, skipped = time.time(), 0, []
+        self.flush()
+        for batch_start in range(0, len(symbol_db_filename_list), SymbolDatabase.max_attached):
+            batch = symbol_db_filename_list[batch_start:batch_start+SymbolDatabase.max_attached]
+            for index, db in enumerate(batch):
+                self.db_connection.execute('ATTACH DATABASE ? AS worker{0}'.format(index), (db,))
+            try:
+                for index in range(len(batch)):
+                    worker = 'worker{0}'.format(index)
+                    if not self.has_data_model(worker):
+                        logging.error("Skipping '{0}' as it has no data model to be merged from.".format(batch[index]))
+                        skipped.append(batch[index])
+                        continue
+                    self.db_connection.execute(
+                        'INSERT OR IGNORE INTO main.files (path) \
+                         SELECT path FROM {0}.files WHERE id IN ( \
+                            SELECT file_id FROM {0}.symbol UNION SELECT includer_file_id FROM {0}.includes UNION SELECT included_file_id FROM {0}.includes \
+                         )'.format(worker)
+                    )
+                    self.db_connection.execute(
+                        'INSERT OR IGNORE INTO main.usrs (usr, name, kind, qualified_name, initials) \
+                         SELECT usr, name, kind, qualified_name, initials FROM {0}.usrs WHERE id IN ( \
+                            SELECT usr_id FROM {0}.symbol UNION SELECT callee_usr_id FROM {0}.calls UNION SELECT caller_usr_id FROM {0}.calls \
+                            UNION SELECT base_usr_id FROM {0}.bases UNION SELECT derived_usr_id FROM {0}.bases \
+                         )'.format(worker)
+                    )
+                    rows_written += self.db_connection.execute(
+                        'INSERT OR IGNORE INTO main.symbol \
+                         SELECT main_files.id, s.line, s.column, main_usrs.id, s.is_definition \
+                         FROM {0}.symbol s \
+                         JOIN {0}.files worker_files ON worker_files.id=s.file_id JOIN main.files main_files ON main_files.path=worker_files.path \
+                         JOIN {0}.usrs worker_usrs ON worker_usrs.id=s.usr_id JOIN main.usrs main_usrs ON main_usrs.usr=worker_usrs.usr'.format(worker)
+                    ).rowcount
+                    self.db_connection.execute(
+                        'INSERT OR IGNORE INTO main.calls \
+                         SELECT main_callees.id, main_callers.id, main_files.id, c.line, c.column \
+                         FROM {0}.calls c \
+                         JOIN {0}.files worker_files ON worker_files.id=c.file_id JOIN main.files main_files ON main_files.path=worker_files.path \
+                         JOIN {0}.usrs worker_callees ON worker_callees.id=c.callee_usr_id JOIN main.usrs main_callees ON main_callees.usr=worker_callees.usr \
+                         JOIN {0}.usrs worker_callers ON worker_callers.id=c.caller_usr_id JOIN main.usrs main_callers ON main_callers.usr=worker_callers.usr'.format(worker)
+                    )
+                    self.db_connection.execute(
+                        'INSERT OR IGNORE INTO main.bases \
+                         SELECT main_bases.id, main_derived.id, main_files.id, b.line, b.column, b.access, b.is_virtual \
+                         FROM {0}.bases b \
+                         JOIN {0}.files worker_files ON worker_files.id=b.file_id JOIN main.files main_files ON main_files.path=worker_files.path \
+                         JOIN {0}.usrs worker_bases ON worker_bases.id=b.base_usr_id JOIN main.usrs main_bases ON main_bases.usr=worker_bases.usr \
+                         JOIN {0}.usrs worker_derived ON worker_derived.id=b.derived_usr_id JOIN main.usrs main_derived ON main_derived.usr=worker_derived.usr'.format(worker)
+                    )
+                    self.db_connection.execute(
+                        'INSERT OR IGNORE INTO main.includes \
+                         SELECT main_included.id, main_includers.id, i.line \
+                         FROM {0}.includes i \
+                         JOIN {0}.files worker_included ON worker_included.id=i.included_file_id JOIN main.files main_included ON main_included.path=worker_included.path \
+                         JOIN {0}.files worker_includers ON worker_includers.id=i.includer_file_id JOIN main.files main_includers ON main_includers.path=worker_includers.path'.format(worker)
                     )
                 self.flush()
-            symbol_db.close()
+            except sqlite3.Error:
+                self.db_connection.rollback()
+                raise
+            finally:
+                for index in range(len(batch)):
+                    self.db_connection.execute('DETACH DATABASE worker{0}'.format(index))
+        self.rows_written += rows_written
+        logging.info("Merged {0} symbol(s) from {1} database(s) in {2:.3f}s.".format(rows_written, len(symbol_db_filename_list) - len(skipped), time.time() - start))
+        return skipped
 
     def flush(self):
+        if self.bulk_rows:
+            self.__write_bulk_rows()
         self.db_connection.commit()
 
+    def get_all_files(self):
+        # Returns the state of each indexed file as it was at the time of indexing: { filename: (mtime, size, content_hash, compiler_args_hash) }
+        files = {}
+        for row in self.db_connection.cursor().execute('SELECT path, mtime, size, content_hash, compiler_args_hash FROM files WHERE mtime IS NOT NULL'):
+            files[row[0].encode('utf8', 'ignore')] = (row[1], row[2], row[3].encode('utf8', 'ignore'), row[4].encode('utf8', 'ignore'),)
+        return files
+
+    def get_declarations_only_files(self):
+        # Files indexed by the declaration pass only, i.e. the ones whose references are yet to be recorded. Headers
+        # are at the tier of their claim (see claim_headers()), source files at the tier they were indexed at.
+        return [row[0].encode('utf8', 'ignore') for row in self.db_connection.cursor().execute(
+            'SELECT path FROM files WHERE declarations_only AND mtime IS NOT NULL UNION SELECT path FROM indexed_headers WHERE declarations_only'
+        )]
+
+    def insert_file(self, filename, mtime, size, content_hash, compiler_args_hash, indexed_at, declarations_only=False):
+        self.db_connection.cursor().execute('UPDATE files SET mtime=?, size=?, content_hash=?, compiler_args_hash=?, indexed_at=?, declarations_only=? WHERE id=?',
+            (
+                mtime,
+                size,
+                content_hash,
+                compiler_args_hash,
+                indexed_at,
+                declarations_only,
+                self.__get_file_id(filename),
+            )
+        )
+
+    def outdate_file(self, filename):
+        # File is treated as if it has never been indexed (see get_all_files()) until its state is recorded again
+        filename = filename.decode('utf8') if isinstance(filename, str) else filename
+        self.db_connection.cursor().execute('UPDATE files SET mtime=NULL WHERE path=?', (filename,))
+
+    def delete_file(self, filename):
+        filename = filename.decode('utf8') if isinstance(filename, str) else filename
+        self.file_ids.pop(filename, None)
+        self.db_connection.cursor().execute('DELETE FROM includes WHERE included_file_id=(SELECT id FROM files WHERE path=?)', (filename,))
+        self.db_connection.cursor().execute('DELETE FROM files WHERE path=?', (filename,))
+
     def delete(self, filename):
-        self.db_connection.cursor().execute('DELETE FROM symbol WHERE filename=?', (filename,))
+        if self.bulk_rows:
+            self.__write_bulk_rows() # Rows buffered so far might belong to the file being deleted
+        self.db_connection.cursor().execute('DELETE FROM symbol WHERE file_id=(SELECT id FROM files WHERE path=?)', (filename,))
+        self.db_connection.cursor().execute('DELETE FROM calls WHERE file_id=(SELECT id FROM files WHERE path=?)', (filename,))
+        self.db_connection.cursor().execute('DELETE FROM bases WHERE file_id=(SELECT id FROM files WHERE path=?)', (filename,))
+        self.db_connection.cursor().execute('DELETE FROM includes WHERE includer_file_id=(SELECT id FROM files WHERE path=?)', (filename,))
+        self.db_connection.cursor().execute('DELETE FROM indexed_headers WHERE path=?', (filename,))
+
+    def delete_all_symbols(self):
+        # Unlike delete_all(), files and USRs are kept so that their ids which somebody else (e.g. the indexing
+        # worker which owns this database) might have cached remain valid.
+        if self.bulk_rows:
+            self.bulk_rows = []
+        self.db_connection.cursor().execute('DELETE FROM symbol')
+        self.db_connection.cursor().execute('DELETE FROM calls')
+        self.db_connection.cursor().execute('DELETE FROM bases')
+        self.db_connection.cursor().execute('DELETE FROM includes')
+        self.db_connection.cursor().execute('DELETE FROM indexed_headers')
 
     def delete_all(self):
+        if self.bulk_rows:
+            self.bulk_rows = []
         self.db_connection.cursor().execute('DELETE FROM symbol')
+        self.db_connection.cursor().execute('DELETE FROM calls')
+        self.db_connection.cursor().execute('DELETE FROM bases')
+        self.db_connection.cursor().execute('DELETE FROM includes')
+        self.db_connection.cursor().execute('DELETE FROM indexed_headers')
+        self.db_connection.cursor().execute('DELETE FROM files')
+        self.db_connection.cursor().execute('DELETE FROM usrs')
+        self.file_ids, self.usr_ids = {}, {}
+
+    def has_data_model(self, schema='main'):
+        # Tables might be missing, or only some of them be there, if whoever was creating them has died in between
+        tables = set(row[0] for row in self.db_connection.cursor().execute("SELECT name FROM {0}.sqlite_master WHERE type='table'".format(schema)))
+        return all(table in tables for table in ['files', 'usrs', 'symbol', 'calls', 'bases', 'includes', 'indexed_headers'])
+
+    def get_version(self):
+        if not self.db_connection.cursor().execute("SELECT name FROM sqlite_master WHERE type='table' AND name='version'").fetchone():
+            return None
+        return self.db_connection.cursor().execute('SELECT major, minor FROM version ORDER BY major DESC, minor DESC').fetchone()
 
     def create_data_model(self):
+        version = self.get_version()
+        # Each of the steps takes the data model from given version to the next one
+        migrations = [
+            ((0, 1), self.__migrate_from_0_1),
+            ((0, 2), self.__migrate_from_0_2),
+            ((0, 3), self.__migrate_from_0_3),
+            ((0, 4), self.__schedule_reindexing),   # 0.4 did not record the calls
+            ((0, 5), self.__schedule_reindexing),   # 0.5 did not record the base classes
+            ((0, 6), self.__schedule_reindexing),   # 0.6 did not record the includes
+            ((0, 7), self.__schedule_reindexing),   # 0.7 indexed the headers on their own
+            ((0, 8), self.__migrate_from_0_8),
+            ((0, 9), self.__migrate_from_0_9),
+        ]
+        if version and version < (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR):
+            self.__migrate(version, [migrate for from_version, migrate in migrations if from_version >= version])
+        self.__create_tables()
+        self.__create_search_index()
+        self.db_connection.cursor().execute(
+            'INSERT OR IGNORE INTO version VALUES (?, ?)', (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR,)
+        )
+        for name in SymbolDatabase.obsolete_indexes:
+            self.db_connection.cursor().execute('DROP INDEX IF EXISTS {0}'.format(name))
+        if self.bulk_rows is None:
+            for name, columns in SymbolDatabase.indexes:
+                self.db_connection.cursor().execute('CREATE INDEX IF NOT EXISTS {0} ON {1}'.format(name, columns))
+
+    def __create_tables(self):
+        self.db_connection.cursor().execute(
+            'CREATE TABLE IF NOT EXISTS files (   \
+                id                 integer,      \
+                path               text UNIQUE,  \
+                mtime              real,         \
+                size               integer,      \
+                content_hash       text,         \
+                compiler_args_hash text,         \
+                indexed_at         real,         \
+                declarations_only  boolean DEFAULT 0, \
+                PRIMARY KEY(id)                  \
+             )'
+        )
         self.db_connection.cursor().execute(
-            'CREATE TABLE IF NOT EXISTS symbol ( \
-                filename        text,            \
-                line            integer,         \
-                column          integer,         \
-                usr             text,            \
-                context         text,            \
-                kind            integer,         \
-                is_definition   boolean,         \
-                PRIMARY KEY(filename, usr, line) \
+            'CREATE TABLE IF NOT EXISTS usrs (    \
+                id                 integer,      \
+                usr                text UNIQUE,  \
+                name               text,         \
+                kind               integer,      \
+                qualified_name     text,         \
+                initials           text,         \
+                PRIMARY KEY(id)                  \
              )'
         )
+        self.db_connection.cursor().execute(
+            'CREATE TABLE IF NOT EXISTS symbol (  \
+                file_id            integer,      \
+                line               integer,      \
+                column             integer,      \
+                usr_id             integer,      \
+                is_definition      boolean,      \
+                PRIMARY KEY(file_id, usr_id, line) \
+             ) WITHOUT ROWID'
+        )
+        self.db_connection.cursor().execute(
+            'CREATE TABLE IF NOT EXISTS calls (   \
+                callee_usr_id      integer,      \
+                caller_usr_id      integer,      \
+                file_id            integer,      \
+                line               integer,      \
+                column             integer,      \
+                PRIMARY KEY(callee_usr_id, caller_usr_id, file_id, line, column) \
+             ) WITHOUT ROWID'
+        )
+        self.db_connection.cursor().execute(
+            'CREATE TABLE IF NOT EXISTS bases (   \
+                base_usr_id        integer,      \
+                derived_usr_id     integer,      \
+                file_id            integer,      \
+                line               integer,      \
+                column             integer,      \
+                access             integer,      \
+                is_virtual         boolean,      \
+                PRIMARY KEY(base_usr_id, derived_usr_id, file_id, line) \
+             ) WITHOUT ROWID'
+        )
+        self.db_connection.cursor().execute(
+            'CREATE TABLE IF NOT EXISTS includes ( \
+                included_file_id   integer,      \
+                includer_file_id   integer,      \
+                line               integer,      \
+                PRIMARY KEY(included_file_id, includer_file_id, line) \
+             ) WITHOUT ROWID'
+        )
+        self.db_connection.cursor().execute(
+            'CREATE TABLE IF NOT EXISTS indexed_headers ( \
+                path               text,         \
+                declarations_only  boolean DEFAULT 0, \
+                claimed_by         text,         \
+                PRIMARY KEY(path)                \
+             ) WITHOUT ROWID'
+        )
         self.db_connection.cursor().execute(
             'CREATE TABLE IF NOT EXISTS version ( \
                 major integer,            \
@@ -130,6 +691,126 @@ class SymbolDatabase(object):
                 PRIMARY KEY(major, minor) \
              )'
         )
+
+    def __create_search_index(self):
+        # Trigram index over the names of the symbols which are visible outside of the function they are declared in.
+        # Index does not keep a copy of the names (content='usrs') and it is kept up-to-date by the triggers.
+        try:
+            self.db_connection.cursor().execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS usrs_search USING fts5(name, content='usrs', content_rowid='id', tokenize='trigram')"
+            )
+        except sqlite3.OperationalError as e:
+            logging.warning("Substring search over the symbol names is going to be slow. Failed to create the trigram index: '{0}'".format(e))
+            return
+        self.db_connection.cursor().execute(
+            'CREATE TRIGGER IF NOT EXISTS usrs_search_insert AFTER INSERT ON usrs WHEN new.qualified_name IS NOT NULL BEGIN \
+                INSERT INTO usrs_search (rowid, name) VALUES (new.id, new.name); \
+             END'
+        )
         self.db_connection.cursor().execute(
-            'INSERT INTO version VALUES (?, ?)', (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR,)
+            "CREATE TRIGGER IF NOT EXISTS usrs_search_delete AFTER DELETE ON usrs WHEN old.qualified_name IS NOT NULL BEGIN \
+                INSERT INTO usrs_search (usrs_search, rowid, name) VALUES ('delete', old.id, old.name); \
+             END"
         )
+
+    def __migrate(self, version, steps):
+        # Whole migration runs in a single transaction so that the database is either migrated or left intact
+        start = time.time()
+        logging.info("Migrating symbol database '{0}' from version {1}.{2} to {3}.{4} ...".format(
+            self.filename, version[0], version[1], SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR)
+        )
+        cursor = self.db_connection.cursor()
+        isolation_level, self.db_connection.isolation_level = self.db_connection.isolation_level, None
+        try:
+            cursor.execute('BEGIN')
+            for migrate in steps:
+                migrate(cursor)
+            cursor.execute('DELETE FROM version')
+            cursor.execute('COMMIT')
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            self.db_connection.isolation_level = isolation_level
+        self.db_connection.execute('VACUUM') # Give the space occupied by the old tables back
+        logging.info("Migration completed in {0:.2f}s.".format(time.time() - start))
+
+    def __migrate_from_0_1(self, cursor):
+        # 0.1 kept the filename, USR and the whole line of code in each of the symbol rows. Filenames and USRs are
+        # now interned into 'files' and 'usrs' tables and the lines of code are read from the source files.
+        tables = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        cursor.execute('ALTER TABLE symbol RENAME TO symbol_0_1')
+        if 'files' in tables:
+            cursor.execute('ALTER TABLE files RENAME TO files_0_1')
+        self.__create_tables()
+        if 'files' in tables:
+            cursor.execute(
+                'INSERT INTO files (path, mtime, size, content_hash, compiler_args_hash, indexed_at) \
+                 SELECT filename, mtime, size, content_hash, compiler_args_hash, indexed_at FROM files_0_1'
+            )
+        cursor.execute('INSERT OR IGNORE INTO files (path) SELECT DISTINCT filename FROM symbol_0_1')
+        cursor.execute('INSERT OR IGNORE INTO usrs (usr, name, kind) SELECT usr, \'\', kind FROM symbol_0_1 GROUP BY usr')
+        cursor.execute(
+            'INSERT OR IGNORE INTO symbol \
+             SELECT files.id, symbol_0_1.line, symbol_0_1.column, usrs.id, symbol_0_1.is_definition \
+             FROM symbol_0_1 JOIN files ON files.path=symbol_0_1.filename JOIN usrs ON usrs.usr=symbol_0_1.usr'
+        )
+        cursor.execute('DROP TABLE symbol_0_1')
+        if 'files' in tables:
+            cursor.execute('DROP TABLE files_0_1')
+
+    def __migrate_from_0_2(self, cursor):
+        # 0.2 kept the byte offset of the line each symbol is found at. These are now resolved from the source
+        # files themselves (see LineCache).
+        cursor.execute('ALTER TABLE symbol RENAME TO symbol_0_2')
+        self.__create_tables()
+        cursor.execute('INSERT INTO symbol SELECT file_id, line, column, usr_id, is_definition FROM symbol_0_2')
+        cursor.execute('DROP TABLE symbol_0_2')
+
+    def __migrate_from_0_3(self, cursor):
+        # 0.3 did not keep the qualified names of the symbols (nor the names, if it was migrated from 0.1). These are
+        # only to be found by parsing the files again so all of them are scheduled for re-indexing.
+        if 'qualified_name' not in [row[1] for row in cursor.execute('PRAGMA table_info(usrs)')]:
+            cursor.execute('ALTER TABLE usrs ADD COLUMN qualified_name text')
+            cursor.execute('ALTER TABLE usrs ADD COLUMN initials text')
+        cursor.execute('DELETE FROM symbol')
+        cursor.execute('DELETE FROM usrs')
+        cursor.execute('UPDATE files SET mtime=NULL')
+
+    def __migrate_from_0_8(self, cursor):
+        # 0.8 did not have the declaration pass so whatever it has indexed is complete
+        for table in ['files', 'indexed_headers']:
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info({0})'.format(table))]
+            if columns and 'declarations_only' not in columns:
+                cursor.execute('ALTER TABLE {0} ADD COLUMN declarations_only boolean DEFAULT 0'.format(table))
+
+    def __migrate_from_0_9(self, cursor):
+        # 0.9 did not keep track of who has claimed the header. Claims which are already there are left as they are.
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(indexed_headers)')]
+        if columns and 'claimed_by' not in columns:
+            cursor.execute('ALTER TABLE indexed_headers ADD COLUMN claimed_by text')
+
+    def __schedule_reindexing(self, cursor):
+        # Whatever the new tables are going to hold can only be found by parsing the files again
+        cursor.execute('UPDATE files SET mtime=NULL')
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def get_initials(name):
+    # First letter of each of the words the name is made of, e.g. 'gfb' for both 'getFooBar' and 'get_foo_bar'
+    return ''.join(word[0] for word in re.findall('[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+', name)).lower()
+
+def rank_symbol(query, name, qualified_name, initials):
+    # The lower the better: exact match, prefix, camel-case (initials) prefix, substring, anything else (e.g. matched
+    # by the qualified name only). Queries containing the scope (e.g. 'ns::Cl') are matched against qualified names.
+    query, text = query.lower(), (qualified_name if '::' in query else name).lower()
+    if text == query:
+        return 0
+    if text.startswith(query):
+        return 1
+    if initials and initials.startswith(query):
+        return 2
+    if query in text:
+        return 3
+    return 4
@@ -1,4 +1,5 @@
 import logging
+from cxxd.compact_result import CompactResult
 from cxxd.parser.ast_node_identifier import ASTNodeId
 from cxxd.parser.clang_parser import ChildVisitResult
 
@@ -16,6 +17,17 @@ class SemanticSyntaxHighlight():
         tunit = self.parser.parse(contents_filename, original_filename)
         return tunit is not None, [tunit, self.__traverse__]
 
+    def serialize_result(self, payload, args):
+        def callback(ast_node_id, ast_node_name, ast_node_line, ast_node_column, result):
+            result.append(0, result.intern(ast_node_id), result.intern(ast_node_name), ast_node_line, ast_node_column)
+
+        tunit, traverse = args
+        if tunit is None:
+            return None
+        result = CompactResult(4) # ast node id, ast node name, line, column
+        traverse(tunit, callback, result)
+        return result
+
 def semantic_syntax_highlight_visitor(ast_node, ast_parent_node, data):
     parser, tunit_spelling, client_callback, client_data = data
     if ast_node.location.file and ast_node.location.file.name == tunit_spelling:  # we're only interested in symbols from associated translation unit
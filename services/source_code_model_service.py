@@ -37,7 +37,7 @@ class SourceCodeModel(cxxd.service.Service):
                                         compiler_args_filename,
                                         cxxd.parser.tunit_cache.TranslationUnitCache(cxxd.parser.tunit_cache.FifoCache(20))
                                      )
-                self.clang_indexer = ClangIndexer(self.parser, project_root_directory)
+                self.clang_indexer = ClangIndexer(self.parser, project_root_directory, self.requests_pending)
                 self.service = {
                     SourceCodeModelSubServiceId.INDEXER                   : self.clang_indexer,
                     SourceCodeModelSubServiceId.SEMANTIC_SYNTAX_HIGHLIGHT : SemanticSyntaxHighlight(self.parser),
@@ -52,9 +52,35 @@ class SourceCodeModel(cxxd.service.Service):
             logging.error('Project root directory, \'{0}\', is not valid!'.format(project_root_directory))
 
     def shutdown_callback(self, args):
-        pass
+        if self.service:
+            self.clang_indexer.close()
 
     def __call__(self, args):
         if self.parser and self.service:
             return self.service.get(int(args[0]), self.__unknown_service)(args[1:len(args)])
         return False, None
+
+    def get_background_fds(self):
+        if self.service:
+            return self.clang_indexer.get_background_fds()
+        return []
+
+    def background_callback(self):
+        if self.service:
+            self.clang_indexer.background_callback()
+
+    def get_request_type(self, payload):
+        if self.service:
+            return self.service.get(int(payload[0]), self).__class__.__name__
+        return self.__class__.__name__
+
+    def holds_live_objects(self, payload):
+        # Diagnostics and semantic syntax highlight results refer to the translation unit kept in the parser cache
+        return int(payload[0]) in [SourceCodeModelSubServiceId.DIAGNOSTICS, SourceCodeModelSubServiceId.SEMANTIC_SYNTAX_HIGHLIGHT]
+
+    def serialize_result(self, payload, args):
+        if self.service:
+            serialize_result = getattr(self.service.get(int(payload[0]), None), 'serialize_result', None)
+            if serialize_result:
+                return serialize_result(payload[1:len(payload)], args)
+        return args
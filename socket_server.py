@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+from compact_result import CompactResult
+from compact_result import is_compact_result_dict
+from compact_result import json_default
+from server import ServerRequestId
+from server import ServiceId
+from service import ServiceRequestId
+from service import TaggedPayload
+from transport import Transport
+
+#
+# Framed protocol spoken over the Unix domain socket:
+#   * Each frame starts with a fixed-size binary header: <body length (u32)> <tag (u32)> <frame id (u8)>
+#   * Body is a JSON-encoded list:
+#       REQUEST  frame: [server_request_id, service_id, payload]              (same as what api.py puts into the handle)
+#       RESPONSE frame: [service_request_id, service_id, success, payload, args]
+#   * Tag is chosen by the client and is echoed back in RESPONSE frames which belong to the given REQUEST frame.
+#     Result streamed in pages comes in a number of RESPONSE frames, all but the last one being PARTIAL_RESULT.
+#
+class FrameId():
+    REQUEST  = 0x1
+    RESPONSE = 0x2
+
+frame_header = struct.Struct('!IIB')
+
+def encode_frame(frame_id, tag, body):
+    data = json.dumps(body, default=json_default)
+    return frame_header.pack(len(data), tag, frame_id) + data
+
+def json_loads(data):
+    # Rest of the code (i.e. libclang bindings) expects 'str' and not 'unicode' which is what json module gives us.
+    def to_str(obj):
+        if isinstance(obj, unicode):
+            return obj.encode('utf8')
+        if isinstance(obj, list):
+            return [to_str(item) for item in obj]
+        if isinstance(obj, dict):
+            return dict((to_str(key), to_str(value)) for key, value in obj.iteritems())
+        return obj
+    return to_str(json.loads(data))
+
+def decode_frame_body(data):
+    return json_loads(data)
+
+def decode_result(args):
+    # Compact results, also the ones which come in pages (see RoutingServicePlugin), are turned back into CompactResult
+    if is_compact_result_dict(args):
+        return CompactResult.from_dict(args)
+    if isinstance(args, dict) and sorted(args.keys()) == ['continuationToken', 'items']:
+        return dict(args, items=decode_result(args['items']))
+    return args
+
+class FrameReader():
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        frames = []
+        self.buffer.extend(data)
+        while len(self.buffer) >= frame_header.size:
+            length, tag, frame_id = frame_header.unpack_from(buffer(self.buffer))
+            if len(self.buffer) < frame_header.size + length:
+                break
+            frames.append((frame_id, tag, decode_frame_body(str(self.buffer[frame_header.size:frame_header.size+length]))))
+            del self.buffer[0:frame_header.size+length]
+        return frames
+
+class SocketServer():
+    """
+    Front-end which makes it possible for multiple clients (i.e. editor instances) to share a single server (and
+    therefore its services, their caches and the symbol database) over the Unix domain socket.
+
+    Runs in the server process. Requests received from the socket are tagged and forwarded to the services using the
+    same handle the server was started with. Results of tagged requests are routed back to the front-end (see
+    Server.route_tagged_results()) which forwards them to the client who issued the request.
+
+    Server and its services are owned by the client who started the server. That is why requests to shut down
+    the server or any of its services are ignored when coming from the socket.
+    """
+    def __init__(self, socket_path, handle, server):
+        self.socket_path = socket_path
+        self.handle = handle
+        self.responses = Transport()
+        self.listener = None
+        self.clients = {}
+        self.pending = {}
+        self.next_tag = 0
+        server.route_tagged_results(self.responses)
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path) # Left behind by the server which did not shut down cleanly
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0600)
+        self.listener.listen(8)
+        thread = threading.Thread(target=self.__run, name='cxxd_socket_server')
+        thread.daemon = True
+        thread.start()
+        logging.info("Listening for clients on '{0}'".format(self.socket_path))
+
+    def stop(self):
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            os.remove(self.socket_path)
+
+    def __run(self):
+        while self.listener:
+            try:
+                readable, _, _ = select.select([self.listener, self.responses] + self.clients.keys(), [], [])
+            except (select.error, socket.error):
+                break # Listener closed
+            for r in readable:
+                if r is self.listener:
+                    self.__accept()
+                elif r is self.responses:
+                    self.__route_response(*self.responses.get())
+                else:
+                    self.__receive(r)
+
+    def __accept(self):
+        client, _ = self.listener.accept()
+        self.clients[client] = FrameReader()
+        logging.info('Client connected. Number of clients: {0}'.format(len(self.clients)))
+
+    def __disconnect(self, client):
+        del self.clients[client]
+        for tag in [tag for tag, (c, client_tag) in self.pending.iteritems() if c is client]:
+            del self.pending[tag]
+        client.close()
+        logging.info('Client disconnected. Number of clients: {0}'.format(len(self.clients)))
+
+    def __receive(self, client):
+        try:
+            data = client.recv(65536)
+        except socket.error:
+            data = None
+        if not data:
+            self.__disconnect(client)
+            return
+        try:
+            frames = self.clients[client].feed(data)
+        except ValueError as e:
+            logging.error('Malformed frame received: {0}. Dropping the client.'.format(e))
+            self.__disconnect(client)
+            return
+        for frame_id, client_tag, body in frames:
+            if frame_id == FrameId.REQUEST:
+                self.__forward_request(client, client_tag, body)
+            else:
+                logging.error('Unexpected frame id {0} received from the client.'.format(frame_id))
+
+    def __forward_request(self, client, client_tag, request):
+        server_request_id, service_id, payload = request
+        if server_request_id in [ServerRequestId.SHUTDOWN_AND_EXIT, ServerRequestId.SHUTDOWN_ALL_SERVICES, ServerRequestId.SHUTDOWN_SERVICE]:
+            logging.warning('Shutting down the server or its services is only possible by the client who started the server.')
+            return
+        if server_request_id in [ServerRequestId.START_ALL_SERVICES, ServerRequestId.START_SERVICE]:
+            # Each of the services is started on its own so that each of them gets the tag of its own. Services which
+            # are already started would not respond to the startup request at all so it is answered right away.
+            service_id_list = self.handle.service_transport.keys() if server_request_id == ServerRequestId.START_ALL_SERVICES else [service_id]
+            with self.handle.service_started.get_lock():
+                for service_id in service_id_list:
+                    if self.handle.is_service_started(service_id):
+                        self.__send_response(client, client_tag, ServiceRequestId.STARTUP, service_id, True, payload, None)
+                    else:
+                        self.handle.put([ServerRequestId.START_SERVICE, service_id, TaggedPayload(payload, self.__add_pending(client, client_tag))])
+            return
+        self.handle.put([server_request_id, service_id, TaggedPayload(payload, self.__add_pending(client, client_tag))])
+
+    def __add_pending(self, client, client_tag):
+        tag, self.next_tag = self.next_tag, (self.next_tag + 1) & 0xFFFFFFFF
+        self.pending[tag] = (client, client_tag,)
+        return tag
+
+    def __route_response(self, service_request_id, tag, service_id, success, payload, args):
+        # Only the pages of the result which is streamed (see RoutingServicePlugin) are followed by the next response
+        if service_request_id == ServiceRequestId.PARTIAL_RESULT:
+            client, client_tag = self.pending.get(tag, (None, None,))
+        else:
+            client, client_tag = self.pending.pop(tag, (None, None,))
+        if client is None:
+            return # Client has disconnected in the meantime
+        self.__send_response(client, client_tag, service_request_id, service_id, success, payload, args)
+
+    def __send_response(self, client, client_tag, service_request_id, service_id, success, payload, args):
+        try:
+            frame = encode_frame(FrameId.RESPONSE, client_tag, [service_request_id, service_id, success, payload, args])
+        except (TypeError, ValueError) as e:
+            logging.error("Result of '{0}' cannot be encoded: '{1}'. Sending an empty result instead.".format(payload, e))
+            frame = encode_frame(FrameId.RESPONSE, client_tag, [service_request_id, service_id, success, payload, None])
+        try:
+            client.sendall(frame)
+        except socket.error:
+            self.__disconnect(client)
+
+class SocketClient():
+    """
+    Handle to the server started by some other client (see api.server_start()) and shared over the Unix domain socket.
+
+    Can be used in place of the handle returned by api.server_start(). Results are delivered to the given plugins
+    from the background thread.
+    """
+    def __init__(self, socket_path, source_code_model_plugin, project_builder_plugin, clang_format_plugin, clang_tidy_plugin):
+        self.plugin = {
+            ServiceId.SOURCE_CODE_MODEL : source_code_model_plugin,
+            ServiceId.PROJECT_BUILDER   : project_builder_plugin,
+            ServiceId.CLANG_FORMAT      : clang_format_plugin,
+            ServiceId.CLANG_TIDY        : clang_tidy_plugin,
+        }
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.lock = threading.Lock()
+        self.next_tag = 0
+        self.receiver = threading.Thread(target=self.__run, name='cxxd_socket_client')
+        self.receiver.daemon = True
+        self.receiver.start()
+
+    def put(self, request):
+        with self.lock:
+            tag, self.next_tag = self.next_tag, (self.next_tag + 1) & 0xFFFFFFFF
+            self.socket.sendall(encode_frame(FrameId.REQUEST, tag, request))
+
+    def close(self):
+        self.socket.shutdown(socket.SHUT_RDWR)
+        self.socket.close()
+
+    def __run(self):
+        frame_reader = FrameReader()
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except socket.error:
+                break
+            if not data:
+                break
+            for frame_id, tag, body in frame_reader.feed(data):
+                self.__dispatch(*body)
+        logging.info('Disconnected from the server.')
+
+    def __dispatch(self, service_request_id, service_id, success, payload, args):
+        plugin = self.plugin.get(service_id, None)
+        if plugin is None:
+            logging.error('Response from unknown service with id={0} received.'.format(service_id))
+        elif service_request_id == ServiceRequestId.STARTUP:
+            plugin.startup_callback(success, payload)
+        elif service_request_id == ServiceRequestId.SHUTDOWN:
+            plugin.shutdown_callback(success, payload)
+        else:
+            plugin.__call__(success, payload, decode_result(args))
@@ -0,0 +1,44 @@
+import argparse
+import os
+import time
+
+from cxxd.services.source_code_model.indexer.clang_indexer import cpp_file_extensions
+from cxxd.services.source_code_model.indexer.project_files import DirectoryScanner
+
+#
+# Time it takes to build-up the list of files to be indexed from the directory tree (see get_cpp_file_list()):
+# os.walk() against the directory scanner listing the directories in parallel, both when it is run for the first time
+# and when the listings it keeps from the previous scan can be used (i.e. none of the directories has changed).
+#
+# Usage (from the parent directory of 'cxxd'):
+#   python -m cxxd.tests.benchmark.bench_directory_scan [--directory /usr/include] [--threads 8]
+#
+def walk(directory):
+    cpp_file_list = []
+    for dirpath, dirs, files in os.walk(directory):
+        cpp_file_list.extend(os.path.join(dirpath, name) for name in files if os.path.splitext(name)[1] in cpp_file_extensions)
+    return cpp_file_list
+
+def measure(scan, repeat):
+    elapsed = []
+    for i in range(repeat):
+        start = time.time()
+        files = len(scan())
+        elapsed.append(time.time() - start)
+    return files, min(elapsed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure the time it takes to scan the directory tree for the files to be indexed.')
+    parser.add_argument('--directory', default='/usr/include', help='directory tree to scan')
+    parser.add_argument('--threads', type=int, default=8, help='number of directories listed in parallel')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs to take the best one of')
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.directory)
+    results = [('os.walk()', measure(lambda: walk(directory), args.repeat))]
+    results.append(('scanner (cold)', measure(lambda: DirectoryScanner(cpp_file_extensions, args.threads).scan(directory), args.repeat)))
+    scanner = DirectoryScanner(cpp_file_extensions, args.threads)
+    scanner.scan(directory)
+    results.append(('scanner (warm)', measure(lambda: scanner.scan(directory), args.repeat)))
+    for name, (files, elapsed) in results:
+        print '{0:<16} {1:>7} files  {2:8.3f}s'.format(name, files, elapsed)
@@ -0,0 +1,71 @@
+import argparse
+import os
+import tempfile
+import time
+
+from cxxd.parser.clang_parser import ClangParser
+from cxxd.parser.tunit_cache import TranslationUnitCache, NoCache
+from cxxd.services.source_code_model.indexer.clang_indexer import get_cpp_file_list, index_single_file, is_header
+from cxxd.services.source_code_model.indexer.symbol_database import SymbolDatabase
+from cxxd.tests.benchmark.bench_symbol_database import remove_db
+
+#
+# Time it takes to index the real source code with each of the indexing engines (see index_single_file()): visiting
+# each of the AST nodes from Python (indexer_visitor()) against libclang calling back for the declarations and
+# references only (index_with_callbacks()). Symbols recorded by one of the engines and not by the other one are
+# reported as well.
+#
+# Usage (from the parent directory of 'cxxd'):
+#   python -m cxxd.tests.benchmark.bench_indexing_engine [--directory <dir>] [--compiler-args <compile_flags.txt>]
+#
+def run(engine, directory, compiler_args_filename, db_filename, headers_db_filename):
+    parser = ClangParser(compiler_args_filename, TranslationUnitCache(NoCache()))
+    symbol_db, headers_db = SymbolDatabase(db_filename), SymbolDatabase(headers_db_filename)
+    symbol_db.create_data_model()
+    headers_db.create_data_model()
+    filenames = [filename for filename in get_cpp_file_list(directory) if not is_header(filename)]
+    start = time.time()
+    symbol_db.begin_bulk_load()
+    for filename in filenames:
+        index_single_file(parser, directory, filename, filename, symbol_db, headers_db, engine)
+    symbol_db.end_bulk_load()
+    elapsed = time.time() - start
+    symbols = set(
+        (symbol_db.get_filename(row), symbol_db.get_line(row), symbol_db.get_column(row), symbol_db.get_usr(row), symbol_db.get_is_definition(row))
+        for row in symbol_db.get_all()
+    )
+    calls = symbol_db.db_connection.execute('SELECT COUNT(*) FROM calls').fetchone()[0]
+    bases = symbol_db.db_connection.execute('SELECT COUNT(*) FROM bases').fetchone()[0]
+    symbol_db.close()
+    headers_db.close()
+    return len(filenames), elapsed, symbols, calls, bases
+
+def print_difference(name, symbols, limit):
+    print '{0} symbols recorded by {1} only{2}'.format(len(symbols), name, ', e.g.:' if symbols else '.')
+    for symbol in sorted(symbols)[0:limit]:
+        print '    {0}:{1}:{2} {3}{4}'.format(symbol[0], symbol[1], symbol[2], symbol[3], ' (definition)' if symbol[4] else '')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure indexing throughput of the indexing engines.')
+    parser.add_argument('--directory', default=os.path.join(os.path.dirname(__file__), '..', 'integration', 'external', 'ChaiScript'), help='source code to index')
+    parser.add_argument('--compiler-args', default=None, help='compile_flags.txt or compile_commands.json to index the source code with')
+    parser.add_argument('--differences', type=int, default=10, help='number of differing symbols to show')
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.directory)
+    compiler_args_filename = args.compiler_args or os.path.join(directory, 'compile_flags.txt')
+    results = {}
+    for engine in ['visitor', 'callbacks']:
+        fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+        os.close(fd)
+        fd, headers_db_filename = tempfile.mkstemp(prefix='cxxd_bench_headers_', suffix='.db')
+        os.close(fd)
+        try:
+            files, elapsed, symbols, calls, bases = run(engine, directory, compiler_args_filename, db_filename, headers_db_filename)
+        finally:
+            remove_db(db_filename)
+            remove_db(headers_db_filename)
+        results[engine] = symbols
+        print '{0:<10} {1:>6} files  {2:8.2f}s  {3:>9} symbols  {4:>7} calls  {5:>6} bases'.format(engine, files, elapsed, len(symbols), calls, bases)
+    print_difference('visitor', results['visitor'] - results['callbacks'], args.differences)
+    print_difference('callbacks', results['callbacks'] - results['visitor'], args.differences)
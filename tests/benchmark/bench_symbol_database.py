@@ -0,0 +1,152 @@
+import argparse
+import os
+import tempfile
+import time
+
+from cxxd.services.source_code_model.indexer.symbol_database import SymbolDatabase
+
+#
+# Throughput of writing indexer results into the symbol database: one insert and commit at a time with default
+# journaling (as it used to be) against the bulk-load mode (see SymbolDatabase.begin_bulk_load()). And the time
+# it takes to merge the workers' databases: row by row through Python (as it used to be) against insert_from().
+# And the size and lookup speed of the data model 0.1 (filenames, USRs and contexts stored in each row) against the
+# current, normalized one.
+#
+# Usage (from the parent directory of 'cxxd'): python -m cxxd.tests.benchmark.bench_symbol_database
+#
+def generate_rows(files, symbols_per_file, first_file=0):
+    for f in range(first_file, first_file + files):
+        filename = 'lib/module{0}/impl{1}.cpp'.format(f % 50, f)
+        yield filename, [
+            (filename, s, 5 + s % 40, 'c:@N@lib@S@Class{0}@F@method{1}#I#'.format(f % 20, s), 21, s % 7 == 0, 'method{0}'.format(s))
+            for s in range(symbols_per_file)
+        ]
+
+def run(db_filename, files, symbols_per_file, bulk_load, first_file=0):
+    symbol_db = SymbolDatabase(db_filename)
+    if not bulk_load:
+        symbol_db.db_connection.execute('PRAGMA journal_mode=DELETE')
+        symbol_db.db_connection.execute('PRAGMA synchronous=FULL')
+    symbol_db.create_data_model()
+    start = time.time()
+    if bulk_load:
+        symbol_db.begin_bulk_load()
+    for filename, rows in generate_rows(files, symbols_per_file, first_file):
+        for row in rows:
+            symbol_db.insert_single(*row)
+        symbol_db.flush() # Indexer commits once per each file
+    if bulk_load:
+        symbol_db.end_bulk_load()
+    elapsed = time.time() - start
+    symbol_db.close()
+    return symbol_db.rows_written, elapsed
+
+def merge_row_by_row(symbol_db, symbol_db_filename_list):
+    for db in symbol_db_filename_list:
+        worker_db = SymbolDatabase(db)
+        for row in worker_db.get_all():
+            symbol_db.insert_single(
+                worker_db.get_filename(row), worker_db.get_line(row), worker_db.get_column(row), worker_db.get_usr(row),
+                worker_db.get_kind(row), worker_db.get_is_definition(row), worker_db.get_name(row)
+            )
+        symbol_db.flush()
+        worker_db.close()
+
+def run_merge(db_filename, worker_db_filenames, merge):
+    symbol_db = SymbolDatabase(db_filename)
+    symbol_db.create_data_model()
+    start = time.time()
+    merge(symbol_db, worker_db_filenames)
+    elapsed = time.time() - start
+    rows = symbol_db.db_connection.execute('SELECT COUNT(*) FROM symbol').fetchone()[0]
+    symbol_db.close()
+    return rows, elapsed
+
+def create_data_model_0_1(db_filename, files, symbols_per_file):
+    symbol_db = SymbolDatabase(db_filename)
+    symbol_db.db_connection.executescript('''
+        CREATE TABLE symbol (filename text, line integer, column integer, usr text, context text, kind integer, is_definition boolean, PRIMARY KEY(filename, usr, line));
+        CREATE TABLE version (major integer, minor integer, PRIMARY KEY(major, minor));
+        INSERT INTO version VALUES (0, 1);
+    ''')
+    for filename, rows in generate_rows(files, symbols_per_file):
+        symbol_db.db_connection.executemany(
+            'INSERT INTO symbol VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(f, line, column, usr, '    return method{0}(value);\n'.format(line), kind, is_definition) for f, line, column, usr, kind, is_definition, _ in rows]
+        )
+    symbol_db.db_connection.execute('CREATE INDEX IF NOT EXISTS symbol_usr ON symbol(usr)')
+    symbol_db.flush()
+    symbol_db.db_connection.execute('VACUUM')
+    symbol_db.close()
+
+def run_lookups(db_filename, files, get_by_usr):
+    symbol_db = SymbolDatabase(db_filename)
+    usrs = ['c:@N@lib@S@Class{0}@F@method{1}#I#'.format(f % 20, f % 97) for f in range(files)]
+    start = time.time()
+    rows = sum(len(get_by_usr(symbol_db, usr).fetchall()) for usr in usrs)
+    elapsed = time.time() - start
+    symbol_db.close()
+    return rows, elapsed, len(usrs)
+
+def run_schemas(files, symbols_per_file):
+    get_by_usr_0_1 = lambda symbol_db, usr: symbol_db.db_connection.execute('SELECT * FROM symbol WHERE usr=?', (usr,))
+    for name in ['schema-0.1', 'schema-{0}.{1}'.format(SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR)]:
+        fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+        os.close(fd)
+        try:
+            if name == 'schema-0.1':
+                create_data_model_0_1(db_filename, files, symbols_per_file)
+                get_by_usr = get_by_usr_0_1
+            else:
+                run(db_filename, files, symbols_per_file, True)
+                symbol_db = SymbolDatabase(db_filename)
+                symbol_db.db_connection.execute('VACUUM')
+                symbol_db.close()
+                get_by_usr = lambda symbol_db, usr: symbol_db.get_by_usr(usr)
+            size = os.path.getsize(db_filename)
+            rows, elapsed, lookups = run_lookups(db_filename, files, get_by_usr)
+        finally:
+            remove_db(db_filename)
+        print '{0:<16} {1:>9.1f} MB  {2:>7} lookups  {3:8.3f}s  {4:>9} rows'.format(name, size / 1048576.0, lookups, elapsed, rows)
+
+def remove_db(db_filename):
+    for filename in [db_filename, db_filename + '-wal', db_filename + '-shm', db_filename + '-journal']:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure symbol database write throughput.')
+    parser.add_argument('--files', type=int, default=500, help='number of files to simulate')
+    parser.add_argument('--symbols-per-file', type=int, default=400, help='number of symbols per file')
+    parser.add_argument('--workers', type=int, default=4, help='number of worker databases to merge')
+    args = parser.parse_args()
+
+    for name, bulk_load in [('row-at-a-time', False), ('bulk-load', True)]:
+        fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+        os.close(fd)
+        try:
+            rows, elapsed = run(db_filename, args.files, args.symbols_per_file, bulk_load)
+        finally:
+            remove_db(db_filename)
+        print '{0:<16} {1:>9} rows  {2:8.2f}s  {3:10.0f} rows/s'.format(name, rows, elapsed, rows / elapsed)
+
+    worker_db_filenames = []
+    for worker in range(args.workers):
+        fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_worker_', suffix='.db')
+        os.close(fd)
+        worker_db_filenames.append(db_filename)
+        run(db_filename, args.files / args.workers, args.symbols_per_file, True, worker * (args.files / args.workers))
+    try:
+        for name, merge in [('merge-in-python', merge_row_by_row), ('merge-in-sqlite', lambda symbol_db, dbs: symbol_db.insert_from(dbs))]:
+            fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+            os.close(fd)
+            try:
+                rows, elapsed = run_merge(db_filename, worker_db_filenames, merge)
+            finally:
+                remove_db(db_filename)
+            print '{0:<16} {1:>9} rows  {2:8.2f}s  {3:10.0f} rows/s'.format(name, rows, elapsed, rows / elapsed)
+    finally:
+        for db_filename in worker_db_filenames:
+            remove_db(db_filename)
+
+    run_schemas(args.files, args.symbols_per_file)
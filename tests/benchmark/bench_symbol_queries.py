@@ -0,0 +1,63 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from cxxd.services.source_code_model.indexer.symbol_database import SymbolDatabase
+from cxxd.tests.benchmark.bench_symbol_database import remove_db, run
+
+#
+# Latency of the symbol database lookups (find-all-references, go-to-definition, deleting the symbols of a file)
+# with and without the secondary indexes (see SymbolDatabase.indexes). Lookups without the indexes end up scanning
+# the whole table so only a handful of these is run.
+#
+# Usage (from the parent directory of 'cxxd'): python -m cxxd.tests.benchmark.bench_symbol_queries [--files 25000]
+#
+def measure(query, args_list):
+    latencies = []
+    for args in args_list:
+        start = time.time()
+        query(*args)
+        latencies.append(time.time() - start)
+    return sorted(latencies)
+
+def percentile(sorted_latencies, p):
+    return sorted_latencies[min(len(sorted_latencies)-1, int(len(sorted_latencies) * p / 100.0))]
+
+def run_queries(symbol_db, files, symbols_per_file, lookups):
+    usrs = [('c:@N@lib@S@Class{0}@F@method{1}#I#'.format(random.randrange(20), random.randrange(symbols_per_file)),) for i in range(lookups)]
+    filenames = [('lib/module{0}/impl{1}.cpp'.format(f % 50, f),) for f in random.sample(range(files), lookups)]
+    def delete(filename):
+        symbol_db.delete(filename)
+        symbol_db.db_connection.rollback() # Keep the rows around for the next round
+    return [
+        ('get_by_usr', measure(lambda usr: symbol_db.get_by_usr(usr).fetchall(), usrs)),
+        ('get_definition', measure(lambda usr: symbol_db.get_definition(usr).fetchall(), usrs)),
+        ('delete', measure(delete, filenames)),
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure symbol database query latency.')
+    parser.add_argument('--files', type=int, default=25000, help='number of files to simulate')
+    parser.add_argument('--symbols-per-file', type=int, default=400, help='number of symbols per file')
+    parser.add_argument('--lookups', type=int, default=200, help='number of lookups to run with the indexes in place')
+    parser.add_argument('--unindexed-lookups', type=int, default=5, help='number of lookups to run without the indexes')
+    args = parser.parse_args()
+
+    fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+    os.close(fd)
+    try:
+        rows, elapsed = run(db_filename, args.files, args.symbols_per_file, True)
+        print 'Generated {0} rows in {1:.2f}s ({2:.1f} MB).'.format(rows, elapsed, os.path.getsize(db_filename) / 1048576.0)
+        symbol_db = SymbolDatabase(db_filename)
+        for name, lookups in [('indexed', args.lookups), ('unindexed', args.unindexed_lookups)]:
+            if name == 'unindexed':
+                for index_name, columns in SymbolDatabase.indexes:
+                    symbol_db.db_connection.execute('DROP INDEX {0}'.format(index_name))
+            for query, latencies in run_queries(symbol_db, args.files, args.symbols_per_file, lookups):
+                print '{0:<10} {1:<15} p50 {2:9.3f}ms  p90 {3:9.3f}ms  max {4:9.3f}ms'.format(
+                    name, query, percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000, latencies[-1] * 1000)
+        symbol_db.close()
+    finally:
+        remove_db(db_filename)
@@ -0,0 +1,76 @@
+import argparse
+import multiprocessing
+import time
+
+from cxxd.transport import Transport
+
+#
+# Round-trip latency of the old request path (client -> server queue -> service queue -> client)
+# against the direct one (client -> service transport -> client).
+#
+# Usage (from the parent directory of 'cxxd'): python -m cxxd.tests.benchmark.bench_transport
+#
+def forward(inbound, outbound):
+    while True:
+        payload = inbound.get()
+        outbound.put(payload)
+        if payload is None:
+            break
+
+def measure(send, receive, payload, iterations):
+    latencies = []
+    for i in range(iterations):
+        start = time.time()
+        send(payload)
+        receive()
+        latencies.append(time.time() - start)
+    return latencies
+
+def percentile(sorted_latencies, p):
+    return sorted_latencies[min(len(sorted_latencies)-1, int(len(sorted_latencies) * p / 100.0))]
+
+def report(name, payload_name, latencies):
+    latencies = sorted(latencies)
+    print '{0:<16} {1:<14} p50={2:9.1f}us  p90={3:9.1f}us  p99={4:9.1f}us  max={5:9.1f}us'.format(
+        name, payload_name,
+        percentile(latencies, 50) * 1e6, percentile(latencies, 90) * 1e6, percentile(latencies, 99) * 1e6, latencies[-1] * 1e6
+    )
+
+def run_queue_path(payload, iterations):
+    client_to_server, server_to_service, service_to_client = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=forward, args=(client_to_server, server_to_service)),
+        multiprocessing.Process(target=forward, args=(server_to_service, service_to_client)),
+    ]
+    for p in processes:
+        p.start()
+    latencies = measure(client_to_server.put, service_to_client.get, payload, iterations)
+    client_to_server.put(None)
+    service_to_client.get()
+    for p in processes:
+        p.join()
+    return latencies
+
+def run_direct_path(payload, iterations):
+    client_to_service, service_to_client = Transport(), Transport()
+    process = multiprocessing.Process(target=forward, args=(client_to_service, service_to_client))
+    process.start()
+    latencies = measure(client_to_service.put, service_to_client.get, payload, iterations)
+    client_to_service.put(None)
+    service_to_client.get()
+    process.join()
+    return latencies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure round-trip latency of request transports.')
+    parser.add_argument('--iterations', type=int, default=2000, help='number of round-trips per payload')
+    args = parser.parse_args()
+
+    payloads = {
+        'request'    : [0x0, 0x4, '/home/user/project/lib/impl.cpp', '/tmp/tmpXyZ12.cpp', 120, 33],
+        'references' : [['/home/user/project/lib/impl{0}.cpp'.format(i), i, 10, '    foobar();'] for i in range(20000)],
+    }
+    for payload_name in ['request', 'references']:
+        iterations = args.iterations if payload_name == 'request' else max(1, args.iterations / 100)
+        report('queue+server', payload_name, run_queue_path(payloads[payload_name], iterations))
+        report('direct', payload_name, run_direct_path(payloads[payload_name], iterations))
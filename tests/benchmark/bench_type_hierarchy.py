@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from cxxd.services.source_code_model.indexer.symbol_database import SymbolDatabase
+from cxxd.tests.benchmark.bench_symbol_database import remove_db
+from cxxd.tests.benchmark.bench_symbol_queries import measure, percentile
+
+#
+# Latency of the type hierarchy queries (see SymbolDatabase.get_derived_classes() and get_base_classes()) on a
+# database with a few hundred thousand classes: each of the interfaces is the root of a tree of classes deriving
+# from it, every now and then from two bases at once.
+#
+# Usage (from the parent directory of 'cxxd'): python -m cxxd.tests.benchmark.bench_type_hierarchy [--classes 200000]
+#
+def generate_bases(classes, interfaces, fan_out):
+    # Class c belongs to the tree of interface (c % interfaces) and derives from its parent in that tree and, every
+    # 10th one, from the class preceding it in the tree too
+    for c in range(interfaces, classes):
+        interface, position = c % interfaces, c / interfaces
+        yield c, interface + ((position - 1) / fan_out) * interfaces
+        if c % 10 == 0 and position > 1:
+            yield c, c - interfaces
+
+def run(db_filename, classes, interfaces, fan_out, classes_per_file):
+    symbol_db = SymbolDatabase(db_filename)
+    symbol_db.create_data_model()
+    start = time.time()
+    symbol_db.begin_bulk_load()
+    for c in range(classes):
+        name = 'Class{0}'.format(c)
+        symbol_db.insert_single('lib/class{0}.h'.format(c / classes_per_file), c % classes_per_file, 7, 'c:@S@' + name, 4, True, name, 'lib::' + name)
+    for derived, base in generate_bases(classes, interfaces, fan_out):
+        symbol_db.insert_base('lib/class{0}.h'.format(derived / classes_per_file), derived % classes_per_file, 20, 'c:@S@Class{0}'.format(derived), 'c:@S@Class{0}'.format(base), 1, False)
+    symbol_db.end_bulk_load()
+    elapsed = time.time() - start
+    symbol_db.close()
+    return elapsed
+
+def run_queries(symbol_db, classes, interfaces, lookups):
+    roots = [('c:@S@Class{0}'.format(random.randrange(interfaces)),) for i in range(lookups)]
+    leaves = [('c:@S@Class{0}'.format(random.randrange(classes / 2, classes)),) for i in range(lookups)]
+    derivations = []
+    def get_all_derived(usr):
+        derivations.append(len(symbol_db.get_derived_classes(usr).fetchall()))
+    return [
+        ('derived (direct)',     measure(lambda usr: symbol_db.get_derived_classes(usr, False).fetchall(), roots)),
+        ('derived (transitive)', measure(get_all_derived, roots)),
+        ('bases (transitive)',   measure(lambda usr: symbol_db.get_base_classes(usr).fetchall(), leaves)),
+    ], sum(derivations) / len(derivations)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure type hierarchy query latency.')
+    parser.add_argument('--classes', type=int, default=200000, help='number of classes to simulate')
+    parser.add_argument('--interfaces', type=int, default=1000, help='number of classes at the root of the hierarchy')
+    parser.add_argument('--fan-out', type=int, default=4, help='number of classes deriving from each of the classes')
+    parser.add_argument('--classes-per-file', type=int, default=10, help='number of classes per file')
+    parser.add_argument('--lookups', type=int, default=20, help='number of queries to run for each of the query types')
+    args = parser.parse_args()
+
+    fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+    os.close(fd)
+    try:
+        elapsed = run(db_filename, args.classes, args.interfaces, args.fan_out, args.classes_per_file)
+        print 'Generated {0} classes in {1:.2f}s ({2:.1f} MB).'.format(args.classes, elapsed, os.path.getsize(db_filename) / 1048576.0)
+        symbol_db = SymbolDatabase(db_filename)
+        results, derivations = run_queries(symbol_db, args.classes, args.interfaces, args.lookups)
+        for query, latencies in results:
+            print '{0:<22} p50 {1:9.3f}ms  p90 {2:9.3f}ms  max {3:9.3f}ms'.format(
+                query, percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000, latencies[-1] * 1000)
+        print 'Transitive query returned {0} derivations per interface on average.'.format(derivations)
+        symbol_db.close()
+    finally:
+        remove_db(db_filename)
@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from cxxd.services.source_code_model.indexer.symbol_database import SymbolDatabase
+from cxxd.services.source_code_model.indexer.symbol_database import get_initials
+from cxxd.tests.benchmark.bench_symbol_database import remove_db
+from cxxd.tests.benchmark.bench_symbol_queries import percentile
+
+#
+# Latency of the workspace symbol search (see SymbolDatabase.find_symbols()) on a database with a few million of
+# symbols: prefixes, camel-case abbreviations and substrings of the names.
+#
+# Usage (from the parent directory of 'cxxd'): python -m cxxd.tests.benchmark.bench_workspace_symbol [--symbols 2000000]
+#
+verbs = ['get', 'set', 'update', 'find', 'create', 'remove', 'parse', 'visit', 'load', 'store', 'merge', 'resolve']
+nouns = ['Buffer', 'Node', 'Token', 'Symbol', 'File', 'Cache', 'Index', 'Range', 'Scope', 'Entry', 'Handle', 'Stream']
+
+def generate_names(symbols):
+    for s in range(symbols):
+        name = verbs[s % len(verbs)] + nouns[(s / len(verbs)) % len(nouns)] + nouns[(s / 7) % len(nouns)] + str(s / 1000)
+        yield s, name, 'lib{0}::Class{1}::{2}'.format(s % 50, s % 1000, name)
+
+def run(db_filename, symbols, symbols_per_file):
+    symbol_db = SymbolDatabase(db_filename)
+    symbol_db.create_data_model()
+    start = time.time()
+    symbol_db.begin_bulk_load()
+    for s, name, qualified_name in generate_names(symbols):
+        symbol_db.insert_single('lib/impl{0}.cpp'.format(s / symbols_per_file), s % symbols_per_file, 5, 'c:@S@' + qualified_name, 21, True, name, qualified_name)
+    symbol_db.end_bulk_load()
+    elapsed = time.time() - start
+    symbol_db.close()
+    return elapsed
+
+def run_queries(symbol_db, symbols, limit, lookups):
+    names = [name for s, name, qualified_name in generate_names(symbols) if s % (symbols / lookups) == 0][0:lookups]
+    queries = [
+        ('prefix',     [random.choice(names)[0:5] for i in range(lookups)]),
+        ('camel-case', [get_initials(random.choice(names))[0:3] for i in range(lookups)]),
+        ('substring',  [random.choice(names)[3:9] for i in range(lookups)]),
+        ('no-match',   ['xyzzy{0}'.format(i) for i in range(lookups)]),
+    ]
+    results = []
+    for name, query_list in queries:
+        latencies = []
+        for query in query_list:
+            start = time.time()
+            symbol_db.find_symbols(query, limit)
+            latencies.append(time.time() - start)
+        results.append((name, sorted(latencies)))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure workspace symbol search latency.')
+    parser.add_argument('--symbols', type=int, default=2000000, help='number of symbols to simulate')
+    parser.add_argument('--symbols-per-file', type=int, default=400, help='number of symbols per file')
+    parser.add_argument('--limit', type=int, default=100, help='maximum number of symbols returned by a single search')
+    parser.add_argument('--lookups', type=int, default=100, help='number of searches to run for each of the query types')
+    args = parser.parse_args()
+
+    fd, db_filename = tempfile.mkstemp(prefix='cxxd_bench_', suffix='.db')
+    os.close(fd)
+    try:
+        elapsed = run(db_filename, args.symbols, args.symbols_per_file)
+        print 'Generated {0} symbols in {1:.2f}s ({2:.1f} MB).'.format(args.symbols, elapsed, os.path.getsize(db_filename) / 1048576.0)
+        symbol_db = SymbolDatabase(db_filename)
+        for name, latencies in run_queries(symbol_db, args.symbols, args.limit, args.lookups):
+            print '{0:<12} p50 {1:9.3f}ms  p90 {2:9.3f}ms  max {3:9.3f}ms'.format(
+                name, percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000, latencies[-1] * 1000)
+        symbol_db.close()
+    finally:
+        remove_db(db_filename)
@@ -84,27 +84,21 @@ class GoToIncludeCallbackResult():
         return self.go_to_include_filename.value
 
 class SemanticSyntaxHighlightCallbackResult():
-    TUNIT_FILENAME_LENGTH_MAX = 150
+    FILENAME_LENGTH_MAX = 150
 
     def __init__(self):
         self.semantic_syntax_highlight_status           = multiprocessing.Value(ctypes.c_bool, False)
-        self.semantic_syntax_highlight_tunit_spelling   = multiprocessing.Array(ctypes.c_char, SemanticSyntaxHighlightCallbackResult.TUNIT_FILENAME_LENGTH_MAX)
+        self.semantic_syntax_highlight_filename         = multiprocessing.Array(ctypes.c_char, SemanticSyntaxHighlightCallbackResult.FILENAME_LENGTH_MAX)
         self.semantic_syntax_highlight_num_of_ast_nodes = multiprocessing.Value(ctypes.c_int, 0)
 
-    def set(self, success, args):
-        def callback(ast_node_id, ast_node_name, ast_node_line, ast_node_column, ast_node_id_list):
-            ast_node_id_list.append(ast_node_id)
-
-        ast_node_id_list = []
-        tunit, traverse = args
-        traverse(tunit, callback, ast_node_id_list)
+    def set(self, success, filename, args):
         self.semantic_syntax_highlight_status.value = success
-        self.semantic_syntax_highlight_tunit_spelling.value = tunit.spelling[0:SemanticSyntaxHighlightCallbackResult.TUNIT_FILENAME_LENGTH_MAX]
-        self.semantic_syntax_highlight_num_of_ast_nodes.value = len(ast_node_id_list)
+        self.semantic_syntax_highlight_filename.value = filename[0:SemanticSyntaxHighlightCallbackResult.FILENAME_LENGTH_MAX]
+        self.semantic_syntax_highlight_num_of_ast_nodes.value = args.row_count(0) if args else 0
 
     def reset(self):
         self.semantic_syntax_highlight_status.value = False
-        self.semantic_syntax_highlight_tunit_spelling.value = ''
+        self.semantic_syntax_highlight_filename.value = ''
         self.semantic_syntax_highlight_num_of_ast_nodes.value = 0
 
     @property
@@ -112,8 +106,8 @@ class SemanticSyntaxHighlightCallbackResult():
         return self.semantic_syntax_highlight_status.value
 
     @property
-    def tunit_spelling(self):
-        return self.semantic_syntax_highlight_tunit_spelling.value
+    def filename(self):
+        return self.semantic_syntax_highlight_filename.value
 
     @property
     def num_of_ast_nodes(self):
@@ -137,6 +131,9 @@ class IndexerCallbackResult():
     def __init__(self):
         self.indexer_status = multiprocessing.Value(ctypes.c_bool, False)
         self.indexer_num_of_references = multiprocessing.Value(ctypes.c_int, 0)
+        self.indexer_num_of_indexed_files = multiprocessing.Value(ctypes.c_int, 0)
+        self.indexer_num_of_up_to_date_files = multiprocessing.Value(ctypes.c_int, 0)
+        self.indexer_num_of_removed_files = multiprocessing.Value(ctypes.c_int, 0)
 
     def set(self, success, indexer_action_id, args):
         from cxxd.services.source_code_model.indexer.clang_indexer import SourceCodeModelIndexerRequestId
@@ -144,7 +141,8 @@ class IndexerCallbackResult():
         if indexer_action_id == SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE:
             pass # Nothing to be checked upon
         elif indexer_action_id == SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY:
-            pass # Nothing to be checked upon
+            if success:
+                self.indexer_num_of_indexed_files.value, self.indexer_num_of_up_to_date_files.value, self.indexer_num_of_removed_files.value = args
         elif indexer_action_id == SourceCodeModelIndexerRequestId.DROP_SINGLE_FILE:
             pass # Nothing to be checked upon
         elif indexer_action_id == SourceCodeModelIndexerRequestId.DROP_ALL:
@@ -155,6 +153,9 @@ class IndexerCallbackResult():
     def reset(self):
         self.indexer_status.value = False
         self.indexer_num_of_references.value = 0
+        self.indexer_num_of_indexed_files.value = 0
+        self.indexer_num_of_up_to_date_files.value = 0
+        self.indexer_num_of_removed_files.value = 0
 
     @property
     def status(self):
@@ -164,6 +165,18 @@ class IndexerCallbackResult():
     def num_of_references(self):
         return self.indexer_num_of_references.value
 
+    @property
+    def num_of_indexed_files(self):
+        return self.indexer_num_of_indexed_files.value
+
+    @property
+    def num_of_up_to_date_files(self):
+        return self.indexer_num_of_up_to_date_files.value
+
+    @property
+    def num_of_removed_files(self):
+        return self.indexer_num_of_removed_files.value
+
 class SourceCodeModelCallbackResult():
     def __init__(self):
         self.type = {
@@ -184,7 +197,7 @@ class SourceCodeModelCallbackResult():
         if source_code_model_service_id == SourceCodeModelSubServiceId.INDEXER:
             self.type['indexer'].set(success, int(payload[1]), args)
         elif source_code_model_service_id == SourceCodeModelSubServiceId.SEMANTIC_SYNTAX_HIGHLIGHT:
-            self.type['semantic_syntax_hl'].set(success, args)
+            self.type['semantic_syntax_hl'].set(success, str(payload[1]), args)
         elif source_code_model_service_id == SourceCodeModelSubServiceId.DIAGNOSTICS:
             self.type['diagnostics'].set(success, args)
         elif source_code_model_service_id == SourceCodeModelSubServiceId.TYPE_DEDUCTION:
@@ -112,6 +112,8 @@ class CxxdIntegrationTest(unittest.TestCase):
         cxxd.api.source_code_model_indexer_run_on_directory_request(self.handle)
         self.source_code_model_cb_result.wait_until_available()
         self.assertTrue(self.source_code_model_cb_result['indexer'].status)
+        self.assertEqual(self.source_code_model_cb_result['indexer'].num_of_removed_files, 0)
+        self.assertNotEqual(self.source_code_model_cb_result['indexer'].num_of_indexed_files + self.source_code_model_cb_result['indexer'].num_of_up_to_date_files, 0)
 
     def test_source_code_model_indexer_drop_single_file(self):
         cxxd.api.source_code_model_indexer_drop_single_file_request(self.handle, self.fut)
@@ -162,7 +164,7 @@ class CxxdIntegrationTest(unittest.TestCase):
         cxxd.api.source_code_model_semantic_syntax_highlight_request(self.handle, self.fut, self.fut)
         self.source_code_model_cb_result.wait_until_available()
         self.assertTrue(self.source_code_model_cb_result['semantic_syntax_hl'].status)
-        self.assertNotEqual(self.source_code_model_cb_result['semantic_syntax_hl'].tunit_spelling, '')
+        self.assertNotEqual(self.source_code_model_cb_result['semantic_syntax_hl'].filename, '')
         self.assertNotEqual(self.source_code_model_cb_result['semantic_syntax_hl'].num_of_ast_nodes, 0)
 
     def test_source_code_model_diagnostics_request(self):
@@ -1,7 +1,10 @@
 import clang.cindex
+import json
+import logging
 import mock
 import os
 import sqlite3
+import subprocess
 import unittest
 
 import cxxd_mocks
@@ -12,14 +15,25 @@ from file_generator import FileGenerator
 from services.source_code_model.indexer.clang_indexer import SourceCodeModelIndexerRequestId
 from services.source_code_model.indexer.clang_indexer import ClangIndexer
 from services.source_code_model.indexer.clang_indexer import create_empty_symbol_db
-from services.source_code_model.indexer.clang_indexer import create_indexer_input_list_file
+from services.source_code_model.indexer.clang_indexer import declaration_visitor
 from services.source_code_model.indexer.clang_indexer import get_clang_index_path
+from services.source_code_model.indexer.clang_indexer import get_compilation_database_file_list
 from services.source_code_model.indexer.clang_indexer import get_cpp_file_list
-from services.source_code_model.indexer.clang_indexer import index_file_list
+from services.source_code_model.indexer.clang_indexer import get_file_state
+from services.source_code_model.indexer.clang_indexer import get_qualified_name
+from services.source_code_model.indexer.clang_indexer import get_recorded_files
+from services.source_code_model.indexer.clang_indexer import get_resource_limits_cmd
+from services.source_code_model.indexer.clang_indexer import get_rss
+from services.source_code_model.indexer.clang_indexer import index_file_stream
 from services.source_code_model.indexer.clang_indexer import index_single_file
+from services.source_code_model.indexer.clang_indexer import index_with_callbacks
+from services.source_code_model.indexer.clang_indexer import record_includes
 from services.source_code_model.indexer.clang_indexer import indexer_visitor
+from services.source_code_model.indexer.clang_indexer import is_header
+from services.source_code_model.indexer.project_files import IgnoreRules
 from services.source_code_model.indexer.clang_indexer import remove_root_dir_from_filename
 from services.source_code_model.indexer.clang_indexer import start_indexing_subprocess
+from services.source_code_model.indexer.clang_indexer import track_enclosing_function
 from services.source_code_model.indexer.symbol_database import SymbolDatabase
 
 class ClangIndexerTest(unittest.TestCase):
@@ -53,6 +67,17 @@ class ClangIndexerTest(unittest.TestCase):
         self.root_directory = os.path.dirname(self.test_file.name)
         self.service = ClangIndexer(self.parser, self.root_directory)
 
+    def tearDown(self):
+        # Opening the symbol database (WAL journal) creates it on the disk
+        for filename in ['tmp.db', 'out.db']:
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(filename + suffix):
+                    os.remove(filename + suffix)
+
+    def find_all_references(self, *args):
+        success, pages = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES] + list(args))
+        return success, [reference for references, continuation_token in pages for reference in references]
+
     def test_if_symbol_db_is_located_in_root_directory(self):
         self.assertEqual(self.service.symbol_db_path, os.path.join(self.root_directory, self.service.symbol_db_name))
 
@@ -64,17 +89,17 @@ class ClangIndexerTest(unittest.TestCase):
 
     def test_if_run_on_single_file_skips_indexing_if_symbol_db_is_inexisting(self):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
-            with mock.patch('services.source_code_model.indexer.clang_indexer.index_single_file') as mock_index_single_file:
+            with mock.patch.object(self.service.indexing_worker_pool, 'index') as mock_indexing_worker_pool_index:
                 success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE, self.test_file.name, self.test_file_edited.name])
-        mock_index_single_file.assert_not_called()
+        mock_indexing_worker_pool_index.assert_not_called()
         self.assertEqual(success, False)
         self.assertEqual(args, None)
 
     def test_if_run_on_single_file_skips_indexing_when_file_is_edited(self):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
-            with mock.patch('services.source_code_model.indexer.clang_indexer.index_single_file') as mock_index_single_file:
+            with mock.patch.object(self.service.indexing_worker_pool, 'index') as mock_indexing_worker_pool_index:
                 success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE, self.test_file.name, self.test_file_edited.name])
-        mock_index_single_file.assert_not_called()
+        mock_indexing_worker_pool_index.assert_not_called()
         self.assertEqual(success, False)
         self.assertEqual(args, None)
 
@@ -82,22 +107,33 @@ class ClangIndexerTest(unittest.TestCase):
         manager = mock.MagicMock()
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete_entry:
+                with mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete_entry, \
+                    mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+                    mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[]), \
+                    mock.patch.object(self.service.symbol_db, 'flush'):
                     with mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', return_value=os.path.basename(self.test_file.name)) as mock_remove_root_dir_from_filename:
-                        with mock.patch('services.source_code_model.indexer.clang_indexer.index_single_file', return_value=True) as mock_index_single_file:
+                        with mock.patch.object(self.service.indexing_worker_pool, 'index', return_value=[(self.test_file.name, True, 0.1)]) as mock_indexing_worker_pool_index, \
+                            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['worker_symbol_db']), \
+                            mock.patch.object(self.service.indexing_worker_pool, 'clear') as mock_indexing_worker_pool_clear, \
+                            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]) as mock_symbol_db_insert_from:
                             manager.attach_mock(mock_symbol_db_open, 'mock_symbol_db_open')
                             manager.attach_mock(mock_symbol_db_delete_entry, 'mock_symbol_db_delete_entry')
                             manager.attach_mock(mock_remove_root_dir_from_filename, 'mock_remove_root_dir_from_filename')
-                            manager.attach_mock(mock_index_single_file, 'mock_index_single_file')
+                            manager.attach_mock(mock_indexing_worker_pool_index, 'mock_indexing_worker_pool_index')
+                            manager.attach_mock(mock_symbol_db_insert_from, 'mock_symbol_db_insert_from')
+                            manager.attach_mock(mock_indexing_worker_pool_clear, 'mock_indexing_worker_pool_clear')
                             success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE, self.test_file.name, self.test_file.name])
         manager.assert_has_calls(
             [
                 mock.call.mock_symbol_db_open(self.service.symbol_db_path),
                 mock.call.mock_remove_root_dir_from_filename(self.root_directory, self.test_file.name),
                 mock.call.mock_symbol_db_delete_entry(mock_remove_root_dir_from_filename.return_value),
-                mock.call.mock_index_single_file(self.service.parser, self.service.root_directory, self.test_file.name, self.test_file.name, self.service.symbol_db)
+                mock.call.mock_indexing_worker_pool_index([self.test_file.name], False, None),
+                mock.call.mock_symbol_db_insert_from(['worker_symbol_db']),
+                mock.call.mock_indexing_worker_pool_clear()
             ]
         )
+        mock_symbol_db_insert_file.assert_called_once_with(mock_remove_root_dir_from_filename.return_value, mock.ANY, mock.ANY, mock.ANY, mock.ANY, mock.ANY)
         self.assertEqual(success, True)
         self.assertEqual(args, None)
 
@@ -105,80 +141,160 @@ class ClangIndexerTest(unittest.TestCase):
         manager = mock.MagicMock()
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete_entry:
+                with mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete_entry, \
+                    mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[]), \
+                    mock.patch.object(self.service.symbol_db, 'flush'):
                     with mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', return_value=os.path.basename(self.test_file.name)) as mock_remove_root_dir_from_filename:
-                        with mock.patch('services.source_code_model.indexer.clang_indexer.index_single_file', return_value=False) as mock_index_single_file:
+                        with mock.patch.object(self.service.indexing_worker_pool, 'index', return_value=[(self.test_file.name, False, 0.1)]) as mock_indexing_worker_pool_index, \
+                            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+                            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+                            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+                            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file:
                             manager.attach_mock(mock_symbol_db_open, 'mock_symbol_db_open')
                             manager.attach_mock(mock_symbol_db_delete_entry, 'mock_symbol_db_delete_entry')
                             manager.attach_mock(mock_remove_root_dir_from_filename, 'mock_remove_root_dir_from_filename')
-                            manager.attach_mock(mock_index_single_file, 'mock_index_single_file')
+                            manager.attach_mock(mock_indexing_worker_pool_index, 'mock_indexing_worker_pool_index')
                             success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE, self.test_file.name, self.test_file.name])
             manager.assert_has_calls(
                 [
                     mock.call.mock_symbol_db_open(self.service.symbol_db_path),
                     mock.call.mock_remove_root_dir_from_filename(self.root_directory, self.test_file.name),
                     mock.call.mock_symbol_db_delete_entry(mock_remove_root_dir_from_filename.return_value),
-                    mock.call.mock_index_single_file(self.service.parser, self.service.root_directory, self.test_file.name, self.test_file.name, self.service.symbol_db)
+                    mock.call.mock_indexing_worker_pool_index([self.test_file.name], False, None)
                 ]
             )
+        mock_symbol_db_insert_file.assert_not_called()
         self.assertEqual(success, False)
         self.assertEqual(args, None)
 
-    def test_if_run_on_directory_skips_indexing_if_symbol_db_already_exists_in_root_directory(self):
-        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
-            with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'create_data_model') as mock_symbol_db_create_data_model:
-                    success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
-        mock_symbol_db_open.assert_not_called()
-        mock_symbol_db_create_data_model.assert_not_called()
+    def test_if_run_on_directory_indexes_only_new_and_changed_files_and_drops_the_removed_ones(self):
+        cpp_file_list = ['/tmp/new.cpp', '/tmp/changed.cpp', '/tmp/unchanged.cpp']
+        indexed_files = {'changed.cpp': (1.0, 10, 'a', 'b'), 'unchanged.cpp': (2.0, 20, 'c', 'd'), 'removed.cpp': (3.0, 30, 'e', 'f')}
+        def get_file_state(filename, compiler_args_hash, indexed_file_state=None):
+            if filename == '/tmp/unchanged.cpp':
+                return (indexed_file_state, True)
+            return ((4.0, 40 if filename == '/tmp/new.cpp' else 50, 'g', 'h'), False)
+        with mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'create_data_model'), \
+            mock.patch.object(self.service.symbol_db, 'get_all_files', return_value=indexed_files), \
+            mock.patch.object(self.service.symbol_db, 'get_declarations_only_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete, \
+            mock.patch.object(self.service.symbol_db, 'delete_file') as mock_symbol_db_delete_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_included_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=cpp_file_list), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', side_effect=get_file_state), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_compiler_args_hash', return_value='h'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', side_effect=lambda root, f: os.path.basename(f)), \
+            mock.patch.object(self.service.indexing_worker_pool, 'index') as mock_indexing_worker_pool_index, \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.symbol_db, 'begin_bulk_load') as mock_symbol_db_begin_bulk_load:
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
+        mock_symbol_db_begin_bulk_load.assert_not_called()
+        mock_indexing_worker_pool_index.assert_called_once_with(['/tmp/changed.cpp', '/tmp/new.cpp'], False, None)
+        self.assertEqual(sorted(c[0][0] for c in mock_symbol_db_delete.call_args_list), ['changed.cpp', 'new.cpp', 'removed.cpp'])
+        mock_symbol_db_delete_file.assert_called_once_with('removed.cpp')
+        self.assertEqual(sorted(c[0][0] for c in mock_symbol_db_insert_file.call_args_list), ['changed.cpp', 'new.cpp'])
         self.assertEqual(success, True)
-        self.assertEqual(args, None)
+        self.assertEqual(args, [2, 1, 1])
+
+    def test_if_run_on_directory_takes_the_files_from_compilation_database_and_records_the_headers_reached_by_indexing_them(self):
+        with mock.patch.multiple(self.service.symbol_db, open=mock.DEFAULT, create_data_model=mock.DEFAULT, delete=mock.DEFAULT, insert_from=mock.MagicMock(return_value=[]),
+                flush=mock.DEFAULT, begin_bulk_load=mock.DEFAULT, end_bulk_load=mock.DEFAULT), \
+            mock.patch.object(self.service.symbol_db, 'get_all_files', return_value={}), \
+            mock.patch.object(self.service.symbol_db, 'get_declarations_only_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_included_files', side_effect=[[], ['a.h'], ['a.h']]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=['a.h']), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.parser.get_compiler_args_db(), 'get_source_files', return_value=['/usr/lib/x.cpp', '/tmp/main.cpp']), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list') as mock_get_cpp_file_list, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((1.0, 10, 'a', 'b'), False)), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_compiler_args_hash', return_value='h'), \
+            mock.patch('os.path.isfile', return_value=True), \
+            mock.patch.object(self.service.indexing_worker_pool, 'index') as mock_indexing_worker_pool_index, \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'):
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
+        mock_get_cpp_file_list.assert_not_called()
+        mock_indexing_worker_pool_index.assert_called_once_with(['/tmp/main.cpp'], False, None)
+        self.assertEqual(sorted(c[0][0] for c in mock_symbol_db_insert_file.call_args_list), ['a.h', 'main.cpp'])
+        self.assertEqual(success, True)
+        self.assertEqual(args, [1, 0, 0])
 
     def test_if_run_on_directory_handles_when_there_are_no_files_existing_in_root_directory(self):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
             with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
                 with mock.patch.object(self.service.symbol_db, 'create_data_model') as mock_symbol_db_create_data_model:
-                    with mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=[]) as mock_get_cpp_file_list:
+                    with mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=[]) as mock_get_cpp_file_list, \
+                        mock.patch.object(self.service.symbol_db, 'get_all_files', return_value={}), \
+                        mock.patch.object(self.service.symbol_db, 'get_declarations_only_files', return_value=[]), \
+                        mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+                        mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+                        mock.patch.object(self.service.symbol_db, 'get_included_files', return_value=[]), \
+                        mock.patch.object(self.service.symbol_db, 'flush'):
                         success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
         mock_symbol_db_open.assert_called_once_with(self.service.symbol_db_path)
         mock_symbol_db_create_data_model.assert_called_once()
-        mock_get_cpp_file_list.assert_called_once_with(self.service.root_directory)
+        mock_get_cpp_file_list.assert_called_once_with(self.service.root_directory, mock.ANY, self.service.directory_scanner)
         self.assertEqual(success, True)
-        self.assertEqual(args, None)
+        self.assertEqual(args, [0, 0, 0])
 
-    def test_if_run_on_directory_handles_when_cpp_file_chunk_list_contains_none_items(self):
-        import multiprocessing, logging, subprocess
-        logging.getLoggerClass().root.handlers[0].baseFilename = 'log_file'
-        dummy_cmd = 'cd'
+    def test_if_run_on_directory_feeds_the_worker_pool_and_bulk_loads_the_results_of_workers_into_symbol_db_when_indexing_from_scratch(self):
         cpp_file_list = ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp', '/tmp/f.cpp', '/tmp/g.cpp']
-        cpp_file_list_chunks = [[cpp_file_list[0], cpp_file_list[1]], [cpp_file_list[2], cpp_file_list[3]], [cpp_file_list[4], cpp_file_list[5]], [cpp_file_list[6], None]]
-        with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
-            with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'create_data_model') as mock_symbol_db_create_data_model:
-                    with mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=cpp_file_list) as mock_get_cpp_file_list:
-                        with mock.patch('services.source_code_model.indexer.clang_indexer.slice_it', return_value=cpp_file_list_chunks) as mock_slice_it, \
-                            mock.patch('services.source_code_model.indexer.clang_indexer.create_indexer_input_list_file', return_value=(None, 'indexer_input_list_file',)) as mock_create_indexer_input_list_file, \
-                            mock.patch('services.source_code_model.indexer.clang_indexer.create_empty_symbol_db', return_value=(None, 'empty_symbol_db_filename',)) as mock_create_empty_symbol_db, \
-                            mock.patch('services.source_code_model.indexer.clang_indexer.start_indexing_subprocess', return_value=subprocess.Popen(dummy_cmd)) as mock_start_indexing_subprocess, \
-                            mock.patch('subprocess.Popen.wait') as mock_subprocess_wait, \
-                            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.insert_from') as mock_symbol_db_insert_from, \
-                            mock.patch('os.remove') as mock_os_remove:
-                            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
+        manager = mock.MagicMock()
+        with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open, \
+            mock.patch.object(self.service.symbol_db, 'create_data_model') as mock_symbol_db_create_data_model, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=cpp_file_list) as mock_get_cpp_file_list, \
+            mock.patch.object(self.service.indexing_worker_pool, 'index', return_value=[]) as mock_indexing_worker_pool_index, \
+            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['symbol_db_0', 'symbol_db_1']), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear') as mock_indexing_worker_pool_clear, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.insert_from', return_value=[]) as mock_symbol_db_insert_from, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.get_all_files', return_value={}), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.get_declarations_only_files', return_value=[]), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.get_claimed_headers', return_value=[]), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.get_included_files', return_value=[]), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.delete'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.insert_file') as mock_symbol_db_insert_file, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.begin_bulk_load') as mock_symbol_db_begin_bulk_load, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.end_bulk_load') as mock_symbol_db_end_bulk_load, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((1.0, 1, 'a', 'b'), False)), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_compiler_args_hash'):
+            manager.attach_mock(mock_symbol_db_begin_bulk_load, 'mock_symbol_db_begin_bulk_load')
+            manager.attach_mock(mock_indexing_worker_pool_index, 'mock_indexing_worker_pool_index')
+            manager.attach_mock(mock_symbol_db_insert_from, 'mock_symbol_db_insert_from')
+            manager.attach_mock(mock_indexing_worker_pool_clear, 'mock_indexing_worker_pool_clear')
+            manager.attach_mock(mock_symbol_db_insert_file, 'mock_symbol_db_insert_file')
+            manager.attach_mock(mock_symbol_db_end_bulk_load, 'mock_symbol_db_end_bulk_load')
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
         mock_symbol_db_open.assert_called_once_with(self.service.symbol_db_path)
         mock_symbol_db_create_data_model.assert_called_once()
-        mock_get_cpp_file_list.assert_called_once_with(self.service.root_directory)
-        mock_slice_it.assert_called_once_with(cpp_file_list, len(cpp_file_list)/multiprocessing.cpu_count())
-        mock_create_indexer_input_list_file.assert_called_with(self.service.root_directory, mock.ANY, mock_slice_it.return_value[len(cpp_file_list_chunks)-1])
-        mock_create_empty_symbol_db.assert_called_with(self.service.root_directory, self.service.symbol_db_name)
-        mock_start_indexing_subprocess.assert_called_with(self.service.root_directory, self.txt_compilation_database.name, mock_create_indexer_input_list_file.return_value[1], mock_create_empty_symbol_db.return_value[1], mock.ANY)
-        mock_symbol_db_insert_from.assert_called_once()
-        self.assertEqual(mock_create_indexer_input_list_file.call_count, len(cpp_file_list_chunks))
-        self.assertEqual(mock_create_empty_symbol_db.call_count, len(cpp_file_list_chunks))
-        self.assertEqual(mock_start_indexing_subprocess.call_count, len(cpp_file_list_chunks))
-        self.assertEqual(mock_os_remove.call_count, 2*len(cpp_file_list_chunks))
-        self.assertEqual(mock_subprocess_wait.call_count, len(cpp_file_list_chunks))
+        mock_get_cpp_file_list.assert_called_once_with(self.service.root_directory, mock.ANY, self.service.directory_scanner)
+        self.assertEqual(sorted(mock_indexing_worker_pool_index.call_args[0][0]), cpp_file_list)
+        self.assertEqual([c[0] for c in manager.mock_calls[0:5]], ['mock_symbol_db_begin_bulk_load', 'mock_indexing_worker_pool_index', 'mock_symbol_db_insert_from', 'mock_indexing_worker_pool_clear', 'mock_symbol_db_insert_file'])
+        self.assertEqual(manager.mock_calls[-1][0], 'mock_symbol_db_end_bulk_load')
+        mock_symbol_db_insert_from.assert_called_once_with(['symbol_db_0', 'symbol_db_1'])
         self.assertEqual(success, True)
-        self.assertEqual(args, None)
+        self.assertEqual(args, [len(cpp_file_list), 0, 0])
+
+    def test_if_indexing_worker_is_started_with_its_own_empty_symbol_db(self):
+        logging.getLoggerClass().root.handlers[0].baseFilename = 'log_file'
+        with mock.patch('services.source_code_model.indexer.clang_indexer.create_empty_symbol_db', return_value=(3, 'empty_symbol_db_filename',)) as mock_create_empty_symbol_db, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.start_indexing_subprocess') as mock_start_indexing_subprocess, \
+            mock.patch('os.close') as mock_os_close:
+            worker = self.service.indexing_worker_pool.start_worker(1)
+        mock_create_empty_symbol_db.assert_called_once_with(self.service.root_directory, self.service.symbol_db_name)
+        mock_os_close.assert_called_once_with(3)
+        mock_start_indexing_subprocess.assert_called_once_with(self.service.root_directory, self.txt_compilation_database.name, 'empty_symbol_db_filename', 'log_file_2', self.service.symbol_db_path, 'visitor', 10, (2, 7), None)
+        self.assertEqual(worker.process, mock_start_indexing_subprocess.return_value)
+        self.assertEqual(worker.output_db_filename, 'empty_symbol_db_filename')
+
+    def test_if_close_stops_the_indexing_workers(self):
+        with mock.patch.object(self.service.indexing_worker_pool, 'close') as mock_indexing_worker_pool_close:
+            self.service.close()
+        mock_indexing_worker_pool_close.assert_called_once()
 
     def test_if_drop_single_file_skips_deleting_an_entry_if_symbol_db_is_inexisting(self):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
@@ -195,15 +311,333 @@ class ClangIndexerTest(unittest.TestCase):
     def test_if_drop_single_file_deletes_an_entry_from_symbol_db(self):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete:
+                with mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete, \
+                    mock.patch.object(self.service.symbol_db, 'delete_file') as mock_symbol_db_delete_file, \
+                    mock.patch.object(self.service.symbol_db, 'flush') as mock_symbol_db_flush:
                     with mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', return_value=os.path.basename(self.test_file.name)) as mock_remove_root_dir_from_filename:
                         success, args = self.service([SourceCodeModelIndexerRequestId.DROP_SINGLE_FILE, self.test_file.name])
         mock_symbol_db_open.assert_called_with(self.service.symbol_db_path)
         mock_symbol_db_delete.assert_called_once_with(mock_remove_root_dir_from_filename.return_value)
+        mock_symbol_db_delete_file.assert_called_once_with(mock_remove_root_dir_from_filename.return_value)
+        mock_symbol_db_flush.assert_called_once()
         mock_remove_root_dir_from_filename.assert_called_once_with(self.root_directory, self.test_file.name)
         self.assertEqual(success, True)
         self.assertEqual(args, None)
 
+    def test_if_run_on_single_file_schedules_includers_of_the_file_for_reindexing_in_the_background(self):
+        filename = os.path.join(self.root_directory, 'a.cpp')
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'delete'), \
+            mock.patch.object(self.service.symbol_db, 'outdate_file') as mock_symbol_db_outdate_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=['b.h']), \
+            mock.patch.object(self.service.symbol_db, 'insert_file'), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[(u'b.h', 1, u'a.cpp'), (u'main.cpp', 1, u'b.h')]), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((1.5, 10, 'content_hash', 'compiler_args_hash'), False)), \
+            mock.patch.object(self.service.indexing_worker_pool, 'index', return_value=[(filename, True, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'schedule') as mock_indexing_worker_pool_schedule, \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch') as mock_indexing_worker_pool_start_batch:
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE, filename, filename])
+        self.assertEqual(success, True)
+        mock_symbol_db_outdate_file.assert_called_once_with('b.h') # Header including it is recorded again by 'main.cpp'
+        mock_indexing_worker_pool_schedule.assert_called_once_with([os.path.join(self.root_directory, 'main.cpp')])
+        mock_indexing_worker_pool_start_batch.assert_called_once_with(ClangIndexer.reindexing_batch_size)
+
+    def test_if_run_on_single_file_does_not_index_header_on_its_own_but_reindexes_its_includers_in_the_background(self):
+        header = os.path.join(self.root_directory, 'a.h')
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete, \
+            mock.patch.object(self.service.symbol_db, 'outdate_file') as mock_symbol_db_outdate_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[(u'b.h', 1, u'a.h'), (u'main.cpp', 1, u'b.h'), (u'main.cpp', 2, u'a.h')]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'index') as mock_indexing_worker_pool_index, \
+            mock.patch.object(self.service.indexing_worker_pool, 'schedule') as mock_indexing_worker_pool_schedule, \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'):
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_SINGLE_FILE, header, header])
+        self.assertEqual(success, True)
+        mock_indexing_worker_pool_index.assert_not_called()
+        self.assertEqual([c[0][0] for c in mock_symbol_db_delete.call_args_list], ['a.h', 'b.h'])
+        self.assertEqual([c[0][0] for c in mock_symbol_db_outdate_file.call_args_list], ['a.h', 'b.h'])
+        mock_indexing_worker_pool_schedule.assert_called_once_with([os.path.join(self.root_directory, 'main.cpp')])
+        mock_symbol_db_insert_file.assert_not_called() # Not until 'main.cpp' has recorded them again
+
+    def test_if_outdated_headers_are_recorded_once_their_includers_are_reindexed_in_the_background(self):
+        header = os.path.join(self.root_directory, 'a.h')
+        self.service.outdated_headers = set([header, os.path.join(self.root_directory, 'removed.h')])
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[(os.path.join(self.root_directory, 'main.cpp'), True, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['worker_symbol_db']), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'), \
+            mock.patch.object(self.service.symbol_db, 'delete'), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=['a.h']), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('os.path.exists', side_effect=lambda filename: filename == header), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((1.5, 10, 'content_hash', 'compiler_args_hash'), False)):
+            self.service.background_callback()
+        self.assertEqual([c[0][0] for c in mock_symbol_db_insert_file.call_args_list], ['main.cpp', 'a.h'])
+        self.assertEqual(self.service.outdated_headers, set())
+
+    def test_if_outdated_headers_are_recorded_without_compiler_args_of_their_own(self):
+        header = os.path.join(self.root_directory, 'a.h')
+        self.service.outdated_headers = set([header])
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=['a.h']), \
+            mock.patch.object(self.service.symbol_db, 'insert_file'), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch.object(self.service.parser.get_compiler_args_db(), 'get') as mock_compiler_args_db_get, \
+            mock.patch('os.path.exists', return_value=True), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((1.5, 10, 'content_hash', ''), False)) as mock_get_file_state:
+            self.service.background_callback()
+        mock_get_file_state.assert_called_once_with(header, '')
+        mock_compiler_args_db_get.assert_not_called()
+
+    def test_if_outdated_headers_which_none_of_the_includers_has_claimed_are_left_as_not_indexed(self):
+        self.service.outdated_headers = set([os.path.join(self.root_directory, 'a.h')])
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[(os.path.join(self.root_directory, 'main.cpp'), False, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['worker_symbol_db']), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch('os.path.exists', return_value=True):
+            self.service.background_callback()
+        mock_symbol_db_insert_file.assert_not_called()
+        self.assertEqual(self.service.outdated_headers, set())
+
+    def test_if_headers_claimed_for_the_file_which_has_failed_to_index_are_released(self):
+        filename = os.path.join(self.root_directory, 'main.cpp')
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[(filename, False, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['worker_symbol_db']), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', side_effect=lambda claimed_by=None: ['a.h'] if claimed_by == 'main.cpp' else []) as mock_symbol_db_get_claimed_headers, \
+            mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete, \
+            mock.patch.object(self.service.symbol_db, 'outdate_file') as mock_symbol_db_outdate_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.logging'), \
+            mock.patch('os.path.exists', return_value=True):
+            self.service.background_callback()
+        mock_symbol_db_get_claimed_headers.assert_any_call('main.cpp')
+        mock_symbol_db_delete.assert_called_once_with('a.h')
+        mock_symbol_db_outdate_file.assert_called_once_with('a.h')
+        mock_symbol_db_insert_file.assert_not_called() # Header is left as not indexed
+        self.assertEqual(self.service.outdated_headers, set())
+
+    def test_if_outdated_headers_are_not_recorded_while_there_are_files_left_to_be_reindexed(self):
+        self.service.outdated_headers = set([os.path.join(self.root_directory, 'a.h')])
+        self.service.indexing_worker_pool.scheduled[os.path.join(self.root_directory, 'main.cpp')] = None
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file:
+            self.service.background_callback()
+        mock_symbol_db_insert_file.assert_not_called()
+        self.assertEqual(len(self.service.outdated_headers), 1)
+
+    def test_if_run_on_directory_reindexes_includers_of_changed_headers_instead_of_the_headers_themselves(self):
+        cpp_file_list = ['/tmp/a.h', '/tmp/b.h', '/tmp/main.cpp', '/tmp/other.cpp']
+        indexed_files = {'a.h': (1.0, 10, 'a', 'b'), 'b.h': (2.0, 20, 'c', 'd'), 'main.cpp': (3.0, 30, 'e', 'f'), 'other.cpp': (4.0, 40, 'g', 'h')}
+        def get_file_state(filename, compiler_args_hash, indexed_file_state=None):
+            if filename == '/tmp/a.h' or indexed_file_state is None:
+                return ((5.0, 50, 'i', 'j'), False)
+            return (indexed_file_state, True)
+        with mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'create_data_model'), \
+            mock.patch.object(self.service.symbol_db, 'get_all_files', return_value=indexed_files), \
+            mock.patch.object(self.service.symbol_db, 'get_declarations_only_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[(u'b.h', 1, u'a.h'), (u'main.cpp', 1, u'b.h')]) as mock_symbol_db_get_includers, \
+            mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete, \
+            mock.patch.object(self.service.symbol_db, 'outdate_file') as mock_symbol_db_outdate_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=['a.h', 'b.h']), \
+            mock.patch.object(self.service.symbol_db, 'get_included_files', return_value=['a.h', 'b.h']), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=cpp_file_list), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', side_effect=get_file_state), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_compiler_args_hash', return_value='h'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', side_effect=lambda root, f: os.path.basename(f)), \
+            mock.patch('os.path.exists', return_value=True), \
+            mock.patch('os.path.getsize', return_value=30), \
+            mock.patch.object(self.service.indexing_worker_pool, 'index') as mock_indexing_worker_pool_index, \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'):
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
+        mock_symbol_db_get_includers.assert_called_once_with('a.h')
+        mock_indexing_worker_pool_index.assert_called_once_with([os.path.join(self.root_directory, 'main.cpp')], False, None)
+        self.assertEqual(sorted(c[0][0] for c in mock_symbol_db_delete.call_args_list), ['a.h', 'b.h', 'main.cpp'])
+        mock_symbol_db_outdate_file.assert_called_once_with('b.h')
+        self.assertEqual(sorted(c[0][0] for c in mock_symbol_db_insert_file.call_args_list), ['a.h', 'b.h'])
+        self.assertEqual(success, True)
+        self.assertEqual(args, [1, 3, 0])
+
+    def test_if_run_on_directory_records_the_declarations_first_and_schedules_the_references_in_the_background_for_big_runs(self):
+        cpp_file_list = ['/tmp/a.h', '/tmp/main.cpp', '/tmp/other.cpp', '/tmp/done.cpp']
+        indexed_files = {'done.cpp': (3.0, 30, 'e', 'f')}
+        sizes = {'/tmp/main.cpp': 10, '/tmp/other.cpp': 20, '/tmp/done.cpp': 30}
+        def get_file_state(filename, compiler_args_hash, indexed_file_state=None):
+            if indexed_file_state is None:
+                return ((5.0, sizes.get(filename, 50), 'i', 'j'), False)
+            return (indexed_file_state, True)
+        with mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'create_data_model'), \
+            mock.patch.object(self.service.symbol_db, 'get_all_files', return_value=indexed_files), \
+            mock.patch.object(self.service.symbol_db, 'get_declarations_only_files', return_value=['done.cpp']), \
+            mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'delete'), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_included_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=cpp_file_list), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', side_effect=get_file_state), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_compiler_args_hash', return_value='h'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', side_effect=lambda root, f: os.path.basename(f)), \
+            mock.patch('os.path.exists', return_value=True), \
+            mock.patch('os.path.getsize', side_effect=lambda f: sizes[f]), \
+            mock.patch.object(ClangIndexer, 'declaration_pass_min_files', 2), \
+            mock.patch.multiple(self.service.indexing_worker_pool, index=mock.DEFAULT, clear=mock.DEFAULT, schedule=mock.DEFAULT, start_batch=mock.DEFAULT,
+                busy_workers=mock.MagicMock(return_value=[])) as mock_indexing_worker_pool:
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
+        mock_indexing_worker_pool['index'].assert_called_once_with(['/tmp/other.cpp', '/tmp/main.cpp'], True, None)
+        self.assertEqual(sorted((c[0][0], c[0][6]) for c in mock_symbol_db_insert_file.call_args_list), [('a.h', False), ('main.cpp', True), ('other.cpp', True)])
+        mock_indexing_worker_pool['schedule'].assert_called_once_with(['/tmp/done.cpp', '/tmp/other.cpp', '/tmp/main.cpp'])
+        mock_indexing_worker_pool['start_batch'].assert_called_once_with(ClangIndexer.reindexing_batch_size)
+        self.assertEqual(success, True)
+        self.assertEqual(args, [3, 1, 0])
+
+    def test_if_run_on_directory_schedules_the_files_held_back_by_the_throttle_in_the_background_without_recording_them(self):
+        cpp_file_list = ['/tmp/main.cpp', '/tmp/other.cpp']
+        sizes = {'/tmp/main.cpp': 10, '/tmp/other.cpp': 20}
+        def index(file_list, declarations_only, throttle):
+            self.assertEqual(throttle.engaged(), True)
+            throttle.held_back.extend(file_list[1:])
+            return [(file_list[0], True, 0.1)]
+        mock_indexing_worker_pool_index = mock.MagicMock(side_effect=index)
+        self.service.requests_pending = mock.MagicMock(return_value=True)
+        with mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'create_data_model'), \
+            mock.patch.object(self.service.symbol_db, 'get_all_files', return_value={}), \
+            mock.patch.object(self.service.symbol_db, 'get_declarations_only_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'delete'), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'get_included_files', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'begin_bulk_load'), \
+            mock.patch.object(self.service.symbol_db, 'end_bulk_load'), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_cpp_file_list', return_value=cpp_file_list), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((5.0, 10, 'i', 'j'), False)), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_compiler_args_hash', return_value='h'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', side_effect=lambda root, f: os.path.basename(f)), \
+            mock.patch('os.path.getsize', side_effect=lambda f: sizes[f]), \
+            mock.patch.multiple(self.service.indexing_worker_pool, index=mock_indexing_worker_pool_index, clear=mock.DEFAULT, schedule=mock.DEFAULT,
+                start_batch=mock.DEFAULT, busy_workers=mock.MagicMock(return_value=[])) as mock_indexing_worker_pool:
+            success, args = self.service([SourceCodeModelIndexerRequestId.RUN_ON_DIRECTORY])
+        self.assertEqual(mock_indexing_worker_pool_index.call_args[0][0], ['/tmp/other.cpp', '/tmp/main.cpp'])
+        self.assertEqual([c[0][0] for c in mock_symbol_db_insert_file.call_args_list], ['other.cpp'])
+        mock_indexing_worker_pool['schedule'].assert_called_once_with(['/tmp/main.cpp'])
+        self.assertEqual(success, True)
+
+    def test_if_background_callback_merges_the_batch_and_starts_the_next_one_once_all_workers_are_done(self):
+        filename = os.path.join(self.root_directory, 'main.cpp')
+        manager = mock.MagicMock()
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[(filename, True, 0.1), ('/tmp/failed.cpp', False, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['worker_symbol_db']), \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear') as mock_indexing_worker_pool_clear, \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch') as mock_indexing_worker_pool_start_batch, \
+            mock.patch.object(self.service.symbol_db, 'delete') as mock_symbol_db_delete, \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]) as mock_symbol_db_insert_from, \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_file_state', return_value=((1.5, 10, 'content_hash', 'compiler_args_hash'), False)):
+            manager.attach_mock(mock_symbol_db_delete, 'mock_symbol_db_delete')
+            manager.attach_mock(mock_symbol_db_insert_from, 'mock_symbol_db_insert_from')
+            manager.attach_mock(mock_indexing_worker_pool_clear, 'mock_indexing_worker_pool_clear')
+            manager.attach_mock(mock_symbol_db_insert_file, 'mock_symbol_db_insert_file')
+            manager.attach_mock(mock_indexing_worker_pool_start_batch, 'mock_indexing_worker_pool_start_batch')
+            self.service.background_callback()
+        self.assertEqual(manager.mock_calls[0:4], [
+            mock.call.mock_symbol_db_delete('main.cpp'),
+            mock.call.mock_symbol_db_insert_from(['worker_symbol_db']),
+            mock.call.mock_indexing_worker_pool_clear(),
+            mock.call.mock_symbol_db_insert_file('main.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', mock.ANY),
+        ])
+        mock_symbol_db_delete.assert_called_once() # Symbols of the file which has failed to re-index are kept
+        mock_indexing_worker_pool_start_batch.assert_called_once_with(ClangIndexer.reindexing_batch_size)
+        self.assertEqual(self.service.background_reports, [])
+
+    def test_if_files_recorded_into_symbol_db_which_could_not_be_merged_are_outdated_instead_of_recorded(self):
+        filename = os.path.join(self.root_directory, 'main.cpp')
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[(filename, True, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=[]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'output_db_filenames', return_value=['worker_symbol_db']), \
+            mock.patch.object(self.service.indexing_worker_pool, 'files_recorded_into', return_value=[filename]) as mock_files_recorded_into, \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch'), \
+            mock.patch.object(self.service.symbol_db, 'delete'), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=['worker_symbol_db']), \
+            mock.patch.object(self.service.symbol_db, 'get_claimed_headers', return_value=[]), \
+            mock.patch.object(self.service.symbol_db, 'insert_file') as mock_symbol_db_insert_file, \
+            mock.patch.object(self.service.symbol_db, 'outdate_file') as mock_symbol_db_outdate_file, \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.logging'):
+            self.service.background_callback()
+        mock_files_recorded_into.assert_called_once_with(['worker_symbol_db'])
+        mock_symbol_db_outdate_file.assert_called_once_with('main.cpp')
+        mock_symbol_db_insert_file.assert_not_called()
+
+    def test_if_background_callback_keeps_the_reports_until_the_whole_batch_is_done(self):
+        with mock.patch.object(self.service.indexing_worker_pool, 'receive', return_value=[('/tmp/a.cpp', True, 0.1)]), \
+            mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=['worker']), \
+            mock.patch.object(self.service.symbol_db, 'insert_from', return_value=[]) as mock_symbol_db_insert_from, \
+            mock.patch.object(self.service.indexing_worker_pool, 'start_batch') as mock_indexing_worker_pool_start_batch:
+            self.service.background_callback()
+        mock_symbol_db_insert_from.assert_not_called()
+        mock_indexing_worker_pool_start_batch.assert_not_called()
+        self.assertEqual(self.service.background_reports, [('/tmp/a.cpp', True, 0.1)])
+
+    def test_if_background_fds_are_the_busy_workers(self):
+        with mock.patch.object(self.service.indexing_worker_pool, 'busy_workers', return_value=['worker']):
+            self.assertEqual(self.service.get_background_fds(), ['worker'])
+
+    def test_if_drop_all_cancels_reindexing_in_the_background(self):
+        self.service.background_reports = [('/tmp/a.cpp', True, 0.1)]
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'delete_all'), \
+            mock.patch.object(self.service.symbol_db, 'flush'), \
+            mock.patch.object(self.service.indexing_worker_pool, 'cancel') as mock_indexing_worker_pool_cancel, \
+            mock.patch.object(self.service.indexing_worker_pool, 'clear') as mock_indexing_worker_pool_clear:
+            success, args = self.service([SourceCodeModelIndexerRequestId.DROP_ALL, False])
+        mock_indexing_worker_pool_cancel.assert_called_once()
+        mock_indexing_worker_pool_clear.assert_called_once()
+        self.assertEqual(self.service.background_reports, [])
+
     def test_if_drop_all_skips_deleting_all_entries_if_symbol_db_is_inexisting(self):
         delete_from_disk = False
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
@@ -219,12 +653,14 @@ class ClangIndexerTest(unittest.TestCase):
         delete_from_disk = False
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'delete_all') as mock_symbol_db_delete_all:
+                with mock.patch.object(self.service.symbol_db, 'delete_all') as mock_symbol_db_delete_all, \
+                    mock.patch.object(self.service.symbol_db, 'flush') as mock_symbol_db_flush:
                     with mock.patch.object(self.service.symbol_db, 'close') as mock_symbol_db_close:
                         with mock.patch('os.remove') as mock_os_remove:
                             success, args = self.service([SourceCodeModelIndexerRequestId.DROP_ALL, delete_from_disk])
         mock_symbol_db_open.assert_called_with(self.service.symbol_db_path)
         mock_symbol_db_delete_all.assert_called_once()
+        mock_symbol_db_flush.assert_called_once()
         mock_symbol_db_close.assert_not_called()
         mock_os_remove.assert_not_called()
         self.assertEqual(success, True)
@@ -234,12 +670,14 @@ class ClangIndexerTest(unittest.TestCase):
         delete_from_disk = True
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
-                with mock.patch.object(self.service.symbol_db, 'delete_all') as mock_symbol_db_delete_all:
+                with mock.patch.object(self.service.symbol_db, 'delete_all') as mock_symbol_db_delete_all, \
+                    mock.patch.object(self.service.symbol_db, 'flush') as mock_symbol_db_flush:
                     with mock.patch.object(self.service.symbol_db, 'close') as mock_symbol_db_close:
                         with mock.patch('os.remove') as mock_os_remove:
                             success, args = self.service([SourceCodeModelIndexerRequestId.DROP_ALL, delete_from_disk])
         mock_symbol_db_open.assert_called_with(self.service.symbol_db_path)
         mock_symbol_db_delete_all.assert_called_once()
+        mock_symbol_db_flush.assert_called_once()
         mock_symbol_db_close.assert_called_once()
         mock_os_remove.assert_called_once_with(self.service.symbol_db.filename)
         self.assertEqual(success, True)
@@ -250,7 +688,7 @@ class ClangIndexerTest(unittest.TestCase):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
             with mock.patch.object(self.service.parser, 'parse') as mock_parser_parse:
                 with mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor:
-                    success, references = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, line, column])
+                    success, references = self.find_all_references(self.test_file.name, line, column)
         mock_parser_parse.assert_not_called()
         mock_parser_get_cursor.assert_not_called()
         self.assertEqual(success, False)
@@ -260,7 +698,7 @@ class ClangIndexerTest(unittest.TestCase):
         line, column = 1, 1
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.parser, 'parse', return_value=None) as mock_parser_parse:
-                success, references = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, line, column])
+                success, references = self.find_all_references(self.test_file.name, line, column)
         mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
         self.assertEqual(success, False)
         self.assertEqual(len(references), 0)
@@ -270,7 +708,7 @@ class ClangIndexerTest(unittest.TestCase):
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.parser, 'parse') as mock_parser_parse:
                 with mock.patch.object(self.service.parser, 'get_cursor', return_value=None) as mock_parser_get_cursor:
-                    success, references = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, line, column])
+                    success, references = self.find_all_references(self.test_file.name, line, column)
         mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
         mock_parser_get_cursor.assert_called_once_with(mock_parser_parse.return_value, line, column)
         self.assertEqual(success, False)
@@ -279,13 +717,13 @@ class ClangIndexerTest(unittest.TestCase):
     def test_if_find_all_references_returns_true_and_empty_references_list_when_run_on_symbol_which_does_not_have_any_occurence_in_symbol_db(self):
         line, column = 1, 1
         cursor = mock.MagicMock(sqlite3.Cursor)
-        cursor.fetchall.return_value = []
+        cursor.fetchmany.return_value = []
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.parser, 'parse') as mock_parser_parse:
                 with mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor:
                     with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
                         with mock.patch.object(self.service.symbol_db, 'get_by_usr', return_value=cursor) as mock_symbol_db_get_by_usr:
-                            success, references = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, line, column])
+                            success, references = self.find_all_references(self.test_file.name, line, column)
         mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
         mock_parser_get_cursor.assert_called_once_with(mock_parser_parse.return_value, line, column)
         mock_symbol_db_open.assert_called_with(self.service.symbol_db_path)
@@ -296,13 +734,13 @@ class ClangIndexerTest(unittest.TestCase):
     def test_if_find_all_references_returns_true_and_non_empty_references_list_when_run_on_symbol_which_has_occurences_in_symbol_db(self):
         line, column = 1, 1
         cursor = mock.MagicMock(sqlite3.Cursor)
-        cursor.fetchall.return_value = [['main.cpp', '22', '5', 'main.cpp#l22#c5#foobar', '    void foobar() {']]
+        cursor.fetchmany.return_value = [['main.cpp', 22, 5, 'main.cpp#l22#c5#foobar', 8, True, 'foobar']]
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.parser, 'parse') as mock_parser_parse:
                 with mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor:
                     with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
                         with mock.patch.object(self.service.symbol_db, 'get_by_usr', return_value=cursor) as mock_symbol_db_get_by_usr:
-                            success, references = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, line, column])
+                            success, references = self.find_all_references(self.test_file.name, line, column)
         mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
         mock_parser_get_cursor.assert_called_once_with(mock_parser_parse.return_value, line, column)
         mock_symbol_db_open.assert_called_with(self.service.symbol_db_path)
@@ -313,13 +751,13 @@ class ClangIndexerTest(unittest.TestCase):
     def test_if_find_all_references_returns_true_and_in_non_empty_references_filename_columns_are_prepended_with_root_directory(self):
         line, column = 1, 1
         cursor = mock.MagicMock(sqlite3.Cursor)
-        cursor.fetchall.return_value = [['main.cpp', '22', '5', 'main.cpp#l22#c5#foobar', '    void foobar() {']]
+        cursor.fetchmany.return_value = [['main.cpp', 22, 5, 'main.cpp#l22#c5#foobar', 8, True, 'foobar']]
         with mock.patch.object(self.service, 'symbol_db_exists', return_value=True):
             with mock.patch.object(self.service.parser, 'parse') as mock_parser_parse:
                 with mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor:
                     with mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open:
                         with mock.patch.object(self.service.symbol_db, 'get_by_usr', return_value=cursor) as mock_symbol_db_get_by_usr:
-                            success, references = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, line, column])
+                            success, references = self.find_all_references(self.test_file.name, line, column)
         mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
         mock_parser_get_cursor.assert_called_once_with(mock_parser_parse.return_value, line, column)
         mock_symbol_db_open.assert_called_with(self.service.symbol_db_path)
@@ -329,118 +767,461 @@ class ClangIndexerTest(unittest.TestCase):
         filename = references[0][0]
         self.assertEqual(filename.startswith(self.root_directory), True)
 
-    def test_if_index_file_list_runs_indexing_for_each_of_the_files_given(self):
-        input_filename_list = ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp', '/tmp/f.cpp', '/tmp/g.cpp']
-        output_db_filename = 'out.db'
-        manager = mock.MagicMock()
-        with mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.create_data_model') as mock_symbol_db_create_data_model, \
-            mock.patch('services.source_code_model.indexer.clang_indexer.ClangParser.__init__', return_value=None) as mock_clang_parser_creation, \
-            mock.patch('services.source_code_model.indexer.clang_indexer.TranslationUnitCache') as mock_translation_unit_cache, \
-            mock.patch('services.source_code_model.indexer.clang_indexer.NoCache') as mock_translation_unit_no_cache_strategy, \
-            mock.patch('services.source_code_model.indexer.clang_indexer.index_single_file') as mock_index_single_file, \
-            mock.patch('__builtin__.open', mock.mock_open(read_data='\n'.join(input_filename_list)), create=True), \
-            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.close') as mock_symbol_db_close:
-                manager.attach_mock(mock_index_single_file, 'mock_index_single_file')
-                index_file_list(self.root_directory, 'file_containing_list_of_files_to_be_indexed', self.txt_compilation_database.name, output_db_filename)
-        mock_symbol_db_create_data_model.assert_called_once()
-        mock_clang_parser_creation.assert_called_once_with(self.txt_compilation_database.name, mock.ANY) # TODO how to test/mock against NoCache() temp object
-        mock_translation_unit_cache.assert_called_once()
-        mock_translation_unit_no_cache_strategy.assert_called_once()
-        self.assertEqual(mock_index_single_file.call_count, len(input_filename_list))
-        manager.assert_has_calls(
-            [
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[0], input_filename_list[0], mock.ANY
-                ),
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[1], input_filename_list[1], mock.ANY
-                ),
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[2], input_filename_list[2], mock.ANY
-                ),
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[3], input_filename_list[3], mock.ANY
-                ),
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[4], input_filename_list[4], mock.ANY
-                ),
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[5], input_filename_list[5], mock.ANY
-                ),
-                mock.call.mock_index_single_file(
-                    mock.ANY, self.root_directory,
-                    input_filename_list[6], input_filename_list[6], mock.ANY
-                )
-            ]
+    def test_if_find_all_references_reads_the_context_of_each_reference_from_the_line_cache(self):
+        cursor = mock.MagicMock(sqlite3.Cursor)
+        cursor.fetchmany.return_value = [['main.cpp', 22, 5, 'main.cpp#l22#c5#foobar', 8, True, 'foobar']]
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse'), \
+            mock.patch.object(self.service.parser, 'get_cursor'), \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_by_usr', return_value=cursor), \
+            mock.patch.object(self.service.line_cache, 'getline', return_value='    void foobar() {\n') as mock_getline:
+            success, references = self.find_all_references(self.test_file.name, 1, 1)
+        mock_getline.assert_called_once_with(os.path.join(self.root_directory, 'main.cpp'), 22)
+        self.assertEqual(references, [[os.path.join(self.root_directory, 'main.cpp'), 22, 5, '    void foobar() {\n']])
+
+    def find_all_references_pages(self, rows, *args):
+        cursor = mock.MagicMock(sqlite3.Cursor)
+        cursor.fetchmany.side_effect = lambda size: [rows.pop(0) for i in range(min(size, len(rows)))]
+        cursor.fetchone.side_effect = lambda: rows.pop(0) if rows else None
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse'), \
+            mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor, \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_by_usr', return_value=cursor) as mock_symbol_db_get_by_usr, \
+            mock.patch.object(self.service.line_cache, 'getline', return_value=''), \
+            mock.patch.object(ClangIndexer, 'references_page_size', 2):
+            mock_parser_get_cursor.return_value.referenced.get_usr.return_value = 'c:@F@foobar#'
+            success, pages = self.service([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, 1, 1] + list(args))
+            pages = [([reference[1] for reference in references], continuation_token) for references, continuation_token in pages]
+        return pages, mock_parser_get_cursor, mock_symbol_db_get_by_usr
+
+    def test_if_find_all_references_streams_references_in_pages_each_with_its_continuation_token(self):
+        rows = [['main.cpp', line, 5, 'c:@F@foobar#', 8, False, 'foobar'] for line in range(1, 6)]
+        pages, mock_parser_get_cursor, mock_symbol_db_get_by_usr = self.find_all_references_pages(rows)
+        self.assertEqual(pages, [([1, 2], ['c:@F@foobar#', 2]), ([3, 4], ['c:@F@foobar#', 4]), ([5], None)])
+        mock_symbol_db_get_by_usr.assert_called_once_with('c:@F@foobar#', 0)
+
+    def test_if_find_all_references_stops_at_the_limit_and_returns_token_to_continue_from_there(self):
+        rows = [['main.cpp', line, 5, 'c:@F@foobar#', 8, False, 'foobar'] for line in range(1, 6)]
+        pages, mock_parser_get_cursor, mock_symbol_db_get_by_usr = self.find_all_references_pages(rows, 3)
+        self.assertEqual(pages, [([1, 2], ['c:@F@foobar#', 2]), ([3], ['c:@F@foobar#', 3])])
+
+    def test_if_find_all_references_does_not_return_token_when_limit_matches_the_number_of_references(self):
+        rows = [['main.cpp', line, 5, 'c:@F@foobar#', 8, False, 'foobar'] for line in range(1, 3)]
+        pages, mock_parser_get_cursor, mock_symbol_db_get_by_usr = self.find_all_references_pages(rows, 2)
+        self.assertEqual(pages, [([1, 2], None)])
+
+    def test_if_find_all_references_continues_from_given_token_without_looking_up_the_symbol_again(self):
+        rows = [['main.cpp', line, 5, 'c:@F@foobar#', 8, False, 'foobar'] for line in range(4, 6)]
+        pages, mock_parser_get_cursor, mock_symbol_db_get_by_usr = self.find_all_references_pages(rows, None, ['c:@F@foobar#', 3])
+        self.assertEqual(pages, [([4, 5], ['c:@F@foobar#', 5]), ([], None)])
+        mock_parser_get_cursor.assert_not_called()
+        mock_symbol_db_get_by_usr.assert_called_once_with('c:@F@foobar#', 3)
+
+    def test_if_serialize_result_converts_references_into_compact_result_with_filenames_interned(self):
+        references = [['/tmp/main.cpp', 22, 5, '    void foobar() {'], ['/tmp/main.cpp', 30, 9, '    foobar();']]
+        result = self.service.serialize_result([SourceCodeModelIndexerRequestId.FIND_ALL_REFERENCES, self.test_file.name, 1, 1], references)
+        self.assertEqual([(result.string(f), l, c, result.string(ctx)) for f, l, c, ctx in result.rows(0)], [tuple(ref) for ref in references])
+        self.assertEqual(len(result.strings), 3)
+
+    def test_if_workspace_symbol_returns_false_on_inexisting_symbol_db(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=False):
+            with mock.patch.object(self.service.symbol_db, 'find_symbols') as mock_symbol_db_find_symbols:
+                success, symbols = self.service([SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL, 'foo', 10])
+        mock_symbol_db_find_symbols.assert_not_called()
+        self.assertEqual(success, False)
+        self.assertEqual(symbols, None)
+
+    def test_if_workspace_symbol_returns_matching_symbols_with_filenames_prepended_with_root_directory(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.symbol_db, 'open') as mock_symbol_db_open, \
+            mock.patch.object(self.service.symbol_db, 'find_symbols', return_value=[('foo', 'ns::foo', 8, 'a.cpp', 3, 5)]) as mock_symbol_db_find_symbols:
+            success, symbols = self.service([SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL, 'foo', 10])
+        mock_symbol_db_open.assert_called_once_with(self.service.symbol_db_path)
+        mock_symbol_db_find_symbols.assert_called_once_with('foo', 10)
+        self.assertEqual(success, True)
+        self.assertEqual(symbols, [['foo', 'ns::foo', 8, os.path.join(self.root_directory, 'a.cpp'), 3, 5]])
+
+    def test_if_workspace_symbol_limits_the_number_of_symbols_by_default(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'find_symbols', return_value=[]) as mock_symbol_db_find_symbols:
+            self.service([SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL, 'foo', None])
+        mock_symbol_db_find_symbols.assert_called_once_with('foo', 100)
+
+    def test_if_serialize_result_converts_workspace_symbols_into_compact_result(self):
+        symbols = [['foo', 'ns::foo', 8, '/tmp/main.cpp', 3, 5], ['fooBar', 'ns::fooBar', 8, '/tmp/main.cpp', 7, 5]]
+        result = self.service.serialize_result([SourceCodeModelIndexerRequestId.WORKSPACE_SYMBOL, 'foo', 10], symbols)
+        self.assertEqual(
+            [[result.string(n), result.string(q), k, result.string(f), l, c] for n, q, k, f, l, c in result.rows(0)], symbols
         )
+
+    def test_if_incoming_calls_returns_callers_of_the_function_under_the_cursor(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse') as mock_parser_parse, \
+            mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor, \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_incoming_calls', return_value=[(u'main', u'main', u'c:@F@main#', u'a.cpp', 3, 5)]) as mock_get_incoming_calls:
+            mock_parser_get_cursor.return_value.referenced.get_usr.return_value = 'c:@F@foobar#'
+            success, calls = self.service([SourceCodeModelIndexerRequestId.INCOMING_CALLS, self.test_file.name, 1, 1])
+        mock_get_incoming_calls.assert_called_once_with('c:@F@foobar#')
+        self.assertEqual(success, True)
+        self.assertEqual(calls, [['main', 'main', 'c:@F@main#', os.path.join(self.root_directory, 'a.cpp'), 3, 5]])
+
+    def test_if_outgoing_calls_does_not_look_up_the_function_again_when_its_usr_is_given(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse') as mock_parser_parse, \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_outgoing_calls', return_value=[]) as mock_get_outgoing_calls:
+            success, calls = self.service([SourceCodeModelIndexerRequestId.OUTGOING_CALLS, self.test_file.name, 1, 1, 'c:@F@main#'])
+        mock_parser_parse.assert_not_called()
+        mock_get_outgoing_calls.assert_called_once_with('c:@F@main#')
+        self.assertEqual(success, True)
+        self.assertEqual(calls, [])
+
+    def test_if_incoming_calls_returns_false_for_invalid_cursor(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse'), \
+            mock.patch.object(self.service.parser, 'get_cursor', return_value=None), \
+            mock.patch.object(self.service.symbol_db, 'get_incoming_calls') as mock_get_incoming_calls:
+            success, calls = self.service([SourceCodeModelIndexerRequestId.INCOMING_CALLS, self.test_file.name, 1, 1])
+        mock_get_incoming_calls.assert_not_called()
+        self.assertEqual(success, False)
+
+    def test_if_serialize_result_converts_calls_into_compact_result(self):
+        calls = [['main', 'main', 'c:@F@main#', '/tmp/main.cpp', 3, 5]]
+        result = self.service.serialize_result([SourceCodeModelIndexerRequestId.INCOMING_CALLS, '/tmp/main.cpp', 1, 1], calls)
+        self.assertEqual(
+            [[result.string(n), result.string(q), result.string(u), result.string(f), l, c] for n, q, u, f, l, c in result.rows(0)], calls
+        )
+
+    def test_if_derived_classes_returns_whole_hierarchy_of_the_class_under_the_cursor(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse') as mock_parser_parse, \
+            mock.patch.object(self.service.parser, 'get_cursor') as mock_parser_get_cursor, \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_derived_classes', return_value=[(u'Bar', u'ns::Bar', u'c:@S@Bar', u'c:@S@Foo', u'a.h', 3, 20, 1, 1)]) as mock_get_derived_classes:
+            mock_parser_get_cursor.return_value.referenced.get_usr.return_value = 'c:@S@Foo'
+            success, classes = self.service([SourceCodeModelIndexerRequestId.DERIVED_CLASSES, self.test_file.name, 1, 1])
+        mock_get_derived_classes.assert_called_once_with('c:@S@Foo', True)
+        self.assertEqual(success, True)
+        self.assertEqual(classes, [['Bar', 'ns::Bar', 'c:@S@Bar', 'c:@S@Foo', os.path.join(self.root_directory, 'a.h'), 3, 20, 1, True]])
+
+    def test_if_base_classes_does_not_look_up_the_class_again_when_its_usr_is_given(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.parser, 'parse') as mock_parser_parse, \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_base_classes', return_value=[]) as mock_get_base_classes:
+            success, classes = self.service([SourceCodeModelIndexerRequestId.BASE_CLASSES, self.test_file.name, 1, 1, 'c:@S@Bar', False])
+        mock_parser_parse.assert_not_called()
+        mock_get_base_classes.assert_called_once_with('c:@S@Bar', False)
+        self.assertEqual(success, True)
+        self.assertEqual(classes, [])
+
+    def test_if_serialize_result_converts_type_hierarchy_into_compact_result(self):
+        classes = [['Bar', 'ns::Bar', 'c:@S@Bar', 'c:@S@Foo', '/tmp/a.h', 3, 20, 1, True]]
+        result = self.service.serialize_result([SourceCodeModelIndexerRequestId.DERIVED_CLASSES, '/tmp/a.h', 1, 1], classes)
+        self.assertEqual(
+            [[result.string(n), result.string(q), result.string(u), result.string(t), result.string(f), l, c, a, bool(v)] for n, q, u, t, f, l, c, a, v in result.rows(0)],
+            classes
+        )
+
+    def test_if_includers_returns_includers_of_the_file_given(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=True), \
+            mock.patch.object(self.service.symbol_db, 'open'), \
+            mock.patch.object(self.service.symbol_db, 'get_includers', return_value=[(u'main.cpp', 3, u'a.h')]) as mock_get_includers:
+            success, includers = self.service([SourceCodeModelIndexerRequestId.INCLUDERS, os.path.join(self.root_directory, 'a.h'), False])
+        mock_get_includers.assert_called_once_with('a.h', False)
+        self.assertEqual(success, True)
+        self.assertEqual(includers, [[os.path.join(self.root_directory, 'main.cpp'), 3, os.path.join(self.root_directory, 'a.h')]])
+
+    def test_if_includers_returns_false_if_symbol_db_does_not_exist(self):
+        with mock.patch.object(self.service, 'symbol_db_exists', return_value=False), \
+            mock.patch.object(self.service.symbol_db, 'get_includers') as mock_get_includers:
+            success, includers = self.service([SourceCodeModelIndexerRequestId.INCLUDERS, os.path.join(self.root_directory, 'a.h')])
+        mock_get_includers.assert_not_called()
+        self.assertEqual(success, False)
+
+    def test_if_serialize_result_converts_includers_into_compact_result(self):
+        includers = [['/tmp/main.cpp', 3, '/tmp/a.h']]
+        result = self.service.serialize_result([SourceCodeModelIndexerRequestId.INCLUDERS, '/tmp/a.h'], includers)
+        self.assertEqual([[result.string(i), l, result.string(f)] for i, l, f in result.rows(0)], includers)
+
+    def test_if_serialize_result_leaves_results_of_other_requests_as_they_are(self):
+        self.assertEqual(self.service.serialize_result([SourceCodeModelIndexerRequestId.DROP_ALL, True], None), None)
+
+    def test_if_index_file_stream_indexes_files_as_they_arrive_and_reports_back_for_each_of_them(self):
+        import StringIO
+        input_stream, output_stream = StringIO.StringIO('"/tmp/a.cpp"\n["/tmp/b.cpp", true]\n'), StringIO.StringIO()
+        with mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.create_data_model'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.begin_bulk_load') as mock_symbol_db_begin_bulk_load, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.ClangParser.__init__', return_value=None), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.index_single_file', side_effect=[True, Exception()]) as mock_index_single_file, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.logging'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.close') as mock_symbol_db_close:
+            index_file_stream(self.root_directory, self.txt_compilation_database.name, 'out.db', input_stream, output_stream)
+        mock_index_single_file.assert_has_calls([
+            mock.call(mock.ANY, self.root_directory, '/tmp/a.cpp', '/tmp/a.cpp', mock.ANY, None, 'visitor', False),
+            mock.call(mock.ANY, self.root_directory, '/tmp/b.cpp', '/tmp/b.cpp', mock.ANY, None, 'visitor', True),
+        ])
+        mock_symbol_db_begin_bulk_load.assert_called_once()
+        reports = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+        self.assertEqual([report[0:2] for report in reports], [['/tmp/a.cpp', True], ['/tmp/b.cpp', False]])
+        self.assertTrue(all(report[3] > 0 for report in reports))
         mock_symbol_db_close.assert_called_once()
 
     def test_if_index_single_file_returns_true_and_traverses_and_flushes_the_symbol_db(self):
         symbol_db = SymbolDatabase('tmp.db')
         with mock.patch.object(self.parser, 'parse') as mock_parser_parse:
-            with mock.patch.object(self.parser, 'traverse') as mock_parser_traverse:
+            with mock.patch.object(self.parser, 'traverse') as mock_parser_traverse, \
+                mock.patch('services.source_code_model.indexer.clang_indexer.get_recorded_files', return_value={self.test_file.name: 'a.cpp'}) as mock_get_recorded_files, \
+                mock.patch('services.source_code_model.indexer.clang_indexer.record_includes'):
                 with mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.flush') as mock_symbol_db_flush:
                     ret = index_single_file(self.parser, os.path.dirname(self.test_file.name), self.test_file.name, self.test_file.name, symbol_db)
-        mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
-        mock_parser_traverse.assert_called_once_with(mock_parser_parse.return_value.cursor, [self.parser, symbol_db, self.root_directory], indexer_visitor)
+        mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name, False)
+        mock_get_recorded_files.assert_called_once_with(mock_parser_parse.return_value, self.root_directory, None, False)
+        mock_parser_traverse.assert_called_once_with(mock_parser_parse.return_value.cursor, [self.parser, symbol_db, mock_get_recorded_files.return_value, {}], indexer_visitor)
         mock_symbol_db_flush.assert_called_once()
         self.assertEqual(ret, True)
 
+    def test_if_index_single_file_runs_callbacks_indexing_engine_instead_of_traversal_when_asked_for(self):
+        symbol_db = SymbolDatabase('tmp.db')
+        with mock.patch.object(self.parser, 'parse') as mock_parser_parse, \
+            mock.patch.object(self.parser, 'traverse') as mock_parser_traverse, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_recorded_files', return_value={self.test_file.name: 'a.cpp'}) as mock_get_recorded_files, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.index_with_callbacks') as mock_index_with_callbacks, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.record_includes'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.flush'):
+            ret = index_single_file(self.parser, os.path.dirname(self.test_file.name), self.test_file.name, self.test_file.name, symbol_db, None, 'callbacks')
+        mock_index_with_callbacks.assert_called_once_with(self.parser, mock_parser_parse.return_value, symbol_db, mock_get_recorded_files.return_value)
+        mock_parser_traverse.assert_not_called()
+        self.assertEqual(ret, True)
+
+    def test_if_index_single_file_skips_function_bodies_and_records_only_the_declarations_in_declaration_pass(self):
+        symbol_db = SymbolDatabase('tmp.db')
+        with mock.patch.object(self.parser, 'parse') as mock_parser_parse, \
+            mock.patch.object(self.parser, 'traverse') as mock_parser_traverse, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_recorded_files', return_value={self.test_file.name: 'a.cpp'}) as mock_get_recorded_files, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.index_with_callbacks') as mock_index_with_callbacks, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.record_includes'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.flush'):
+            ret = index_single_file(self.parser, os.path.dirname(self.test_file.name), self.test_file.name, self.test_file.name, symbol_db, None, 'callbacks', True)
+        mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name, True)
+        mock_get_recorded_files.assert_called_once_with(mock_parser_parse.return_value, self.root_directory, None, True)
+        mock_parser_traverse.assert_called_once_with(mock_parser_parse.return_value.cursor, [self.parser, symbol_db, mock_get_recorded_files.return_value, {}], declaration_visitor)
+        mock_index_with_callbacks.assert_not_called()
+        self.assertEqual(ret, True)
+
+    def test_if_index_with_callbacks_records_declarations_references_and_calls_from_recorded_files_only(self):
+        tunit = self.parser.parse(self.test_file.name, self.test_file.name)
+        symbol_db = mock.MagicMock(SymbolDatabase)
+        symbol_db.is_usr_known.return_value = False
+        self.assertEqual(index_with_callbacks(self.parser, tunit, symbol_db, {self.test_file.name: 'a.cpp'}), True)
+        symbols = [c[0][0:7] for c in symbol_db.insert_single.call_args_list]
+        self.assertIn(('a.cpp', 3, 5, 'c:@F@foobar#', clang.cindex.CursorKind.FUNCTION_DECL.value, True, 'foobar'), symbols)
+        self.assertIn(('a.cpp', 9, 12, 'c:@F@foobar#', clang.cindex.CursorKind.FUNCTION_DECL.value, False, 'foobar'), symbols)
+        self.assertTrue(any('@S@vector>#I#' in usr for _, _, _, usr, _, _, _ in symbols)) # Specialization rather than the template itself
+        self.assertTrue(all(filename == 'a.cpp' for filename, _, _, _, _, _, _ in symbols))
+        symbol_db.insert_call.assert_any_call('a.cpp', 9, 12, 'c:@F@main#', 'c:@F@foobar#')
+
+    def test_if_record_includes_records_includes_of_project_headers_only(self):
+        def inclusion(source, include, line):
+            inclusion = mock.MagicMock()
+            inclusion.source.name, inclusion.include.name, inclusion.location.line = source, include, line
+            return inclusion
+        tunit = mock.MagicMock()
+        tunit.get_includes.return_value = [
+            inclusion('/project/main.cpp', '/project/include/a.h', 1),
+            inclusion('/project/main.cpp', '/usr/include/stdio.h', 2),
+            inclusion('/project/include/a.h', '/project/src/../include/b.h', 3),
+            inclusion('/project/main.cpp', '/project-other/c.h', 4),
+        ]
+        symbol_db = mock.MagicMock(SymbolDatabase)
+        record_includes(tunit, '/project/', symbol_db)
+        self.assertEqual(
+            symbol_db.insert_include.call_args_list,
+            [mock.call('main.cpp', 'include/a.h', 1), mock.call('include/a.h', 'include/b.h', 3)]
+        )
+
+    def test_if_get_recorded_files_are_the_tunit_and_the_project_headers_it_has_claimed(self):
+        def inclusion(source, include):
+            inclusion = mock.MagicMock()
+            inclusion.source.name, inclusion.include.name = source, include
+            return inclusion
+        tunit = mock.MagicMock()
+        tunit.spelling = '/project/main.cpp'
+        tunit.get_includes.return_value = [
+            inclusion('/project/main.cpp', '/project/include/a.h'),
+            inclusion('/project/main.cpp', '/usr/include/stdio.h'),
+            inclusion('/project/include/a.h', '/project/src/../include/b.h'),
+            inclusion('/project/main.cpp', '/project/include/c.h'),
+        ]
+        headers_db = mock.MagicMock(SymbolDatabase)
+        headers_db.claim_headers.return_value = ['include/b.h', 'include/c.h'] # 'include/a.h' has been claimed by somebody else
+        self.assertEqual(get_recorded_files(tunit, '/project/', headers_db), {
+            '/project/main.cpp': 'main.cpp', '/project/src/../include/b.h': 'include/b.h', '/project/include/c.h': 'include/c.h'
+        })
+        headers_db.claim_headers.assert_called_once_with(['include/a.h', 'include/b.h', 'include/c.h'], False, 'main.cpp')
+
+    def test_if_get_recorded_files_is_the_tunit_only_if_headers_are_not_to_be_claimed(self):
+        tunit = mock.MagicMock()
+        tunit.spelling = '/project/main.cpp'
+        self.assertEqual(get_recorded_files(tunit, '/project/', None), {'/project/main.cpp': 'main.cpp'})
+        tunit.get_includes.assert_not_called()
+
     def test_if_index_single_file_returns_false_and_does_not_continue_traversing_for_invalid_tunit(self):
         symbol_db = SymbolDatabase('tmp.db')
         with mock.patch.object(self.parser, 'parse', return_value=None) as mock_parser_parse:
             with mock.patch.object(self.parser, 'traverse') as mock_parser_traverse:
                 with mock.patch('services.source_code_model.indexer.clang_indexer.SymbolDatabase.flush') as mock_symbol_db_flush:
                     ret = index_single_file(self.parser, os.path.dirname(self.test_file.name), self.test_file.name, self.test_file.name, symbol_db)
-        mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name)
+        mock_parser_parse.assert_called_once_with(self.test_file.name, self.test_file.name, False)
         mock_parser_traverse.assert_not_called()
         mock_symbol_db_flush.assert_not_called()
         self.assertEqual(ret, False)
 
     def test_if_indexer_visitor_inserts_a_single_entry_to_symbol_db_for_ast_node_from_tunit_under_test_and_recurses_further(self):
-        import linecache
         line, column = 10, 15
         location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, line, column))
-        translation_unit_mock = cxxd_mocks.TranslationUnitMock(self.test_file.name)
         ast_node = mock.MagicMock(clang.cindex.Cursor)
         type(ast_node).location = location_mock
-        type(ast_node).translation_unit = translation_unit_mock
         type(ast_node).referenced = None
+        type(ast_node).spelling = 'foobar'
         ast_node._kind_id = clang.cindex.CursorKind.CLASS_DECL
         symbol_db = SymbolDatabase('tmp.db')
-        args = [self.parser, symbol_db, self.root_directory]
+        args = [self.parser, symbol_db, {self.test_file.name: os.path.basename(self.test_file.name)}, {}]
         with mock.patch.object(self.parser, 'get_ast_node_id', return_value=ClangIndexer.supported_ast_node_ids[0]):
             with mock.patch.object(symbol_db, 'insert_single') as mock_symbol_db_insert_single:
                 with mock.patch.object(ast_node, 'get_usr', return_value='#usr#of#some#symbol') as mock_clang_cursor_get_usr:
                     with mock.patch.object(ast_node, 'is_definition', return_value=True) as mock_clang_cursor_is_definition:
-                        with mock.patch('services.source_code_model.indexer.clang_indexer.remove_root_dir_from_filename', return_value=os.path.basename(self.test_file.name)) as mock_remove_root_dir_from_filename:
+                        with mock.patch('services.source_code_model.indexer.clang_indexer.get_qualified_name', return_value='ns::foobar') as mock_get_qualified_name:
                             ret = indexer_visitor(ast_node, None, args)
         self.assertEqual(ret, parser.clang_parser.ChildVisitResult.RECURSE.value)
-        mock_remove_root_dir_from_filename.assert_called_once_with(self.root_directory, translation_unit_mock.spelling)
+        mock_get_qualified_name.assert_called_once_with(ast_node)
         mock_symbol_db_insert_single.assert_called_once_with(
-            mock_remove_root_dir_from_filename.return_value,
+            os.path.basename(self.test_file.name),
             line, column,
             mock_clang_cursor_get_usr.return_value,
-            linecache.getline(self.test_file.name, line),
             ast_node._kind_id,
-            mock_clang_cursor_is_definition.return_value
+            mock_clang_cursor_is_definition.return_value,
+            'foobar',
+            mock_get_qualified_name.return_value
         )
 
+    def test_if_indexer_visitor_does_not_look_up_qualified_name_of_usr_which_is_already_known(self):
+        location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, 10, 15))
+        ast_node = mock.MagicMock(clang.cindex.Cursor)
+        type(ast_node).location = location_mock
+        type(ast_node).referenced = None
+        type(ast_node).spelling = 'foobar'
+        symbol_db = SymbolDatabase('tmp.db')
+        with mock.patch.object(self.parser, 'get_ast_node_id', return_value=ClangIndexer.supported_ast_node_ids[0]), \
+            mock.patch.object(symbol_db, 'insert_single') as mock_symbol_db_insert_single, \
+            mock.patch.object(symbol_db, 'is_usr_known', return_value=True), \
+            mock.patch.object(ast_node, 'get_usr', return_value='#usr#of#some#symbol'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_qualified_name') as mock_get_qualified_name:
+            indexer_visitor(ast_node, None, [self.parser, symbol_db, {self.test_file.name: 'a.cpp'}, {}])
+        mock_get_qualified_name.assert_not_called()
+        self.assertEqual(mock_symbol_db_insert_single.call_args[0][-1], None)
+
+    def test_if_indexer_visitor_records_call_expression_together_with_the_function_it_is_found_in(self):
+        location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, 10, 15))
+        function, call_expr = mock.MagicMock(clang.cindex.Cursor), mock.MagicMock(clang.cindex.Cursor)
+        function.kind, function.hash = clang.cindex.CursorKind.FUNCTION_DECL, 1
+        function.get_usr.return_value = 'c:@F@main#'
+        call_expr.kind, call_expr.hash = clang.cindex.CursorKind.CALL_EXPR, 2
+        type(call_expr).location = location_mock
+        call_expr.referenced.get_usr.return_value = 'c:@F@foobar#'
+        symbol_db = SymbolDatabase('tmp.db')
+        with mock.patch.object(self.parser, 'get_ast_node_id', return_value=ClangIndexer.supported_ast_node_ids[0]), \
+            mock.patch.object(symbol_db, 'insert_single'), \
+            mock.patch.object(symbol_db, 'insert_call') as mock_symbol_db_insert_call, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_qualified_name'):
+            indexer_visitor(call_expr, function, [self.parser, symbol_db, {self.test_file.name: 'a.cpp'}, {function.hash: 'c:@F@main#'}])
+        mock_symbol_db_insert_call.assert_called_once_with('a.cpp', 10, 15, 'c:@F@main#', 'c:@F@foobar#')
+
+    def test_if_indexer_visitor_does_not_record_call_expression_outside_of_function(self):
+        location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, 10, 15))
+        tunit, call_expr = mock.MagicMock(clang.cindex.Cursor), mock.MagicMock(clang.cindex.Cursor)
+        tunit.kind, tunit.hash = clang.cindex.CursorKind.TRANSLATION_UNIT, 1
+        call_expr.kind, call_expr.hash = clang.cindex.CursorKind.CALL_EXPR, 2
+        type(call_expr).location = location_mock
+        symbol_db = SymbolDatabase('tmp.db')
+        with mock.patch.object(self.parser, 'get_ast_node_id', return_value=ClangIndexer.supported_ast_node_ids[0]), \
+            mock.patch.object(symbol_db, 'insert_single'), \
+            mock.patch.object(symbol_db, 'insert_call') as mock_symbol_db_insert_call, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_qualified_name'):
+            indexer_visitor(call_expr, tunit, [self.parser, symbol_db, {self.test_file.name: 'a.cpp'}, {}])
+        mock_symbol_db_insert_call.assert_not_called()
+
+    def test_if_indexer_visitor_records_base_specifier_together_with_the_class_deriving_from_it(self):
+        location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, 10, 15))
+        derived, base_specifier = mock.MagicMock(clang.cindex.Cursor), mock.MagicMock(clang.cindex.Cursor)
+        derived.kind, derived.hash = clang.cindex.CursorKind.CLASS_DECL, 1
+        derived.get_usr.return_value = 'c:@S@Bar'
+        base_specifier.kind, base_specifier.hash = clang.cindex.CursorKind.CXX_BASE_SPECIFIER, 2
+        base_specifier.access_specifier = clang.cindex.AccessSpecifier.PROTECTED
+        type(base_specifier).location = location_mock
+        base_specifier.referenced.get_usr.return_value = 'c:@S@Foo'
+        symbol_db = SymbolDatabase('tmp.db')
+        with mock.patch.object(self.parser, 'get_ast_node_id', return_value=ClangIndexer.supported_ast_node_ids[0]), \
+            mock.patch.object(symbol_db, 'insert_single'), \
+            mock.patch.object(symbol_db, 'insert_base') as mock_symbol_db_insert_base, \
+            mock.patch('services.source_code_model.indexer.clang_indexer.get_qualified_name'), \
+            mock.patch('services.source_code_model.indexer.clang_indexer.is_virtual_base', return_value=True):
+            indexer_visitor(base_specifier, derived, [self.parser, symbol_db, {self.test_file.name: 'a.h'}, {}])
+        mock_symbol_db_insert_base.assert_called_once_with('a.h', 10, 15, 'c:@S@Bar', 'c:@S@Foo', clang.cindex.AccessSpecifier.PROTECTED.value, True)
+
+    def test_if_declaration_visitor_records_declarations_and_recurses_past_the_references(self):
+        declaration, reference = mock.MagicMock(clang.cindex.Cursor), mock.MagicMock(clang.cindex.Cursor)
+        declaration.kind, reference.kind = clang.cindex.CursorKind.FUNCTION_DECL, clang.cindex.CursorKind.DECL_REF_EXPR
+        args = [self.parser, SymbolDatabase('tmp.db'), {self.test_file.name: 'a.cpp'}, {}]
+        with mock.patch('services.source_code_model.indexer.clang_indexer.indexer_visitor') as mock_indexer_visitor:
+            self.assertEqual(declaration_visitor(declaration, None, args), mock_indexer_visitor.return_value)
+            self.assertEqual(declaration_visitor(reference, declaration, args), parser.clang_parser.ChildVisitResult.RECURSE.value)
+        mock_indexer_visitor.assert_called_once_with(declaration, None, args)
+
+    def test_if_track_enclosing_function_passes_function_down_to_the_descendants(self):
+        enclosing_functions = {}
+        tunit = self.cursor(clang.cindex.CursorKind.TRANSLATION_UNIT, 'a.cpp', None)
+        function = self.cursor(clang.cindex.CursorKind.CXX_METHOD, 'bar', tunit)
+        function.get_usr.return_value = 'c:@S@Foo@F@bar#'
+        compound_stmt = self.cursor(clang.cindex.CursorKind.COMPOUND_STMT, '', None)
+        call_expr = self.cursor(clang.cindex.CursorKind.CALL_EXPR, 'foobar', None)
+        tunit.hash, function.hash, compound_stmt.hash, call_expr.hash = 1, 2, 3, 4
+        self.assertEqual(track_enclosing_function(function, tunit, enclosing_functions), 'c:@S@Foo@F@bar#')
+        self.assertEqual(track_enclosing_function(compound_stmt, function, enclosing_functions), 'c:@S@Foo@F@bar#')
+        self.assertEqual(track_enclosing_function(call_expr, compound_stmt, enclosing_functions), 'c:@S@Foo@F@bar#')
+        self.assertEqual(track_enclosing_function(self.cursor(clang.cindex.CursorKind.VAR_DECL, 'x', None), tunit, enclosing_functions), None)
+
+    def cursor(self, kind, spelling, semantic_parent):
+        cursor = mock.MagicMock(clang.cindex.Cursor)
+        cursor.kind, cursor.spelling, cursor.semantic_parent = kind, spelling, semantic_parent
+        return cursor
+
+    def test_if_get_qualified_name_joins_the_names_of_enclosing_scopes(self):
+        tunit = self.cursor(clang.cindex.CursorKind.TRANSLATION_UNIT, 'a.cpp', None)
+        ns = self.cursor(clang.cindex.CursorKind.NAMESPACE, 'ns', tunit)
+        anonymous_ns = self.cursor(clang.cindex.CursorKind.NAMESPACE, '', ns)
+        cls = self.cursor(clang.cindex.CursorKind.CLASS_DECL, 'Foo', anonymous_ns)
+        self.assertEqual(get_qualified_name(self.cursor(clang.cindex.CursorKind.CXX_METHOD, 'bar', cls)), 'ns::(anonymous)::Foo::bar')
+        self.assertEqual(get_qualified_name(self.cursor(clang.cindex.CursorKind.FUNCTION_DECL, 'main', tunit)), 'main')
+
+    def test_if_get_qualified_name_returns_none_for_symbols_local_to_function(self):
+        tunit = self.cursor(clang.cindex.CursorKind.TRANSLATION_UNIT, 'a.cpp', None)
+        function = self.cursor(clang.cindex.CursorKind.FUNCTION_DECL, 'main', tunit)
+        self.assertEqual(get_qualified_name(self.cursor(clang.cindex.CursorKind.VAR_DECL, 'counter', function)), None)
+        self.assertEqual(get_qualified_name(self.cursor(clang.cindex.CursorKind.PARM_DECL, 'argc', function)), None)
+        self.assertEqual(get_qualified_name(self.cursor(clang.cindex.CursorKind.TEMPLATE_TYPE_PARAMETER, 'T', tunit)), None)
+
     def test_if_indexer_visitor_does_not_insert_an_entry_to_symbol_db_for_unsupported_ast_node_and_recurses_further(self):
         line, column = 10, 15
         location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, line, column))
-        translation_unit_mock = cxxd_mocks.TranslationUnitMock(self.test_file.name)
         ast_node = mock.MagicMock(clang.cindex.Cursor)
         type(ast_node).location = location_mock
-        type(ast_node).translation_unit = translation_unit_mock
         symbol_db = SymbolDatabase('tmp.db')
-        args = [self.parser, symbol_db, self.root_directory]
+        args = [self.parser, symbol_db, {self.test_file.name: 'a.cpp'}, {}]
         with mock.patch.object(self.parser, 'get_ast_node_id', return_value=self.unsupported_ast_node_ids[0]) as mock_get_ast_node_id:
             with mock.patch.object(symbol_db, 'insert_single') as mock_symbol_db_insert_single:
                 ret = indexer_visitor(ast_node, None, args)
@@ -448,15 +1229,13 @@ class ClangIndexerTest(unittest.TestCase):
         mock_get_ast_node_id.assert_called_once()
         mock_symbol_db_insert_single.assert_not_called()
 
-    def test_if_indexer_visitor_does_not_insert_an_entry_to_symbol_db_for_ast_node_from_another_tunit_and_does_not_recurse_further(self):
+    def test_if_indexer_visitor_does_not_insert_an_entry_to_symbol_db_for_ast_node_from_file_which_is_not_recorded_and_does_not_recurse_further(self):
         line, column = 10, 15
         location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, line, column))
-        translation_unit_mock = cxxd_mocks.TranslationUnitMock('some_other_tunit')
         ast_node = mock.MagicMock(clang.cindex.Cursor)
         type(ast_node).location = location_mock
-        type(ast_node).translation_unit = translation_unit_mock
         symbol_db = SymbolDatabase('tmp.db')
-        args = [self.parser, symbol_db, self.root_directory]
+        args = [self.parser, symbol_db, {'some_other_tunit': 'some_other_tunit'}, {}]
         with mock.patch.object(symbol_db, 'insert_single') as mock_symbol_db_insert_single:
             ret = indexer_visitor(ast_node, None, args)
         self.assertEqual(ret, parser.clang_parser.ChildVisitResult.CONTINUE.value)
@@ -469,49 +1248,37 @@ class ClangIndexerTest(unittest.TestCase):
         self.assertTrue(os.path.exists(get_clang_index_path()))
 
     def test_if_get_cpp_file_list_returns_cpp_files_only(self):
-        os_walk_dir_list = (self.root_directory)
-        os_walk_file_list = ('/tmp/a.cpp', '/tmp/b.cc', '/tmp/c.cxx', '/tmp/d.c', '/tmp/e.h', '/tmp/f.hh', '/tmp/g.hpp')
-        with mock.patch('os.walk', return_value=[(self.root_directory, os_walk_dir_list, os_walk_file_list),]) as mock_os_walk:
+        directory_list = ['a.cpp', 'b.cc', 'c.cxx', 'd.c', 'e.h', 'f.hh', 'g.hpp']
+        with mock.patch('os.listdir', return_value=directory_list) as mock_os_listdir, \
+            mock.patch('os.path.isdir', return_value=False):
             cpp_list = get_cpp_file_list(self.root_directory)
-        mock_os_walk.assert_called_once_with(self.root_directory)
-        self.assertEqual(len(os_walk_file_list), len(cpp_list))
+        mock_os_listdir.assert_called_once_with(self.root_directory)
+        self.assertEqual(cpp_list, [os.path.join(self.root_directory, filename) for filename in directory_list])
 
     def test_if_get_cpp_file_list_does_not_include_non_cpp_files(self):
-        os_walk_dir_list = (self.root_directory)
-        os_walk_file_list = ('/tmp/a.md', '/tmp/b.txt', '/tmp/c.json')
-        with mock.patch('os.walk', return_value=[(self.root_directory, os_walk_dir_list, os_walk_file_list),]) as mock_os_walk:
+        with mock.patch('os.listdir', return_value=['a.md', 'b.txt', 'c.json']) as mock_os_listdir, \
+            mock.patch('os.path.isdir', return_value=False):
             cpp_list = get_cpp_file_list(self.root_directory)
-        mock_os_walk.assert_called_once_with(self.root_directory)
+        mock_os_listdir.assert_called_once_with(self.root_directory)
         self.assertEqual(0, len(cpp_list))
 
+    def test_if_get_compilation_database_file_list_returns_existing_sources_and_headers_from_project_directory_only_once(self):
+        existing = ['/tmp/main.cpp', '/tmp/lib/a.h', '/tmp/build/gen.cpp', '/usr/include/x.h']
+        with mock.patch('os.path.isfile', side_effect=lambda filename: filename in existing):
+            cpp_file_list = get_compilation_database_file_list(
+                '/tmp/', ['/tmp/main.cpp', '/tmp/main.cpp', '/tmp/removed.cpp', '/usr/lib/x.cpp', '/tmp/build/gen.cpp'], ['lib/a.h', 'lib/a.inc'], IgnoreRules(['/build/'])
+            )
+        self.assertEqual(cpp_file_list, ['/tmp/main.cpp', '/tmp/lib/a.h'])
+
+    def test_if_is_header_tells_headers_from_source_files(self):
+        self.assertEqual([is_header(f) for f in ['a.h', 'lib/b.hh', 'c.hpp', 'd.cpp', 'e.cc', 'f.c']], [True, True, True, False, False, False])
+
     def test_if_get_cpp_file_list_returns_empty_list_for_no_files_found(self):
-        os_walk_dir_list = (self.root_directory)
-        os_walk_file_list = ()
-        with mock.patch('os.walk', return_value=[(self.root_directory, os_walk_dir_list, os_walk_file_list),]) as mock_os_walk:
+        with mock.patch('os.listdir', return_value=[]) as mock_os_listdir:
             cpp_list = get_cpp_file_list(self.root_directory)
-        mock_os_walk.assert_called_once_with(self.root_directory)
+        mock_os_listdir.assert_called_once_with(self.root_directory)
         self.assertEqual(0, len(cpp_list))
 
-    def test_if_create_indexer_input_list_file_creates_a_file_containing_newline_separated_list_of_files_with_given_prefix_in_given_directory(self):
-        input_list_prefix = 'input_list_0'
-        cpp_file_list = ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp', '/tmp/f.cpp', '/tmp/g.cpp']
-        cpp_files_newline_separated = '/tmp/a.cpp\n/tmp/b.cpp\n/tmp/c.cpp\n/tmp/d.cpp\n/tmp/e.cpp\n/tmp/f.cpp\n/tmp/g.cpp'
-        with mock.patch('tempfile.mkstemp', return_value=(None, None)) as mock_mkstemp:
-            with mock.patch('os.write') as mock_os_write:
-                create_indexer_input_list_file(self.root_directory, input_list_prefix, cpp_file_list)
-        mock_mkstemp.assert_called_once_with(prefix=input_list_prefix, dir=self.root_directory)
-        mock_os_write.assert_called_once_with(mock.ANY, cpp_files_newline_separated)
-
-    def test_if_create_indexer_input_list_file_creates_a_file_containing_newline_separated_list_of_files_with_given_prefix_in_given_directory_and_can_handle_none_items_in_the_list(self):
-        input_list_prefix = 'input_list_0'
-        cpp_file_list = ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp', '/tmp/f.cpp', '/tmp/g.cpp', None]
-        cpp_files_newline_separated = '/tmp/a.cpp\n/tmp/b.cpp\n/tmp/c.cpp\n/tmp/d.cpp\n/tmp/e.cpp\n/tmp/f.cpp\n/tmp/g.cpp'
-        with mock.patch('tempfile.mkstemp', return_value=(None, None)) as mock_mkstemp:
-            with mock.patch('os.write') as mock_os_write:
-                create_indexer_input_list_file(self.root_directory, input_list_prefix, cpp_file_list)
-        mock_mkstemp.assert_called_once_with(prefix=input_list_prefix, dir=self.root_directory)
-        mock_os_write.assert_called_once_with(mock.ANY, cpp_files_newline_separated)
-
     def test_if_create_empty_symbol_db_creates_an_empty_file_with_given_prefix_in_given_directory(self):
         symbol_db_prefix = 'tmp_symbol_db'
         with mock.patch('tempfile.mkstemp', return_value=(None, None)) as mock_mkstemp:
@@ -519,20 +1286,68 @@ class ClangIndexerTest(unittest.TestCase):
         mock_mkstemp.assert_called_once_with(prefix=symbol_db_prefix, dir=self.root_directory)
 
     def test_if_start_indexing_subprocess_invokes_correctly_clang_index_script(self):
-        indexer_input_filename = 'input0'
         output_db_filename = 'output0.db'
         log_filename = 'log.txt'
         expected_cmd = 'python2 ' + \
             get_clang_index_path() + \
             ' --project_root_directory=\'' + self.root_directory + \
             '\' --compiler_args_filename=\'' + self.txt_compilation_database.name + \
-            '\' --input_list=\'' + indexer_input_filename + \
             '\' --output_db_filename=\'' + output_db_filename + \
-            '\' --log_file=\'' + log_filename + '\''
+            '\' --log_file=\'' + log_filename + '\' --engine=visitor'
         with mock.patch('shlex.split') as mock_shlex_split:
             with mock.patch('subprocess.Popen') as mock_subprocess_popen:
-                start_indexing_subprocess(self.root_directory, self.txt_compilation_database.name, indexer_input_filename, output_db_filename, log_filename)
+                start_indexing_subprocess(self.root_directory, self.txt_compilation_database.name, output_db_filename, log_filename)
         mock_shlex_split.assert_called_once_with(expected_cmd)
-        mock_subprocess_popen.assert_called_once()
+        mock_subprocess_popen.assert_called_once_with(mock_shlex_split.return_value, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def test_if_start_indexing_subprocess_runs_clang_index_script_with_the_resource_limits(self):
+        with mock.patch('shlex.split', return_value=['python2', 'clang_index.py']), \
+            mock.patch('distutils.spawn.find_executable', return_value='/usr/bin/tool'), \
+            mock.patch('subprocess.Popen') as mock_subprocess_popen:
+            start_indexing_subprocess(self.root_directory, self.txt_compilation_database.name, 'output0.db', 'log.txt', nice=10, ionice=(2, 7), cpu_affinity=[0, 2])
+        mock_subprocess_popen.assert_called_once_with(
+            ['nice', '-n', '10', 'ionice', '-c', '2', '-n', '7', 'taskset', '-c', '0,2', 'python2', 'clang_index.py'], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+    def test_if_get_resource_limits_cmd_skips_the_limits_which_cannot_be_applied(self):
+        with mock.patch('distutils.spawn.find_executable', side_effect=lambda tool: None if tool == 'ionice' else '/usr/bin/' + tool):
+            self.assertEqual(get_resource_limits_cmd(5, (3, None), None), ['nice', '-n', '5'])
+            self.assertEqual(get_resource_limits_cmd(0, None, None), [])
+
+    def test_if_get_rss_falls_back_to_the_peak_rss_when_proc_is_not_available(self):
+        with mock.patch('__builtin__.open', side_effect=IOError()), \
+            mock.patch('resource.getrusage') as mock_getrusage, \
+            mock.patch('sys.platform', 'linux2'):
+            mock_getrusage.return_value.ru_maxrss = 2048
+            self.assertEqual(get_rss(), 2048 * 1024)
+
+    def test_if_get_file_state_reports_file_never_indexed_before_as_not_up_to_date(self):
+        file_state, up_to_date = get_file_state(self.test_file.name, 'compiler_args_hash')
+        self.assertEqual(up_to_date, False)
+        self.assertEqual(file_state[1], os.path.getsize(self.test_file.name))
+
+    def test_if_get_file_state_reports_unmodified_file_as_up_to_date_without_reading_it(self):
+        file_state, up_to_date = get_file_state(self.test_file.name, 'compiler_args_hash')
+        with mock.patch('services.source_code_model.indexer.clang_indexer.get_content_hash') as mock_get_content_hash:
+            self.assertEqual(get_file_state(self.test_file.name, 'compiler_args_hash', file_state), (file_state, True))
+        mock_get_content_hash.assert_not_called()
+
+    def test_if_get_file_state_reports_touched_but_not_changed_file_as_up_to_date_with_new_mtime(self):
+        mtime, size, content_hash, compiler_args_hash = get_file_state(self.test_file.name, 'compiler_args_hash')[0]
+        file_state, up_to_date = get_file_state(self.test_file.name, 'compiler_args_hash', (mtime - 10, size, content_hash, compiler_args_hash))
+        self.assertEqual(up_to_date, True)
+        self.assertEqual(file_state, (mtime, size, content_hash, compiler_args_hash))
+
+    def test_if_get_file_state_reports_file_with_changed_contents_as_not_up_to_date(self):
+        mtime, size, content_hash, compiler_args_hash = get_file_state(self.test_file.name, 'compiler_args_hash')[0]
+        self.assertEqual(get_file_state(self.test_file.name, 'compiler_args_hash', (mtime - 10, size, 'other_content_hash', compiler_args_hash))[1], False)
+
+    def test_if_get_file_state_reports_file_with_changed_compiler_args_as_not_up_to_date(self):
+        file_state, up_to_date = get_file_state(self.test_file.name, 'compiler_args_hash')
+        self.assertEqual(get_file_state(self.test_file.name, 'other_compiler_args_hash', file_state)[1], False)
+
+    def test_if_get_file_state_does_not_compare_compiler_args_of_files_which_come_with_none(self):
+        file_state, up_to_date = get_file_state(self.test_file.name, 'compiler_args_hash')
+        self.assertEqual(get_file_state(self.test_file.name, '', file_state), (file_state, True))
 
 # TODO fuzz the ClangIndexer interface ...
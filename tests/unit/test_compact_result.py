@@ -0,0 +1,59 @@
+import cPickle
+import json
+import mmap
+import tempfile
+import unittest
+
+import compact_result
+from compact_result import CompactResult
+
+class CompactResultTest(unittest.TestCase):
+    def setUp(self):
+        self.result = CompactResult(2, 3)
+        self.result.append(0, self.result.intern('foo'), 10)
+        self.result.append(0, self.result.intern('bar'), 20)
+        self.result.append(1, 1, 2, self.result.intern('foo'))
+
+    def test_if_equal_strings_are_interned_only_once(self):
+        self.assertEqual(self.result.intern('foo'), 0)
+        self.assertEqual(self.result.strings, ['foo', 'bar'])
+
+    def test_if_rows_are_returned_as_they_were_appended(self):
+        self.assertEqual(self.result.row_count(0), 2)
+        self.assertEqual(list(self.result.rows(0)), [(0, 10), (1, 20)])
+        self.assertEqual(list(self.result.rows(1)), [(1, 2, 0)])
+        self.assertEqual(self.result.string(self.result.row(0, 1)[0]), 'bar')
+
+    def test_if_deserialize_returns_what_has_been_serialized(self):
+        self.assertEqual(compact_result.deserialize(self.result.serialize()), self.result)
+
+    def test_if_non_ascii_strings_survive_serialization(self):
+        result = CompactResult(1)
+        result.append(0, result.intern(u'\u010d'))
+        self.assertEqual(compact_result.deserialize(result.serialize()).string(0).decode('utf8'), u'\u010d')
+
+    def test_if_result_can_be_deserialized_directly_from_mmap_ed_buffer(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self.result.serialize())
+            f.flush()
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.assertEqual(compact_result.deserialize(buf), self.result)
+            buf.close()
+
+    def test_if_pickled_result_is_unpickled_into_an_equal_one(self):
+        self.assertEqual(cPickle.loads(cPickle.dumps(self.result, cPickle.HIGHEST_PROTOCOL)), self.result)
+
+    def test_if_pickled_result_is_smaller_than_the_equivalent_list_of_tuples(self):
+        result, rows = CompactResult(4), []
+        for i in range(1000):
+            result.append(0, result.intern('/tmp/some/file.cpp'), i, i % 80, result.intern('context'))
+            rows.append(('/tmp/some/file.cpp', i, i % 80, 'context'))
+        self.assertTrue(len(cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)) < len(cPickle.dumps(rows, cPickle.HIGHEST_PROTOCOL)))
+
+    def test_if_result_survives_json_round_trip(self):
+        d = json.loads(json.dumps(self.result, default=compact_result.json_default))
+        self.assertTrue(compact_result.is_compact_result_dict(d))
+        self.assertEqual(CompactResult.from_dict(d), self.result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -56,5 +56,18 @@ class SourceCodeModelDiagnosticsTest(unittest.TestCase):
         self.assertEqual(success, False)
         self.assertEqual(diagnostics_iter, None)
 
+    def test_if_serialize_result_converts_diagnostics_into_compact_result(self):
+        from services.source_code_model.diagnostics.diagnostics import DiagnosticsTable
+        success, args = self.service([self.test_file_with_compile_errors.name, self.test_file_with_compile_errors.name])
+        result = self.service.serialize_result([self.test_file_with_compile_errors.name, self.test_file_with_compile_errors.name], args)
+        self.assertEqual(result.row_count(DiagnosticsTable.DIAGNOSTICS), len(args[0]))
+        line, column, spelling, severity, category_number, category_name, first_fixit, number_of_fixits = result.row(DiagnosticsTable.DIAGNOSTICS, 0)
+        self.assertEqual(result.string(spelling), args[0][0].spelling)
+        self.assertEqual(number_of_fixits, len(list(args[0][0].fixits)))
+
+    def test_if_serialize_result_returns_none_for_inexisting_source_code(self):
+        success, args = self.service(['inexisting_source_code_filename', 'inexisting_source_code_filename'])
+        self.assertEqual(self.service.serialize_result(['inexisting_source_code_filename', 'inexisting_source_code_filename'], args), None)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,379 @@
+import json
+import mock
+import os
+import unittest
+
+from services.source_code_model.indexer.indexing_worker import IndexingWorker
+from services.source_code_model.indexer.indexing_worker import IndexingWorkerPool
+from services.source_code_model.indexer.indexing_worker import Throttle
+from services.source_code_model.indexer.indexing_worker import index_files
+
+class FakeProcess():
+    # Stands in for the clang_index.py worker: whatever is sent to it is available from 'sent' and its reports
+    # are written with 'report()'.
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+        self.sent = []
+        self.stdin = mock.MagicMock()
+        self.stdin.write.side_effect = lambda data: self.sent.append(json.loads(data))
+        self.reader, self.writer = os.pipe()
+        self.stdout = os.fdopen(self.reader, 'r')
+
+    def poll(self):
+        return self.returncode
+
+    def report(self, filename, success=True, elapsed=0.1, rss=1024):
+        os.write(self.writer, json.dumps([filename, success, elapsed, rss]) + '\n')
+
+    def close(self):
+        if self.writer is not None:
+            os.close(self.writer)
+            self.writer = None
+        self.stdout.close()
+
+class IndexingWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.process = FakeProcess(1)
+        self.worker = IndexingWorker(self.process, 'out.db')
+
+    def tearDown(self):
+        self.process.close()
+
+    def test_if_send_writes_json_encoded_filename_and_marks_it_as_in_flight(self):
+        self.worker.send('/tmp/a.cpp')
+        self.assertEqual(self.process.sent, ['/tmp/a.cpp'])
+        self.assertEqual(self.worker.in_flight, '/tmp/a.cpp')
+
+    def test_if_send_tells_the_worker_to_record_only_the_declarations_when_asked_for(self):
+        self.worker.send('/tmp/a.cpp', True)
+        self.assertEqual(self.process.sent, [['/tmp/a.cpp', True]])
+        self.assertEqual(self.worker.in_flight, '/tmp/a.cpp')
+
+    def test_if_receive_returns_report_and_accounts_for_busy_time(self):
+        self.worker.send('/tmp/a.cpp')
+        self.process.report('/tmp/a.cpp', True, 0.5)
+        self.assertEqual(self.worker.receive(), [('/tmp/a.cpp', True, 0.5,)])
+        self.assertEqual(self.worker.in_flight, None)
+        self.assertEqual(self.worker.files_indexed, 1)
+        self.assertEqual(self.worker.busy_time, 0.5)
+
+    def test_if_receive_keeps_track_of_files_recorded_into_the_output_db(self):
+        self.process.report('/tmp/a.cpp', True)
+        self.process.report('/tmp/b.cpp', False)
+        self.worker.receive()
+        self.assertEqual(self.worker.recorded, ['/tmp/a.cpp'])
+
+    def test_if_receive_keeps_track_of_current_and_peak_rss(self):
+        for rss in [300, 500, 400]:
+            self.process.report('/tmp/a.cpp', True, 0.1, rss)
+            self.worker.receive()
+        self.assertEqual((self.worker.rss, self.worker.peak_rss), (400, 500))
+
+    def test_if_receive_keeps_partial_report_until_the_rest_of_it_arrives(self):
+        os.write(self.process.writer, '["/tmp/a.cpp", tr')
+        self.assertEqual(self.worker.receive(), [])
+        os.write(self.process.writer, 'ue, 0.5, 1024]\n')
+        self.assertEqual(self.worker.receive(), [('/tmp/a.cpp', True, 0.5,)])
+
+    def test_if_receive_returns_none_when_worker_has_gone_away(self):
+        os.close(self.process.writer)
+        self.process.writer = None
+        self.assertEqual(self.worker.receive(), None)
+        self.assertEqual(self.worker.alive, False)
+
+class IndexFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.processes = [FakeProcess(1), FakeProcess(2)]
+        self.workers = [IndexingWorker(process, 'out.db') for process in self.processes]
+
+    def tearDown(self):
+        for process in self.processes:
+            process.close()
+
+    def auto_report(self, process, elapsed):
+        # Worker reports back as soon as it gets the file
+        def send(data):
+            process.sent.append(json.loads(data))
+            process.report(process.sent[-1], True, elapsed(process.sent[-1]))
+        process.stdin.write.side_effect = send
+
+    def test_if_files_are_handed_out_one_at_a_time_in_given_order(self):
+        for process in self.processes:
+            self.auto_report(process, lambda filename: 0.1)
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging'):
+            reports = index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp'])
+        self.assertEqual(sorted(report[0] for report in reports), ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp'])
+        self.assertEqual(self.processes[0].sent[0], '/tmp/a.cpp')
+        self.assertEqual(self.processes[1].sent[0], '/tmp/b.cpp')
+        self.assertEqual(len(self.processes[0].sent) + len(self.processes[1].sent), 5)
+
+    def test_if_idle_worker_gets_the_next_file_while_the_other_one_is_still_busy(self):
+        # First worker reports back only once the second one has indexed all the remaining files
+        self.auto_report(self.processes[1], lambda filename: 0.1)
+        original_receive = self.workers[1].receive
+        def receive():
+            reports = original_receive()
+            if len(self.processes[1].sent) == 3 and self.workers[0].in_flight is not None:
+                self.processes[0].report(self.processes[0].sent[-1], True, 5.0)
+            return reports
+        self.workers[1].receive = receive
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging'):
+            reports = index_files(self.workers, ['/tmp/big.cpp', '/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.assertEqual(self.processes[0].sent, ['/tmp/big.cpp'])
+        self.assertEqual(self.processes[1].sent, ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.assertEqual(len(reports), 4)
+
+    def test_if_worker_which_has_died_is_reported_and_the_rest_of_the_files_is_indexed_by_others(self):
+        self.auto_report(self.processes[1], lambda filename: 0.1)
+        self.processes[0].stdin.write.side_effect = lambda data: (self.processes[0].sent.append(json.loads(data)), os.close(self.processes[0].writer))
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging') as mock_logging:
+            reports = index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.processes[0].writer = None
+        mock_logging.error.assert_called_once()
+        self.assertTrue('/tmp/a.cpp' in mock_logging.error.call_args[0][0])
+        self.assertEqual(sorted((report[0], report[1]) for report in reports), [('/tmp/a.cpp', False), ('/tmp/b.cpp', True), ('/tmp/c.cpp', True)])
+
+    def test_if_file_in_flight_is_retried_by_the_fresh_worker_once_the_worker_has_died(self):
+        fresh_process = FakeProcess(3)
+        self.auto_report(fresh_process, lambda filename: 0.1)
+        fresh_worker = IndexingWorker(fresh_process, 'out.db')
+        self.auto_report(self.processes[1], lambda filename: 0.1)
+        self.processes[0].stdin.write.side_effect = lambda data: (self.processes[0].sent.append(json.loads(data)), os.close(self.processes[0].writer))
+        recycle = mock.MagicMock(side_effect=lambda worker: worker if worker.alive else fresh_worker)
+        try:
+            with mock.patch('services.source_code_model.indexer.indexing_worker.logging'):
+                reports = index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'], False, None, recycle)
+        finally:
+            self.processes[0].writer = None
+            fresh_process.close()
+        self.assertEqual(sorted(report[0] for report in reports), ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.assertEqual(fresh_process.sent[0], '/tmp/a.cpp')
+
+    def test_if_worker_is_recycled_once_it_is_done_with_the_file(self):
+        for process in self.processes:
+            self.auto_report(process, lambda filename: 0.1)
+        recycle = mock.MagicMock(side_effect=lambda worker: worker)
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging') as mock_logging:
+            index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'], False, None, recycle)
+        self.assertEqual(recycle.call_count, 3)
+        self.assertTrue('peak RSS' in ' '.join(c[0][0] for c in mock_logging.info.call_args_list))
+
+    def test_if_utilization_and_tail_latency_are_logged(self):
+        for process in self.processes:
+            self.auto_report(process, lambda filename: 0.1)
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging') as mock_logging:
+            index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp'])
+        messages = ' '.join(c[0][0] for c in mock_logging.info.call_args_list)
+        self.assertTrue('utilization' in messages)
+        self.assertTrue('p50' in messages and 'p90' in messages and 'max' in messages)
+
+    def test_if_engaged_throttle_holds_back_the_rest_of_the_files_and_files_in_flight_are_still_waited_for(self):
+        for process in self.processes:
+            self.auto_report(process, lambda filename: 0.1)
+        throttle = Throttle(lambda: len(self.processes[0].sent) + len(self.processes[1].sent) >= 3)
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging'):
+            reports = index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp'], False, throttle)
+        self.assertEqual(sorted(report[0] for report in reports), ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.assertEqual(throttle.held_back, ['/tmp/d.cpp', '/tmp/e.cpp'])
+
+    def test_if_throughput_is_logged(self):
+        for process in self.processes:
+            self.auto_report(process, lambda filename: 0.1)
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging') as mock_logging:
+            index_files(self.workers, ['/tmp/a.cpp', '/tmp/b.cpp'])
+        self.assertTrue('files/s' in mock_logging.info.call_args_list[0][0][0])
+
+    def test_if_nothing_is_sent_when_there_are_no_files_to_be_indexed(self):
+        self.assertEqual(index_files(self.workers, []), [])
+        self.assertEqual(self.processes[0].sent, [])
+        self.assertEqual(self.processes[1].sent, [])
+
+class IndexingWorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.processes = []
+        self.pool = IndexingWorkerPool(2, self.start_worker)
+
+    def tearDown(self):
+        for process in self.processes:
+            process.close()
+
+    def start_worker(self, worker_id, output_db_filename=None):
+        self.processes.append(FakeProcess(len(self.processes) + 1))
+        worker = IndexingWorker(self.processes[-1], output_db_filename or 'worker_' + str(worker_id) + '.db')
+        worker.close = mock.MagicMock()
+        return worker
+
+    def test_if_workers_are_started_on_first_use_and_only_as_many_as_needed(self):
+        self.assertEqual(self.processes, [])
+        workers = self.pool.get_workers(1)
+        self.assertEqual(len(workers), 1)
+        self.assertEqual(len(self.processes), 1)
+
+    def test_if_workers_are_reused_across_the_requests(self):
+        workers = self.pool.get_workers(2)
+        self.assertEqual(self.pool.get_workers(2), workers)
+        self.assertEqual(len(self.processes), 2)
+
+    def test_if_no_more_workers_than_pool_size_are_started(self):
+        self.assertEqual(len(self.pool.get_workers(5)), 2)
+
+    def test_if_worker_which_has_exited_is_replaced_with_a_new_one(self):
+        workers = self.pool.get_workers(2)
+        self.processes[0].returncode = -9
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging'), \
+            mock.patch('os.remove') as mock_os_remove:
+            new_workers = self.pool.get_workers(2)
+        mock_os_remove.assert_not_called() # Results which are yet to be merged are kept
+        self.assertEqual(new_workers[0].output_db_filename, 'worker_0.db')
+        self.assertNotEqual(new_workers[0], workers[0])
+        self.assertEqual(new_workers[1], workers[1])
+        self.assertEqual(len(self.processes), 3)
+
+    def test_if_index_feeds_the_files_to_the_workers(self):
+        with mock.patch('services.source_code_model.indexer.indexing_worker.index_files', return_value=[]) as mock_index_files:
+            self.pool.index(['/tmp/a.cpp'])
+        mock_index_files.assert_called_once_with(self.pool.workers[0:1], ['/tmp/a.cpp'], False, None, self.pool.recycle)
+
+    def test_if_output_db_filenames_are_returned_only_for_started_workers(self):
+        self.pool.get_workers(1)
+        self.assertEqual(self.pool.output_db_filenames(), ['worker_0.db'])
+
+    def test_if_clear_empties_symbol_dbs_of_started_workers(self):
+        self.pool.get_workers(1)
+        with mock.patch('services.source_code_model.indexer.indexing_worker.SymbolDatabase') as mock_symbol_db:
+            self.pool.clear()
+        mock_symbol_db.assert_called_once_with('worker_0.db')
+        mock_symbol_db.return_value.delete_all_symbols.assert_called_once()
+        mock_symbol_db.return_value.flush.assert_called_once()
+
+    def test_if_clear_leaves_symbol_db_without_data_model_alone_and_forgets_the_recorded_files(self):
+        self.pool.get_workers(1)[0].recorded = ['/tmp/a.cpp']
+        with mock.patch('services.source_code_model.indexer.indexing_worker.SymbolDatabase') as mock_symbol_db:
+            mock_symbol_db.return_value.has_data_model.return_value = False
+            self.pool.clear()
+        mock_symbol_db.return_value.delete_all_symbols.assert_not_called()
+        mock_symbol_db.return_value.close.assert_called_once()
+        self.assertEqual(self.pool.workers[0].recorded, [])
+
+    def test_if_files_recorded_into_returns_the_files_recorded_into_given_dbs(self):
+        workers = self.pool.get_workers(2)
+        workers[0].recorded, workers[1].recorded = ['/tmp/a.cpp'], ['/tmp/b.cpp']
+        self.assertEqual(self.pool.files_recorded_into(['worker_1.db']), ['/tmp/b.cpp'])
+
+    def auto_report(self, process):
+        # Worker reports back as soon as it gets the file
+        def send(data):
+            process.sent.append(json.loads(data))
+            process.report(process.sent[-1], True, 0.1)
+        process.stdin.write.side_effect = send
+
+    def receive_all(self):
+        reports = []
+        while self.pool.busy_workers():
+            reports.extend(self.pool.receive())
+        return reports
+
+    def test_if_scheduled_file_is_kept_only_once(self):
+        self.pool.schedule(['/tmp/a.cpp', '/tmp/b.cpp'])
+        self.pool.schedule(['/tmp/b.cpp', '/tmp/a.cpp', '/tmp/c.cpp'])
+        self.assertEqual(self.pool.scheduled.keys(), ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+
+    def test_if_batch_is_handed_out_one_file_per_worker_and_the_rest_as_workers_are_done(self):
+        self.pool.schedule(['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp', '/tmp/e.cpp'])
+        self.pool.start_batch(4)
+        self.assertEqual([process.sent for process in self.processes], [['/tmp/a.cpp'], ['/tmp/b.cpp']])
+        for process in self.processes:
+            self.auto_report(process)
+            process.report(process.sent[-1], True, 0.1)
+        reports = self.receive_all()
+        self.assertEqual(sorted(report[0] for report in reports), ['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp', '/tmp/d.cpp'])
+        self.assertEqual(self.pool.scheduled.keys(), ['/tmp/e.cpp'])
+
+    def test_if_drain_waits_for_files_in_flight_and_leaves_the_rest_for_the_next_batch(self):
+        self.pool.schedule(['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.pool.start_batch(3)
+        for process in self.processes:
+            process.report(process.sent[-1], True, 0.1)
+        reports = self.pool.drain()
+        self.assertEqual(sorted(report[0] for report in reports), ['/tmp/a.cpp', '/tmp/b.cpp'])
+        self.assertEqual(self.pool.busy_workers(), [])
+        self.assertEqual(self.pool.scheduled.keys(), ['/tmp/c.cpp'])
+
+    def test_if_file_worker_has_died_on_during_the_batch_is_retried_once_by_the_fresh_worker(self):
+        self.pool.schedule(['/tmp/a.cpp'])
+        self.pool.start_batch(1)
+        for expected_reports in [[], [('/tmp/a.cpp', False, 0.0)]]: # Given up on once it has been retried
+            os.close(self.processes[-1].writer)
+            self.processes[-1].writer = None
+            with mock.patch('services.source_code_model.indexer.indexing_worker.logging') as mock_logging:
+                self.assertEqual(self.pool.receive(), expected_reports)
+            mock_logging.error.assert_called_once()
+        self.assertEqual([process.sent for process in self.processes], [['/tmp/a.cpp'], ['/tmp/a.cpp'], []])
+        self.assertEqual(self.pool.output_db_filenames(), ['worker_0.db'])
+        self.assertEqual(self.pool.busy_workers(), [])
+
+    def test_if_worker_is_restarted_once_it_has_outgrown_its_limits(self):
+        pool = IndexingWorkerPool(1, self.start_worker, max_files=2, max_rss=1000)
+        worker = pool.get_workers(1)[0]
+        self.assertEqual(pool.recycle(worker), worker)
+        worker.rss, worker.recorded = 1000, ['/tmp/a.cpp']
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging'):
+            fresh_worker = pool.recycle(worker)
+        worker.close.assert_called_once()
+        self.assertEqual(pool.workers, [fresh_worker])
+        self.assertEqual(fresh_worker.output_db_filename, 'worker_0.db')
+        self.assertEqual(fresh_worker.recorded, ['/tmp/a.cpp'])
+        fresh_worker.files_indexed = 2
+        with mock.patch('services.source_code_model.indexer.indexing_worker.logging'):
+            self.assertNotEqual(pool.recycle(fresh_worker), fresh_worker)
+
+    def test_if_whatever_has_been_claimed_for_the_file_in_flight_is_released_once_its_worker_has_died(self):
+        release = mock.MagicMock()
+        pool = IndexingWorkerPool(1, self.start_worker, release=release)
+        worker = pool.get_workers(1)[0]
+        worker.send('/tmp/a.cpp')
+        worker.alive = False
+        fresh_worker = pool.recycle(worker)
+        release.assert_called_once_with('/tmp/a.cpp')
+        self.assertEqual(fresh_worker.output_db_filename, 'worker_0.db')
+
+    def test_if_worker_which_has_exited_with_a_file_in_flight_is_left_for_receive_to_take_care_of(self):
+        workers = self.pool.get_workers(1)
+        workers[0].send('/tmp/a.cpp')
+        self.processes[0].returncode = -9
+        self.assertEqual(self.pool.get_workers(1), workers)
+
+    def test_if_files_indexed_in_the_foreground_are_no_longer_scheduled(self):
+        self.pool.schedule(['/tmp/a.cpp', '/tmp/b.cpp'])
+        with mock.patch('services.source_code_model.indexer.indexing_worker.index_files', return_value=[]):
+            self.pool.index(['/tmp/a.cpp'])
+        self.assertEqual(self.pool.scheduled.keys(), ['/tmp/b.cpp'])
+
+    def test_if_files_whose_declarations_only_are_indexed_in_the_foreground_are_still_scheduled(self):
+        self.pool.schedule(['/tmp/a.cpp', '/tmp/b.cpp'])
+        with mock.patch('services.source_code_model.indexer.indexing_worker.index_files', return_value=[]) as mock_index_files:
+            self.pool.index(['/tmp/a.cpp'], True)
+        mock_index_files.assert_called_once_with(self.pool.workers[0:1], ['/tmp/a.cpp'], True, None, self.pool.recycle)
+        self.assertEqual(sorted(self.pool.scheduled.keys()), ['/tmp/a.cpp', '/tmp/b.cpp'])
+
+    def test_if_cancel_forgets_scheduled_files(self):
+        self.pool.schedule(['/tmp/a.cpp', '/tmp/b.cpp', '/tmp/c.cpp'])
+        self.pool.start_batch(3)
+        for process in self.processes:
+            process.report(process.sent[-1], True, 0.1)
+        self.pool.cancel()
+        self.assertEqual(self.pool.scheduled.keys(), [])
+        self.assertEqual(self.pool.busy_workers(), [])
+
+    def test_if_close_stops_the_workers_and_removes_their_symbol_dbs(self):
+        workers = self.pool.get_workers(2)
+        with mock.patch('os.remove') as mock_os_remove:
+            self.pool.close()
+        for worker in workers:
+            worker.close.assert_called_once()
+        self.assertEqual(mock_os_remove.call_count, 2)
+        self.assertEqual(self.pool.output_db_filenames(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import json
+import mock
+import os
+import select
+import unittest
+
+import server
+import service
+from compact_result import CompactResult
+from jsonrpc_server import JsonRpcErrorCode
+from jsonrpc_server import JsonRpcServer
+from jsonrpc_server import MessageReader
+from jsonrpc_server import encode_message
+from transport import Transport
+
+class MessageReaderTest(unittest.TestCase):
+    def test_if_message_reader_decodes_encoded_message(self):
+        message = {'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/a.cpp'}}
+        self.assertEqual([json.loads(m) for m in MessageReader().feed(encode_message(message))], [message])
+
+    def test_if_message_reader_waits_for_the_whole_message_to_arrive(self):
+        data = encode_message({'id': 1})
+        reader = MessageReader()
+        self.assertEqual(reader.feed(data[0:10]), [])
+        self.assertEqual(reader.feed(data[10:-1]), [])
+        self.assertEqual(reader.feed(data[-1:]), ['{"id": 1}'])
+
+    def test_if_message_reader_splits_multiple_messages_received_at_once(self):
+        self.assertEqual(MessageReader().feed(encode_message({'id': 1}) + encode_message({'id': 2})), ['{"id": 1}', '{"id": 2}'])
+
+    def test_if_message_reader_raises_value_error_for_message_without_content_length(self):
+        self.assertRaises(ValueError, MessageReader().feed, 'Content-Type: json\r\n\r\n{}')
+
+class JsonRpcServerTest(unittest.TestCase):
+    def setUp(self):
+        self.input_reader, self.input_writer = os.pipe()
+        self.output_reader, self.output_writer = os.pipe()
+        self.handle = mock.MagicMock()
+        self.responses = Transport()
+        self.cancelled_requests = service.CancelledRequests()
+        self.jsonrpc_server = JsonRpcServer(self.input_reader, self.output_writer, self.handle, self.responses, self.cancelled_requests)
+        self.output = MessageReader()
+
+    def tearDown(self):
+        for fd in [self.input_reader, self.input_writer, self.output_reader, self.output_writer, self.responses.reader, self.responses.writer]:
+            os.close(fd)
+
+    def send(self, message):
+        os.write(self.input_writer, encode_message(message))
+        self.jsonrpc_server.process_events(0)
+
+    def complete(self, request_number, success, args):
+        payload = self.handle.put.call_args_list[request_number][0][0][2]
+        self.responses.put([service.ServiceRequestId.REQUEST, service.get_payload_tag(payload), server.ServiceId.CLANG_FORMAT, success, list(payload), args])
+        self.jsonrpc_server.process_events(0)
+
+    def received(self):
+        messages = []
+        while select.select([self.output_reader], [], [], 0)[0]:
+            messages.extend(self.output.feed(os.read(self.output_reader, 65536)))
+        return [json.loads(m) for m in messages]
+
+    def test_if_method_is_mapped_onto_service_request_with_tagged_payload(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/a.cpp'}})
+        request_id, service_id, payload = self.handle.put.call_args[0][0]
+        self.assertEqual(request_id, server.ServerRequestId.SEND_SERVICE)
+        self.assertEqual(service_id, server.ServiceId.CLANG_FORMAT)
+        self.assertEqual(payload, ['/tmp/a.cpp'])
+        self.assertNotEqual(service.get_payload_tag(payload), None)
+        self.assertEqual(self.received(), [])
+
+    def test_if_parameters_can_be_given_by_position(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangTidy/run', 'params': ['/tmp/a.cpp', True]})
+        self.assertEqual(self.handle.put.call_args[0][0][2], ['/tmp/a.cpp', True])
+
+    def test_if_decoded_parameters_are_not_unicode(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/a.cpp'}})
+        self.assertTrue(isinstance(self.handle.put.call_args[0][0][2][0], str))
+
+    def test_if_start_request_is_not_tagged_and_is_answered_right_away(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/start', 'params': {'configFile': '/tmp/.clang-format'}})
+        self.assertEqual(self.handle.put.call_args[0][0], [server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/.clang-format']])
+        self.assertEqual(service.get_payload_tag(self.handle.put.call_args[0][0][2]), None)
+        self.assertEqual(self.received(), [{'jsonrpc': '2.0', 'id': 1, 'result': None}])
+
+    def test_if_result_is_sent_once_service_completes_the_request(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/a.cpp'}})
+        self.complete(0, True, ['/tmp/a.cpp'])
+        self.assertEqual(self.received(), [{'jsonrpc': '2.0', 'id': 1, 'result': {'success': True, 'result': ['/tmp/a.cpp']}}])
+
+    def test_if_compact_result_is_sent_as_json_object(self):
+        result = CompactResult(2)
+        result.append(0, result.intern('foo'), 10)
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'sourceCodeModel/semanticSyntaxHighlight', 'params': ['/tmp/a.cpp', '/tmp/a.cpp']})
+        self.complete(0, True, result)
+        self.assertEqual(self.received()[0]['result']['result'], {'rowSizes': [2], 'tables': [[0, 10]], 'strings': ['foo']})
+
+    def test_if_results_completed_out_of_order_are_matched_with_their_requests(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/a.cpp'}})
+        self.send({'jsonrpc': '2.0', 'id': 2, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/b.cpp'}})
+        self.complete(1, True, 'b')
+        self.complete(0, False, 'a')
+        self.assertEqual(self.received(), [
+            {'jsonrpc': '2.0', 'id': 2, 'result': {'success': True, 'result': 'b'}},
+            {'jsonrpc': '2.0', 'id': 1, 'result': {'success': False, 'result': 'a'}},
+        ])
+
+    def test_if_partial_results_are_sent_as_notifications_ahead_of_the_result(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'sourceCodeModel/indexer/findAllReferences', 'params': {'filename': '/tmp/a.cpp', 'line': 1, 'column': 2}})
+        payload = self.handle.put.call_args[0][0][2]
+        for service_request_id, page in [(service.ServiceRequestId.PARTIAL_RESULT, {'items': ['a'], 'continuationToken': 1}), (service.ServiceRequestId.REQUEST, {'items': ['b'], 'continuationToken': None})]:
+            self.responses.put([service_request_id, service.get_payload_tag(payload), server.ServiceId.SOURCE_CODE_MODEL, True, list(payload), page])
+            self.jsonrpc_server.process_events(0)
+        self.assertEqual(self.received(), [
+            {'jsonrpc': '2.0', 'method': '$/partialResult', 'params': {'id': 1, 'success': True, 'result': {'items': ['a'], 'continuationToken': 1}}},
+            {'jsonrpc': '2.0', 'id': 1, 'result': {'success': True, 'result': {'items': ['b'], 'continuationToken': None}}},
+        ])
+
+    def test_if_optional_parameters_can_be_left_out(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'sourceCodeModel/indexer/findAllReferences', 'params': ['/tmp/a.cpp', 1, 2]})
+        self.assertEqual(self.handle.put.call_args[0][0][2][-5:], ['/tmp/a.cpp', 1, 2, None, None])
+        self.send({'jsonrpc': '2.0', 'id': 2, 'method': 'sourceCodeModel/indexer/findAllReferences', 'params': {'filename': '/tmp/a.cpp', 'line': 1, 'column': 2, 'limit': 10}})
+        self.assertEqual(self.handle.put.call_args[0][0][2][-5:], ['/tmp/a.cpp', 1, 2, 10, None])
+
+    def test_if_cancelled_request_is_answered_with_an_error_and_its_late_result_is_dropped(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangFormat/format', 'params': {'filename': '/tmp/a.cpp'}})
+        self.send({'jsonrpc': '2.0', 'method': '$/cancelRequest', 'params': {'id': 1}})
+        self.assertTrue(service.get_payload_tag(self.handle.put.call_args[0][0][2]) in self.cancelled_requests)
+        self.complete(0, True, ['/tmp/a.cpp'])
+        self.assertEqual(self.received(), [{'jsonrpc': '2.0', 'id': 1, 'error': {'code': JsonRpcErrorCode.REQUEST_CANCELLED, 'message': 'Request cancelled'}}])
+
+    def test_if_cancelling_unknown_request_is_ignored(self):
+        self.send({'jsonrpc': '2.0', 'method': '$/cancelRequest', 'params': {'id': 42}})
+        self.assertEqual(self.received(), [])
+
+    def test_if_unknown_method_is_answered_with_method_not_found_error(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'unknown/method'})
+        self.assertEqual(self.received()[0]['error']['code'], JsonRpcErrorCode.METHOD_NOT_FOUND)
+        self.handle.put.assert_not_called()
+
+    def test_if_missing_parameter_is_answered_with_invalid_params_error(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'clangTidy/run', 'params': {'filename': '/tmp/a.cpp'}})
+        self.assertEqual(self.received()[0]['error']['code'], JsonRpcErrorCode.INVALID_PARAMS)
+        self.handle.put.assert_not_called()
+
+    def test_if_malformed_json_is_answered_with_parse_error(self):
+        os.write(self.input_writer, 'Content-Length: 3\r\n\r\n{{{')
+        self.jsonrpc_server.process_events(0)
+        self.assertEqual(self.received()[0]['error']['code'], JsonRpcErrorCode.PARSE_ERROR)
+
+    def test_if_shutdown_stops_the_server_and_exit_stops_the_dispatcher(self):
+        self.send({'jsonrpc': '2.0', 'id': 1, 'method': 'shutdown'})
+        self.handle.put.assert_called_once_with([server.ServerRequestId.SHUTDOWN_AND_EXIT, 0x0, []])
+        os.write(self.input_writer, encode_message({'jsonrpc': '2.0', 'method': 'exit'}))
+        self.assertEqual(self.jsonrpc_server.process_events(0), False)
+
+    def test_if_server_is_stopped_when_client_goes_away(self):
+        os.close(self.input_writer)
+        self.input_writer = os.open(os.devnull, os.O_WRONLY)
+        self.jsonrpc_server.run()
+        self.handle.put.assert_called_once_with([server.ServerRequestId.SHUTDOWN_AND_EXIT, 0x0, []])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import mock
+import os
+import tempfile
+import unittest
+
+from services.source_code_model.indexer.line_cache import LineCache
+from services.source_code_model.indexer.line_cache import get_line_offsets
+from services.source_code_model.indexer.line_cache import map_file
+
+class LineCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.line_cache = LineCache(max_files=2)
+        self.test_file = self.create_file('int main() {\n\n    return 0;\n}')
+
+    def tearDown(self):
+        self.line_cache.clear()
+        os.remove(self.test_file)
+
+    def create_file(self, contents):
+        fd, filename = tempfile.mkstemp(suffix='.cpp')
+        os.write(fd, contents)
+        os.close(fd)
+        return filename
+
+    def test_if_getline_returns_the_line_together_with_its_line_ending(self):
+        self.assertEqual(self.line_cache.getline(self.test_file, 1), 'int main() {\n')
+        self.assertEqual(self.line_cache.getline(self.test_file, 2), '\n')
+        self.assertEqual(self.line_cache.getline(self.test_file, 4), '}')
+
+    def test_if_getline_returns_empty_string_for_line_out_of_range(self):
+        self.assertEqual(self.line_cache.getline(self.test_file, 0), '')
+        self.assertEqual(self.line_cache.getline(self.test_file, 5), '')
+
+    def test_if_getline_returns_empty_string_for_inexisting_or_empty_file(self):
+        empty_file = self.create_file('')
+        self.assertEqual(self.line_cache.getline('/inexisting/main.cpp', 1), '')
+        self.assertEqual(self.line_cache.getline(empty_file, 1), '')
+        os.remove(empty_file)
+
+    def test_if_file_is_mapped_only_once_while_it_remains_unchanged(self):
+        with mock.patch('services.source_code_model.indexer.line_cache.map_file', wraps=map_file) as mock_map_file:
+            self.line_cache.getline(self.test_file, 1)
+            self.line_cache.getline(self.test_file, 3)
+        mock_map_file.assert_called_once()
+
+    def test_if_file_is_mapped_again_once_it_has_changed(self):
+        self.assertEqual(self.line_cache.getline(self.test_file, 3), '    return 0;\n')
+        with open(self.test_file, 'w') as f:
+            f.write('int main() {\n    int a = 1;\n    return a;\n}')
+        self.assertEqual(self.line_cache.getline(self.test_file, 3), '    return a;\n')
+
+    def test_if_least_recently_used_file_is_unmapped_once_there_are_too_many_of_them(self):
+        files = [self.create_file('int a;\n') for i in range(2)]
+        self.line_cache.getline(self.test_file, 1)
+        for filename in files:
+            self.line_cache.getline(filename, 1)
+        self.assertEqual(list(self.line_cache.files.keys()), files)
+        for filename in files:
+            os.remove(filename)
+
+    def test_if_get_line_offsets_returns_byte_offset_of_each_line(self):
+        self.assertEqual(list(get_line_offsets('int main() {\n\n    return 0;\n}')), [0, 13, 14, 28])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from services.source_code_model.indexer.project_files import DirectoryScanner
+from services.source_code_model.indexer.project_files import IgnoreRules
+
+class IgnoreRulesTest(unittest.TestCase):
+    def test_if_pattern_without_slash_matches_the_name_at_any_level(self):
+        ignore_rules = IgnoreRules(['*.pb.h', 'build'])
+        self.assertEqual(ignore_rules.is_ignored('a.pb.h'), True)
+        self.assertEqual(ignore_rules.is_ignored('lib/proto/a.pb.h'), True)
+        self.assertEqual(ignore_rules.is_ignored('lib/build/a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('lib/a.h'), False)
+
+    def test_if_pattern_with_slash_matches_relative_to_the_root_directory(self):
+        ignore_rules = IgnoreRules(['/build', 'tests/integration/external/'])
+        self.assertEqual(ignore_rules.is_ignored('build/a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('lib/build/a.cpp'), False)
+        self.assertEqual(ignore_rules.is_ignored('tests/integration/external/a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('tests/external/a.cpp'), False)
+
+    def test_if_pattern_with_trailing_slash_matches_directories_only(self):
+        ignore_rules = IgnoreRules(['third_party/'])
+        self.assertEqual(ignore_rules.is_ignored('third_party/a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('third_party'), False)
+
+    def test_if_wildcards_do_not_match_across_directories_except_for_double_asterisk(self):
+        ignore_rules = IgnoreRules(['/lib/*.cpp', '/src/**/gen_*.cpp', '/doc/**'])
+        self.assertEqual(ignore_rules.is_ignored('lib/a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('lib/impl/a.cpp'), False)
+        self.assertEqual(ignore_rules.is_ignored('src/gen_a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('src/x/y/gen_a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('doc/x/a.cpp'), True)
+
+    def test_if_last_matching_pattern_wins_and_negated_one_includes_the_file_back(self):
+        ignore_rules = IgnoreRules(['*.h', '!config.h', '# comment', ''])
+        self.assertEqual(ignore_rules.is_ignored('lib/a.h'), True)
+        self.assertEqual(ignore_rules.is_ignored('lib/config.h'), False)
+        self.assertEqual(IgnoreRules(['!config.h', '*.h']).is_ignored('lib/config.h'), True)
+
+    def test_if_file_cannot_be_included_back_once_its_directory_is_excluded(self):
+        self.assertEqual(IgnoreRules(['build/', '!build/config.h']).is_ignored('build/config.h'), True)
+
+    def test_if_character_classes_are_supported(self):
+        ignore_rules = IgnoreRules(['test_[ab].cpp', 'v[!0-9].h'])
+        self.assertEqual([ignore_rules.is_ignored(f) for f in ['test_a.cpp', 'test_c.cpp', 'vx.h', 'v1.h']], [True, False, True, False])
+
+    def test_if_patterns_from_the_file_in_root_directory_are_applied_on_top_of_the_given_ones(self):
+        root_directory = tempfile.mkdtemp()
+        try:
+            self.assertEqual(bool(IgnoreRules.from_directory(root_directory)), False)
+            with open(os.path.join(root_directory, IgnoreRules.filename), 'w') as f:
+                f.write('!keep.cpp\nexternal/\n')
+            ignore_rules = IgnoreRules.from_directory(root_directory, ['*.cpp'])
+        finally:
+            shutil.rmtree(root_directory)
+        self.assertEqual(ignore_rules.is_ignored('a.cpp'), True)
+        self.assertEqual(ignore_rules.is_ignored('keep.cpp'), False)
+        self.assertEqual(ignore_rules.is_ignored('external/keep.cpp'), True)
+
+class DirectoryScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.root_directory = tempfile.mkdtemp()
+        for filename in ['main.cpp', 'README.md', 'lib/a.h', 'lib/a.cpp', 'build/gen.cpp', 'build/deps/b.cpp']:
+            self.create_file(filename)
+        self.scanner = DirectoryScanner(['.cpp', '.h'], threads=2)
+
+    def tearDown(self):
+        self.scanner.close()
+        shutil.rmtree(self.root_directory)
+
+    def create_file(self, filename):
+        filename = os.path.join(self.root_directory, filename)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        open(filename, 'w').close()
+
+    def relative(self, cpp_file_list):
+        return sorted(os.path.relpath(filename, self.root_directory) for filename in cpp_file_list)
+
+    def test_if_scan_returns_files_with_given_extensions_from_all_of_the_directories(self):
+        self.assertEqual(self.relative(self.scanner.scan(self.root_directory)), ['build/deps/b.cpp', 'build/gen.cpp', 'lib/a.cpp', 'lib/a.h', 'main.cpp'])
+
+    def test_if_scan_does_not_descend_into_ignored_directories(self):
+        with mock.patch('os.listdir', side_effect=os.listdir) as mock_os_listdir:
+            cpp_file_list = self.scanner.scan(self.root_directory, IgnoreRules(['/build/', 'a.h']))
+        self.assertEqual(self.relative(cpp_file_list), ['lib/a.cpp', 'main.cpp'])
+        self.assertEqual(sorted(c[0][0] for c in mock_os_listdir.call_args_list), [self.root_directory, os.path.join(self.root_directory, 'lib')])
+
+    def test_if_directory_is_listed_again_only_once_it_has_changed(self):
+        self.scanner.scan(self.root_directory)
+        lib = os.path.join(self.root_directory, 'lib')
+        self.create_file('lib/b.cpp')
+        os.utime(lib, (0, 0)) # Make sure that the mtime is different no matter the resolution of the file system timestamps
+        with mock.patch('os.listdir', side_effect=os.listdir) as mock_os_listdir:
+            cpp_file_list = self.scanner.scan(self.root_directory)
+        mock_os_listdir.assert_called_once_with(lib)
+        self.assertIn('lib/b.cpp', self.relative(cpp_file_list))
+
+    def test_if_removed_directories_are_forgotten(self):
+        self.scanner.scan(self.root_directory)
+        shutil.rmtree(os.path.join(self.root_directory, 'build'))
+        os.utime(self.root_directory, (0, 0))
+        self.assertEqual(self.relative(self.scanner.scan(self.root_directory)), ['lib/a.cpp', 'lib/a.h', 'main.cpp'])
+        self.assertEqual(sorted(self.scanner.listings.keys()), [self.root_directory, os.path.join(self.root_directory, 'lib')])
+
+    def test_if_symbolic_links_to_directories_are_not_followed(self):
+        os.symlink(os.path.join(self.root_directory, 'lib'), os.path.join(self.root_directory, 'lib_link'))
+        self.assertNotIn('lib_link/a.cpp', self.relative(self.scanner.scan(self.root_directory)))
+
+if __name__ == '__main__':
+    unittest.main()
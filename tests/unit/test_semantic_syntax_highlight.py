@@ -37,6 +37,13 @@ class SemanticSyntaxHighlightTest(unittest.TestCase):
         self.assertNotEqual(tunit, None)
         self.assertNotEqual(ast_traversal_fun, None)
 
+    def test_if_serialize_result_converts_traversal_into_compact_result(self):
+        success, args = self.service([self.test_file.name, self.test_file.name])
+        result = self.service.serialize_result([self.test_file.name, self.test_file.name], args)
+        self.assertNotEqual(result.row_count(0), 0)
+        for ast_node_id, ast_node_name, ast_node_line, ast_node_column in result.rows(0):
+            self.assertTrue(isinstance(result.string(ast_node_id), str))
+
     def test_if_semantic_syntax_highlight_visitor_does_not_recurse_into_symbols_from_other_tunits(self):
         location_mock = mock.PropertyMock(return_value=cxxd_mocks.SourceLocationMock(self.test_file.name, 10, 15))
         ast_node = mock.MagicMock(clang.cindex.Cursor)
@@ -77,6 +77,43 @@ class ServiceTest(unittest.TestCase):
         mock_service_shutdown_callback.assert_not_called()
         mock_service_plugin_shutdown_callback.assert_not_called()
 
+    def test_if_background_work_is_handled_while_there_is_no_request_waiting(self):
+        import os
+        reader, writer = os.pipe()
+        os.write(writer, 'x')
+        def background_callback():
+            os.read(reader, 1)
+            self.service.send_startup_request(self.payload) # Request arrives once background work is handled
+        try:
+            with mock.patch.object(self.service, 'get_background_fds', side_effect=lambda: [reader]), \
+                mock.patch.object(self.service, 'background_callback', side_effect=background_callback) as mock_background_callback:
+                self.service.process_request()
+        finally:
+            os.close(reader)
+            os.close(writer)
+        mock_background_callback.assert_called_once()
+        self.assertEqual(self.service.is_started_up(), True)
+
+    def test_if_request_is_processed_before_background_work_when_both_are_waiting(self):
+        import os
+        reader, writer = os.pipe()
+        os.write(writer, 'x')
+        self.service.send_startup_request(self.payload)
+        try:
+            with mock.patch.object(self.service, 'get_background_fds', return_value=[reader]), \
+                mock.patch.object(self.service, 'background_callback') as mock_background_callback:
+                self.service.process_request()
+        finally:
+            os.close(reader)
+            os.close(writer)
+        mock_background_callback.assert_not_called()
+        self.assertEqual(self.service.is_started_up(), True)
+
+    def test_if_requests_pending_tells_whether_there_is_a_request_waiting(self):
+        self.assertEqual(self.service.requests_pending(), False)
+        self.service.send_startup_request(self.payload)
+        self.assertEqual(self.service.requests_pending(), True)
+
     def test_if_send_request_makes_no_effect_if_service_is_not_started(self):
         self.service.send_request(self.payload)
         with mock.patch.object(self.service, '__call__') as mock_service_request:
@@ -231,5 +268,200 @@ class ServiceTest(unittest.TestCase):
         self.service.process_request()
         self.assertEqual(self.service.is_started_up(), True)
 
+    def test_if_cancelled_request_is_not_handed_over_to_the_service(self):
+        import service
+        self.service.cancelled_requests = service.CancelledRequests()
+        self.service.cancelled_requests.add(7)
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        self.service.send_request(service.TaggedPayload(self.payload, 7))
+        with mock.patch.object(self.service, '__call__', mock.Mock(return_value=(True, None))) as mock_service_request:
+            with mock.patch.object(self.service.service_plugin, '__call__') as mock_service_plugin_request:
+                self.assertEqual(self.service.process_request(), True)
+        mock_service_request.assert_not_called()
+        mock_service_plugin_request.assert_not_called()
+
+    def test_if_result_produced_in_pages_is_handed_over_to_service_plugin_page_by_page(self):
+        def pages():
+            yield ['a', 'b'], 2
+            yield ['c'], None
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        self.service.send_request(self.payload)
+        with mock.patch.object(self.service, '__call__', mock.Mock(return_value=(True, pages()))):
+            with mock.patch.object(self.service.service_plugin, '__call__') as mock_service_plugin_request:
+                self.service.process_request()
+        self.assertEqual(mock_service_plugin_request.call_count, 2)
+        first, last = [c[0][2] for c in mock_service_plugin_request.call_args_list]
+        self.assertEqual((first, first.continuation_token, first.last), (['a', 'b'], 2, False))
+        self.assertEqual((last, last.continuation_token, last.last), (['c'], None, True))
+
+    def test_if_result_produced_in_no_pages_at_all_is_handed_over_as_a_single_empty_page(self):
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        self.service.send_request(self.payload)
+        with mock.patch.object(self.service, '__call__', mock.Mock(return_value=(False, (page for page in [])))):
+            with mock.patch.object(self.service.service_plugin, '__call__') as mock_service_plugin_request:
+                self.service.process_request()
+        mock_service_plugin_request.assert_called_once_with(False, self.payload, [])
+        self.assertEqual(mock_service_plugin_request.call_args[0][2].last, True)
+
+    def test_if_streaming_stops_once_request_gets_cancelled(self):
+        import service
+        self.service.cancelled_requests = service.CancelledRequests()
+        def pages():
+            yield ['a'], 1
+            self.service.cancelled_requests.add(7)
+            yield ['b'], 2
+            yield ['c'], None
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        self.service.send_request(service.TaggedPayload(self.payload, 7))
+        with mock.patch.object(self.service, '__call__', mock.Mock(return_value=(True, pages()))):
+            with mock.patch.object(self.service.service_plugin, '__call__') as mock_service_plugin_request:
+                self.service.process_request()
+        mock_service_plugin_request.assert_called_once_with(True, self.payload, ['a'])
+
+    def test_if_slow_plugin_does_not_block_the_next_request_once_dispatcher_is_started(self):
+        import threading
+        plugin_may_return = threading.Event()
+        self.service.plugin_dispatcher.start()
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        with mock.patch.object(self.service.service_plugin, '__call__', side_effect=lambda *args: plugin_may_return.wait()) as mock_service_plugin_request:
+            self.service.send_request(self.payload)
+            self.service.send_request(self.payload)
+            self.assertEqual(self.service.process_request(), True)
+            self.assertEqual(self.service.process_request(), True)
+            plugin_may_return.set()
+            self.service.plugin_dispatcher.stop()
+        self.assertEqual(mock_service_plugin_request.call_count, 2)
+
+    def test_if_plugin_callback_time_is_measured_per_request_type(self):
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        self.service.send_request(self.payload)
+        self.service.process_request()
+        stats = self.service.plugin_dispatcher.get_stats()
+        self.assertEqual(stats['startup'][0], 1)
+        self.assertEqual(stats[self.service.get_request_type(self.payload)][0], 1)
+
+    def test_if_result_is_prepared_from_the_service_thread_before_being_dispatched(self):
+        import threading
+        prepared_from = []
+        self.service.service_plugin.prepare = lambda payload, args: (prepared_from.append(threading.current_thread().name), ['prepared'])[1]
+        self.service.plugin_dispatcher.start()
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        with mock.patch.object(self.service.service_plugin, '__call__') as mock_service_plugin_request:
+            self.service.send_request(self.payload)
+            self.service.process_request()
+            self.service.plugin_dispatcher.stop()
+        self.assertEqual(prepared_from, [threading.current_thread().name])
+        mock_service_plugin_request.assert_called_once_with(False, self.payload, ['prepared'])
+
+    def test_if_result_holding_live_objects_is_converted_into_plain_data_from_the_service_thread_before_being_dispatched(self):
+        import threading
+        serialized_from = []
+        self.service.plugin_dispatcher.start()
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        with mock.patch.object(self.service, 'holds_live_objects', return_value=True), \
+            mock.patch.object(self.service, 'serialize_result', side_effect=lambda payload, args: (serialized_from.append(threading.current_thread().name), ['serialized'])[1]), \
+            mock.patch.object(self.service.service_plugin, '__call__') as mock_service_plugin_request:
+            self.service.send_request(self.payload)
+            self.service.process_request()
+            self.service.plugin_dispatcher.stop()
+        self.assertEqual(serialized_from, [threading.current_thread().name])
+        mock_service_plugin_request.assert_called_once_with(False, self.payload, ['serialized'])
+
+    def test_if_slow_plugin_callback_for_result_holding_live_objects_does_not_block_the_next_request(self):
+        import threading
+        plugin_may_return = threading.Event()
+        self.service.plugin_dispatcher.start()
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        with mock.patch.object(self.service, 'holds_live_objects', return_value=True), \
+            mock.patch.object(self.service.service_plugin, '__call__', side_effect=lambda *args: plugin_may_return.wait()) as mock_service_plugin_request:
+            self.service.send_request(self.payload)
+            self.service.send_request(self.payload)
+            self.assertEqual(self.service.process_request(), True)
+            self.assertEqual(self.service.process_request(), True)
+            plugin_may_return.set()
+            self.service.plugin_dispatcher.stop()
+        self.assertEqual(mock_service_plugin_request.call_count, 2)
+
+    def test_if_result_holding_live_objects_is_handed_over_from_the_service_thread_to_the_plugin_which_needs_live_objects(self):
+        import threading
+        called_from = []
+        self.service.service_plugin.needs_live_objects = True
+        self.service.plugin_dispatcher.start()
+        self.service.send_startup_request(self.payload)
+        self.service.process_request()
+        with mock.patch.object(self.service, 'holds_live_objects', return_value=True), \
+            mock.patch.object(self.service.service_plugin, '__call__', side_effect=lambda *args: called_from.append(threading.current_thread().name)):
+            self.service.send_request(self.payload)
+            self.service.process_request()
+            self.assertEqual(called_from, [threading.current_thread().name])
+        self.service.plugin_dispatcher.stop()
+
+class PluginDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        import service
+        self.dispatcher = service.PluginDispatcher()
+
+    def test_if_callback_is_executed_synchronously_if_dispatcher_is_not_started(self):
+        callback = mock.MagicMock()
+        self.dispatcher.dispatch('request', callback, 1, 2)
+        callback.assert_called_once_with(1, 2)
+
+    def test_if_callbacks_are_executed_in_order_from_dispatcher_thread(self):
+        import threading
+        calls = []
+        self.dispatcher.start()
+        for i in range(100):
+            self.dispatcher.dispatch('request', lambda i: calls.append((i, threading.current_thread().name)), i)
+        self.dispatcher.stop()
+        self.assertEqual([i for i, thread in calls], range(100))
+        self.assertTrue(all(thread == 'cxxd_plugin_dispatcher' for i, thread in calls))
+
+    def test_if_failing_callback_does_not_stop_the_dispatcher(self):
+        callback = mock.MagicMock()
+        self.dispatcher.start()
+        with mock.patch('service.logging') as mock_logging:
+            self.dispatcher.dispatch('request', mock.MagicMock(side_effect=RuntimeError))
+            self.dispatcher.dispatch('request', callback)
+            self.dispatcher.stop()
+        mock_logging.exception.assert_called_once()
+        callback.assert_called_once()
+        self.assertEqual(self.dispatcher.get_stats()['request'][0], 2)
+
+    def test_if_callback_is_executed_from_the_calling_thread_once_the_dispatched_ones_are_delivered(self):
+        import threading
+        calls = []
+        self.dispatcher.start()
+        for i in range(10):
+            self.dispatcher.dispatch('request', lambda i: calls.append((i, threading.current_thread().name)), i)
+        self.dispatcher.execute('request', lambda i: calls.append((i, threading.current_thread().name)), 10)
+        self.dispatcher.stop()
+        self.assertEqual([i for i, thread in calls], range(11))
+        self.assertEqual(calls[-1][1], threading.current_thread().name)
+
+class CancelledRequestsTest(unittest.TestCase):
+    def setUp(self):
+        import service
+        self.cancelled_requests = service.CancelledRequests()
+
+    def test_if_added_tag_is_contained(self):
+        self.cancelled_requests.add(5)
+        self.assertTrue(5 in self.cancelled_requests)
+        self.assertFalse(6 in self.cancelled_requests)
+
+    def test_if_only_the_most_recent_tags_are_remembered(self):
+        for tag in range(self.cancelled_requests.capacity + 1):
+            self.cancelled_requests.add(tag)
+        self.assertFalse(0 in self.cancelled_requests)
+        self.assertTrue(self.cancelled_requests.capacity in self.cancelled_requests)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+import mock
+import unittest
+
+import cxxd_mocks
+import service
+from service_plugin import RoutingServicePlugin
+
+class RoutingServicePluginTest(unittest.TestCase):
+    def setUp(self):
+        self.service_id = 0x2
+        self.transport = mock.MagicMock()
+        self.service_plugin = cxxd_mocks.ServicePluginMock()
+        self.plugin = RoutingServicePlugin(self.service_plugin, self.service_id, self.transport)
+
+    def test_if_result_of_untagged_request_is_handed_over_to_the_original_plugin(self):
+        with mock.patch.object(self.service_plugin, '__call__') as mock_service_plugin_call:
+            self.plugin(True, ['/tmp/a.cpp'], ['result'])
+        mock_service_plugin_call.assert_called_once_with(True, ['/tmp/a.cpp'], ['result'])
+        self.transport.put.assert_not_called()
+
+    def test_if_result_of_tagged_request_is_routed_over_the_transport(self):
+        with mock.patch.object(self.service_plugin, '__call__') as mock_service_plugin_call:
+            self.plugin(True, service.TaggedPayload(['/tmp/a.cpp'], 5), ['result'])
+        mock_service_plugin_call.assert_not_called()
+        self.transport.put.assert_called_once_with([service.ServiceRequestId.REQUEST, 5, self.service_id, True, ['/tmp/a.cpp'], ['result']])
+
+    def test_if_startup_of_tagged_request_is_routed_over_the_transport(self):
+        with mock.patch.object(self.service_plugin, 'startup_callback') as mock_service_plugin_startup_callback:
+            self.plugin.startup_callback(True, service.TaggedPayload(['/tmp'], 5))
+        mock_service_plugin_startup_callback.assert_not_called()
+        self.transport.put.assert_called_once_with([service.ServiceRequestId.STARTUP, 5, self.service_id, True, ['/tmp'], None])
+
+    def test_if_unserializable_result_is_replaced_with_an_empty_one(self):
+        self.transport.put.side_effect = [TypeError("can't pickle"), None]
+        self.plugin(True, service.TaggedPayload(['/tmp/a.cpp'], 5), [lambda: None])
+        self.transport.put.assert_called_with([service.ServiceRequestId.REQUEST, 5, self.service_id, True, ['/tmp/a.cpp'], None])
+
+    def test_if_result_of_tagged_request_is_serialized_before_being_routed(self):
+        serialize_result = mock.MagicMock(return_value=['serialized'])
+        plugin = RoutingServicePlugin(self.service_plugin, self.service_id, self.transport, serialize_result)
+        plugin(True, service.TaggedPayload(['/tmp/a.cpp'], 5), ['result'])
+        serialize_result.assert_called_once_with(['/tmp/a.cpp'], ['result'])
+        self.transport.put.assert_called_once_with([service.ServiceRequestId.REQUEST, 5, self.service_id, True, ['/tmp/a.cpp'], ['serialized']])
+
+    def test_if_result_pages_are_routed_as_partial_results_except_for_the_last_one(self):
+        serialize_result = mock.MagicMock(side_effect=lambda payload, args: list(args))
+        plugin = RoutingServicePlugin(self.service_plugin, self.service_id, self.transport, serialize_result)
+        plugin(True, service.TaggedPayload(['/tmp/a.cpp'], 5), service.ResultPage(['a'], 1, False))
+        plugin(True, service.TaggedPayload(['/tmp/a.cpp'], 5), service.ResultPage(['b'], None, True))
+        self.assertEqual(self.transport.put.call_args_list, [
+            mock.call([service.ServiceRequestId.PARTIAL_RESULT, 5, self.service_id, True, ['/tmp/a.cpp'], {'items': ['a'], 'continuationToken': 1}]),
+            mock.call([service.ServiceRequestId.REQUEST, 5, self.service_id, True, ['/tmp/a.cpp'], {'items': ['b'], 'continuationToken': None}]),
+        ])
+
+    def test_if_prepared_result_is_routed_without_being_serialized_once_again(self):
+        serialize_result = mock.MagicMock(return_value=['serialized'])
+        plugin = RoutingServicePlugin(self.service_plugin, self.service_id, self.transport, serialize_result)
+        payload = service.TaggedPayload(['/tmp/a.cpp'], 5)
+        plugin(True, payload, plugin.prepare(payload, ['result']))
+        serialize_result.assert_called_once_with(['/tmp/a.cpp'], ['result'])
+        self.transport.put.assert_called_once_with([service.ServiceRequestId.REQUEST, 5, self.service_id, True, ['/tmp/a.cpp'], ['serialized']])
+
+    def test_if_result_of_untagged_request_is_not_prepared(self):
+        serialize_result = mock.MagicMock()
+        plugin = RoutingServicePlugin(self.service_plugin, self.service_id, self.transport, serialize_result)
+        self.assertEqual(plugin.prepare(['/tmp/a.cpp'], ['result']), ['result'])
+        serialize_result.assert_not_called()
+
+    def test_if_plugin_needs_live_objects_only_if_original_plugin_does(self):
+        self.assertEqual(self.plugin.needs_live_objects, False)
+        self.service_plugin.needs_live_objects = True
+        self.assertEqual(self.plugin.needs_live_objects, True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import mock
 import os
 import unittest
 
@@ -35,6 +36,29 @@ class SourceCodeModelTest(unittest.TestCase):
         self.assertEqual(self.service.parser, None)
         self.assertEqual(self.service.service, None)
 
+    def test_if_shutdown_callback_stops_the_indexing_workers(self):
+        self.service.startup_callback([os.path.dirname(self.json_compilation_database.name), self.json_compilation_database.name])
+        with mock.patch.object(self.service.clang_indexer, 'close') as mock_clang_indexer_close:
+            self.service.shutdown_callback(None)
+        mock_clang_indexer_close.assert_called_once()
+
+    def test_if_shutdown_callback_is_a_no_op_when_services_were_not_instantiated(self):
+        self.service.startup_callback(['inexisting_directory', 'inexisting_compilation_db'])
+        self.service.shutdown_callback(None)
+
+    def test_if_background_work_of_the_indexer_is_handled(self):
+        self.service.startup_callback([os.path.dirname(self.json_compilation_database.name), self.json_compilation_database.name])
+        with mock.patch.object(self.service.clang_indexer, 'get_background_fds', return_value=['worker']), \
+            mock.patch.object(self.service.clang_indexer, 'background_callback') as mock_clang_indexer_background_callback:
+            self.assertEqual(self.service.get_background_fds(), ['worker'])
+            self.service.background_callback()
+        mock_clang_indexer_background_callback.assert_called_once()
+
+    def test_if_there_is_no_background_work_when_services_were_not_instantiated(self):
+        self.service.startup_callback(['inexisting_directory', 'inexisting_compilation_db'])
+        self.assertEqual(self.service.get_background_fds(), [])
+        self.service.background_callback()
+
     def test_if_call_returns_false_and_none_when_triggered_with_unknown_sub_service_id(self):
         self.service.startup_callback([os.path.dirname(self.json_compilation_database.name), self.json_compilation_database.name])
         success, args = self.service([self.unknown_subservice_id])
@@ -47,5 +71,15 @@ class SourceCodeModelTest(unittest.TestCase):
         self.assertEqual(success, False)
         self.assertEqual(args, None)
 
+    def test_if_request_type_is_the_name_of_sub_service(self):
+        self.service.startup_callback([os.path.dirname(self.json_compilation_database.name), self.json_compilation_database.name])
+        self.assertEqual(self.service.get_request_type([SourceCodeModelSubServiceId.DIAGNOSTICS]), 'Diagnostics')
+        self.assertEqual(self.service.get_request_type([self.unknown_subservice_id]), 'SourceCodeModel')
+
+    def test_if_diagnostics_and_semantic_syntax_highlight_results_hold_live_objects(self):
+        self.assertEqual(self.service.holds_live_objects([SourceCodeModelSubServiceId.DIAGNOSTICS]), True)
+        self.assertEqual(self.service.holds_live_objects([SourceCodeModelSubServiceId.SEMANTIC_SYNTAX_HIGHLIGHT]), True)
+        self.assertEqual(self.service.holds_live_objects([SourceCodeModelSubServiceId.INDEXER]), False)
+
 if __name__ == '__main__':
     unittest.main()
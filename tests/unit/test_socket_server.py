@@ -0,0 +1,124 @@
+import mock
+import os
+import tempfile
+import threading
+import unittest
+
+import server
+import service
+from compact_result import CompactResult
+from socket_server import FrameId
+from socket_server import FrameReader
+from socket_server import SocketClient
+from socket_server import SocketServer
+from socket_server import decode_result
+from socket_server import encode_frame
+
+class FrameTest(unittest.TestCase):
+    def test_if_frame_reader_decodes_encoded_frame(self):
+        frame = encode_frame(FrameId.REQUEST, 7, [server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/a.cpp']])
+        self.assertEqual(FrameReader().feed(frame), [(FrameId.REQUEST, 7, [server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/a.cpp']])])
+
+    def test_if_frame_reader_waits_for_the_whole_frame_to_arrive(self):
+        frame = encode_frame(FrameId.REQUEST, 7, ['/tmp/a.cpp'])
+        frame_reader = FrameReader()
+        self.assertEqual(frame_reader.feed(frame[0:5]), [])
+        self.assertEqual(frame_reader.feed(frame[5:-1]), [])
+        self.assertEqual(frame_reader.feed(frame[-1:]), [(FrameId.REQUEST, 7, ['/tmp/a.cpp'])])
+
+    def test_if_frame_reader_splits_multiple_frames_received_at_once(self):
+        frame_reader = FrameReader()
+        frames = frame_reader.feed(encode_frame(FrameId.REQUEST, 1, [1]) + encode_frame(FrameId.RESPONSE, 2, [2]))
+        self.assertEqual(frames, [(FrameId.REQUEST, 1, [1]), (FrameId.RESPONSE, 2, [2])])
+
+    def test_if_decoded_strings_are_not_unicode(self):
+        frames = FrameReader().feed(encode_frame(FrameId.REQUEST, 1, ['/tmp/a.cpp']))
+        self.assertTrue(isinstance(frames[0][2][0], str))
+
+    def test_if_compact_result_streamed_in_pages_is_decoded(self):
+        result = CompactResult(1)
+        result.append(0, 7)
+        self.assertEqual(decode_result({'items': result.as_dict(), 'continuationToken': ['usr', 1]}), {'items': result, 'continuationToken': ['usr', 1]})
+
+class SocketServerTest(unittest.TestCase):
+    def setUp(self):
+        self.socket_path = tempfile.mktemp(prefix='cxxd_test_', suffix='.sock')
+        self.request_received = threading.Event()
+        self.response_received = threading.Event()
+        self.handle = mock.MagicMock()
+        self.handle.put.side_effect = lambda request: self.request_received.set()
+        self.server = mock.MagicMock()
+        self.plugin = mock.MagicMock()
+        self.plugin.side_effect = lambda success, payload, args: self.response_received.set()
+        self.socket_server = SocketServer(self.socket_path, self.handle, self.server)
+        self.socket_server.start()
+        self.client = SocketClient(self.socket_path, mock.MagicMock(), mock.MagicMock(), self.plugin, mock.MagicMock())
+
+    def tearDown(self):
+        self.client.close()
+        self.socket_server.stop()
+
+    def test_if_results_are_routed_to_socket_server(self):
+        self.server.route_tagged_results.assert_called_once_with(self.socket_server.responses)
+
+    def test_if_socket_is_accessible_only_by_the_owner(self):
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0777, 0600)
+
+    def test_if_request_is_forwarded_to_the_handle_as_tagged_payload(self):
+        self.client.put([server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/a.cpp']])
+        self.assertTrue(self.request_received.wait(5))
+        request_id, service_id, payload = self.handle.put.call_args[0][0]
+        self.assertEqual(request_id, server.ServerRequestId.SEND_SERVICE)
+        self.assertEqual(service_id, server.ServiceId.CLANG_FORMAT)
+        self.assertEqual(payload, ['/tmp/a.cpp'])
+        self.assertNotEqual(service.get_payload_tag(payload), None)
+
+    def test_if_shutdown_request_coming_from_the_socket_is_ignored(self):
+        self.client.put([server.ServerRequestId.SHUTDOWN_AND_EXIT, 0x0, []])
+        self.client.put([server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/a.cpp']])
+        self.assertTrue(self.request_received.wait(5))
+        self.assertEqual(self.handle.put.call_count, 1)
+        self.assertEqual(self.handle.put.call_args[0][0][0], server.ServerRequestId.SEND_SERVICE)
+
+    def test_if_result_is_routed_back_to_the_client_who_issued_the_request(self):
+        self.client.put([server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/a.cpp']])
+        self.assertTrue(self.request_received.wait(5))
+        payload = self.handle.put.call_args[0][0][2]
+        self.socket_server.responses.put([service.ServiceRequestId.REQUEST, service.get_payload_tag(payload), server.ServiceId.CLANG_FORMAT, True, list(payload), None])
+        self.assertTrue(self.response_received.wait(5))
+        self.plugin.assert_called_once_with(True, ['/tmp/a.cpp'], None)
+
+    def test_if_partial_results_are_routed_back_to_the_client_until_the_last_one(self):
+        calls = []
+        self.plugin.side_effect = lambda success, payload, args: (calls.append(args), len(calls) == 2 and self.response_received.set())
+        self.client.put([server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp/a.cpp']])
+        self.assertTrue(self.request_received.wait(5))
+        tag = service.get_payload_tag(self.handle.put.call_args[0][0][2])
+        self.socket_server.responses.put([service.ServiceRequestId.PARTIAL_RESULT, tag, server.ServiceId.CLANG_FORMAT, True, ['/tmp/a.cpp'], {'items': ['a'], 'continuationToken': 1}])
+        self.socket_server.responses.put([service.ServiceRequestId.REQUEST, tag, server.ServiceId.CLANG_FORMAT, True, ['/tmp/a.cpp'], {'items': ['b'], 'continuationToken': None}])
+        self.assertTrue(self.response_received.wait(5))
+        self.assertEqual(calls, [{'items': ['a'], 'continuationToken': 1}, {'items': ['b'], 'continuationToken': None}])
+
+    def test_if_pending_request_is_forgotten_once_the_startup_response_is_routed_back(self):
+        self.handle.is_service_started.return_value = False
+        self.plugin.startup_callback.side_effect = lambda success, payload: self.response_received.set()
+        self.client.put([server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp']])
+        self.assertTrue(self.request_received.wait(5))
+        request_id, service_id, payload = self.handle.put.call_args[0][0]
+        self.assertEqual((request_id, service_id), (server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT))
+        self.socket_server.responses.put([service.ServiceRequestId.STARTUP, service.get_payload_tag(payload), server.ServiceId.CLANG_FORMAT, True, ['/tmp'], None])
+        self.assertTrue(self.response_received.wait(5))
+        self.plugin.startup_callback.assert_called_once_with(True, ['/tmp'])
+        self.assertEqual(self.socket_server.pending, {})
+
+    def test_if_starting_the_service_which_is_already_started_is_answered_right_away(self):
+        self.handle.is_service_started.return_value = True
+        self.plugin.startup_callback.side_effect = lambda success, payload: self.response_received.set()
+        self.client.put([server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT, ['/tmp']])
+        self.assertTrue(self.response_received.wait(5))
+        self.plugin.startup_callback.assert_called_once_with(True, ['/tmp'])
+        self.handle.put.assert_not_called()
+        self.assertEqual(self.socket_server.pending, {})
+
+if __name__ == '__main__':
+    unittest.main()
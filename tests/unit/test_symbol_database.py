@@ -1 +1,705 @@
-# TODO placeholder to not to forget to write unit tests
+import mock
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from services.source_code_model.indexer.symbol_database import SymbolDatabase
+from services.source_code_model.indexer.symbol_database import get_initials
+
+class SymbolDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.symbol_db = SymbolDatabase(':memory:')
+        self.symbol_db.create_data_model()
+
+    def tearDown(self):
+        self.symbol_db.close()
+
+    def test_if_create_data_model_can_be_run_on_already_existing_data_model(self):
+        self.symbol_db.create_data_model()
+
+    def test_if_get_all_files_returns_state_of_inserted_files(self):
+        self.symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.assertEqual(self.symbol_db.get_all_files(), {'a.cpp': (1.5, 10, 'content_hash', 'compiler_args_hash')})
+
+    def test_if_insert_file_replaces_the_existing_state(self):
+        self.symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.insert_file('a.cpp', 3.5, 20, 'content_hash2', 'compiler_args_hash', 4.5)
+        self.assertEqual(self.symbol_db.get_all_files(), {'a.cpp': (3.5, 20, 'content_hash2', 'compiler_args_hash')})
+
+    def test_if_delete_file_removes_only_the_given_file(self):
+        self.symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.insert_file('b.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.delete_file('a.cpp')
+        self.assertEqual(self.symbol_db.get_all_files().keys(), ['b.cpp'])
+
+    def test_if_insert_single_ignores_duplicates(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 1)
+
+    def test_if_rows_are_buffered_in_bulk_load_mode_until_flushed(self):
+        self.symbol_db.begin_bulk_load()
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.assertEqual(self.symbol_db.get_all().fetchall(), [])
+        self.symbol_db.flush()
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 1)
+        self.assertEqual(self.symbol_db.rows_written, 1)
+
+    def test_if_rows_are_written_in_batches_in_bulk_load_mode(self):
+        self.symbol_db.begin_bulk_load()
+        with mock.patch.object(SymbolDatabase, 'bulk_load_batch_size', 2):
+            for line in range(5):
+                self.symbol_db.insert_single('a.cpp', line, 1, 'c:@F@main#', 8, True)
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 4)
+        self.symbol_db.end_bulk_load()
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 5)
+
+    def test_if_duplicates_are_ignored_in_bulk_load_mode(self):
+        self.symbol_db.begin_bulk_load()
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.symbol_db.end_bulk_load()
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 1)
+
+    def test_if_rows_with_empty_usr_are_not_inserted_in_bulk_load_mode(self):
+        self.symbol_db.begin_bulk_load()
+        self.symbol_db.insert_single('a.cpp', 1, 1, '', 8, True)
+        self.symbol_db.end_bulk_load()
+        self.assertEqual(self.symbol_db.get_all().fetchall(), [])
+
+    def test_if_indexes_are_dropped_for_the_bulk_load_and_built_once_it_is_done(self):
+        get_indexes = lambda: [row[0] for row in self.symbol_db.db_connection.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")]
+        self.assertEqual(get_indexes(), [name for name, columns in SymbolDatabase.indexes])
+        self.symbol_db.begin_bulk_load()
+        self.assertEqual(get_indexes(), [])
+        self.symbol_db.end_bulk_load()
+        self.assertEqual(get_indexes(), [name for name, columns in SymbolDatabase.indexes])
+
+    def test_if_delete_writes_out_buffered_rows_before_deleting_in_bulk_load_mode(self):
+        self.symbol_db.begin_bulk_load()
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.symbol_db.delete('a.cpp')
+        self.symbol_db.end_bulk_load()
+        self.assertEqual(self.symbol_db.get_all().fetchall(), [])
+
+    def test_if_database_on_disk_uses_wal_journal_and_relaxes_synchronous_only_during_the_bulk_load(self):
+        fd, db_filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        symbol_db = SymbolDatabase(db_filename)
+        try:
+            symbol_db.create_data_model()
+            get_pragma = lambda name: symbol_db.db_connection.execute('PRAGMA {0}'.format(name)).fetchone()[0]
+            self.assertEqual(get_pragma('journal_mode'), 'wal')
+            self.assertEqual(get_pragma('synchronous'), 1)  # NORMAL
+            symbol_db.begin_bulk_load()
+            self.assertEqual(get_pragma('synchronous'), 0)  # OFF
+            symbol_db.end_bulk_load()
+            self.assertEqual(get_pragma('synchronous'), 1)
+        finally:
+            symbol_db.close()
+            for filename in [db_filename, db_filename + '-wal', db_filename + '-shm']:
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+    def test_if_insert_from_merges_symbols_of_all_given_databases_and_ignores_duplicates(self):
+        db_filenames = []
+        for symbols in [[('a.cpp', 1), ('a.cpp', 2)], [('b.cpp', 1), ('a.cpp', 1)]]:
+            fd, db_filename = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            db_filenames.append(db_filename)
+            symbol_db = SymbolDatabase(db_filename)
+            symbol_db.create_data_model()
+            for filename, line in symbols:
+                symbol_db.insert_single(filename, line, 1, 'c:@F@main#', 8, True)
+            symbol_db.flush()
+            symbol_db.close()
+        try:
+            with mock.patch.object(SymbolDatabase, 'max_attached', 1):
+                self.symbol_db.insert_from(db_filenames)
+        finally:
+            for db_filename in db_filenames:
+                os.remove(db_filename)
+        self.assertEqual(sorted((row[0], row[1]) for row in self.symbol_db.get_all()), [('a.cpp', 1), ('a.cpp', 2), ('b.cpp', 1)])
+        self.assertEqual(self.symbol_db.rows_written, 3)
+        self.assertEqual(self.symbol_db.db_connection.execute('PRAGMA database_list').fetchall()[1:], [])
+
+    def test_if_insert_from_skips_and_returns_databases_without_data_model(self):
+        db_filenames = []
+        for create_data_model in [False, True]:
+            fd, db_filename = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            db_filenames.append(db_filename)
+            if create_data_model:
+                symbol_db = SymbolDatabase(db_filename)
+                symbol_db.create_data_model()
+                symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+                symbol_db.flush()
+                symbol_db.close()
+        try:
+            with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+                skipped = self.symbol_db.insert_from(db_filenames)
+        finally:
+            for db_filename in db_filenames:
+                os.remove(db_filename)
+        self.assertEqual(skipped, db_filenames[0:1])
+        self.assertEqual([(row[0], row[1]) for row in self.symbol_db.get_all()], [('a.cpp', 1)])
+
+    def test_if_has_data_model_tells_whether_the_tables_have_been_created(self):
+        self.assertTrue(self.symbol_db.has_data_model())
+        self.assertFalse(SymbolDatabase(':memory:').has_data_model())
+
+    def test_if_insert_from_writes_out_rows_buffered_in_bulk_load_mode_first(self):
+        self.symbol_db.begin_bulk_load()
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.symbol_db.insert_from([])
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 1)
+
+    def query_plan(self, query, args):
+        return ' '.join(row[-1] for row in self.symbol_db.db_connection.execute('EXPLAIN QUERY PLAN ' + query, args))
+
+    def test_if_lookup_by_usr_is_served_from_covering_index(self):
+        plan = self.query_plan(SymbolDatabase.symbol_select + ' WHERE usrs.usr=?', ('c:@F@main#',))
+        self.assertTrue('SEARCH symbol USING COVERING INDEX symbol_usr_definition (usr_id=?)' in plan)
+        self.assertFalse('SCAN' in plan)
+
+    def test_if_lookup_of_definition_is_served_from_covering_index(self):
+        plan = self.query_plan(SymbolDatabase.symbol_select + ' WHERE usrs.usr=? AND symbol.is_definition=1', ('c:@F@main#',))
+        self.assertTrue('SEARCH symbol USING COVERING INDEX symbol_usr_definition (usr_id=? AND is_definition=?)' in plan)
+        self.assertFalse('SCAN' in plan)
+
+    def test_if_deleting_symbols_of_a_file_does_not_scan_the_whole_table(self):
+        plan = self.query_plan('DELETE FROM symbol WHERE file_id=(SELECT id FROM files WHERE path=?)', ('a.cpp',))
+        self.assertTrue('SEARCH symbol USING PRIMARY KEY (file_id=?)' in plan)
+        self.assertFalse('SCAN' in plan)
+
+    def test_if_incoming_calls_are_served_from_primary_key(self):
+        plan = self.query_plan(SymbolDatabase.calls_select.format('caller', 'callee'), ('c:@F@main#',))
+        self.assertTrue('SEARCH calls USING PRIMARY KEY (callee_usr_id=?)' in plan, plan)
+        self.assertFalse('SCAN' in plan)
+
+    def test_if_outgoing_calls_are_served_from_covering_index(self):
+        plan = self.query_plan(SymbolDatabase.calls_select.format('callee', 'caller'), ('c:@F@main#',))
+        self.assertTrue('SEARCH calls USING COVERING INDEX calls_caller (caller_usr_id=?)' in plan, plan)
+        self.assertFalse('SCAN' in plan)
+
+    def test_if_deleting_calls_of_a_file_does_not_scan_the_whole_table(self):
+        plan = self.query_plan('DELETE FROM calls WHERE file_id=(SELECT id FROM files WHERE path=?)', ('a.cpp',))
+        self.assertTrue('USING COVERING INDEX calls_file (file_id=?)' in plan, plan)
+        self.assertFalse('SCAN' in plan)
+
+    def test_if_derived_classes_are_served_from_primary_key_at_each_level_of_hierarchy(self):
+        plan = self.query_plan(SymbolDatabase.hierarchy_transitive.format('derived', 'base') + SymbolDatabase.bases_select.format('derived', 'base'), ('c:@S@Foo',))
+        self.assertTrue('SEARCH bases USING PRIMARY KEY (base_usr_id=?)' in plan, plan)
+        self.assertFalse('SCAN bases' in plan)
+
+    def test_if_base_classes_are_served_from_index_at_each_level_of_hierarchy(self):
+        plan = self.query_plan(SymbolDatabase.hierarchy_transitive.format('base', 'derived') + SymbolDatabase.bases_select.format('base', 'derived'), ('c:@S@Foo',))
+        self.assertTrue('SEARCH bases USING COVERING INDEX bases_derived (derived_usr_id=?)' in plan, plan)
+        self.assertFalse('SCAN bases' in plan)
+
+    def insert_bases(self, symbol_db, filename, bases):
+        for derived, base, line in bases:
+            symbol_db.insert_single(filename, line, 7, 'c:@S@{0}'.format(derived), 4, True, derived, derived)
+            symbol_db.insert_single(filename, line, 20, 'c:@S@{0}'.format(base), 4, False, base, base)
+            symbol_db.insert_base(filename, line, 20, 'c:@S@{0}'.format(derived), 'c:@S@{0}'.format(base), 1, derived == 'Left')
+
+    def test_if_derived_classes_are_found_through_the_whole_hierarchy_only_once(self):
+        # Diamond: Bottom derives from Left and Right, both of which derive from Top
+        self.insert_bases(self.symbol_db, 'a.h', [('Left', 'Top', 3), ('Right', 'Top', 4), ('Bottom', 'Left', 5), ('Bottom', 'Right', 6), ('Other', 'Base', 7)])
+        self.assertEqual(
+            sorted(tuple(row) for row in self.symbol_db.get_derived_classes('c:@S@Top')),
+            [(u'Bottom', u'Bottom', u'c:@S@Bottom', u'c:@S@Left', u'a.h', 5, 20, 1, 0), (u'Bottom', u'Bottom', u'c:@S@Bottom', u'c:@S@Right', u'a.h', 6, 20, 1, 0),
+             (u'Left', u'Left', u'c:@S@Left', u'c:@S@Top', u'a.h', 3, 20, 1, 1), (u'Right', u'Right', u'c:@S@Right', u'c:@S@Top', u'a.h', 4, 20, 1, 0)]
+        )
+        self.assertEqual(sorted(row[0] for row in self.symbol_db.get_derived_classes('c:@S@Top', False)), [u'Left', u'Right'])
+        self.assertEqual(self.symbol_db.get_derived_classes('c:@S@Bottom').fetchall(), [])
+
+    def test_if_base_classes_are_found_through_the_whole_hierarchy(self):
+        self.insert_bases(self.symbol_db, 'a.h', [('Left', 'Top', 3), ('Right', 'Top', 4), ('Bottom', 'Left', 5), ('Bottom', 'Right', 6)])
+        self.assertEqual(
+            sorted((row[0], row[3]) for row in self.symbol_db.get_base_classes('c:@S@Bottom')),
+            [(u'Left', u'c:@S@Bottom'), (u'Right', u'c:@S@Bottom'), (u'Top', u'c:@S@Left'), (u'Top', u'c:@S@Right')]
+        )
+        self.assertEqual(sorted(row[0] for row in self.symbol_db.get_base_classes('c:@S@Bottom', False)), [u'Left', u'Right'])
+
+    def test_if_delete_removes_bases_found_in_the_file(self):
+        self.insert_bases(self.symbol_db, 'a.h', [('Left', 'Top', 3)])
+        self.insert_bases(self.symbol_db, 'b.h', [('Right', 'Top', 4)])
+        self.symbol_db.delete('a.h')
+        self.assertEqual([row[0] for row in self.symbol_db.get_derived_classes('c:@S@Top')], [u'Right'])
+        self.symbol_db.delete_all_symbols()
+        self.assertEqual(self.symbol_db.get_derived_classes('c:@S@Top').fetchall(), [])
+
+    def test_if_insert_from_merges_bases(self):
+        fd, db_filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        symbol_db = SymbolDatabase(db_filename)
+        symbol_db.create_data_model()
+        self.insert_bases(symbol_db, 'b.h', [('Bottom', 'Left', 5)])
+        symbol_db.flush()
+        symbol_db.close()
+        self.insert_bases(self.symbol_db, 'a.h', [('Left', 'Top', 3)]) # Different file and USR ids than in the other one
+        try:
+            self.symbol_db.insert_from([db_filename])
+        finally:
+            os.remove(db_filename)
+        self.assertEqual(
+            [(row[0], row[3], row[4]) for row in self.symbol_db.get_derived_classes('c:@S@Top')],
+            [(u'Left', u'c:@S@Top', u'a.h'), (u'Bottom', u'c:@S@Left', u'b.h')]
+        )
+
+    def test_if_includers_are_served_from_primary_key_at_each_level_of_inclusion(self):
+        plan = self.query_plan(SymbolDatabase.inclusion_transitive + SymbolDatabase.includers_select, ('a.h',))
+        self.assertTrue('SEARCH includes USING PRIMARY KEY (included_file_id=?)' in plan, plan)
+        self.assertFalse('SCAN includes' in plan)
+
+    def test_if_deleting_includes_of_a_file_does_not_scan_the_whole_table(self):
+        plan = self.query_plan('DELETE FROM includes WHERE includer_file_id=(SELECT id FROM files WHERE path=?)', ('a.cpp',))
+        self.assertTrue('USING COVERING INDEX includes_includer (includer_file_id=?)' in plan, plan)
+        self.assertFalse('SCAN' in plan)
+
+    def insert_includes(self, symbol_db, includes):
+        for includer, included, line in includes:
+            symbol_db.insert_include(includer, included, line)
+
+    def test_if_get_included_files_returns_each_of_the_included_files_only_once(self):
+        self.insert_includes(self.symbol_db, [('a.h', 'common.h', 1), ('b.h', 'common.h', 2), ('main.cpp', 'a.h', 1), ('main.cpp', 'b.h', 2)])
+        self.assertEqual(sorted(self.symbol_db.get_included_files()), ['a.h', 'b.h', 'common.h'])
+
+    def test_if_includers_are_found_through_the_whole_inclusion_graph_only_once(self):
+        # Both of the headers including the common one are included by main.cpp
+        self.insert_includes(self.symbol_db, [('a.h', 'common.h', 1), ('b.h', 'common.h', 2), ('main.cpp', 'a.h', 1), ('main.cpp', 'b.h', 2), ('other.cpp', 'other.h', 1)])
+        self.assertEqual(
+            sorted(tuple(row) for row in self.symbol_db.get_includers('common.h')),
+            [(u'a.h', 1, u'common.h'), (u'b.h', 2, u'common.h'), (u'main.cpp', 1, u'a.h'), (u'main.cpp', 2, u'b.h')]
+        )
+        self.assertEqual(sorted(tuple(row) for row in self.symbol_db.get_includers('common.h', False)), [(u'a.h', 1, u'common.h'), (u'b.h', 2, u'common.h')])
+        self.assertEqual(self.symbol_db.get_includers('main.cpp').fetchall(), [])
+        self.assertEqual(self.symbol_db.get_includers('unknown.h').fetchall(), [])
+
+    def test_if_delete_removes_includes_found_in_the_file(self):
+        self.insert_includes(self.symbol_db, [('a.cpp', 'a.h', 1), ('b.cpp', 'a.h', 1)])
+        self.symbol_db.delete('a.cpp')
+        self.assertEqual([row[0] for row in self.symbol_db.get_includers('a.h')], [u'b.cpp'])
+        self.symbol_db.delete_all_symbols()
+        self.assertEqual(self.symbol_db.get_includers('a.h').fetchall(), [])
+
+    def test_if_delete_file_removes_includes_of_the_file(self):
+        self.insert_includes(self.symbol_db, [('a.cpp', 'a.h', 1), ('a.cpp', 'b.h', 2)])
+        self.symbol_db.delete_file('a.h')
+        self.assertEqual(self.symbol_db.db_connection.execute('SELECT COUNT(*) FROM includes').fetchone()[0], 1)
+
+    def test_if_header_can_be_claimed_only_once(self):
+        self.assertEqual(self.symbol_db.claim_headers(['a.h', 'b.h']), ['a.h', 'b.h'])
+        self.assertEqual(self.symbol_db.claim_headers(['b.h', 'c.h']), ['c.h'])
+
+    def test_if_claims_are_shared_by_all_connections_to_the_database(self):
+        fd, db_filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            symbol_db, other_symbol_db = SymbolDatabase(db_filename), SymbolDatabase(db_filename)
+            symbol_db.create_data_model()
+            self.assertEqual(symbol_db.claim_headers(['a.h']), ['a.h'])
+            self.assertEqual(other_symbol_db.claim_headers(['a.h', 'b.h']), ['b.h'])
+            symbol_db.close()
+            other_symbol_db.close()
+        finally:
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(db_filename + suffix):
+                    os.remove(db_filename + suffix)
+
+    def test_if_header_claimed_by_the_declaration_pass_can_be_claimed_once_again_by_the_full_one(self):
+        self.assertEqual(self.symbol_db.claim_headers(['a.h', 'b.h'], True), ['a.h', 'b.h'])
+        self.assertEqual(self.symbol_db.claim_headers(['a.h'], True), [])
+        self.assertEqual(self.symbol_db.claim_headers(['a.h']), ['a.h'])
+        self.assertEqual(self.symbol_db.claim_headers(['a.h', 'b.h']), ['b.h'])
+        self.assertEqual(self.symbol_db.claim_headers(['a.h'], True), [])
+
+    def test_if_claims_are_retried_while_the_database_is_locked(self):
+        self.symbol_db.db_connection = mock.MagicMock(wraps=self.symbol_db.db_connection)
+        self.symbol_db.db_connection.commit.side_effect = [sqlite3.OperationalError('database is locked'), None]
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging') as mock_logging:
+            self.assertEqual(self.symbol_db.claim_headers(['a.h']), ['a.h'])
+        mock_logging.warning.assert_called_once()
+        self.assertEqual(self.symbol_db.get_claimed_headers(), ['a.h'])
+
+    def test_if_headers_are_left_unclaimed_if_the_database_stays_locked(self):
+        self.symbol_db.db_connection = mock.MagicMock(wraps=self.symbol_db.db_connection)
+        self.symbol_db.db_connection.commit.side_effect = sqlite3.OperationalError('database is locked')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging') as mock_logging:
+            self.assertEqual(self.symbol_db.claim_headers(['a.h', 'b.h']), [])
+        self.assertEqual(mock_logging.warning.call_count, SymbolDatabase.claim_attempts)
+        self.assertEqual(self.symbol_db.get_claimed_headers(), [])
+
+    def test_if_claimed_headers_are_returned_for_the_file_they_have_been_claimed_by(self):
+        self.symbol_db.claim_headers(['a.h', 'b.h'], True, 'a.cpp')
+        self.symbol_db.claim_headers(['b.h', 'c.h'], False, 'b.cpp')
+        self.assertEqual(sorted(self.symbol_db.get_claimed_headers()), ['a.h', 'b.h', 'c.h'])
+        self.assertEqual(self.symbol_db.get_claimed_headers('a.cpp'), ['a.h'])
+        self.assertEqual(sorted(self.symbol_db.get_claimed_headers('b.cpp')), ['b.h', 'c.h'])
+
+    def test_if_get_declarations_only_files_returns_the_files_and_the_headers_indexed_by_the_declaration_pass_only(self):
+        self.symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5, True)
+        self.symbol_db.insert_file('b.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.claim_headers(['a.h', 'b.h'], True)
+        self.symbol_db.claim_headers(['b.h', 'c.h'])
+        self.assertEqual(sorted(self.symbol_db.get_declarations_only_files()), ['a.cpp', 'a.h'])
+        self.symbol_db.insert_file('a.cpp', 3.5, 10, 'content_hash', 'compiler_args_hash', 4.5)
+        self.assertEqual(self.symbol_db.get_declarations_only_files(), ['a.h'])
+
+    def test_if_delete_releases_the_claim_of_the_header(self):
+        self.symbol_db.claim_headers(['a.h', 'b.h'])
+        self.symbol_db.delete('a.h')
+        self.assertEqual(self.symbol_db.claim_headers(['a.h', 'b.h']), ['a.h'])
+        self.symbol_db.delete_all_symbols()
+        self.assertEqual(self.symbol_db.claim_headers(['a.h', 'b.h']), ['a.h', 'b.h'])
+
+    def test_if_outdated_file_is_treated_as_not_indexed_until_its_state_is_recorded_again(self):
+        self.symbol_db.insert_file('a.h', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.outdate_file('a.h')
+        self.assertEqual(self.symbol_db.get_all_files(), {})
+        self.symbol_db.insert_file('a.h', 3.5, 10, 'content_hash', 'compiler_args_hash', 4.5)
+        self.assertEqual(self.symbol_db.get_all_files(), {'a.h': (3.5, 10, 'content_hash', 'compiler_args_hash')})
+
+    def test_if_insert_from_merges_includes(self):
+        fd, db_filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        symbol_db = SymbolDatabase(db_filename)
+        symbol_db.create_data_model()
+        self.insert_includes(symbol_db, [('b.cpp', 'b.h', 3)])
+        symbol_db.flush()
+        symbol_db.close()
+        self.insert_includes(self.symbol_db, [('b.h', 'common.h', 1)]) # Different file ids than in the other one
+        try:
+            self.symbol_db.insert_from([db_filename])
+        finally:
+            os.remove(db_filename)
+        self.assertEqual([tuple(row) for row in self.symbol_db.get_includers('common.h')], [(u'b.h', 1, u'common.h'), (u'b.cpp', 3, u'b.h')])
+
+    def insert_calls(self, symbol_db, filename, calls):
+        for caller, callee, line in calls:
+            symbol_db.insert_single(filename, 1, 5, 'c:@F@{0}#'.format(caller), 8, True, caller, caller)
+            symbol_db.insert_single(filename, line, 5, 'c:@F@{0}#'.format(callee), 8, False, callee, callee)
+            symbol_db.insert_call(filename, line, 5, 'c:@F@{0}#'.format(caller), 'c:@F@{0}#'.format(callee))
+
+    def test_if_incoming_calls_return_callers_with_call_sites(self):
+        self.insert_calls(self.symbol_db, 'a.cpp', [('main', 'foo', 3), ('main', 'foo', 4), ('bar', 'foo', 9), ('main', 'bar', 5)])
+        self.assertEqual(
+            sorted(tuple(row) for row in self.symbol_db.get_incoming_calls('c:@F@foo#')),
+            [(u'bar', u'bar', u'c:@F@bar#', u'a.cpp', 9, 5), (u'main', u'main', u'c:@F@main#', u'a.cpp', 3, 5), (u'main', u'main', u'c:@F@main#', u'a.cpp', 4, 5)]
+        )
+        self.assertEqual(self.symbol_db.get_incoming_calls('c:@F@main#').fetchall(), [])
+
+    def test_if_outgoing_calls_return_callees_with_call_sites(self):
+        self.insert_calls(self.symbol_db, 'a.cpp', [('main', 'foo', 3), ('main', 'bar', 5), ('bar', 'foo', 9)])
+        self.assertEqual(
+            sorted(tuple(row) for row in self.symbol_db.get_outgoing_calls('c:@F@main#')),
+            [(u'bar', u'bar', u'c:@F@bar#', u'a.cpp', 5, 5), (u'foo', u'foo', u'c:@F@foo#', u'a.cpp', 3, 5)]
+        )
+
+    def test_if_delete_removes_calls_found_in_the_file(self):
+        self.insert_calls(self.symbol_db, 'a.cpp', [('main', 'foo', 3)])
+        self.insert_calls(self.symbol_db, 'b.cpp', [('bar', 'foo', 9)])
+        self.symbol_db.delete('a.cpp')
+        self.assertEqual([row[0] for row in self.symbol_db.get_incoming_calls('c:@F@foo#')], [u'bar'])
+        self.symbol_db.delete_all_symbols()
+        self.assertEqual(self.symbol_db.get_incoming_calls('c:@F@foo#').fetchall(), [])
+
+    def test_if_insert_from_merges_calls(self):
+        fd, db_filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        symbol_db = SymbolDatabase(db_filename)
+        symbol_db.create_data_model()
+        self.insert_calls(symbol_db, 'b.cpp', [('bar', 'foo', 9)])
+        symbol_db.flush()
+        symbol_db.close()
+        self.insert_calls(self.symbol_db, 'a.cpp', [('main', 'bar', 3)]) # Different file and USR ids than in the other one
+        try:
+            self.symbol_db.insert_from([db_filename])
+        finally:
+            os.remove(db_filename)
+        self.assertEqual([tuple(row) for row in self.symbol_db.get_incoming_calls('c:@F@foo#')], [(u'bar', u'bar', u'c:@F@bar#', u'b.cpp', 9, 5)])
+
+    def test_if_data_model_0_4_is_migrated_and_all_files_are_scheduled_for_reindexing(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.create_data_model()
+        symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@foo#', 8, True, 'foo', 'foo')
+        symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        symbol_db.db_connection.executescript('DROP TABLE calls; DELETE FROM version; INSERT INTO version VALUES (0, 4);')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all_files(), {})
+        self.assertEqual(symbol_db.get_outgoing_calls('c:@F@foo#').fetchall(), [])
+        symbol_db.close()
+
+    def test_if_data_model_0_5_is_migrated_and_all_files_are_scheduled_for_reindexing(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.create_data_model()
+        symbol_db.insert_file('a.h', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        symbol_db.db_connection.executescript('DROP TABLE bases; DELETE FROM version; INSERT INTO version VALUES (0, 5);')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all_files(), {})
+        self.assertEqual(symbol_db.get_derived_classes('c:@S@Foo').fetchall(), [])
+        symbol_db.close()
+
+    def test_if_data_model_0_6_is_migrated_and_all_files_are_scheduled_for_reindexing(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.create_data_model()
+        symbol_db.insert_file('a.h', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        symbol_db.db_connection.executescript('DROP TABLE includes; DELETE FROM version; INSERT INTO version VALUES (0, 6);')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all_files(), {})
+        self.assertEqual(symbol_db.get_includers('a.h').fetchall(), [])
+        symbol_db.close()
+
+    def test_if_data_model_0_7_is_migrated_and_all_files_are_scheduled_for_reindexing(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.create_data_model()
+        symbol_db.insert_file('a.h', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        symbol_db.db_connection.executescript('DROP TABLE indexed_headers; DELETE FROM version; INSERT INTO version VALUES (0, 7);')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all_files(), {})
+        self.assertEqual(symbol_db.claim_headers(['a.h']), ['a.h'])
+        symbol_db.close()
+
+    def test_if_data_model_0_8_is_migrated_and_whatever_has_been_indexed_is_kept_as_complete(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.db_connection.executescript(
+            'CREATE TABLE files (id integer, path text, mtime real, size integer, content_hash text, compiler_args_hash text, indexed_at real, PRIMARY KEY(id));'
+            'CREATE TABLE indexed_headers (path text, PRIMARY KEY(path)) WITHOUT ROWID;'
+            "INSERT INTO files VALUES (1, 'a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5);"
+            "INSERT INTO indexed_headers VALUES ('a.h');"
+            'CREATE TABLE version (major integer, minor integer); INSERT INTO version VALUES (0, 8);'
+        )
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all_files(), {'a.cpp': (1.5, 10, 'content_hash', 'compiler_args_hash')})
+        self.assertEqual(symbol_db.get_declarations_only_files(), [])
+        self.assertEqual(symbol_db.claim_headers(['a.h']), [])
+        symbol_db.close()
+
+    def test_if_data_model_0_9_is_migrated_and_existing_claims_are_kept(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.db_connection.executescript(
+            'CREATE TABLE indexed_headers (path text, declarations_only boolean DEFAULT 0, PRIMARY KEY(path)) WITHOUT ROWID;'
+            "INSERT INTO indexed_headers VALUES ('a.h', 0);"
+            'CREATE TABLE version (major integer, minor integer); INSERT INTO version VALUES (0, 9);'
+        )
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_claimed_headers(), ['a.h'])
+        self.assertEqual(symbol_db.claim_headers(['a.h', 'b.h'], False, 'b.cpp'), ['b.h'])
+        self.assertEqual(symbol_db.get_claimed_headers('b.cpp'), ['b.h'])
+        symbol_db.close()
+
+    def test_if_obsolete_indexes_are_dropped(self):
+        self.symbol_db.db_connection.execute('CREATE INDEX symbol_usr ON symbol(usr_id)')
+        self.symbol_db.create_data_model()
+        self.assertEqual(self.symbol_db.db_connection.execute("SELECT name FROM sqlite_master WHERE name='symbol_usr'").fetchall(), [])
+
+    def test_if_filenames_and_usrs_are_stored_only_once(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.symbol_db.insert_single('a.cpp', 5, 3, 'c:@F@foo#', 8, False, 'foo')
+        self.symbol_db.insert_single('b.cpp', 7, 3, 'c:@F@foo#', 8, False, 'foo')
+        self.symbol_db.flush()
+        self.assertEqual(self.symbol_db.db_connection.execute('SELECT COUNT(*) FROM files').fetchone()[0], 2)
+        self.assertEqual(self.symbol_db.db_connection.execute('SELECT usr, name, kind FROM usrs').fetchall(), [(u'c:@F@foo#', u'foo', 8)])
+        self.assertEqual(len(self.symbol_db.get_all().fetchall()), 3)
+
+    def test_if_rows_are_returned_with_filename_and_usr_resolved(self):
+        self.symbol_db.insert_single('a.cpp', 5, 3, 'c:@F@foo#', 8, True, 'foo')
+        row = self.symbol_db.get_by_usr('c:@F@foo#').fetchone()
+        self.assertEqual(self.symbol_db.get_filename(row), 'a.cpp')
+        self.assertEqual(self.symbol_db.get_line(row), 5)
+        self.assertEqual(self.symbol_db.get_column(row), 3)
+        self.assertEqual(self.symbol_db.get_usr(row), 'c:@F@foo#')
+        self.assertEqual(self.symbol_db.get_kind(row), 8)
+        self.assertEqual(self.symbol_db.get_is_definition(row), True)
+        self.assertEqual(self.symbol_db.get_name(row), 'foo')
+
+    def test_if_get_definition_returns_only_definitions(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, False, 'foo')
+        self.symbol_db.insert_single('b.cpp', 2, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.assertEqual([self.symbol_db.get_filename(row) for row in self.symbol_db.get_definition('c:@F@foo#')], ['b.cpp'])
+
+    def test_if_delete_removes_only_symbols_of_given_file(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.symbol_db.insert_single('b.cpp', 2, 1, 'c:@F@foo#', 8, False, 'foo')
+        self.symbol_db.delete('a.cpp')
+        self.assertEqual([self.symbol_db.get_filename(row) for row in self.symbol_db.get_all()], ['b.cpp'])
+
+    def test_if_insert_file_keeps_the_file_id_symbols_refer_to(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.insert_file('a.cpp', 3.5, 10, 'content_hash', 'compiler_args_hash', 4.5)
+        self.assertEqual([self.symbol_db.get_filename(row) for row in self.symbol_db.get_all()], ['a.cpp'])
+
+    def test_if_files_without_recorded_state_are_not_reported_as_indexed(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.assertEqual(self.symbol_db.get_all_files(), {})
+
+    def test_if_file_can_be_inserted_again_once_deleted(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.symbol_db.delete('a.cpp')
+        self.symbol_db.delete_file('a.cpp')
+        self.symbol_db.insert_single('a.cpp', 2, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.assertEqual([(self.symbol_db.get_filename(row), self.symbol_db.get_line(row)) for row in self.symbol_db.get_all()], [('a.cpp', 2)])
+
+    def test_if_delete_all_symbols_keeps_files_and_usrs(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.symbol_db.delete_all_symbols()
+        self.symbol_db.insert_single('a.cpp', 2, 1, 'c:@F@foo#', 8, True, 'foo')
+        self.assertEqual([self.symbol_db.get_line(row) for row in self.symbol_db.get_all()], [2])
+        self.assertEqual(self.symbol_db.db_connection.execute('SELECT COUNT(*) FROM usrs').fetchone()[0], 1)
+
+    def test_if_version_of_newly_created_data_model_is_the_current_one(self):
+        self.assertEqual(self.symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+
+    def test_if_data_model_0_1_is_migrated(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.db_connection.executescript('''
+            CREATE TABLE symbol (filename text, line integer, column integer, usr text, context text, kind integer, is_definition boolean, PRIMARY KEY(filename, usr, line));
+            CREATE TABLE files (filename text, mtime real, size integer, content_hash text, compiler_args_hash text, indexed_at real, PRIMARY KEY(filename));
+            CREATE TABLE version (major integer, minor integer, PRIMARY KEY(major, minor));
+            INSERT INTO version VALUES (0, 1);
+            INSERT INTO symbol VALUES ('a.cpp', 1, 5, 'c:@F@foo#', 'int foo() {', 8, 1);
+            INSERT INTO symbol VALUES ('b.cpp', 3, 7, 'c:@F@foo#', '    foo();', 8, 0);
+            INSERT INTO files VALUES ('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5);
+        ''')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all().fetchall(), []) # Qualified names are only to be found by re-indexing
+        self.assertEqual(symbol_db.get_all_files(), {})
+        self.assertEqual(
+            sorted(row[0] for row in symbol_db.db_connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'usrs_search%'")),
+            ['bases', 'calls', 'files', 'includes', 'indexed_headers', 'symbol', 'usrs', 'version']
+        )
+        symbol_db.close()
+
+    def test_if_data_model_0_2_is_migrated(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.db_connection.executescript('''
+            CREATE TABLE files (id integer, path text UNIQUE, mtime real, size integer, content_hash text, compiler_args_hash text, indexed_at real, PRIMARY KEY(id));
+            CREATE TABLE usrs (id integer, usr text UNIQUE, name text, kind integer, PRIMARY KEY(id));
+            CREATE TABLE symbol (file_id integer, line integer, column integer, usr_id integer, context_offset integer, is_definition boolean, PRIMARY KEY(file_id, usr_id, line)) WITHOUT ROWID;
+            CREATE INDEX symbol_usr_definition ON symbol(usr_id, is_definition, column, context_offset);
+            CREATE TABLE version (major integer, minor integer, PRIMARY KEY(major, minor));
+            INSERT INTO version VALUES (0, 2);
+            INSERT INTO files VALUES (1, 'a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5);
+            INSERT INTO usrs VALUES (1, 'c:@F@foo#', 'foo', 8);
+            INSERT INTO symbol VALUES (1, 1, 5, 1, 0, 1);
+        ''')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all().fetchall(), [])
+        self.assertEqual(symbol_db.get_all_files(), {})
+        self.assertEqual(
+            symbol_db.db_connection.execute("SELECT sql FROM sqlite_master WHERE name='symbol_usr_definition'").fetchone()[0],
+            'CREATE INDEX symbol_usr_definition ON ' + dict(SymbolDatabase.indexes)['symbol_usr_definition']
+        )
+        symbol_db.close()
+
+    def test_if_data_model_0_3_is_migrated_and_all_files_are_scheduled_for_reindexing(self):
+        symbol_db = SymbolDatabase(':memory:')
+        symbol_db.db_connection.executescript('''
+            CREATE TABLE files (id integer, path text UNIQUE, mtime real, size integer, content_hash text, compiler_args_hash text, indexed_at real, PRIMARY KEY(id));
+            CREATE TABLE usrs (id integer, usr text UNIQUE, name text, kind integer, PRIMARY KEY(id));
+            CREATE TABLE symbol (file_id integer, line integer, column integer, usr_id integer, is_definition boolean, PRIMARY KEY(file_id, usr_id, line)) WITHOUT ROWID;
+            CREATE TABLE version (major integer, minor integer, PRIMARY KEY(major, minor));
+            INSERT INTO version VALUES (0, 3);
+            INSERT INTO files VALUES (1, 'a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5);
+            INSERT INTO usrs VALUES (1, 'c:@F@foo#', 'foo', 8);
+            INSERT INTO symbol VALUES (1, 1, 5, 1, 1);
+        ''')
+        with mock.patch('services.source_code_model.indexer.symbol_database.logging'):
+            symbol_db.create_data_model()
+        self.assertEqual(symbol_db.get_version(), (SymbolDatabase.VERSION_MAJOR, SymbolDatabase.VERSION_MINOR))
+        self.assertEqual(symbol_db.get_all().fetchall(), [])
+        self.assertEqual(symbol_db.get_all_files(), {})
+        symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@foo#', 8, True, 'foo', 'foo')
+        self.assertEqual(symbol_db.find_symbols('foo', 10), [('foo', 'foo', 8, 'a.cpp', 1, 5)])
+        symbol_db.close()
+
+    def test_if_find_symbols_returns_symbols_by_prefix_initials_and_substring(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:@N@ns@F@getFooBar#', 8, True, 'getFooBar', 'ns::getFooBar')
+        self.symbol_db.insert_single('a.cpp', 2, 5, 'c:@N@ns@F@get_foo_baz#', 8, True, 'get_foo_baz', 'ns::get_foo_baz')
+        self.symbol_db.insert_single('a.cpp', 3, 5, 'c:@N@ns@F@resetFoo#', 8, True, 'resetFoo', 'ns::resetFoo')
+        self.symbol_db.insert_single('a.cpp', 4, 5, 'c:@N@ns@F@bar#', 8, True, 'bar', 'ns::bar')
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('get', 10)], ['getFooBar', 'get_foo_baz'])
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('gfb', 10)], ['getFooBar', 'get_foo_baz'])
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('foo', 10)], ['resetFoo', 'getFooBar', 'get_foo_baz'])
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('ns::b', 10)], ['bar'])
+
+    def test_if_find_symbols_ranks_exact_match_then_prefix_then_initials_then_substring(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@prefixFoo#', 8, True, 'fooBar', 'fooBar')
+        self.symbol_db.insert_single('a.cpp', 2, 5, 'c:@F@foobar#', 8, True, 'foobar', 'foobar')
+        self.symbol_db.insert_single('a.cpp', 3, 5, 'c:@F@findOrOpenBuffer#', 8, True, 'findOrOpenBuffer', 'findOrOpenBuffer')
+        self.symbol_db.insert_single('a.cpp', 4, 5, 'c:@F@myFoobar#', 8, True, 'myFoobar', 'myFoobar')
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('foob', 10)], ['fooBar', 'foobar', 'findOrOpenBuffer', 'myFoobar'])
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('foob', 2)], ['fooBar', 'foobar'])
+
+    def test_if_find_symbols_skips_symbols_without_qualified_name(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:a.cpp@10@F@main#@counter', 9, True, 'counter', None)
+        self.assertEqual(self.symbol_db.find_symbols('counter', 10), [])
+        self.assertEqual(self.symbol_db.find_symbols('cou', 10), [])
+
+    def test_if_find_symbols_returns_location_of_definition_if_there_is_one(self):
+        self.symbol_db.insert_single('a.h', 1, 5, 'c:@F@foo#', 8, False, 'foo', 'foo')
+        self.symbol_db.insert_single('a.cpp', 7, 5, 'c:@F@foo#', 8, True, 'foo', 'foo')
+        self.assertEqual(self.symbol_db.find_symbols('foo', 10), [('foo', 'foo', 8, 'a.cpp', 7, 5)])
+
+    def test_if_find_symbols_skips_symbols_which_are_not_found_in_any_of_the_files_anymore(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@foo#', 8, True, 'foo', 'foo')
+        self.symbol_db.delete('a.cpp')
+        self.assertEqual(self.symbol_db.find_symbols('foo', 10), [])
+
+    def test_if_find_symbols_treats_like_wildcards_literally(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@foo#', 8, True, 'foo', 'foo')
+        self.assertEqual(self.symbol_db.find_symbols('%', 10), [])
+        self.assertEqual(self.symbol_db.find_symbols('f_o', 10), [])
+
+    def test_if_search_index_follows_deleted_usrs(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@resetFoo#', 8, True, 'resetFoo', 'resetFoo')
+        self.symbol_db.delete_all()
+        self.assertEqual(self.symbol_db.db_connection.execute("SELECT COUNT(*) FROM usrs_search WHERE usrs_search MATCH 'Foo'").fetchone()[0], 0)
+        self.symbol_db.db_connection.execute("INSERT INTO usrs_search (usrs_search) VALUES ('integrity-check')")
+
+    def test_if_find_symbols_falls_back_to_scanning_when_there_is_no_search_index(self):
+        self.symbol_db.insert_single('a.cpp', 1, 5, 'c:@F@resetFoo#', 8, True, 'resetFoo', 'resetFoo')
+        self.symbol_db.db_connection.execute('DROP TABLE usrs_search')
+        self.assertEqual([symbol[0] for symbol in self.symbol_db.find_symbols('Foo', 10)], ['resetFoo'])
+
+    def test_if_name_and_initials_lookups_are_served_from_the_index(self):
+        for column in ['name', 'initials']:
+            plan = ' '.join(row[3] for row in self.symbol_db.db_connection.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM usrs WHERE {0} >= ? COLLATE NOCASE AND {0} < ? COLLATE NOCASE'.format(column), ('foo', 'fop',))
+            )
+            self.assertTrue(plan.startswith('SEARCH') and 'INDEX usrs_' + column in plan, plan)
+
+    def test_if_get_initials_splits_camel_case_and_snake_case_names(self):
+        self.assertEqual(get_initials('getFooBar'), 'gfb')
+        self.assertEqual(get_initials('get_foo_bar'), 'gfb')
+        self.assertEqual(get_initials('HTTPServer'), 'hs')
+        self.assertEqual(get_initials('Vector3d'), 'v3d')
+
+    def test_if_delete_all_removes_symbols_and_files(self):
+        self.symbol_db.insert_single('a.cpp', 1, 1, 'c:@F@main#', 8, True)
+        self.symbol_db.insert_file('a.cpp', 1.5, 10, 'content_hash', 'compiler_args_hash', 2.5)
+        self.symbol_db.delete_all()
+        self.assertEqual(self.symbol_db.get_all().fetchall(), [])
+        self.assertEqual(self.symbol_db.get_all_files(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import mock
+import os
+import unittest
+
+import server
+import service
+from transport import SharedMemorySegment
+from transport import Transport
+
+class TransportTest(unittest.TestCase):
+    def setUp(self):
+        self.transport = Transport()
+
+    def tearDown(self):
+        os.close(self.transport.reader)
+        os.close(self.transport.writer)
+
+    def test_if_get_returns_what_has_been_put(self):
+        payload = [0x2, ['/tmp/a.cpp', '/tmp/a.cpp', 10, 15]]
+        self.transport.put(payload)
+        self.assertEqual(self.transport.get(), payload)
+
+    def test_if_frames_are_received_in_order(self):
+        for i in range(100):
+            self.transport.put([i])
+        for i in range(100):
+            self.assertEqual(self.transport.get(), [i])
+
+    def test_if_small_payload_is_sent_inline(self):
+        with mock.patch('transport.SharedMemorySegment.create') as mock_shared_memory_create:
+            self.transport.put([0x1, 0x2, 0x3])
+        mock_shared_memory_create.assert_not_called()
+
+    def test_if_large_payload_is_sent_through_shared_memory_segment(self):
+        payload = [str(i) * 1024 for i in range(64)]
+        with mock.patch('transport.SharedMemorySegment.create', side_effect=SharedMemorySegment.create) as mock_shared_memory_create:
+            self.transport.put(payload)
+        mock_shared_memory_create.assert_called_once()
+        self.assertEqual(self.transport.get(), payload)
+
+    def test_if_shared_memory_segment_is_removed_once_consumed(self):
+        name = SharedMemorySegment.create('some data')
+        self.assertEqual(SharedMemorySegment.consume(name), 'some data')
+        self.assertFalse(os.path.exists(name))
+
+    def test_if_put_does_not_block_when_pipe_is_full_and_frames_are_not_lost(self):
+        how_many = 10000 # ~ 10x the pipe capacity
+        for i in range(how_many):
+            self.transport.put(['/tmp/some/file.cpp', i])
+        for i in range(how_many):
+            self.assertEqual(self.transport.get(), ['/tmp/some/file.cpp', i])
+
+    def test_if_poll_returns_false_for_empty_transport(self):
+        self.assertEqual(self.transport.poll(), False)
+
+    def test_if_poll_returns_true_for_non_empty_transport(self):
+        self.transport.put([0x1])
+        self.assertEqual(self.transport.poll(), True)
+
+class ServerHandleTest(unittest.TestCase):
+    def setUp(self):
+        self.payload = [0x1, 0x2, 0x3]
+        self.handle = server.ServerHandle()
+
+    def test_if_start_service_is_sent_to_server_and_startup_request_directly_to_service(self):
+        self.handle.put([server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT, self.payload])
+        self.assertEqual(self.handle.get(), [server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT, self.payload])
+        self.assertEqual(self.handle.service_transport[server.ServiceId.CLANG_FORMAT].get(), [service.ServiceRequestId.STARTUP, self.payload])
+
+    def test_if_service_request_bypasses_the_server_once_service_is_started(self):
+        self.handle.put([server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_FORMAT, self.payload])
+        self.handle.get()
+        self.handle.put([server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, self.payload])
+        self.assertEqual(self.handle.server_transport.poll(), False)
+        transport = self.handle.service_transport[server.ServiceId.CLANG_FORMAT]
+        self.assertEqual(transport.get(), [service.ServiceRequestId.STARTUP, self.payload])
+        self.assertEqual(transport.get(), [service.ServiceRequestId.REQUEST, self.payload])
+
+    def test_if_service_request_goes_through_the_server_if_service_is_not_started(self):
+        self.handle.put([server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, self.payload])
+        self.assertEqual(self.handle.get(), [server.ServerRequestId.SEND_SERVICE, server.ServiceId.CLANG_FORMAT, self.payload])
+        self.assertEqual(self.handle.service_transport[server.ServiceId.CLANG_FORMAT].poll(), False)
+
+    def test_if_shutdown_and_exit_sends_shutdown_request_to_started_services_only(self):
+        self.handle.put([server.ServerRequestId.START_SERVICE, server.ServiceId.CLANG_TIDY, self.payload])
+        self.handle.put([server.ServerRequestId.SHUTDOWN_AND_EXIT, 0x0, self.payload])
+        transport = self.handle.service_transport[server.ServiceId.CLANG_TIDY]
+        self.assertEqual(transport.get(), [service.ServiceRequestId.STARTUP, self.payload])
+        self.assertEqual(transport.get(), [service.ServiceRequestId.SHUTDOWN, self.payload])
+        self.assertEqual(self.handle.service_transport[server.ServiceId.CLANG_FORMAT].poll(), False)
+
+    def test_if_server_does_not_forward_requests_to_services_attached_to_the_handle(self):
+        srv = server.Server(self.handle, mock.MagicMock(), mock.MagicMock(), mock.MagicMock(), mock.MagicMock())
+        svc_handler = srv.service[server.ServiceId.CLANG_FORMAT]
+        self.assertEqual(svc_handler.service.queue, self.handle.service_transport[server.ServiceId.CLANG_FORMAT])
+        with mock.patch.object(svc_handler, 'is_started', return_value=True):
+            with mock.patch.object(svc_handler.service, 'send_request') as mock_send_request:
+                svc_handler.request(self.payload)
+        mock_send_request.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import cPickle
+import collections
+import errno
+import fcntl
+import logging
+import mmap
+import os
+import select
+import struct
+import tempfile
+import threading
+
+class SharedMemorySegment():
+    """
+    Named memory segment used to move large payloads between processes without pushing them through a pipe.
+
+    Python 2 does not come with multiprocessing.shared_memory so we get the same thing by mmap-ing a file
+    which lives on tmpfs (/dev/shm). Segment is created by the writer and consumed (and unlinked) by the reader.
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    prefix = 'cxxd_shm_'
+
+    @staticmethod
+    def create(data):
+        fd, name = tempfile.mkstemp(prefix=SharedMemorySegment.prefix, dir=SharedMemorySegment.directory)
+        try:
+            os.ftruncate(fd, len(data))
+            segment = mmap.mmap(fd, len(data))
+            segment[0:len(data)] = data
+            segment.close()
+        finally:
+            os.close(fd)
+        return name
+
+    @staticmethod
+    def consume(name):
+        with open(name, 'rb') as f:
+            segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = segment[:]
+            segment.close()
+        os.remove(name)
+        return data
+
+class Transport():
+    """
+    One-way, multiple-writers/single-reader channel between processes.
+
+    Compared to multiprocessing.Queue:
+        * Every frame is written with a single write() to the pipe. Frames are never larger than PIPE_BUF so the
+          write is atomic which is why we don't need any inter-process locking between the writers.
+        * There is no feeder thread involved in the common case. Frames are written directly from the calling thread.
+          Only if pipe is full (reader is busy), frames will be buffered and flushed from a background thread so
+          that put() never blocks the caller (i.e. an editor).
+        * Payloads which do not fit into a single frame travel through SharedMemorySegment and only its name is
+          written to the pipe.
+    """
+    INLINE        = 0x0
+    SHARED_MEMORY = 0x1
+
+    header = struct.Struct('!IB')  # frame length, frame type
+    frame_length_max = select.PIPE_BUF
+
+    def __init__(self):
+        self.reader, self.writer = os.pipe()
+        flags = fcntl.fcntl(self.writer, fcntl.F_GETFL)
+        fcntl.fcntl(self.writer, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.__reset_backlog()
+
+    def __getstate__(self):
+        raise TypeError('Transport can only be inherited by child processes (fork), not pickled.')
+
+    def __reset_backlog(self):
+        self.owner_pid = os.getpid()
+        self.backlog = collections.deque()
+        self.backlog_lock = threading.Lock()
+        self.backlog_flusher = None
+
+    def put(self, payload):
+        data = cPickle.dumps(payload, cPickle.HIGHEST_PROTOCOL)
+        if Transport.header.size + len(data) <= Transport.frame_length_max:
+            frame = Transport.header.pack(len(data), Transport.INLINE) + data
+        else:
+            name = SharedMemorySegment.create(data)
+            frame = Transport.header.pack(len(name), Transport.SHARED_MEMORY) + name
+        self.__write(frame)
+
+    def get(self):
+        length, frame_type = Transport.header.unpack(self.__read(Transport.header.size))
+        data = self.__read(length)
+        if frame_type == Transport.SHARED_MEMORY:
+            data = SharedMemorySegment.consume(data)
+        return cPickle.loads(data)
+
+    def poll(self, timeout=0):
+        readable, _, _ = select.select([self.reader], [], [], timeout)
+        return len(readable) > 0
+
+    def fileno(self):
+        return self.reader
+
+    def __write(self, frame):
+        if self.owner_pid != os.getpid():   # Backlog state is not something we want to inherit from the parent process
+            self.__reset_backlog()
+        with self.backlog_lock:
+            if not self.backlog and self.__try_write(frame):
+                return
+            self.backlog.append(frame)
+            if self.backlog_flusher is None:
+                logging.info('Transport is full. Remaining frames will be flushed in the background.')
+                self.backlog_flusher = threading.Thread(target=self.__flush_backlog, name='cxxd_transport_flusher')
+                self.backlog_flusher.daemon = True
+                self.backlog_flusher.start()
+
+    def __try_write(self, frame):
+        try:
+            os.write(self.writer, frame)
+            return True
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return False
+            raise
+
+    def __flush_backlog(self):
+        while True:
+            with self.backlog_lock:
+                if not self.backlog:
+                    self.backlog_flusher = None
+                    return
+                frame = self.backlog[0]
+                if self.__try_write(frame):
+                    self.backlog.popleft()
+                    continue
+            select.select([], [self.writer], [])
+
+    def __read(self, length):
+        chunks = []
+        while length > 0:
+            chunk = os.read(self.reader, length)
+            if not chunk:
+                raise EOFError('Transport closed.')
+            chunks.append(chunk)
+            length -= len(chunk)
+        return ''.join(chunks)